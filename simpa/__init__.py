@@ -20,8 +20,16 @@ from .core.simulation_modules.optical_module.mcx_adapter import \
     MCXAdapter
 from .core.simulation_modules.optical_module.mcx_reflectance_adapter import \
     MCXReflectanceAdapter
+from .core.simulation_modules.optical_module.analytic_diffusion_adapter import \
+    AnalyticDiffusionAdapter
 from .core.simulation_modules.acoustic_module.k_wave_adapter import \
     KWaveAdapter
+from .core.simulation_modules.acoustic_module.k_space_pseudospectral_adapter import \
+    KSpacePseudospectralAdapter
+from .core.simulation_modules.acoustic_module.system_matrix_adapter import \
+    AcousticSystemMatrixAdapter
+from .core.simulation_modules.acoustic_module.analytic_point_source_adapter import \
+    AnalyticPointSourceAdapter
 from .core.simulation_modules.reconstruction_module.delay_and_sum_adapter import \
     DelayAndSumAdapter
 from .core.simulation_modules.reconstruction_module.delay_multiply_and_sum_adapter import \
@@ -30,13 +38,27 @@ from .core.simulation_modules.reconstruction_module.signed_delay_multiply_and_su
     SignedDelayMultiplyAndSumAdapter
 from .core.simulation_modules.reconstruction_module.time_reversal_adapter import \
     TimeReversalAdapter
+from .core.simulation_modules.reconstruction_module.fourier_domain_reconstruction_adapter import \
+    FourierDomainReconstructionAdapter
+from .core.simulation_modules.reconstruction_module.universal_back_projection_adapter import \
+    UniversalBackProjectionAdapter
 
 from .core.simulation_modules.reconstruction_module.delay_and_sum_adapter import \
-    reconstruct_delay_and_sum_pytorch
+    reconstruct_delay_and_sum_pytorch, reconstruct_delay_and_sum_frames_pytorch
 from .core.simulation_modules.reconstruction_module.delay_multiply_and_sum_adapter import \
     reconstruct_delay_multiply_and_sum_pytorch
 from .core.simulation_modules.reconstruction_module.signed_delay_multiply_and_sum_adapter import \
     reconstruct_signed_delay_multiply_and_sum_pytorch
+from .core.simulation_modules.reconstruction_module.fourier_domain_reconstruction_adapter import \
+    reconstruct_fourier_domain_pytorch
+from .core.simulation_modules.reconstruction_module.universal_back_projection_adapter import \
+    reconstruct_universal_back_projection_pytorch
+from .core.simulation_modules.reconstruction_module.reconstruction_precision_validation import \
+    validate_reconstruction_precision
+from .core.simulation_modules.reconstruction_module.streaming_reconstructor import \
+    StreamingReconstructor
+from .core.simulation_modules.reconstruction_module.travel_time_tables import \
+    compute_travel_time_tables
 from .core.simulation_modules.acoustic_module.k_wave_adapter import \
     perform_k_wave_acoustic_forward_simulation
 
@@ -46,6 +68,7 @@ from simpa.core.processing_components.monospectral.noise import PoissonNoise
 from simpa.core.processing_components.monospectral.noise import SaltAndPepperNoise
 from simpa.core.processing_components.monospectral.noise import UniformNoise
 from simpa.core.processing_components.monospectral.field_of_view_cropping import FieldOfViewCropping
+from simpa.core.processing_components.monospectral.time_series_decimation import TimeSeriesDecimation
 from simpa.core.processing_components.monospectral.iterative_qPAI_algorithm import IterativeqPAI
 from simpa.core.processing_components.multispectral.linear_unmixing import LinearUnmixing
 
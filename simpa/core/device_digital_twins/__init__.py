@@ -18,6 +18,7 @@ from .illumination_geometries.rectangle_illumination import RectangleIlluminatio
 from .illumination_geometries.ring_illumination import RingIlluminationGeometry
 from .illumination_geometries.ithera_msot_acuity_illumination import MSOTAcuityIlluminationGeometry
 from .illumination_geometries.ithera_msot_invision_illumination import MSOTInVisionIlluminationGeometry
+from .illumination_geometries.combined_illumination import CombinedIlluminationGeometry
 from .pa_devices.ithera_msot_invision import InVision256TF
 from .pa_devices.ithera_msot_acuity import MSOTAcuityEcho
 from .pa_devices.ithera_rsom import RSOMExplorerP50
@@ -0,0 +1,96 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import typing
+
+import numpy as np
+
+from simpa.core.device_digital_twins import IlluminationGeometryBase
+from simpa.utils import Settings
+
+
+class CombinedIlluminationGeometry(IlluminationGeometryBase):
+    """
+    This class fuses several illumination geometries into a single multi-source illumination geometry.
+    Instead of running one optical forward model per illuminator and averaging the resulting fluences, the sources of
+    all illuminators are launched within a single optical forward model run.
+    The sources are exported like the sources of `MSOTInVisionIlluminationGeometry`, as a single mcx source definition
+    with one row of "Pos", "Dir", "Param1" and "Param2" per source, so all fused illumination geometries need to have
+    the same source type. mcx splits the photons equally between the rows and normalises the fluence by the energy of
+    all launched photons, such that the result is the average of the fluences of the separate runs.
+
+    Usage example::
+
+        combined_geometry = CombinedIlluminationGeometry(device.get_illumination_geometry())
+    """
+
+    def __init__(self, illumination_geometries: typing.Optional[typing.List[IlluminationGeometryBase]] = None):
+        """
+        :param illumination_geometries: The illumination geometries that should be fused.
+        """
+        super(CombinedIlluminationGeometry, self).__init__()
+        if illumination_geometries is None:
+            illumination_geometries = []
+        self.illumination_geometries = list(illumination_geometries)
+
+    def get_mcx_illuminator_definition(self, global_settings: Settings) -> dict:
+        """
+        Merges the mcx source definitions of all fused illumination geometries into a single source definition with
+        one row of "Pos", "Dir", "Param1" and "Param2" per source. Definitions that already contain several sources,
+        like the one of `MSOTInVisionIlluminationGeometry`, contribute all of their rows. Parameters that are not
+        defined by an illumination geometry are set to zero for its sources.
+
+        :param global_settings: The global settings.
+        :return: Dictionary that includes all parameters needed for mcx.
+        :raises ValueError: if the illumination geometries have different source types
+        """
+        definitions = [illumination_geometry.get_mcx_illuminator_definition(global_settings)
+                       for illumination_geometry in self.illumination_geometries]
+        source_types = set(definition["Type"] for definition in definitions)
+        if len(source_types) != 1:
+            raise ValueError(f"Only illumination geometries with the same mcx source type can be combined into a "
+                             f"single simulation, but the types are {sorted(source_types)}.")
+
+        merged_definition = {"Type": source_types.pop(), "Pos": [], "Dir": [], "Param1": [], "Param2": []}
+        for definition in definitions:
+            number_of_sources = len(np.reshape(definition["Pos"], (-1, 3)))
+            for key in ["Pos", "Dir", "Param1", "Param2"]:
+                if key in definition:
+                    rows = np.atleast_2d(np.asarray(definition[key], dtype=float))
+                else:
+                    rows = np.zeros((1, 4))
+                if len(rows) == 1:
+                    rows = np.repeat(rows, number_of_sources, axis=0)
+                merged_definition[key] += rows.tolist()
+        return merged_definition
+
+    def check_settings_prerequisites(self, global_settings) -> bool:
+        return all(illumination_geometry.check_settings_prerequisites(global_settings)
+                   for illumination_geometry in self.illumination_geometries)
+
+    def get_illuminated_region_mm(self) -> typing.Optional[np.ndarray]:
+        """
+        Returns the union of the illuminated regions of all fused illumination geometries. If the region of any
+        of the illumination geometries is unknown, None is returned.
+
+        :return: Illuminated region in mm as [xs, xe, ys, ye, zs, ze] or None.
+        """
+        regions = [illumination_geometry.get_illuminated_region_mm()
+                   for illumination_geometry in self.illumination_geometries]
+        if len(regions) == 0 or any(region is None for region in regions):
+            return None
+        regions = np.asarray(regions)
+        return np.ravel([[np.min(regions[:, 2 * axis]), np.max(regions[:, 2 * axis + 1])] for axis in range(3)])
+
+    def serialize(self) -> dict:
+        serialized_device = self.__dict__
+        device_dict = {"CombinedIlluminationGeometry": serialized_device}
+        return device_dict
+
+    @staticmethod
+    def deserialize(dictionary_to_deserialize):
+        deserialized_device = CombinedIlluminationGeometry()
+        for key, value in dictionary_to_deserialize.items():
+            deserialized_device.__dict__[key] = value
+        return deserialized_device
@@ -2,6 +2,8 @@
 # SPDX-FileCopyrightText: 2021 Janek Groehl
 # SPDX-License-Identifier: MIT
 
+import numpy as np
+
 from simpa.core.device_digital_twins import IlluminationGeometryBase
 from simpa.utils import Tags
 
@@ -52,6 +54,10 @@ class DiskIlluminationGeometry(IlluminationGeometryBase):
             "Param2": source_param2
         }
 
+    def get_illuminated_region_mm(self) -> np.ndarray:
+        position = np.asarray(self.device_position_mm, dtype=float)
+        return np.ravel([[p - self.beam_radius_mm, p + self.beam_radius_mm] for p in position])
+
     def serialize(self) -> dict:
         serialized_device = self.__dict__
         device_dict = {"DiskIlluminationGeometry": serialized_device}
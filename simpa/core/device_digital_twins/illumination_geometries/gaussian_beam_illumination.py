@@ -2,8 +2,11 @@
 # SPDX-FileCopyrightText: 2021 Janek Groehl
 # SPDX-License-Identifier: MIT
 
+import typing
 from math import log, sqrt
 from collections.abc import Sized
+import numpy as np
+
 from simpa.core.device_digital_twins import IlluminationGeometryBase
 from simpa.utils import Tags
 
@@ -65,6 +68,15 @@ class GaussianBeamIlluminationGeometry(IlluminationGeometryBase):
             "Param2": source_param2
         }
 
+    def get_illuminated_region_mm(self) -> typing.Optional[np.ndarray]:
+        if self.focal_length_mm is not None and self.focal_length_mm < 0:
+            # the beam of a cone-shaped gaussian source keeps widening within the volume
+            return None
+        # include the gaussian tails up to three times the half width at half maximum
+        extent = 3 * self.beam_radius_mm
+        position = np.asarray(self.device_position_mm, dtype=float)
+        return np.ravel([[p - extent, p + extent] for p in position])
+
     def serialize(self) -> dict:
         serialized_device = self.__dict__
         device_dict = {"GaussianBeamIlluminationGeometry": serialized_device}
@@ -2,6 +2,7 @@
 # SPDX-FileCopyrightText: 2021 Janek Groehl
 # SPDX-License-Identifier: MIT
 
+import typing
 from abc import abstractmethod
 from simpa.core.device_digital_twins import DigitalDeviceTwinBase
 from simpa.utils import Settings
@@ -51,6 +52,18 @@ class IlluminationGeometryBase(DigitalDeviceTwinBase):
         """
         pass
 
+    def get_illuminated_region_mm(self) -> typing.Optional[np.ndarray]:
+        """
+        Returns the region in which the light of this illumination geometry enters the volume in mm.
+        It is defined as a numpy array of the shape [xs, xe, ys, ye, zs, ze], where x, y, and z denote the coordinate
+        axes and s and e denote the start and end positions.
+        Illumination geometries for which this region is unknown return None.
+
+        :return: Illuminated region in mm or None.
+        :rtype: ndarray, None
+        """
+        return None
+
     def check_settings_prerequisites(self, global_settings) -> bool:
         return True
 
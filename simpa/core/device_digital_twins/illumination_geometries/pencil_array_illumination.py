@@ -63,6 +63,12 @@ class PencilArrayIlluminationGeometry(IlluminationGeometryBase):
             "Param2": source_param2
         }
 
+    def get_illuminated_region_mm(self) -> np.ndarray:
+        position = np.asarray(self.device_position_mm, dtype=float)
+        return np.asarray([position[0], position[0] + self.number_illuminators_x * self.pitch_mm,
+                           position[1], position[1] + self.number_illuminators_y * self.pitch_mm,
+                           position[2], position[2]])
+
     def serialize(self) -> dict:
         serialized_device = self.__dict__
         device_dict = {"PencilArrayIlluminationGeometry": serialized_device}
@@ -2,6 +2,8 @@
 # SPDX-FileCopyrightText: 2021 Janek Groehl
 # SPDX-License-Identifier: MIT
 
+import numpy as np
+
 from simpa.core.device_digital_twins import IlluminationGeometryBase
 from simpa.utils import Tags
 
@@ -33,6 +35,10 @@ class PencilBeamIlluminationGeometry(IlluminationGeometryBase):
             "Param2": source_param2
         }
 
+    def get_illuminated_region_mm(self) -> np.ndarray:
+        position = np.asarray(self.device_position_mm, dtype=float)
+        return np.repeat(position, 2)
+
     def serialize(self) -> dict:
         serialized_device = self.__dict__
         return {"PencilBeamIlluminationGeometry": serialized_device}
@@ -88,6 +88,17 @@ class RectangleIlluminationGeometry(IlluminationGeometryBase):
             "Param2": source_param2
         }
 
+    def get_illuminated_region_mm(self) -> np.ndarray:
+        """
+        Returns the region in which the light of this illumination geometry enters the volume in mm.
+
+        :return: Illuminated region in mm as [xs, xe, ys, ye, zs, ze].
+        """
+        position = np.asarray(self.device_position_mm, dtype=float)
+        return np.asarray([position[0], position[0] + self.width_mm,
+                           position[1], position[1] + self.length_mm,
+                           position[2], position[2]])
+
     def serialize(self) -> dict:
         """
         Serializes the object into a dictionary.
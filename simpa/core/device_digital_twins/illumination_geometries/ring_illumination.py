@@ -99,6 +99,15 @@ class RingIlluminationGeometry(IlluminationGeometryBase):
             "Param1": source_param1
         }
 
+    def get_illuminated_region_mm(self) -> np.ndarray:
+        """
+        Returns the region in which the light of this illumination geometry enters the volume in mm.
+
+        :return: Illuminated region in mm as [xs, xe, ys, ye, zs, ze].
+        """
+        position = np.asarray(self.device_position_mm, dtype=float)
+        return np.ravel([[p - self.outer_radius_in_mm, p + self.outer_radius_in_mm] for p in position])
+
     def serialize(self) -> dict:
         """
         Serializes the object into a dictionary.
@@ -67,6 +67,12 @@ class SlitIlluminationGeometry(IlluminationGeometryBase):
             "Param2": source_param2
         }
 
+    def get_illuminated_region_mm(self) -> np.ndarray:
+        position = np.asarray(self.device_position_mm, dtype=float)
+        start = position - 0.5 * np.asarray(self.slit_vector_mm)
+        end = position + 0.5 * np.asarray(self.slit_vector_mm)
+        return np.ravel([[min(s, e), max(s, e)] for s, e in zip(start, end)])
+
     def serialize(self) -> dict:
         serialized_device = self.__dict__
         device_dict = {"SlitIlluminationGeometry": serialized_device}
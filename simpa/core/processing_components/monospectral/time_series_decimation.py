@@ -0,0 +1,122 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+from fractions import Fraction
+
+import h5py
+import numpy as np
+from scipy.signal import resample_poly
+
+from simpa.core.device_digital_twins import DetectionGeometryBase, DigitalDeviceTwinBase, PhotoacousticDevice
+from simpa.core.processing_components import ProcessingComponentBase
+from simpa.io_handling import load_data_field, save_data_field
+from simpa.io_handling.io_hdf5 import save_hdf5
+from simpa.utils import Settings, Tags
+from simpa.utils.dict_path_manager import generate_dict_path
+
+
+class TimeSeriesDecimation(ProcessingComponentBase):
+    """
+    Crops the time series data to the time window in which signals from the field of view arrive at the detector
+    elements and decimates it to the sampling rate of the device with an anti-aliasing polyphase filter.
+    The acoustic forward models sample the time series on their simulation time grid, which is usually much finer and
+    longer than needed, so this reduces the stored data and the cost of the reconstruction.
+    The sensor data is read, filtered and written in blocks of detector elements. Tags.K_WAVE_SPECIFIC_DT and
+    Tags.K_WAVE_SPECIFIC_NT are updated to the new time grid.
+    Component Settings::
+
+       Tags.SENSOR_SAMPLING_RATE_MHZ (default: sampling rate of the detection geometry)
+       Tags.DATA_FIELD_SPEED_OF_SOUND (default: minimum of the simulated speed of sound)
+       Tags.TIME_SERIES_DECIMATION_BLOCK_SIZE (default: 64)
+    """
+
+    def __init__(self, global_settings, settings_key=None):
+        if settings_key is None:
+            settings_key = "TimeSeriesDecimation"
+            if settings_key not in global_settings:
+                global_settings[settings_key] = Settings()
+        super(TimeSeriesDecimation, self).__init__(global_settings, settings_key)
+        self.simulation_time_spacing = None
+
+    def run(self, device: DigitalDeviceTwinBase):
+        self.logger.info("Decimating time series data...")
+
+        if isinstance(device, PhotoacousticDevice):
+            detection_geometry = device.get_detection_geometry()
+        elif isinstance(device, DetectionGeometryBase):
+            detection_geometry = device
+        else:
+            msg = "The time series data can only be decimated for a device with a detection geometry."
+            self.logger.critical(msg)
+            raise TypeError(msg)
+
+        file_path = self.global_settings[Tags.SIMPA_OUTPUT_FILE_PATH]
+        wavelength = self.global_settings[Tags.WAVELENGTH]
+
+        # the time step of the simulation is remembered, as the global settings hold the decimated time step once
+        # the first wavelength has been processed
+        if self.simulation_time_spacing is None or Tags.WAVELENGTHS not in self.global_settings or \
+                wavelength == self.global_settings[Tags.WAVELENGTHS][0]:
+            self.simulation_time_spacing = self.global_settings[Tags.K_WAVE_SPECIFIC_DT]
+        dt = self.simulation_time_spacing
+
+        if Tags.SENSOR_SAMPLING_RATE_MHZ in self.component_settings:
+            sampling_frequency_hz = self.component_settings[Tags.SENSOR_SAMPLING_RATE_MHZ] * 1e6
+        else:
+            sampling_frequency_hz = detection_geometry.sampling_frequency_MHz * 1e6
+
+        if Tags.DATA_FIELD_SPEED_OF_SOUND in self.component_settings and \
+                self.component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND]:
+            speed_of_sound = self.component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND]
+        else:
+            speed_of_sound = np.min(load_data_field(file_path, Tags.DATA_FIELD_SPEED_OF_SOUND))
+
+        if Tags.TIME_SERIES_DECIMATION_BLOCK_SIZE in self.component_settings:
+            block_size = self.component_settings[Tags.TIME_SERIES_DECIMATION_BLOCK_SIZE]
+        else:
+            block_size = 64
+
+        # the decimation factor is approximated by a ratio of small integers
+        ratio = Fraction(1 / (dt * sampling_frequency_hz)).limit_denominator(10)
+        if ratio <= 1:
+            up, down = 1, 1
+        else:
+            up, down = ratio.denominator, ratio.numerator
+        new_dt = dt * down / up
+        self.logger.debug(f"Resampling the time series data by {up}/{down} to a time step of {new_dt} s")
+
+        time_series_path = generate_dict_path(Tags.DATA_FIELD_TIME_SERIES_DATA, wavelength=wavelength)
+        with h5py.File(file_path, "r") as h5file:
+            number_detector_elements, number_time_steps = h5file[time_series_path].shape
+            dtype = h5file[time_series_path].dtype
+
+        # latest arrival of a signal from the field of view, which is at one of the corners of the field of view
+        field_of_view_mm = np.reshape(detection_geometry.get_field_of_view_mm(), (3, 2))
+        corners_mm = np.stack(np.meshgrid(*field_of_view_mm, indexing="ij"), axis=-1).reshape(-1, 3)
+        detector_positions_mm = detection_geometry.get_detector_element_positions_accounting_for_device_position_mm()
+        max_distance_mm = np.max(np.linalg.norm(detector_positions_mm[:, np.newaxis] - corners_mm[np.newaxis],
+                                                axis=-1))
+        new_number_time_steps = min(int(np.ceil(max_distance_mm / 1000 / speed_of_sound / new_dt)) + 1,
+                                    int(np.ceil(number_time_steps * up / down)))
+        # samples after the time window are read as well, so that the anti-aliasing filter is not truncated
+        filter_margin = int(np.ceil(10 * max(up, down) / up)) + 1
+        cropped_number_time_steps = min(int(np.ceil((new_number_time_steps - 1) * down / up)) + filter_margin,
+                                        number_time_steps)
+        self.logger.debug(f"Cropping the time series data from {number_time_steps} to {cropped_number_time_steps} "
+                          f"samples and decimating it to {new_number_time_steps} samples")
+
+        time_series_data = np.zeros((number_detector_elements, new_number_time_steps), dtype=dtype)
+        for start in range(0, number_detector_elements, block_size):
+            block = load_data_field(file_path, Tags.DATA_FIELD_TIME_SERIES_DATA, wavelength,
+                                    data_slice=np.s_[start:start + block_size, :cropped_number_time_steps])
+            if up != down:
+                block = resample_poly(block, up, down, axis=-1)
+            time_series_data[start:start + block_size] = block[:, :new_number_time_steps]
+
+        save_data_field(time_series_data, file_path, Tags.DATA_FIELD_TIME_SERIES_DATA, wavelength)
+        self.global_settings[Tags.K_WAVE_SPECIFIC_DT] = float(new_dt)
+        self.global_settings[Tags.K_WAVE_SPECIFIC_NT] = new_number_time_steps
+        save_hdf5(self.global_settings, file_path, "/settings/")
+
+        self.logger.info("Decimating time series data...[Done]")
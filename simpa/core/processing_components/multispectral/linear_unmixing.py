@@ -2,13 +2,22 @@
 # SPDX-FileCopyrightText: 2021 Janek Groehl
 # SPDX-License-Identifier: MIT
 
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
 from simpa.utils import Tags
 from simpa.io_handling import save_data_field
 from simpa.core.processing_components.multispectral import MultispectralProcessingAlgorithm
 from simpa.utils.libraries.spectrum_library import Spectrum
 import numpy as np
 import scipy.linalg as linalg
-from scipy.optimize import nnls
+
+# largest number of endmembers for which all active sets of the non-negative least squares problem are enumerated,
+# the enumeration takes 2^n - 1 passes over the pixels and is slower than the batched active set method for more
+# endmembers
+MAX_ENUMERATED_ENDMEMBERS = 2
+# number of pixels that are unmixed together by one thread
+NON_NEGATIVE_UNMIXING_CHUNK_SIZE = 2 ** 16
 
 
 class LinearUnmixing(MultispectralProcessingAlgorithm):
@@ -186,12 +195,7 @@ class LinearUnmixing(MultispectralProcessingAlgorithm):
         # else non-negative least squares is performed.
         try:
             if non_negative:
-                output = []
-                for i in range(np.shape(reshapedData)[1]):
-                    foo, ris = nnls(np.array(self.absorption_matrix), reshapedData[:, i])
-                    output.append(foo)
-
-                output = np.swapaxes(output, axis1=0, axis2=1)
+                output = non_negative_least_squares(np.array(self.absorption_matrix), reshapedData)
             else:
                 self.pseudo_inverse_absorption_matrix = linalg.pinv(self.absorption_matrix)
                 output = np.matmul(self.pseudo_inverse_absorption_matrix, reshapedData)
@@ -230,3 +234,108 @@ class LinearUnmixing(MultispectralProcessingAlgorithm):
         except Exception:
             raise KeyError("Chromophores oxy- and/or deoxyhemoglobin were not specified in component settings, "
                            "so so2 cannot be calculated!")
+
+
+def non_negative_least_squares(matrix: np.ndarray, data: np.ndarray) -> np.ndarray:
+    """
+    Solves the non-negative least squares problem min ||matrix @ x - b|| subject to x >= 0 for all columns b of the
+    data at once. The solution is the least squares solution on the set of its non-zero entries, so for up to
+    MAX_ENUMERATED_ENDMEMBERS endmembers, the least squares solutions of all sets of endmembers are computed for all
+    pixels together and the non-negative solution with the smallest residual is selected per pixel. Smaller sets are
+    preferred if the residuals are equal, like for `scipy.optimize.nnls`. For more endmembers, the active set method
+    of Lawson and Hanson is applied to all pixels together, see `batched_active_set_least_squares`. The pixels are
+    processed in chunks by several threads.
+
+    :param matrix: (numpy array) endmember matrix of shape (wavelengths, endmembers)
+    :param data: (numpy array) measured spectra of shape (wavelengths, pixels)
+    :return: (numpy array) non-negative endmember concentrations of shape (endmembers, pixels)
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    data = np.asarray(data, dtype=np.float64)
+    n_endmembers = np.shape(matrix)[1]
+
+    if n_endmembers > MAX_ENUMERATED_ENDMEMBERS:
+        def solve(chunk):
+            return batched_active_set_least_squares(matrix, chunk)
+    else:
+        subsets = [list(subset) for size in range(1, n_endmembers + 1)
+                   for subset in itertools.combinations(range(n_endmembers), size)]
+        pseudo_inverses = [linalg.pinv(matrix[:, subset]) for subset in subsets]
+
+        def solve(chunk):
+            solution = np.zeros((n_endmembers, np.shape(chunk)[1]))
+            best_residual = np.sum(chunk ** 2, axis=0)
+            tolerance = 1e-12 * best_residual
+            for subset, pseudo_inverse in zip(subsets, pseudo_inverses):
+                candidate = pseudo_inverse @ chunk
+                residual = np.sum((chunk - matrix[:, subset] @ candidate) ** 2, axis=0)
+                better = np.all(candidate >= 0, axis=0) & (residual < best_residual - tolerance)
+                solution[:, better] = 0
+                solution[np.ix_(subset, better)] = candidate[:, better]
+                best_residual[better] = residual[better]
+            return solution
+
+    chunks = [data[:, start:start + NON_NEGATIVE_UNMIXING_CHUNK_SIZE]
+              for start in range(0, np.shape(data)[1], NON_NEGATIVE_UNMIXING_CHUNK_SIZE)]
+    if len(chunks) <= 1:
+        return solve(data)
+    with ThreadPoolExecutor(max_workers=min(len(chunks), os.cpu_count() or 1)) as executor:
+        return np.concatenate(list(executor.map(solve, chunks)), axis=1)
+
+
+def batched_active_set_least_squares(matrix: np.ndarray, data: np.ndarray) -> np.ndarray:
+    """
+    Applies the active set method of Lawson and Hanson, which is also used by `scipy.optimize.nnls`, to all columns of
+    the data at once. In every iteration, the endmember with the largest positive gradient is added to the passive set
+    of every pixel that is not optimal yet. The least squares problems on the passive sets are solved together with the
+    normal equations, in which the endmembers outside of the passive set of a pixel are replaced by the identity.
+    The columns of the matrix are normalised to improve the conditioning of the normal equations.
+
+    :param matrix: (numpy array) endmember matrix of shape (wavelengths, endmembers)
+    :param data: (numpy array) measured spectra of shape (wavelengths, pixels)
+    :return: (numpy array) non-negative endmember concentrations of shape (endmembers, pixels)
+    """
+    n_endmembers = np.shape(matrix)[1]
+    n_pixels = np.shape(data)[1]
+    column_norms = np.maximum(np.linalg.norm(matrix, axis=0), 1e-300)
+    normalised_matrix = matrix / column_norms
+    gram_matrix = normalised_matrix.T @ normalised_matrix
+    correlations = (normalised_matrix.T @ data).T
+    tolerance = 10 * np.finfo(np.float64).eps * n_endmembers * max(np.max(np.abs(correlations), initial=0), 1)
+    identity = np.eye(n_endmembers)
+
+    def solve_passive_sets(passive, rhs):
+        # the rows and columns outside of the passive set are replaced by the identity, so their solution is zero
+        outer = passive[:, :, np.newaxis] & passive[:, np.newaxis, :]
+        systems = np.where(outer, gram_matrix, identity)
+        return np.linalg.solve(systems, (rhs * passive)[..., np.newaxis])[..., 0]
+
+    solution = np.zeros((n_pixels, n_endmembers))
+    passive = np.zeros((n_pixels, n_endmembers), dtype=bool)
+    gradient = correlations.copy()
+    for _ in range(3 * n_endmembers):
+        candidates = np.where(passive, -np.inf, gradient)
+        updating = np.flatnonzero(np.max(candidates, axis=1) > tolerance)
+        if len(updating) == 0:
+            break
+        passive[updating, np.argmax(candidates[updating], axis=1)] = True
+
+        for _ in range(3 * n_endmembers):
+            trial = solve_passive_sets(passive[updating], correlations[updating])
+            infeasible = np.any(passive[updating] & (trial <= 0), axis=1)
+            feasible = updating[~infeasible]
+            solution[feasible] = trial[~infeasible]
+            if not np.any(infeasible):
+                break
+            # move towards the trial solution until the first passive endmember becomes zero and drop it
+            updating, trial = updating[infeasible], trial[infeasible]
+            current = solution[updating]
+            blocking = passive[updating] & (trial <= 0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                step = np.min(np.where(blocking, current / (current - trial), np.inf), axis=1)
+            current = current + step[:, np.newaxis] * (trial - current)
+            passive[updating] &= current > tolerance
+            solution[updating] = np.where(passive[updating], current, 0)
+        gradient = correlations - solution @ gram_matrix
+
+    return (solution / column_norms).T
@@ -10,6 +10,7 @@ from simpa.io_handling.ipasc import export_to_ipasc
 from simpa.utils.settings import Settings
 from simpa.log import Logger
 from .device_digital_twins import DigitalDeviceTwinBase
+from .simulation_modules.acoustic_module import AcousticAdapterBase
 
 import numpy as np
 import os
@@ -82,21 +83,38 @@ def simulate(simulation_pipeline: list, settings: Settings, digital_device_twin:
         save_hdf5(simpa_output, settings[Tags.SIMPA_OUTPUT_FILE_PATH])
     logger.debug("Saving settings dictionary...[Done]")
 
-    for wavelength in settings[Tags.WAVELENGTHS]:
-        logger.debug(f"Running pipeline for wavelength {wavelength}nm...")
-
-        if settings[Tags.RANDOM_SEED] is not None:
-            np.random.seed(settings[Tags.RANDOM_SEED])
+    # Acoustic adapters that batch the wavelengths split the pipeline into stages: the pipeline elements before
+    # them are run for all wavelengths, then they are run once, followed by the remaining pipeline elements.
+    pipeline_stages = [[]]
+    for pipeline_element in simulation_pipeline:
+        if isinstance(pipeline_element, AcousticAdapterBase) and pipeline_element.batches_wavelengths():
+            pipeline_stages += [pipeline_element, []]
         else:
-            np.random.seed(None)
+            pipeline_stages[-1].append(pipeline_element)
+
+    for pipeline_stage in pipeline_stages:
+        if isinstance(pipeline_stage, AcousticAdapterBase):
+            logger.debug(f"Running {type(pipeline_stage)} for all wavelengths")
+            pipeline_stage.run_multiple_wavelengths(digital_device_twin, settings[Tags.WAVELENGTHS])
+            continue
+        if len(pipeline_stage) == 0:
+            continue
+
+        for wavelength in settings[Tags.WAVELENGTHS]:
+            logger.debug(f"Running pipeline for wavelength {wavelength}nm...")
+
+            if settings[Tags.RANDOM_SEED] is not None:
+                np.random.seed(settings[Tags.RANDOM_SEED])
+            else:
+                np.random.seed(None)
 
-        settings[Tags.WAVELENGTH] = wavelength
+            settings[Tags.WAVELENGTH] = wavelength
 
-        for pipeline_element in simulation_pipeline:
-            logger.debug(f"Running {type(pipeline_element)}")
-            pipeline_element.run(digital_device_twin)
+            for pipeline_element in pipeline_stage:
+                logger.debug(f"Running {type(pipeline_element)}")
+                pipeline_element.run(digital_device_twin)
 
-        logger.debug(f"Running pipeline for wavelength {wavelength}nm... [Done]")
+            logger.debug(f"Running pipeline for wavelength {wavelength}nm... [Done]")
 
     # If the dimensions of the simulation results are changed after calling the respective module
     # adapter / processing components, the amount of space on the hard drive that is allocated by the HDF5
@@ -3,10 +3,11 @@
 # SPDX-License-Identifier: MIT
 
 from abc import abstractmethod
+from typing import List, Tuple, Union
 import numpy as np
 from simpa.core.simulation_modules import SimulationModuleBase
 from simpa.utils import Tags, Settings
-from simpa.io_handling.io_hdf5 import save_hdf5
+from simpa.io_handling.io_hdf5 import load_data_field, save_hdf5
 from simpa.utils.dict_path_manager import generate_dict_path
 from simpa.core.device_digital_twins import PhotoacousticDevice, DetectionGeometryBase
 from simpa.utils.quality_assurance.data_sanity_testing import assert_array_well_defined
@@ -33,6 +34,8 @@ class AcousticAdapterBase(SimulationModuleBase):
 
     def __init__(self, global_settings: Settings):
         super(AcousticAdapterBase, self).__init__(global_settings=global_settings)
+        self.acoustic_properties = None
+        self.acoustic_properties_key = None
 
     def load_component_settings(self) -> Settings:
         """Implements abstract method to serve acoustic settings as component settings
@@ -41,6 +44,20 @@ class AcousticAdapterBase(SimulationModuleBase):
         """
         return self.global_settings.get_acoustic_settings()
 
+    def get_setting(self, tag: Tuple, default):
+        """
+        returns the value of a tag from the component settings or the global settings or the given default.
+
+        :param tag: tag to look up
+        :param default: default value
+        :return: value of the tag
+        """
+        if tag in self.component_settings:
+            return self.component_settings[tag]
+        if tag in self.global_settings:
+            return self.global_settings[tag]
+        return default
+
     @abstractmethod
     def forward_model(self, detection_geometry) -> np.ndarray:
         """
@@ -52,33 +69,155 @@ class AcousticAdapterBase(SimulationModuleBase):
         """
         pass
 
-    def run(self, digital_device_twin):
+    def get_lateral_axis(self, detection_geometry: DetectionGeometryBase) -> Union[int, None]:
         """
-        Call this method to invoke the simulation process.
+        determines whether a 2D simulation is performed and along which axis the detector elements are aligned.
 
-        :param digital_device_twin:
-        :return: a numpy array containing the time series pressure data per detection element
+        :param detection_geometry: detection geometry of the device
+        :return: 0 or 1 if a 2D simulation in the x-z or y-z plane is performed, None for a 3D simulation
+        """
+        if Tags.ACOUSTIC_SIMULATION_3D in self.component_settings and \
+                self.component_settings[Tags.ACOUSTIC_SIMULATION_3D]:
+            return None
+        field_of_view = detection_geometry.get_field_of_view_mm()
+        if np.abs(field_of_view[2] - field_of_view[3]) < 1e-5:
+            return 0
+        if np.abs(field_of_view[0] - field_of_view[1]) < 1e-5:
+            return 1
+        return None
+
+    def get_image_slice(self, detection_geometry: DetectionGeometryBase) -> Tuple:
         """
+        returns the slice of the volume that contains the detector elements for 2D simulations and the entire
+        volume for 3D simulations.
 
-        self.logger.info("Simulating the acoustic forward process...")
+        :param detection_geometry: detection geometry of the device
+        :return: numpy slice
+        """
+        lateral_axis = self.get_lateral_axis(detection_geometry)
+        if lateral_axis is None:
+            return np.s_[:]
+        detector_positions_mm = detection_geometry.get_detector_element_positions_accounting_for_device_position_mm()
+        transducer_plane = int(round(detector_positions_mm[0, 1 - lateral_axis] /
+                                     self.global_settings[Tags.SPACING_MM])) - 1
+        if lateral_axis == 0:
+            return np.s_[:, transducer_plane, :]
+        return np.s_[transducer_plane, :, :]
+
+    def load_acoustic_properties(self, image_slice=np.s_[:]) -> dict:
+        """
+        Loads the wavelength-independent acoustic properties speed of sound, density and attenuation. Only the given
+        image slice is read from the SIMPA output file. The properties are kept in memory and reused for the
+        subsequent wavelengths of a simulation until `clear_acoustic_properties` is called, which `run` does for the
+        first wavelength of every simulation and `run_multiple_wavelengths` does for every simulation.
 
-        _device = None
+        :param image_slice: part of the volume to load, e.g. the imaging plane of 2D simulations
+        :return: dictionary with the acoustic properties
+        """
+        file_path = self.global_settings[Tags.SIMPA_OUTPUT_FILE_PATH]
+        key = (file_path, str(image_slice))
+        if key != self.acoustic_properties_key:
+            self.acoustic_properties = {data_field: load_data_field(file_path, data_field, data_slice=image_slice)
+                                        for data_field in [Tags.DATA_FIELD_SPEED_OF_SOUND, Tags.DATA_FIELD_DENSITY,
+                                                           Tags.DATA_FIELD_ALPHA_COEFF]}
+            self.acoustic_properties_key = key
+        return self.acoustic_properties
+
+    def clear_acoustic_properties(self):
+        """
+        Removes the acoustic properties from memory, so that they are read again from the SIMPA output file.
+        """
+        self.acoustic_properties = None
+        self.acoustic_properties_key = None
+
+    def forward_model_multiple_wavelengths(self, detection_geometry, wavelengths: List) -> List[np.ndarray]:
+        """
+        Performs the acoustic forward modeling for the initial pressure distributions of several wavelengths.
+        As the acoustic properties do not depend on the wavelength, deriving classes may override this method to
+        propagate all initial pressure distributions at once. By default, `forward_model` is called per wavelength.
+
+        :param detection_geometry: detection geometry of the device
+        :param wavelengths: wavelengths whose initial pressure distributions are propagated
+        :return: list with the time series pressure data of each wavelength
+        """
+        time_series_data = []
+        for wavelength in wavelengths:
+            self.global_settings[Tags.WAVELENGTH] = wavelength
+            time_series_data.append(self.forward_model(detection_geometry))
+        return time_series_data
+
+    def batches_wavelengths(self) -> bool:
+        """
+        :return: True if the acoustic forward model is to be run once for all wavelengths of a simulation, see
+            Tags.ACOUSTIC_MODEL_BATCH_WAVELENGTHS
+        """
+        return bool(Tags.ACOUSTIC_MODEL_BATCH_WAVELENGTHS in self.component_settings and
+                    self.component_settings[Tags.ACOUSTIC_MODEL_BATCH_WAVELENGTHS])
+
+    def get_detection_geometry(self, digital_device_twin) -> DetectionGeometryBase:
+        """
+        :param digital_device_twin: detection geometry or photoacoustic device
+        :return: the detection geometry of the device
+        :raises TypeError: if the device is neither a detection geometry nor a photoacoustic device
+        """
         if isinstance(digital_device_twin, DetectionGeometryBase):
-            _device = digital_device_twin
+            return digital_device_twin
         elif isinstance(digital_device_twin, PhotoacousticDevice):
-            _device = digital_device_twin.get_detection_geometry()
+            return digital_device_twin.get_detection_geometry()
         else:
             raise TypeError(
                 f"The optical forward modelling does not support devices of type {type(digital_device_twin)}")
 
-        time_series_data = self.forward_model(_device)
+    def save_time_series_data(self, time_series_data: np.ndarray, wavelength):
+        """
+        checks the time series data and saves it to the SIMPA output file.
 
+        :param time_series_data: time series pressure data per detection element
+        :param wavelength: wavelength the time series data belongs to
+        """
         if not (Tags.IGNORE_QA_ASSERTIONS in self.global_settings and Tags.IGNORE_QA_ASSERTIONS):
             assert_array_well_defined(time_series_data, array_name="time_series_data")
 
-        acoustic_output_path = generate_dict_path(
-            Tags.DATA_FIELD_TIME_SERIES_DATA, wavelength=self.global_settings[Tags.WAVELENGTH])
+        acoustic_output_path = generate_dict_path(Tags.DATA_FIELD_TIME_SERIES_DATA, wavelength=wavelength)
 
         save_hdf5(time_series_data, self.global_settings[Tags.SIMPA_OUTPUT_FILE_PATH], acoustic_output_path)
 
+    def run(self, digital_device_twin):
+        """
+        Call this method to invoke the simulation process.
+
+        :param digital_device_twin:
+        :return: a numpy array containing the time series pressure data per detection element
+        """
+
+        self.logger.info("Simulating the acoustic forward process...")
+
+        # the acoustic properties of a previous simulation may have changed, they are only reused for the
+        # subsequent wavelengths of the same simulation
+        if not (Tags.WAVELENGTHS in self.global_settings and Tags.WAVELENGTH in self.global_settings and
+                self.global_settings[Tags.WAVELENGTH] != self.global_settings[Tags.WAVELENGTHS][0]):
+            self.clear_acoustic_properties()
+
+        time_series_data = self.forward_model(self.get_detection_geometry(digital_device_twin))
+        self.save_time_series_data(time_series_data, self.global_settings[Tags.WAVELENGTH])
+
         self.logger.info("Simulating the acoustic forward process...[Done]")
+
+    def run_multiple_wavelengths(self, digital_device_twin, wavelengths: List):
+        """
+        Call this method to invoke the simulation process for several wavelengths at once.
+        The initial pressure distributions of all wavelengths must have been simulated before.
+
+        :param digital_device_twin:
+        :param wavelengths: wavelengths to simulate
+        """
+
+        self.logger.info(f"Simulating the acoustic forward process for {len(wavelengths)} wavelengths...")
+
+        self.clear_acoustic_properties()
+        all_time_series_data = self.forward_model_multiple_wavelengths(
+            self.get_detection_geometry(digital_device_twin), wavelengths)
+        for wavelength, time_series_data in zip(wavelengths, all_time_series_data):
+            self.save_time_series_data(time_series_data, wavelength)
+
+        self.logger.info(f"Simulating the acoustic forward process for {len(wavelengths)} wavelengths...[Done]")
@@ -0,0 +1,189 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+from typing import Tuple
+
+import numpy as np
+import torch
+
+from simpa.core.device_digital_twins import DetectionGeometryBase
+from simpa.core.simulation_modules.acoustic_module import AcousticAdapterBase
+from simpa.core.simulation_modules.acoustic_module.k_space_pseudospectral_adapter import (
+    apply_gaussian_frequency_response, compute_k_wave_time_grid)
+from simpa.core.simulation_modules.acoustic_module.system_matrix_adapter import (
+    VOXEL_KERNEL_WIDTH, get_detector_element_samples_mm)
+from simpa.io_handling.io_hdf5 import load_data_field, save_hdf5
+from simpa.utils import Tags
+from simpa.utils.processing_device import get_processing_device
+
+
+class AnalyticPointSourceAdapter(AcousticAdapterBase):
+    """
+    The AnalyticPointSourceAdapter computes the time series data in a homogeneous, lossless medium by summing the
+    analytic spherical wave of every voxel at every detector element. It is the forward counterpart of delay and sum
+    and does not need MATLAB or a full-wave solver.
+
+    Every voxel is modelled as a spherical Gaussian source as in the AcousticSystemMatrixAdapter, but the signals are
+    computed on the fly in chunks of voxels with torch, on the GPU if Tags.GPU is set, so that no matrix has to be
+    stored. Voxels without initial pressure are skipped. The detector elements integrate the pressure over their
+    surface, which models their size and directivity. If Tags.MODEL_SENSOR_FREQUENCY_RESPONSE is set, the Gaussian
+    frequency response of the elements is applied as well.
+    For 2D simulations, only the imaging plane (see `get_image_slice`) is read from the file.
+    The adapter reads::
+
+        The initial pressure distribution:
+            Tags.DATA_FIELD_INITIAL_PRESSURE
+        Acoustic tissue properties:
+            Tags.DATA_FIELD_SPEED_OF_SOUND (the given value or the mean of the imaging plane)
+        Other parameters:
+            Tags.SPACING_MM
+            Tags.GPU
+            Tags.ACOUSTIC_SIMULATION_3D
+            Tags.MODEL_SENSOR_FREQUENCY_RESPONSE
+            Tags.ACOUSTIC_MODEL_VOXELS_PER_CHUNK
+    """
+
+    def forward_model(self, detection_geometry: DetectionGeometryBase) -> np.ndarray:
+        """
+        Runs the acoustic forward model and performs reading parameters and values from an hdf5 file
+        before calling the actual algorithm and saves the updated settings afterwards.
+
+        :param detection_geometry:
+        :return: simulated time series data (numpy array)
+        """
+        wavelength = self.global_settings[Tags.WAVELENGTH]
+        file_path = self.global_settings[Tags.SIMPA_OUTPUT_FILE_PATH]
+        detection_geometry.check_settings_prerequisites(self.global_settings)
+        image_slice = self.get_image_slice(detection_geometry)
+        initial_pressure = load_data_field(file_path, Tags.DATA_FIELD_INITIAL_PRESSURE, wavelength=wavelength,
+                                           data_slice=image_slice)
+
+        if Tags.DATA_FIELD_SPEED_OF_SOUND in self.component_settings and \
+                self.component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND]:
+            speed_of_sound = self.component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND]
+        else:
+            speed_of_sound = np.mean(load_data_field(file_path, Tags.DATA_FIELD_SPEED_OF_SOUND, data_slice=image_slice))
+
+        time_series_data, global_settings = self.point_source_acoustic_forward_model(
+            detection_geometry, float(speed_of_sound), initial_pressure, image_slice)
+        save_hdf5(global_settings, global_settings[Tags.SIMPA_OUTPUT_FILE_PATH], "/settings/")
+
+        return time_series_data
+
+    def point_source_acoustic_forward_model(self, detection_geometry: DetectionGeometryBase, speed_of_sound: float,
+                                            initial_pressure: np.ndarray, image_slice=np.s_[:]) -> tuple:
+        """
+        Computes the time series data of the given initial pressure distribution by summing the analytic response of
+        every voxel.
+
+        :param detection_geometry: detection geometry of the device
+        :param speed_of_sound: homogeneous speed of sound in m/s
+        :param initial_pressure: initial pressure distribution in the image slice
+        :param image_slice: slice of the volume that the initial pressure distribution was taken from
+        :return: time_series_data (numpy array): simulated time series data, global_settings (Settings): updated global
+            settings with new entries from the simulation
+        """
+        spacing_mm = self.global_settings[Tags.SPACING_MM]
+        initial_pressure = np.asarray(initial_pressure)
+        dt, number_time_steps = compute_k_wave_time_grid(np.shape(initial_pressure), spacing_mm / 1000,
+                                                         speed_of_sound, detection_geometry.sampling_frequency_MHz)
+        element_samples_mm = get_detector_element_samples_mm(detection_geometry, spacing_mm,
+                                                             self.get_lateral_axis(detection_geometry) is None)
+        if Tags.ACOUSTIC_MODEL_VOXELS_PER_CHUNK in self.component_settings:
+            voxels_per_chunk = self.component_settings[Tags.ACOUSTIC_MODEL_VOXELS_PER_CHUNK]
+        else:
+            voxels_per_chunk = 2048
+
+        voxel_positions_mm = get_voxel_positions_mm(image_slice, np.shape(initial_pressure), spacing_mm)
+        time_series_data = compute_point_source_time_series(initial_pressure.reshape(-1), voxel_positions_mm,
+                                                            element_samples_mm, spacing_mm, speed_of_sound, dt,
+                                                            number_time_steps, voxels_per_chunk,
+                                                            get_processing_device(self.global_settings))
+
+        if Tags.MODEL_SENSOR_FREQUENCY_RESPONSE in self.component_settings and \
+                self.component_settings[Tags.MODEL_SENSOR_FREQUENCY_RESPONSE]:
+            time_series_data = apply_gaussian_frequency_response(time_series_data, 1 / dt,
+                                                                 detection_geometry.center_frequency_Hz,
+                                                                 detection_geometry.bandwidth_percent)
+
+        self.global_settings[Tags.K_WAVE_SPECIFIC_DT] = float(dt)
+        self.global_settings[Tags.K_WAVE_SPECIFIC_NT] = number_time_steps
+        return time_series_data, self.global_settings
+
+
+def get_voxel_positions_mm(image_slice, shape: Tuple, spacing_mm: float) -> np.ndarray:
+    """
+    computes the positions of the voxel centers of a slice of the volume.
+
+    :param image_slice: slice of the volume, e.g. as returned by `get_image_slice`
+    :param shape: shape of the sliced volume
+    :param spacing_mm: spacing of the volume in mm
+    :return: voxel positions in mm with shape (n_voxels, 3) in the order of the flattened slice
+    """
+    image_slice = image_slice if isinstance(image_slice, tuple) else (image_slice, )
+    image_slice = image_slice + (slice(None), ) * (3 - len(image_slice))
+    sizes = iter(shape)
+    axes = []
+    for index in image_slice:
+        if isinstance(index, slice):
+            axes.append(np.arange(next(sizes)) * (index.step or 1) + (index.start or 0))
+        else:
+            axes.append(np.array([index]))
+    voxel_indices = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1)
+    return ((voxel_indices + 0.5) * spacing_mm).reshape(-1, 3)
+
+
+def compute_point_source_time_series(initial_pressure: np.ndarray, voxel_positions_mm: np.ndarray,
+                                     element_samples_mm: np.ndarray, spacing_mm: float, speed_of_sound: float,
+                                     dt: float, number_time_steps: int, voxels_per_chunk: int = 2048,
+                                     torch_device: torch.device = torch.device("cpu")) -> np.ndarray:
+    """
+    computes the time series data of the detector elements in a homogeneous, lossless medium with the same
+    Gaussian voxel model as `compute_acoustic_system_matrix`, without assembling the matrix. The signals of all
+    element samples are computed for a chunk of voxels at once and accumulated into the time series.
+
+    :param initial_pressure: initial pressure of the voxels, shape (n_voxels, )
+    :param voxel_positions_mm: positions of the voxel centers in mm, shape (n_voxels, 3)
+    :param element_samples_mm: sample positions on the detector elements in mm, shape (n_elements, n_samples, 3)
+    :param spacing_mm: spacing of the volume in mm
+    :param speed_of_sound: speed of sound in m/s
+    :param dt: time step in s
+    :param number_time_steps: number of time steps including t = 0
+    :param voxels_per_chunk: number of voxels that are processed at once
+    :param torch_device: device to compute on
+    :return: time series data of shape (n_elements, number_time_steps)
+    """
+    kernel_width = VOXEL_KERNEL_WIDTH * spacing_mm
+    amplitude = spacing_mm ** 3 / ((2 * np.pi) ** 1.5 * kernel_width)
+    step_mm = speed_of_sound * 1000 * dt
+    number_of_elements, number_of_samples = np.shape(element_samples_mm)[:2]
+    support = int(np.ceil(8 * kernel_width / step_mm)) + 2
+
+    sources = np.flatnonzero(initial_pressure)
+    samples = torch.as_tensor(np.reshape(element_samples_mm, (-1, 3)), dtype=torch.float64, device=torch_device)
+    sample_offsets = (torch.arange(number_of_elements * number_of_samples, device=torch_device) //
+                      number_of_samples) * number_time_steps
+    time_series_data = torch.zeros(number_of_elements * number_time_steps, dtype=torch.float64, device=torch_device)
+
+    with torch.no_grad():
+        for start in range(0, len(sources), voxels_per_chunk):
+            chunk = sources[start:start + voxels_per_chunk]
+            positions = torch.as_tensor(voxel_positions_mm[chunk], dtype=torch.float64, device=torch_device)
+            weights = torch.as_tensor(initial_pressure[chunk], dtype=torch.float64, device=torch_device)
+            distance = torch.clamp(torch.cdist(positions, samples, compute_mode="donot_use_mm_for_euclid_dist"),
+                                   min=kernel_width)
+            # the time steps are kept in floating point, as integer tensors are promoted to single precision
+            first_step = torch.floor((distance - 4 * kernel_width) / step_mm - 0.5)
+            scale = weights[:, None] * amplitude / (2 * distance * step_mm * number_of_samples)
+            for offset in range(support):
+                time_steps = first_step + offset
+                retarded_distance = distance - time_steps * step_mm
+                # integral of u g(u) over the sampling interval
+                pressure = scale * (torch.exp(-(retarded_distance - step_mm / 2) ** 2 / (2 * kernel_width ** 2)) -
+                                    torch.exp(-(retarded_distance + step_mm / 2) ** 2 / (2 * kernel_width ** 2)))
+                valid = (time_steps >= 0) & (time_steps < number_time_steps)
+                indices = (sample_offsets[None, :] + time_steps.long())[valid]
+                time_series_data.index_add_(0, indices, pressure[valid])
+
+    return time_series_data.reshape(number_of_elements, number_time_steps).cpu().numpy()
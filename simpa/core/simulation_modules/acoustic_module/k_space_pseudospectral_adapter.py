@@ -0,0 +1,484 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+from typing import List, Tuple, Union
+
+import numpy as np
+import torch
+from scipy.sparse import coo_matrix
+
+from simpa.core.device_digital_twins import DetectionGeometryBase
+from simpa.core.simulation_modules.acoustic_module import AcousticAdapterBase
+from simpa.io_handling.io_hdf5 import load_data_field, save_hdf5
+from simpa.utils import Tags
+
+# number of "gel" voxels added in front of the volume along the depth axis, as in the k-Wave MATLAB scripts
+GEL_LAYER_HEIGHT = 3
+
+
+class KSpacePseudospectralAdapter(AcousticAdapterBase):
+    """
+    The KSpacePseudospectralAdapter solves the acoustic forward problem with a PyTorch implementation of the
+    first-order k-space pseudospectral method used by k-Wave (Treeby and Cox, "k-Wave: MATLAB toolbox for the
+    simulation and reconstruction of photoacoustic wave fields", J. Biomed. Opt. 15(2), 2010).
+    It runs on the CPU within the Python process, i.e. neither MATLAB nor a file handoff is required.
+
+    The adapter uses the same inputs as the `KWaveAdapter`::
+
+        The initial pressure distribution:
+            Tags.DATA_FIELD_INITIAL_PRESSURE
+        Acoustic tissue properties:
+            Tags.DATA_FIELD_SPEED_OF_SOUND
+            Tags.DATA_FIELD_DENSITY
+            Tags.DATA_FIELD_ALPHA_COEFF
+        Other parameters:
+            Tags.SPACING_MM
+            Tags.ACOUSTIC_SIMULATION_3D
+            Tags.KWAVE_PROPERTY_ALPHA_POWER
+            Tags.KWAVE_PROPERTY_PMLSize
+            Tags.KWAVE_PROPERTY_PMLAlpha
+            Tags.KWAVE_PROPERTY_INITIAL_PRESSURE_SMOOTHING
+            Tags.MODEL_SENSOR_FREQUENCY_RESPONSE
+
+    The perfectly matched layer is always added outside of the volume. Power law absorption is modelled without
+    dispersion. The detector elements integrate the pressure along their in-plane width.
+    The time series data has the same layout as the output of the `KWaveAdapter`: one row per detector element and
+    one column per time step, starting with the initial pressure at t = 0.
+    """
+
+    def forward_model(self, detection_geometry: DetectionGeometryBase) -> np.ndarray:
+        """
+        Runs the acoustic forward model and performs reading parameters and values from an hdf5 file
+        before calling the actual algorithm and saves the updated settings afterwards.
+
+        :param detection_geometry:
+        :return: simulated time series data (numpy array)
+        """
+        wavelength = self.global_settings[Tags.WAVELENGTH]
+        file_path = self.global_settings[Tags.SIMPA_OUTPUT_FILE_PATH]
+        detection_geometry.check_settings_prerequisites(self.global_settings)
+        image_slice = self.get_image_slice(detection_geometry)
+        initial_pressure = load_data_field(file_path, Tags.DATA_FIELD_INITIAL_PRESSURE, wavelength=wavelength,
+                                           data_slice=image_slice)
+        acoustic_properties = self.load_acoustic_properties(image_slice)
+
+        time_series_data, global_settings = self.k_space_acoustic_forward_model(
+            detection_geometry,
+            acoustic_properties[Tags.DATA_FIELD_SPEED_OF_SOUND],
+            acoustic_properties[Tags.DATA_FIELD_DENSITY],
+            acoustic_properties[Tags.DATA_FIELD_ALPHA_COEFF],
+            initial_pressure)
+        save_hdf5(global_settings, global_settings[Tags.SIMPA_OUTPUT_FILE_PATH], "/settings/")
+
+        return time_series_data
+
+    def forward_model_multiple_wavelengths(self, detection_geometry: DetectionGeometryBase,
+                                           wavelengths: List) -> List[np.ndarray]:
+        """
+        Propagates the initial pressure distributions of all given wavelengths in one batched run, as the acoustic
+        properties are the same for all wavelengths and the propagation is linear in the initial pressure.
+
+        :param detection_geometry: detection geometry of the device
+        :param wavelengths: wavelengths whose initial pressure distributions are propagated
+        :return: list with the time series pressure data of each wavelength
+        """
+        file_path = self.global_settings[Tags.SIMPA_OUTPUT_FILE_PATH]
+        detection_geometry.check_settings_prerequisites(self.global_settings)
+        image_slice = self.get_image_slice(detection_geometry)
+        initial_pressure = np.stack([load_data_field(file_path, Tags.DATA_FIELD_INITIAL_PRESSURE,
+                                                     wavelength=wavelength, data_slice=image_slice)
+                                     for wavelength in wavelengths])
+        acoustic_properties = self.load_acoustic_properties(image_slice)
+
+        time_series_data, global_settings = self.k_space_acoustic_forward_model(
+            detection_geometry,
+            acoustic_properties[Tags.DATA_FIELD_SPEED_OF_SOUND],
+            acoustic_properties[Tags.DATA_FIELD_DENSITY],
+            acoustic_properties[Tags.DATA_FIELD_ALPHA_COEFF],
+            initial_pressure,
+            batched=True)
+        save_hdf5(global_settings, global_settings[Tags.SIMPA_OUTPUT_FILE_PATH], "/settings/")
+
+        return list(time_series_data)
+
+    def k_space_acoustic_forward_model(self, detection_geometry: DetectionGeometryBase,
+                                       speed_of_sound: Union[float, np.ndarray],
+                                       density: Union[float, np.ndarray],
+                                       alpha_coeff: Union[float, np.ndarray],
+                                       initial_pressure: np.ndarray,
+                                       batched: bool = False) -> tuple:
+        """
+        Runs the acoustic forward model for the given initial pressure and acoustic properties. A 2D simulation is
+        performed if the initial pressure is two-dimensional, in which case the arrays have the axes
+        (lateral, depth) as obtained with `self.get_image_slice`.
+
+        :param detection_geometry: detection geometry of the device
+        :param speed_of_sound: speed of sound in m/s
+        :param density: density in kg/m^3
+        :param alpha_coeff: acoustic attenuation in dB/(MHz^y cm)
+        :param initial_pressure: initial pressure distribution
+        :param batched: if True, the first axis of the initial pressure stacks several initial pressure distributions
+            that are propagated in one run
+        :return: time_series_data (numpy array): simulated time series data with an additional leading axis if
+            batched, global_settings (Settings): updated global settings with new entries from the simulation
+        """
+        spacing_mm = self.global_settings[Tags.SPACING_MM]
+        grid_shape = np.shape(initial_pressure)[1:] if batched else np.shape(initial_pressure)
+        speed_of_sound = np.ones(grid_shape) * speed_of_sound
+        density = np.ones(grid_shape) * density
+        alpha_coeff = np.ones(grid_shape) * alpha_coeff
+        dimensions = len(grid_shape)
+
+        detector_positions_mm = detection_geometry.get_detector_element_positions_accounting_for_device_position_mm()
+        orientations = detection_geometry.get_detector_element_orientations()
+        if dimensions == 2:
+            lateral_axis = self.get_lateral_axis(detection_geometry)
+            detector_positions_mm = detector_positions_mm[:, [lateral_axis, 2]]
+            orientations = orientations[:, [lateral_axis, 2]]
+
+        # add a "gel" layer in front of the volume along the depth axis to reduce Fourier artifacts
+        gel_padding = [(0, 0)] * (dimensions - 1) + [(GEL_LAYER_HEIGHT, 0)]
+        initial_pressure = np.pad(initial_pressure, [(0, 0)] * batched + gel_padding)
+        speed_of_sound = np.pad(speed_of_sound, gel_padding, mode="edge")
+        density = np.pad(density, gel_padding, mode="edge")
+        alpha_coeff = np.pad(alpha_coeff, gel_padding, mode="edge")
+        detector_positions_voxels = detector_positions_mm / spacing_mm
+        detector_positions_voxels[:, -1] += GEL_LAYER_HEIGHT
+
+        spacing_m = spacing_mm / 1000
+        dt, number_time_steps = compute_k_wave_time_grid(np.shape(speed_of_sound), spacing_m, speed_of_sound,
+                                                         detection_geometry.sampling_frequency_MHz)
+
+        pml_size = self.get_setting(Tags.KWAVE_PROPERTY_PMLSize, 20 if dimensions == 2 else 10)
+        pml_size = [int(size) for size in np.broadcast_to(pml_size, (dimensions,))]
+        sensor_matrix = compute_detector_sensor_matrix(
+            detector_positions_voxels=detector_positions_voxels + np.asarray(pml_size),
+            detector_orientations=orientations,
+            detector_element_width_voxels=detection_geometry.detector_element_width_mm / spacing_mm,
+            shape=tuple(np.asarray(np.shape(speed_of_sound)) + 2 * np.asarray(pml_size)))
+
+        time_series_data = simulate_k_space_first_order(
+            initial_pressure=initial_pressure,
+            speed_of_sound=speed_of_sound,
+            density=density,
+            alpha_coeff=alpha_coeff,
+            alpha_power=self.get_setting(Tags.KWAVE_PROPERTY_ALPHA_POWER, 0.0),
+            spacing_m=spacing_m,
+            dt=dt,
+            number_time_steps=number_time_steps,
+            sensor_matrix=sensor_matrix,
+            pml_size=pml_size,
+            pml_alpha=self.get_setting(Tags.KWAVE_PROPERTY_PMLAlpha, 2.0),
+            smooth_initial_pressure=self.get_setting(Tags.KWAVE_PROPERTY_INITIAL_PRESSURE_SMOOTHING, True))
+
+        if self.get_setting(Tags.MODEL_SENSOR_FREQUENCY_RESPONSE, False):
+            time_series_data = apply_gaussian_frequency_response(time_series_data, 1 / dt,
+                                                                 detection_geometry.center_frequency_Hz,
+                                                                 detection_geometry.bandwidth_percent)
+
+        self.global_settings[Tags.K_WAVE_SPECIFIC_DT] = float(dt)
+        self.global_settings[Tags.K_WAVE_SPECIFIC_NT] = number_time_steps
+        return time_series_data, self.global_settings
+
+
+def compute_k_wave_time_grid(shape: Tuple, spacing_m: float, speed_of_sound: np.ndarray,
+                             sampling_frequency_mhz: float) -> Tuple[float, int]:
+    """
+    computes the time step and the number of time steps as done in the k-Wave MATLAB scripts of SIMPA: the waves
+    traverse the grid diagonally and the sampling rate of the device is used unless it exceeds a CFL number of 0.3.
+
+    :param shape: shape of the simulation grid
+    :param spacing_m: isotropic grid spacing in m
+    :param speed_of_sound: speed of sound in m/s
+    :param sampling_frequency_mhz: sampling frequency of the device in MHz
+    :return: time step in s and number of time steps
+    """
+    dt = 1.0 / (sampling_frequency_mhz * 1e6)
+    grid_diagonal_m = np.sqrt(np.sum(np.asarray(shape, dtype=float) ** 2)) * spacing_m
+    if dt / spacing_m * np.mean(speed_of_sound) < 0.3:
+        number_time_steps = int(round(grid_diagonal_m / np.mean(speed_of_sound) / dt))
+    else:
+        dt = 0.3 * spacing_m / np.max(speed_of_sound)
+        number_time_steps = int(np.floor(grid_diagonal_m / np.min(speed_of_sound) / dt)) + 1
+    return dt, number_time_steps
+
+
+def compute_detector_sensor_matrix(detector_positions_voxels: np.ndarray,
+                                   detector_orientations: np.ndarray,
+                                   detector_element_width_voxels: float,
+                                   shape: Tuple) -> coo_matrix:
+    """
+    computes the sparse matrix that maps the flattened pressure field to the signals of the detector elements.
+    Every element averages the pressure along its in-plane width, which is perpendicular to its orientation, using
+    multilinear interpolation between the grid nodes. Grid node `i` is located at `i` voxels.
+
+    :param detector_positions_voxels: positions of the element centers in voxels, shape (n_elements, n_dimensions)
+    :param detector_orientations: orientations of the elements, shape (n_elements, n_dimensions)
+    :param detector_element_width_voxels: width of the elements in voxels
+    :param shape: shape of the simulation grid
+    :return: sparse matrix of shape (n_elements, prod(shape))
+    """
+    dimensions = len(shape)
+    number_of_samples = max(int(np.ceil(detector_element_width_voxels * 2)), 1)
+    offsets = ((np.arange(number_of_samples) + 0.5) / number_of_samples - 0.5) * detector_element_width_voxels
+    rows, columns, values = [], [], []
+    for element_index, (position, orientation) in enumerate(zip(detector_positions_voxels, detector_orientations)):
+        width_direction = _get_width_direction(np.asarray(orientation, dtype=float))
+        for offset in offsets:
+            sample = position + offset * width_direction
+            lower = np.floor(sample).astype(int)
+            fraction = sample - lower
+            for corner in np.ndindex(*([2] * dimensions)):
+                index = lower + np.asarray(corner)
+                weight = np.prod(np.where(np.asarray(corner) == 1, fraction, 1 - fraction))
+                if weight == 0 or np.any(index < 0) or np.any(index >= np.asarray(shape)):
+                    continue
+                rows.append(element_index)
+                columns.append(np.ravel_multi_index(tuple(index), shape))
+                values.append(weight / number_of_samples)
+    return coo_matrix((values, (rows, columns)), shape=(len(detector_positions_voxels), int(np.prod(shape))))
+
+
+def _get_width_direction(orientation: np.ndarray) -> np.ndarray:
+    """
+    returns the in-plane direction perpendicular to the orientation of a detector element. In 3D, the width is
+    assumed to lie within the x-z plane unless the element faces along the y axis.
+
+    :param orientation: orientation of the element
+    :return: unit vector along the width of the element
+    """
+    if np.linalg.norm(orientation) == 0:
+        orientation = np.zeros_like(orientation)
+        orientation[-1] = 1
+    if len(orientation) == 2:
+        direction = np.array([orientation[1], -orientation[0]])
+    else:
+        direction = np.cross(orientation, np.array([0, 1, 0]))
+        if np.linalg.norm(direction) < 1e-10:
+            direction = np.cross(orientation, np.array([0, 0, 1]))
+    return direction / np.linalg.norm(direction)
+
+
+def _get_pml(size: int, pml_size: Tuple, pml_alpha: float, reference_speed_of_sound: float, spacing_m: float,
+             dt: float, staggered: bool) -> np.ndarray:
+    """
+    computes the multiplicative absorption of the perfectly matched layer along one axis as defined by k-Wave.
+
+    :param size: number of grid nodes along the axis including the PML
+    :param pml_size: number of PML nodes on each side of the axis
+    :param pml_alpha: absorption of the PML in Nepers per grid point
+    :param reference_speed_of_sound: reference speed of sound in m/s
+    :param spacing_m: grid spacing in m
+    :param dt: time step in s
+    :param staggered: whether the PML is evaluated on the staggered grid
+    :return: multiplicative absorption per half time step
+    """
+    position = np.arange(size, dtype=float) + (0.5 if staggered else 0)
+    absorption = np.zeros(size)
+    if pml_size > 0:
+        left_depth = np.clip((pml_size - position) / pml_size, 0, None)
+        right_depth = np.clip((position - (size - 1 - pml_size)) / pml_size, 0, None)
+        absorption = pml_alpha * reference_speed_of_sound / spacing_m * (left_depth ** 4 + right_depth ** 4)
+    return np.exp(-absorption * dt / 2)
+
+
+def smooth_initial_pressure_distribution(initial_pressure: np.ndarray) -> np.ndarray:
+    """
+    smooths the initial pressure with a radially symmetric Blackman window in the spatial frequency domain and
+    restores its maximum, as done by k-Wave to reduce the Gibbs phenomenon.
+
+    :param initial_pressure: initial pressure
+    :return: smoothed initial pressure
+    """
+    radius_squared = np.zeros(np.shape(initial_pressure))
+    for axis, size in enumerate(np.shape(initial_pressure)):
+        frequency = np.abs(np.fft.fftfreq(size)) * 2
+        radius_squared = radius_squared + np.expand_dims(frequency ** 2, [i for i in range(np.ndim(initial_pressure))
+                                                                         if i != axis])
+    radius = np.sqrt(radius_squared)
+    window = np.where(radius <= 1, 0.42 + 0.5 * np.cos(np.pi * radius) + 0.08 * np.cos(2 * np.pi * radius), 0)
+    smoothed = np.real(np.fft.ifftn(np.fft.fftn(initial_pressure) * window))
+    if np.max(np.abs(smoothed)) > 0:
+        smoothed = smoothed * np.max(np.abs(initial_pressure)) / np.max(np.abs(smoothed))
+    return smoothed
+
+
+def apply_gaussian_frequency_response(time_series_data: np.ndarray, sampling_frequency_hz: float,
+                                      center_frequency_hz: float, bandwidth_percent: float) -> np.ndarray:
+    """
+    filters the time series data with the gaussian frequency response of the detector elements as done by k-Wave.
+
+    :param time_series_data: time series data with time along the last axis
+    :param sampling_frequency_hz: sampling frequency in Hz
+    :param center_frequency_hz: center frequency of the detector in Hz
+    :param bandwidth_percent: full width at half maximum in percent of the center frequency
+    :return: filtered time series data
+    """
+    response = compute_gaussian_frequency_response(np.shape(time_series_data)[-1], sampling_frequency_hz,
+                                                   center_frequency_hz, bandwidth_percent)
+    return np.real(np.fft.ifft(np.fft.fft(time_series_data, axis=-1) * response, axis=-1))
+
+
+def compute_gaussian_frequency_response(number_time_steps: int, sampling_frequency_hz: float,
+                                        center_frequency_hz: float, bandwidth_percent: float) -> np.ndarray:
+    """
+    computes the Gaussian frequency response of the detector elements at the frequencies of `np.fft.fftfreq`.
+
+    :param number_time_steps: number of time steps
+    :param sampling_frequency_hz: sampling frequency in Hz
+    :param center_frequency_hz: center frequency of the detector in Hz
+    :param bandwidth_percent: full width at half maximum in percent of the center frequency
+    :return: frequency response
+    """
+    frequencies = np.fft.fftfreq(number_time_steps, d=1 / sampling_frequency_hz)
+    variance = (bandwidth_percent / 100 * center_frequency_hz / (2 * np.sqrt(2 * np.log(2)))) ** 2
+    return (np.exp(-(frequencies - center_frequency_hz) ** 2 / (2 * variance)) +
+            np.exp(-(frequencies + center_frequency_hz) ** 2 / (2 * variance)))
+
+
+def simulate_k_space_first_order(initial_pressure: np.ndarray,
+                                 speed_of_sound: np.ndarray,
+                                 density: np.ndarray,
+                                 alpha_coeff: np.ndarray,
+                                 alpha_power: float,
+                                 spacing_m: float,
+                                 dt: float,
+                                 number_time_steps: int,
+                                 sensor_matrix: coo_matrix,
+                                 pml_size: List[int],
+                                 pml_alpha: float = 2.0,
+                                 smooth_initial_pressure: bool = True) -> np.ndarray:
+    """
+    simulates the propagation of an initial pressure distribution with the first-order k-space pseudospectral method
+    on a 2D or 3D grid with a perfectly matched layer (PML) added around the grid. The coupled equations for the
+    particle velocity, the split acoustic density and the pressure are integrated on staggered grids using
+    k-space corrected spectral gradients, see kspaceFirstOrder2D/3D of k-Wave.
+
+    :param initial_pressure: initial pressure distribution. Several initial pressure distributions in the same medium,
+        e.g. of different wavelengths, are propagated in one batched run if they are stacked along an additional
+        leading axis.
+    :param speed_of_sound: speed of sound in m/s on the 2D or 3D grid
+    :param density: density in kg/m^3 on the 2D or 3D grid
+    :param alpha_coeff: acoustic attenuation in dB/(MHz^y cm) on the 2D or 3D grid
+    :param alpha_power: exponent y of the power law attenuation
+    :param spacing_m: isotropic grid spacing in m
+    :param dt: time step in s
+    :param number_time_steps: number of recorded time steps including t = 0
+    :param sensor_matrix: sparse matrix mapping the flattened pressure on the grid including the PML to the sensor
+        signals, see `compute_detector_sensor_matrix`
+    :param pml_size: number of PML grid points per side along each axis
+    :param pml_alpha: absorption of the PML in Nepers per grid point
+    :param smooth_initial_pressure: whether to smooth the initial pressure with a Blackman window
+    :return: sensor data with shape (n_sensors, number_time_steps) or (n_sources, n_sensors, number_time_steps) for
+        stacked initial pressure distributions
+    """
+    dimensions = np.ndim(speed_of_sound)
+    batched = np.ndim(initial_pressure) > dimensions
+    initial_pressure = np.reshape(initial_pressure, (-1,) + np.shape(speed_of_sound))
+    number_of_sources = len(initial_pressure)
+    if smooth_initial_pressure:
+        initial_pressure = np.stack([smooth_initial_pressure_distribution(source) for source in initial_pressure])
+    padding = [(size, size) for size in pml_size]
+    initial_pressure = np.pad(initial_pressure, [(0, 0)] + padding)
+    speed_of_sound = np.pad(speed_of_sound, padding, mode="edge")
+    density = np.pad(density, padding, mode="edge")
+    alpha_coeff = np.pad(alpha_coeff, padding, mode="edge")
+    shape = np.shape(speed_of_sound)
+    axes = tuple(range(-dimensions, 0))
+    reference_speed_of_sound = np.max(speed_of_sound)
+
+    def as_tensor(array):
+        return torch.as_tensor(np.ascontiguousarray(array), dtype=torch.float32)
+
+    def expand(vector, axis):
+        return vector.reshape([-1 if i == axis else 1 for i in range(dimensions)])
+
+    # spatial frequencies of the real-to-complex fft
+    wavenumbers = []
+    for axis, size in enumerate(shape):
+        if axis == dimensions - 1:
+            wavenumbers.append(2 * np.pi * np.fft.rfftfreq(size, d=spacing_m))
+        else:
+            wavenumbers.append(2 * np.pi * np.fft.fftfreq(size, d=spacing_m))
+    wavenumber_magnitude = np.sqrt(sum(np.expand_dims(k ** 2, [i for i in range(dimensions) if i != axis])
+                                       for axis, k in enumerate(wavenumbers)))
+    kappa = torch.as_tensor(np.sinc(reference_speed_of_sound * wavenumber_magnitude * dt / (2 * np.pi)),
+                            dtype=torch.complex64)
+    shift_positive = []
+    shift_negative = []
+    for axis, k in enumerate(wavenumbers):
+        shift_positive.append(expand(torch.as_tensor(1j * k * np.exp(1j * k * spacing_m / 2),
+                                                     dtype=torch.complex64), axis) * kappa)
+        shift_negative.append(expand(torch.as_tensor(1j * k * np.exp(-1j * k * spacing_m / 2),
+                                                     dtype=torch.complex64), axis) * kappa)
+
+    def gradient(field_k, operator):
+        return torch.fft.irfftn(field_k * operator, s=shape, dim=axes)
+
+    # medium properties, the density is interpolated onto the staggered grids
+    c_squared = as_tensor(speed_of_sound ** 2)
+    rho0 = as_tensor(density)
+    rho0_staggered = []
+    for axis in range(dimensions):
+        shifted = np.concatenate([np.take(density, np.arange(1, shape[axis]), axis=axis),
+                                  np.take(density, [shape[axis] - 1], axis=axis)], axis=axis)
+        rho0_staggered.append(as_tensor((density + shifted) / 2))
+
+    absorbing = np.any(alpha_coeff > 0)
+    if absorbing:
+        # conversion from dB/(MHz^y cm) to Np/((rad/s)^y m)
+        alpha_np = 100 * alpha_coeff * (1e-6 / (2 * np.pi)) ** alpha_power / (20 * np.log10(np.e))
+        absorb_tau = as_tensor(-2 * alpha_np * speed_of_sound ** (alpha_power - 1))
+        with np.errstate(divide="ignore"):
+            absorb_nabla = wavenumber_magnitude ** (alpha_power - 2)
+        absorb_nabla[~np.isfinite(absorb_nabla)] = 0
+        absorb_nabla = torch.as_tensor(absorb_nabla, dtype=torch.complex64)
+
+    pml = []
+    pml_staggered = []
+    for axis, size in enumerate(shape):
+        pml.append(expand(as_tensor(_get_pml(size, pml_size[axis], pml_alpha, reference_speed_of_sound, spacing_m,
+                                             dt, staggered=False)), axis))
+        pml_staggered.append(expand(as_tensor(_get_pml(size, pml_size[axis], pml_alpha, reference_speed_of_sound,
+                                                       spacing_m, dt, staggered=True)), axis))
+
+    sensor_matrix = sensor_matrix.tocoo()
+    sensor = torch.sparse_coo_tensor(torch.as_tensor(np.vstack([sensor_matrix.row, sensor_matrix.col])),
+                                     torch.as_tensor(sensor_matrix.data, dtype=torch.float32),
+                                     size=sensor_matrix.shape).coalesce()
+    sensor_data = torch.zeros((number_of_sources, sensor_matrix.shape[0], number_time_steps), dtype=torch.float32)
+
+    def record(field):
+        return torch.sparse.mm(sensor, field.reshape(number_of_sources, -1).T).T
+
+    with torch.no_grad():
+        # initial conditions: u(-dt/2) is chosen such that u(0) = 0, see kspaceFirstOrder2D/3D
+        pressure = as_tensor(initial_pressure)
+        pressure_k = torch.fft.rfftn(pressure, dim=axes)
+        density_split = [pressure / (dimensions * c_squared) for _ in range(dimensions)]
+        velocity = [dt / (2 * rho0_staggered[axis]) * gradient(pressure_k, shift_positive[axis])
+                    for axis in range(dimensions)]
+        sensor_data[:, :, 0] = record(pressure)
+
+        for time_step in range(1, number_time_steps):
+            for axis in range(dimensions):
+                velocity[axis] = pml_staggered[axis] * (pml_staggered[axis] * velocity[axis] - dt /
+                                                        rho0_staggered[axis] *
+                                                        gradient(pressure_k, shift_positive[axis]))
+            divergence = torch.zeros_like(pressure)
+            for axis in range(dimensions):
+                velocity_gradient = gradient(torch.fft.rfftn(velocity[axis], dim=axes), shift_negative[axis])
+                density_split[axis] = pml[axis] * (pml[axis] * density_split[axis] - dt * rho0 * velocity_gradient)
+                divergence = divergence + velocity_gradient
+            total_density = sum(density_split)
+            if absorbing:
+                total_density = total_density + absorb_tau * torch.fft.irfftn(
+                    absorb_nabla * torch.fft.rfftn(rho0 * divergence, dim=axes), s=shape, dim=axes)
+            pressure = c_squared * total_density
+            pressure_k = torch.fft.rfftn(pressure, dim=axes)
+            sensor_data[:, :, time_step] = record(pressure)
+
+    if batched:
+        return sensor_data.numpy()
+    return sensor_data[0].numpy()
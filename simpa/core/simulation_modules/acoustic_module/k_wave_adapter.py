@@ -7,16 +7,21 @@ import os
 import subprocess
 
 import numpy as np
-import scipy.io as sio
 from scipy.spatial.transform import Rotation
 
 from simpa.core.device_digital_twins import (CurvedArrayDetectionGeometry,
                                              DetectionGeometryBase)
 from simpa.core.simulation_modules.acoustic_module import \
     AcousticAdapterBase
+from simpa.core.simulation_modules.acoustic_module.k_space_pseudospectral_adapter import (
+    GEL_LAYER_HEIGHT, apply_gaussian_frequency_response, compute_detector_sensor_matrix, compute_k_wave_time_grid,
+    smooth_initial_pressure_distribution)
+from simpa.core.simulation_modules.acoustic_module.k_wave_binary_io import (get_sensor_mask_index,
+                                                                            read_k_wave_binary_output_file,
+                                                                            write_k_wave_binary_input_file)
 from simpa.io_handling.io_hdf5 import load_data_field, save_hdf5
 from simpa.utils import Tags
-from simpa.utils.matlab import generate_matlab_cmd
+from simpa.utils.matlab import generate_matlab_cmd, load_mat_v73, save_mat_v73
 from simpa.utils.calculate import rotation_matrix_between_vectors
 from simpa.utils.dict_path_manager import generate_dict_path
 from simpa.utils.path_manager import PathManager
@@ -31,6 +36,9 @@ class KWaveAdapter(AcousticAdapterBase):
 
     In order to use this toolbox, MATLAB needs to be installed on your system and the path to the
     MATLAB binary needs to be specified in the settings dictionary.
+    Alternatively, the simulation can be run with the multi-threaded k-Wave C++ code by setting Tags.K_WAVE_BACKEND
+    to Tags.K_WAVE_BACKEND_BINARY and pointing Tags.ACOUSTIC_MODEL_BINARY_PATH to the executable
+    (e.g. kspaceFirstOrder-OMP).
 
     In order to use the toolbox from with SIMPA, a number of parameters have to be specified in the
     settings dictionary::
@@ -82,38 +90,22 @@ class KWaveAdapter(AcousticAdapterBase):
 
         self.logger.debug(f"OPTICAL_PATH: {str(optical_path)}")
 
-        data_dict = {}
-        file_path = self.global_settings[Tags.SIMPA_OUTPUT_FILE_PATH]
-        data_dict[Tags.DATA_FIELD_INITIAL_PRESSURE] = load_data_field(file_path, Tags.DATA_FIELD_INITIAL_PRESSURE,
-                                                                      wavelength=wavelength)
-        data_dict[Tags.DATA_FIELD_SPEED_OF_SOUND] = load_data_field(file_path, Tags.DATA_FIELD_SPEED_OF_SOUND)
-        data_dict[Tags.DATA_FIELD_DENSITY] = load_data_field(file_path, Tags.DATA_FIELD_DENSITY)
-        data_dict[Tags.DATA_FIELD_ALPHA_COEFF] = load_data_field(file_path, Tags.DATA_FIELD_ALPHA_COEFF)
-
         pa_device = detection_geometry
         pa_device.check_settings_prerequisites(self.global_settings)
-        field_of_view_extent = pa_device.field_of_view_extent_mm
-        detector_positions_mm = pa_device.get_detector_element_positions_accounting_for_device_position_mm()
-        self.logger.debug(f"field_of_view_extent: {field_of_view_extent}")
+        self.logger.debug(f"field_of_view_extent: {pa_device.field_of_view_extent_mm}")
 
-        detectors_are_aligned_along_x_axis = field_of_view_extent[2] == 0 and field_of_view_extent[3] == 0
-        detectors_are_aligned_along_y_axis = field_of_view_extent[0] == 0 and field_of_view_extent[1] == 0
-        if not (Tags.ACOUSTIC_SIMULATION_3D in self.component_settings
-                and self.component_settings[Tags.ACOUSTIC_SIMULATION_3D]) and \
-                (detectors_are_aligned_along_x_axis or detectors_are_aligned_along_y_axis):
-            if detectors_are_aligned_along_y_axis:
-                transducer_plane = int(round((detector_positions_mm[0, 0] / self.global_settings[Tags.SPACING_MM]))) - 1
-                image_slice = np.s_[transducer_plane, :, :]
-            else:
-                transducer_plane = int(round((detector_positions_mm[0, 1] / self.global_settings[Tags.SPACING_MM]))) - 1
-                image_slice = np.s_[:, transducer_plane, :]
-        else:
-            image_slice = np.s_[:]
+        # for 2D simulations, only the transducer plane is read from the file
+        image_slice = self.get_image_slice(pa_device)
+        file_path = self.global_settings[Tags.SIMPA_OUTPUT_FILE_PATH]
+        acoustic_properties = self.load_acoustic_properties(image_slice)
 
-        data_dict[Tags.DATA_FIELD_SPEED_OF_SOUND] = data_dict[Tags.DATA_FIELD_SPEED_OF_SOUND][image_slice].T
-        data_dict[Tags.DATA_FIELD_DENSITY] = data_dict[Tags.DATA_FIELD_DENSITY][image_slice].T
-        data_dict[Tags.DATA_FIELD_ALPHA_COEFF] = data_dict[Tags.DATA_FIELD_ALPHA_COEFF][image_slice].T
-        data_dict[Tags.DATA_FIELD_INITIAL_PRESSURE] = data_dict[Tags.DATA_FIELD_INITIAL_PRESSURE][image_slice].T
+        data_dict = {}
+        data_dict[Tags.DATA_FIELD_SPEED_OF_SOUND] = acoustic_properties[Tags.DATA_FIELD_SPEED_OF_SOUND].T
+        data_dict[Tags.DATA_FIELD_DENSITY] = acoustic_properties[Tags.DATA_FIELD_DENSITY].T
+        data_dict[Tags.DATA_FIELD_ALPHA_COEFF] = acoustic_properties[Tags.DATA_FIELD_ALPHA_COEFF].T
+        data_dict[Tags.DATA_FIELD_INITIAL_PRESSURE] = load_data_field(file_path, Tags.DATA_FIELD_INITIAL_PRESSURE,
+                                                                      wavelength=wavelength,
+                                                                      data_slice=image_slice).T
 
         time_series_data, global_settings = self.k_wave_acoustic_forward_model(
             detection_geometry,
@@ -166,9 +158,10 @@ class KWaveAdapter(AcousticAdapterBase):
         else:
             simulate_2d = False
 
-        data_dict[Tags.DATA_FIELD_SPEED_OF_SOUND] = np.ones_like(initial_pressure) * speed_of_sound
-        data_dict[Tags.DATA_FIELD_DENSITY] = np.ones_like(initial_pressure) * density
-        data_dict[Tags.DATA_FIELD_ALPHA_COEFF] = np.ones_like(initial_pressure) * alpha_coeff
+        # broadcasting does not copy the maps if they already have the shape of the initial pressure
+        data_dict[Tags.DATA_FIELD_SPEED_OF_SOUND] = np.broadcast_to(speed_of_sound, np.shape(initial_pressure))
+        data_dict[Tags.DATA_FIELD_DENSITY] = np.broadcast_to(density, np.shape(initial_pressure))
+        data_dict[Tags.DATA_FIELD_ALPHA_COEFF] = np.broadcast_to(alpha_coeff, np.shape(initial_pressure))
         data_dict[Tags.DATA_FIELD_INITIAL_PRESSURE] = initial_pressure
 
         if simulate_2d:
@@ -197,6 +190,10 @@ class KWaveAdapter(AcousticAdapterBase):
             data_dict[Tags.KWAVE_PROPERTY_DIRECTIVITY_ANGLE] = angles
             data_dict[Tags.KWAVE_PROPERTY_INTRINSIC_EULER_ANGLE] = intrinsic_euler_angles
 
+        if Tags.K_WAVE_BACKEND in self.component_settings and \
+                self.component_settings[Tags.K_WAVE_BACKEND] == Tags.K_WAVE_BACKEND_BINARY:
+            return self.k_wave_binary_acoustic_forward_model(pa_device, data_dict, optical_path)
+
         optical_path = optical_path + ".mat"
         optical_path = os.path.abspath(optical_path)
 
@@ -226,7 +223,10 @@ class KWaveAdapter(AcousticAdapterBase):
                 self.logger.warning(f"Did not find parameter {parameter} in any settings.")
 
         data_dict["settings"] = k_wave_settings
-        sio.savemat(optical_path, data_dict, long_field_names=True)
+        save_mat_v73(optical_path, data_dict, single_precision_fields=[Tags.DATA_FIELD_INITIAL_PRESSURE,
+                                                                       Tags.DATA_FIELD_SPEED_OF_SOUND,
+                                                                       Tags.DATA_FIELD_DENSITY,
+                                                                       Tags.DATA_FIELD_ALPHA_COEFF])
 
         del data_dict, k_wave_settings, detector_positions_mm, pa_device
         gc.collect()
@@ -245,11 +245,11 @@ class KWaveAdapter(AcousticAdapterBase):
         self.logger.info(cmd)
         subprocess.run(cmd)
 
-        raw_time_series_data = sio.loadmat(optical_path)[Tags.DATA_FIELD_TIME_SERIES_DATA]
-        time_grid = sio.loadmat(optical_path + "dt.mat")
-        num_time_steps = int(np.round(time_grid["number_time_steps"]))
+        raw_time_series_data = load_mat_v73(optical_path, Tags.DATA_FIELD_TIME_SERIES_DATA)
+        num_time_steps = int(np.round(load_mat_v73(optical_path + "dt.mat", "number_time_steps").item()))
 
-        self.global_settings[Tags.K_WAVE_SPECIFIC_DT] = float(time_grid["time_step"])
+        self.global_settings[Tags.K_WAVE_SPECIFIC_DT] = float(load_mat_v73(optical_path + "dt.mat",
+                                                                           "time_step").item())
         self.global_settings[Tags.K_WAVE_SPECIFIC_NT] = num_time_steps
 
         os.remove(optical_path)
@@ -258,6 +258,96 @@ class KWaveAdapter(AcousticAdapterBase):
 
         return raw_time_series_data, self.global_settings
 
+    def k_wave_binary_acoustic_forward_model(self, detection_geometry: DetectionGeometryBase, data_dict: dict,
+                                             optical_path: str) -> tuple:
+        """
+        Runs the acoustic forward model with the k-Wave C++ code. The HDF5 input file is written next to the
+        `optical_path`, the executable given by Tags.ACOUSTIC_MODEL_BINARY_PATH is run and the pressure recorded at
+        the sensor points is read from the HDF5 output file.
+        As the C++ code only supports binary sensor masks, the detector elements are encoded as the grid points that
+        are required to integrate the pressure along the element width. The recorded signals are combined per
+        element after the simulation, which accounts for the directivity of the elements. The frequency response of
+        the elements is applied after the simulation as well.
+
+        :param detection_geometry: detection geometry of the device
+        :param data_dict: dictionary with the acoustic properties and the initial pressure in the axis order of the
+            k-Wave MATLAB scripts and the detector element positions in mm
+        :param optical_path: path used for the temporary files
+        :return: time_series_data (numpy array): simulated time series data, global_settings (Settings): updated global
+            settings with new entries from the simulation
+        """
+        initial_pressure = data_dict[Tags.DATA_FIELD_INITIAL_PRESSURE]
+        dimensions = np.ndim(initial_pressure)
+        spacing_mm = self.global_settings[Tags.SPACING_MM]
+        spacing_m = spacing_mm / 1000
+
+        orientations = detection_geometry.get_detector_element_orientations()
+        orientations = orientations[:, [2, 0]] if dimensions == 2 else orientations[:, [2, 1, 0]]
+        detector_positions_voxels = np.moveaxis(np.asarray(data_dict[Tags.SENSOR_ELEMENT_POSITIONS]), 0, 1) / spacing_mm
+
+        # add a "gel" layer in front of the volume along the depth axis to reduce Fourier artifacts
+        gel_padding = [(GEL_LAYER_HEIGHT, 0)] + [(0, 0)] * (dimensions - 1)
+        if self.get_setting(Tags.KWAVE_PROPERTY_INITIAL_PRESSURE_SMOOTHING, True):
+            initial_pressure = smooth_initial_pressure_distribution(initial_pressure)
+        initial_pressure = np.pad(initial_pressure, gel_padding)
+        speed_of_sound, density, alpha_coeff = [np.pad(data_dict[field], gel_padding, mode="edge") for field in
+                                                [Tags.DATA_FIELD_SPEED_OF_SOUND, Tags.DATA_FIELD_DENSITY,
+                                                 Tags.DATA_FIELD_ALPHA_COEFF]]
+        detector_positions_voxels[:, 0] += GEL_LAYER_HEIGHT
+        dt, number_time_steps = compute_k_wave_time_grid(np.shape(initial_pressure), spacing_m, speed_of_sound,
+                                                         detection_geometry.sampling_frequency_MHz)
+
+        # the perfectly matched layer of the C++ code lies inside the grid
+        pml_size = self.get_setting(Tags.KWAVE_PROPERTY_PMLSize, 20 if dimensions == 2 else 10)
+        pml_size = [int(size) for size in np.broadcast_to(pml_size, (dimensions,))]
+        if not self.get_setting(Tags.KWAVE_PROPERTY_PMLInside, False):
+            padding = [(size, size) for size in pml_size]
+            initial_pressure = np.pad(initial_pressure, padding)
+            speed_of_sound, density, alpha_coeff = [np.pad(field, padding, mode="edge") for field in
+                                                    [speed_of_sound, density, alpha_coeff]]
+            detector_positions_voxels += np.asarray(pml_size)
+
+        shape = np.shape(initial_pressure)
+        sensor_matrix = compute_detector_sensor_matrix(detector_positions_voxels, orientations,
+                                                       detection_geometry.detector_element_width_mm / spacing_mm,
+                                                       shape)
+        sensor_mask_index, combination_matrix = get_sensor_mask_index(sensor_matrix, shape)
+
+        input_file_path = os.path.abspath(optical_path + "_k_wave_input.h5")
+        output_file_path = os.path.abspath(optical_path + "_k_wave_output.h5")
+        write_k_wave_binary_input_file(input_file_path,
+                                       initial_pressure=initial_pressure,
+                                       speed_of_sound=speed_of_sound,
+                                       density=density,
+                                       alpha_coeff=alpha_coeff,
+                                       alpha_power=self.get_setting(Tags.KWAVE_PROPERTY_ALPHA_POWER, 0.0),
+                                       spacing_m=spacing_m,
+                                       dt=dt,
+                                       number_time_steps=number_time_steps,
+                                       sensor_mask_index=sensor_mask_index,
+                                       pml_size=pml_size,
+                                       pml_alpha=self.get_setting(Tags.KWAVE_PROPERTY_PMLAlpha, 2.0))
+
+        cmd = [self.component_settings[Tags.ACOUSTIC_MODEL_BINARY_PATH], "-i", input_file_path,
+               "-o", output_file_path, "--p_raw"] + self.get_additional_flags()
+        self.logger.info(cmd)
+        try:
+            subprocess.run(cmd, check=True)
+            time_series_data = combination_matrix @ read_k_wave_binary_output_file(output_file_path)
+        finally:
+            for file_path in [input_file_path, output_file_path]:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+
+        if self.get_setting(Tags.MODEL_SENSOR_FREQUENCY_RESPONSE, False):
+            time_series_data = apply_gaussian_frequency_response(time_series_data, 1 / dt,
+                                                                 detection_geometry.center_frequency_Hz,
+                                                                 detection_geometry.bandwidth_percent)
+
+        self.global_settings[Tags.K_WAVE_SPECIFIC_DT] = float(dt)
+        self.global_settings[Tags.K_WAVE_SPECIFIC_NT] = number_time_steps
+        return time_series_data, self.global_settings
+
 
 def perform_k_wave_acoustic_forward_simulation(initial_pressure: np.array,
                                                detection_geometry: DetectionGeometryBase,
@@ -0,0 +1,166 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+"""
+Reading and writing of the HDF5 input and output files of the k-Wave C++ code (kspaceFirstOrder-OMP and
+kspaceFirstOrder-CUDA), file format version 1.2.
+All arrays are given in (x, y[, z]) order and are stored with reversed dimensions, i.e. in the column-major layout
+used by MATLAB. Scalars are stored as arrays of shape (1, 1, 1).
+"""
+
+import time
+from typing import List, Tuple
+
+import h5py
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+
+
+def _write_dataset(file: h5py.File, name: str, value, data_type: str = "float") -> None:
+    """
+    writes a dataset with the attributes required by k-Wave.
+
+    :param file: open HDF5 file
+    :param name: name of the dataset
+    :param value: scalar or array in (x, y[, z]) order
+    :param data_type: "float" for single precision values or "long" for unsigned integers
+    """
+    array = np.asarray(value, dtype=np.float32 if data_type == "float" else np.uint64)
+    array = array.reshape(array.shape + (1,) * (3 - array.ndim))
+    file.create_dataset(name, data=np.ascontiguousarray(array.transpose()))
+    file[name].attrs["data_type"] = np.bytes_(data_type)
+    file[name].attrs["domain_type"] = np.bytes_("real")
+
+
+def _staggered(volume: np.ndarray, axis: int) -> np.ndarray:
+    """
+    interpolates a volume onto the grid that is staggered by half a grid point along the given axis.
+
+    :param volume: volume
+    :param axis: axis along which the grid is staggered
+    :return: staggered volume
+    """
+    shifted = np.concatenate([np.take(volume, np.arange(1, volume.shape[axis]), axis=axis),
+                              np.take(volume, [volume.shape[axis] - 1], axis=axis)], axis=axis)
+    return (volume + shifted) / 2
+
+
+def _homogeneous_or_volume(volume: np.ndarray):
+    """
+    returns a scalar for homogeneous volumes, as k-Wave accepts both.
+    """
+    if np.all(volume == volume.flat[0]):
+        return volume.flat[0]
+    return volume
+
+
+def get_sensor_mask_index(sensor_matrix: coo_matrix, shape: Tuple) -> Tuple[np.ndarray, csr_matrix]:
+    """
+    converts a sensor matrix that maps the C-ordered flattened pressure to the detector elements into a k-Wave
+    sensor mask and a matrix that combines the recorded sensor points into the signals of the detector elements.
+
+    :param sensor_matrix: sparse matrix of shape (n_elements, prod(shape))
+    :param shape: shape of the simulation grid
+    :return: 1-based column-major linear indices of the sensor points in ascending order and the combination matrix of
+        shape (n_elements, n_sensor_points)
+    """
+    sensor_matrix = csr_matrix(sensor_matrix)
+    columns = np.unique(sensor_matrix.nonzero()[1])
+    column_major_index = np.ravel_multi_index(np.unravel_index(columns, shape), shape, order="F")
+    order = np.argsort(column_major_index)
+    return column_major_index[order] + 1, sensor_matrix[:, columns[order]]
+
+
+def write_k_wave_binary_input_file(file_path: str,
+                                   initial_pressure: np.ndarray,
+                                   speed_of_sound: np.ndarray,
+                                   density: np.ndarray,
+                                   alpha_coeff: np.ndarray,
+                                   alpha_power: float,
+                                   spacing_m: float,
+                                   dt: float,
+                                   number_time_steps: int,
+                                   sensor_mask_index: np.ndarray,
+                                   pml_size: List[int],
+                                   pml_alpha: float) -> None:
+    """
+    writes a k-Wave C++ input file for an initial value problem recorded with a binary sensor mask.
+    The perfectly matched layer lies inside the given grid.
+
+    :param file_path: path of the HDF5 input file
+    :param initial_pressure: initial pressure in Pa on the 2D or 3D grid
+    :param speed_of_sound: speed of sound in m/s
+    :param density: density in kg/m^3
+    :param alpha_coeff: acoustic attenuation in dB/(MHz^y cm)
+    :param alpha_power: exponent y of the power law attenuation
+    :param spacing_m: isotropic grid spacing in m
+    :param dt: time step in s
+    :param number_time_steps: number of time steps
+    :param sensor_mask_index: 1-based column-major linear indices of the sensor points
+    :param pml_size: number of PML grid points per side along each axis
+    :param pml_alpha: absorption of the PML in Nepers per grid point
+    """
+    dimensions = np.ndim(initial_pressure)
+    axes = ["x", "y", "z"][:dimensions]
+    shape = list(np.shape(initial_pressure)) + [1] * (3 - dimensions)
+    absorbing = bool(np.any(alpha_coeff > 0))
+
+    with h5py.File(file_path, "w") as file:
+        file.attrs["created_by"] = np.bytes_("SIMPA")
+        file.attrs["creation_date"] = np.bytes_(time.strftime("%d-%b-%Y-%H-%M-%S"))
+        file.attrs["file_description"] = np.bytes_("k-Wave input file written by SIMPA")
+        file.attrs["file_type"] = np.bytes_("input")
+        file.attrs["major_version"] = np.bytes_("1")
+        file.attrs["minor_version"] = np.bytes_("2")
+
+        # simulation flags
+        for axis in axes:
+            _write_dataset(file, f"u{axis}_source_flag", 0, "long")
+        for flag in ["p_source_flag", "transducer_source_flag", "nonuniform_grid_flag", "nonlinear_flag",
+                     "axisymmetric_flag"]:
+            _write_dataset(file, flag, 0, "long")
+        _write_dataset(file, "p0_source_flag", 1, "long")
+        _write_dataset(file, "absorbing_flag", int(absorbing), "long")
+
+        # grid
+        for axis, size in zip(["x", "y", "z"], shape):
+            _write_dataset(file, f"N{axis}", size, "long")
+        _write_dataset(file, "Nt", number_time_steps, "long")
+        _write_dataset(file, "dt", dt)
+        for axis in axes:
+            _write_dataset(file, f"d{axis}", spacing_m)
+
+        # medium
+        _write_dataset(file, "c0", _homogeneous_or_volume(speed_of_sound))
+        _write_dataset(file, "c_ref", np.max(speed_of_sound))
+        _write_dataset(file, "rho0", _homogeneous_or_volume(density))
+        for axis_index, axis in enumerate(axes):
+            _write_dataset(file, f"rho0_sg{axis}", _homogeneous_or_volume(_staggered(density, axis_index)))
+        if absorbing:
+            _write_dataset(file, "alpha_coeff", _homogeneous_or_volume(alpha_coeff))
+            _write_dataset(file, "alpha_power", alpha_power)
+
+        # sensor
+        _write_dataset(file, "sensor_mask_type", 0, "long")
+        _write_dataset(file, "sensor_mask_index", np.asarray(sensor_mask_index).reshape(-1), "long")
+
+        # source
+        _write_dataset(file, "p0_source_input", initial_pressure)
+
+        # perfectly matched layer
+        for axis, size in zip(axes, pml_size):
+            _write_dataset(file, f"pml_{axis}_size", size, "long")
+            _write_dataset(file, f"pml_{axis}_alpha", pml_alpha)
+
+
+def read_k_wave_binary_output_file(file_path: str) -> np.ndarray:
+    """
+    reads the pressure recorded at the sensor points from a k-Wave C++ output file.
+
+    :param file_path: path of the HDF5 output file
+    :return: pressure with shape (n_sensor_points, n_time_steps)
+    """
+    with h5py.File(file_path, "r") as file:
+        pressure = file["p"][()]
+    return pressure.reshape(pressure.shape[-2], pressure.shape[-1]).T
@@ -78,9 +78,9 @@ end
 dt = 1.0 / double(settings.sensor_sampling_rate_mhz * 1000000);
 
 % Simulate as many time steps as a wave takes to traverse diagonally through the entire tissue
-Nt = round((sqrt(Ny*Ny+Nx*Nx)*dx / mean(medium.sound_speed, 'all')) / dt);
+Nt = round((sqrt(Ny*Ny+Nx*Nx)*dx / double(mean(medium.sound_speed, 'all'))) / dt);
 
-estimated_cfl_number = dt / dx * mean(medium.sound_speed, 'all');
+estimated_cfl_number = dt / dx * double(mean(medium.sound_speed, 'all'));
 disp(estimated_cfl_number);
 
 % smaller time steps are better for numerical stability in time progressing simulations
@@ -164,9 +164,9 @@ end
 time_series_data = karray.combineSensorData(kgrid, time_series_data);
 
 %% Write data to mat array
-save(optical_path, 'time_series_data')%, '-v7.3')
+save(optical_path, 'time_series_data', '-v7.3')
 time_step = kgrid.dt
 number_time_steps = kgrid.Nt
-save(strcat(optical_path, 'dt.mat'), 'time_step', 'number_time_steps');
+save(strcat(optical_path, 'dt.mat'), 'time_step', 'number_time_steps', '-v7.3');
 
 end
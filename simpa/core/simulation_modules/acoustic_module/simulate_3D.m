@@ -79,9 +79,9 @@ end
 dt = 1.0 / double(settings.sensor_sampling_rate_mhz * 1000000);
 
 % Simulate as many time steps as a wave takes to traverse diagonally through the entire tissue
-Nt = round((sqrt(Ny*Ny+Nx*Nx+Nz*Nz)*dx / mean(medium.sound_speed, 'all')) / dt);
+Nt = round((sqrt(Ny*Ny+Nx*Nx+Nz*Nz)*dx / double(mean(medium.sound_speed, 'all'))) / dt);
 
-estimated_cfl_number = dt / dx * mean(medium.sound_speed, 'all');
+estimated_cfl_number = dt / dx * double(mean(medium.sound_speed, 'all'));
 
 % smaller time steps are better for numerical stability in time progressing simulations
 % A minimum CFL of 0.3 is advised in the kwave handbook.
@@ -165,9 +165,9 @@ end
 time_series_data = karray.combineSensorData(kgrid, time_series_data);
 
 %% Write data to mat array
-save(optical_path, 'time_series_data')%, '-v7.3')
+save(optical_path, 'time_series_data', '-v7.3')
 time_step = kgrid.dt;
 number_time_steps = kgrid.Nt;
-save(strcat(optical_path, 'dt.mat'), 'time_step', 'number_time_steps');
+save(strcat(optical_path, 'dt.mat'), 'time_step', 'number_time_steps', '-v7.3');
 
 end
\ No newline at end of file
@@ -0,0 +1,271 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import json
+import os
+from typing import Tuple
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix, identity, kron, load_npz, save_npz
+
+from simpa.core.device_digital_twins import DetectionGeometryBase
+from simpa.core.simulation_modules.acoustic_module import AcousticAdapterBase
+from simpa.core.simulation_modules.acoustic_module.k_space_pseudospectral_adapter import (
+    _get_width_direction, compute_gaussian_frequency_response, compute_k_wave_time_grid)
+from simpa.io_handling.io_hdf5 import load_data_field, save_hdf5
+from simpa.utils import Tags
+
+# standard deviation of the Gaussian that represents a voxel in the system matrix, in voxels
+VOXEL_KERNEL_WIDTH = 0.7
+
+
+class AcousticSystemMatrixAdapter(AcousticAdapterBase):
+    """
+    The AcousticSystemMatrixAdapter models the acoustic forward problem in a homogeneous, lossless medium as a
+    sparse matrix that maps the initial pressure of every voxel to the time samples of every detector element.
+    Once the matrix is built for a device and a grid, the time series data of a phantom is obtained with a single
+    sparse matrix-vector product.
+
+    The matrix is assembled from the analytic solution for a spherical Gaussian source per voxel, averaged over the
+    time sampling interval. The detector elements integrate the
+    pressure over their surface, which models their size and directivity. If Tags.MODEL_SENSOR_FREQUENCY_RESPONSE
+    is set, the Gaussian frequency response of the elements is applied to the matrix as well.
+    For 2D simulations, only the voxels in the imaging plane (see `get_image_slice`) contribute to the signals.
+
+    The matrices are cached in memory and, if Tags.ACOUSTIC_SYSTEM_MATRIX_CACHE_PATH is given, on disk. They are
+    identified by the positions, orientations and sizes of the detector elements, their sampling frequency and
+    frequency response, the grid and the speed of sound, so that the cache on disk is reused across sessions.
+    The adapter reads::
+
+        The initial pressure distribution:
+            Tags.DATA_FIELD_INITIAL_PRESSURE
+        Acoustic tissue properties:
+            Tags.DATA_FIELD_SPEED_OF_SOUND (the given value or the mean of the volume)
+        Other parameters:
+            Tags.SPACING_MM
+            Tags.ACOUSTIC_SIMULATION_3D
+            Tags.MODEL_SENSOR_FREQUENCY_RESPONSE
+            Tags.ACOUSTIC_SYSTEM_MATRIX_CACHE_PATH
+    """
+
+    def __init__(self, global_settings):
+        super(AcousticSystemMatrixAdapter, self).__init__(global_settings)
+        self.system_matrices = dict()
+
+    def forward_model(self, detection_geometry: DetectionGeometryBase) -> np.ndarray:
+        """
+        Runs the acoustic forward model and performs reading parameters and values from an hdf5 file
+        before applying the system matrix and saves the updated settings afterwards.
+
+        :param detection_geometry:
+        :return: simulated time series data (numpy array)
+        """
+        wavelength = self.global_settings[Tags.WAVELENGTH]
+        file_path = self.global_settings[Tags.SIMPA_OUTPUT_FILE_PATH]
+        detection_geometry.check_settings_prerequisites(self.global_settings)
+        image_slice = self.get_image_slice(detection_geometry)
+        initial_pressure = load_data_field(file_path, Tags.DATA_FIELD_INITIAL_PRESSURE, wavelength=wavelength)
+
+        if Tags.DATA_FIELD_SPEED_OF_SOUND in self.component_settings and \
+                self.component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND]:
+            speed_of_sound = self.component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND]
+        else:
+            speed_of_sound = np.mean(load_data_field(file_path, Tags.DATA_FIELD_SPEED_OF_SOUND))
+
+        time_series_data, global_settings = self.system_matrix_acoustic_forward_model(
+            detection_geometry, float(speed_of_sound), initial_pressure, image_slice)
+        save_hdf5(global_settings, global_settings[Tags.SIMPA_OUTPUT_FILE_PATH], "/settings/")
+
+        return time_series_data
+
+    def system_matrix_acoustic_forward_model(self, detection_geometry: DetectionGeometryBase, speed_of_sound: float,
+                                             initial_pressure: np.ndarray, image_slice=np.s_[:]) -> tuple:
+        """
+        Computes the time series data of the given initial pressure distribution with the system matrix of the
+        detection geometry.
+
+        :param detection_geometry: detection geometry of the device
+        :param speed_of_sound: homogeneous speed of sound in m/s
+        :param initial_pressure: initial pressure distribution of the entire volume
+        :param image_slice: part of the volume that contributes to the signals
+        :return: time_series_data (numpy array): simulated time series data, global_settings (Settings): updated global
+            settings with new entries from the simulation
+        """
+        system_matrix, dt, number_time_steps = self.get_system_matrix(detection_geometry, speed_of_sound,
+                                                                      np.shape(initial_pressure), image_slice)
+        time_series_data = system_matrix @ np.ravel(initial_pressure[image_slice])
+        time_series_data = time_series_data.reshape(detection_geometry.number_detector_elements, number_time_steps)
+
+        self.global_settings[Tags.K_WAVE_SPECIFIC_DT] = float(dt)
+        self.global_settings[Tags.K_WAVE_SPECIFIC_NT] = number_time_steps
+        return time_series_data, self.global_settings
+
+    def get_system_matrix(self, detection_geometry: DetectionGeometryBase, speed_of_sound: float, shape: Tuple,
+                          image_slice=np.s_[:]) -> tuple:
+        """
+        returns the system matrix for the given detection geometry and grid from the in-memory cache, the cache
+        directory or by computing it.
+
+        :param detection_geometry: detection geometry of the device
+        :param speed_of_sound: homogeneous speed of sound in m/s
+        :param shape: shape of the volume
+        :param image_slice: part of the volume that contributes to the signals
+        :return: system matrix of shape (n_elements * n_time_steps, n_voxels), time step in s and number of time steps
+        """
+        spacing_mm = self.global_settings[Tags.SPACING_MM]
+        voxel_indices = np.stack(np.meshgrid(*[np.arange(size) for size in shape], indexing="ij"), axis=-1)
+        voxel_positions_mm = ((voxel_indices[image_slice] + 0.5) * spacing_mm).reshape(-1, 3)
+        dt, number_time_steps = compute_k_wave_time_grid(np.shape(voxel_indices[image_slice])[:-1], spacing_mm / 1000,
+                                                         speed_of_sound, detection_geometry.sampling_frequency_MHz)
+        model_frequency_response = bool(Tags.MODEL_SENSOR_FREQUENCY_RESPONSE in self.component_settings and
+                                        self.component_settings[Tags.MODEL_SENSOR_FREQUENCY_RESPONSE])
+        element_samples_mm = get_detector_element_samples_mm(detection_geometry, spacing_mm,
+                                                             self.get_lateral_axis(detection_geometry) is None)
+
+        # the key is built from the geometry data instead of the device UUID, which differs between processes
+        key = hashlib.sha256(json.dumps({
+            "element_positions_mm": np.round(
+                detection_geometry.get_detector_element_positions_accounting_for_device_position_mm(), 9).tolist(),
+            "element_orientations": np.round(detection_geometry.get_detector_element_orientations(), 9).tolist(),
+            "element_size_mm": [float(detection_geometry.detector_element_width_mm),
+                                float(detection_geometry.detector_element_length_mm)],
+            "element_samples_mm": np.round(element_samples_mm, 9).tolist(),
+            "sampling_frequency_MHz": float(detection_geometry.sampling_frequency_MHz),
+            "shape": [int(size) for size in shape],
+            "image_slice": str(image_slice),
+            "spacing_mm": float(spacing_mm),
+            "speed_of_sound": float(speed_of_sound),
+            "dt": float(dt),
+            "number_time_steps": int(number_time_steps),
+            "frequency_response": [float(detection_geometry.center_frequency_Hz),
+                                   float(detection_geometry.bandwidth_percent)] if model_frequency_response else None
+        }, sort_keys=True).encode("utf-8")).hexdigest()
+
+        if key in self.system_matrices:
+            return self.system_matrices[key], dt, number_time_steps
+
+        cache_file_path = None
+        if Tags.ACOUSTIC_SYSTEM_MATRIX_CACHE_PATH in self.component_settings:
+            cache_directory = self.component_settings[Tags.ACOUSTIC_SYSTEM_MATRIX_CACHE_PATH]
+            os.makedirs(cache_directory, exist_ok=True)
+            cache_file_path = os.path.join(cache_directory, f"acoustic_system_matrix_{key}.npz")
+
+        if cache_file_path is not None and os.path.exists(cache_file_path):
+            self.logger.debug(f"Loading the acoustic system matrix from {cache_file_path}")
+            system_matrix = load_npz(cache_file_path).tocsr()
+        else:
+            self.logger.info("Computing the acoustic system matrix...")
+            system_matrix = compute_acoustic_system_matrix(voxel_positions_mm, element_samples_mm,
+                                                           spacing_mm, speed_of_sound, dt, number_time_steps)
+            if model_frequency_response:
+                impulse_response = compute_gaussian_impulse_response_matrix(
+                    number_time_steps, 1 / dt, detection_geometry.center_frequency_Hz,
+                    detection_geometry.bandwidth_percent)
+                system_matrix = (kron(identity(len(element_samples_mm), format="csr"), impulse_response,
+                                      format="csr") @ system_matrix).tocsr()
+            if cache_file_path is not None:
+                save_npz(cache_file_path, system_matrix)
+            self.logger.info("Computing the acoustic system matrix...[Done]")
+
+        self.system_matrices[key] = system_matrix
+        return system_matrix, dt, number_time_steps
+
+
+def get_detector_element_samples_mm(detection_geometry: DetectionGeometryBase, spacing_mm: float,
+                                    include_element_length: bool) -> np.ndarray:
+    """
+    samples the surface of every detector element with two points per voxel along its width and, optionally, its
+    length.
+
+    :param detection_geometry: detection geometry of the device
+    :param spacing_mm: spacing of the volume in mm
+    :param include_element_length: whether to sample along the element length as well, e.g. for 3D simulations
+    :return: sample positions in mm with shape (n_elements, n_samples, 3)
+    """
+    def offsets(size_mm):
+        number_of_samples = max(int(np.ceil(size_mm / spacing_mm * 2)), 1)
+        return ((np.arange(number_of_samples) + 0.5) / number_of_samples - 0.5) * size_mm
+
+    width_offsets = offsets(detection_geometry.detector_element_width_mm)
+    length_offsets = offsets(detection_geometry.detector_element_length_mm) if include_element_length else [0.0]
+    positions = detection_geometry.get_detector_element_positions_accounting_for_device_position_mm()
+    samples = []
+    for position, orientation in zip(positions, detection_geometry.get_detector_element_orientations()):
+        orientation = np.asarray(orientation, dtype=float)
+        width_direction = _get_width_direction(orientation)
+        length_direction = np.cross(orientation, width_direction) if np.linalg.norm(orientation) > 0 \
+            else np.array([0, 1.0, 0])
+        samples.append([position + width * width_direction + length * length_direction
+                        for width in width_offsets for length in length_offsets])
+    return np.asarray(samples)
+
+
+def compute_acoustic_system_matrix(voxel_positions_mm: np.ndarray, element_samples_mm: np.ndarray,
+                                   spacing_mm: float, speed_of_sound: float, dt: float,
+                                   number_time_steps: int) -> csr_matrix:
+    """
+    computes the matrix that maps the initial pressure of the voxels to the time series data of the detector
+    elements in a homogeneous, lossless medium. The initial pressure of every voxel is spread with a spherical
+    Gaussian of standard deviation `VOXEL_KERNEL_WIDTH * spacing`, which suppresses the artifacts of the regular voxel
+    lattice. The pressure of a Gaussian source `g` at distance `R` is `(R - c t) g(R - c t) / (2 R)` for distances
+    that are large compared to the source. It is averaged over the sampling interval of each time sample and over
+    the samples of each element.
+
+    :param voxel_positions_mm: positions of the voxel centers in mm, shape (n_voxels, 3)
+    :param element_samples_mm: sample positions on the detector elements in mm, shape (n_elements, n_samples, 3)
+    :param spacing_mm: spacing of the volume in mm
+    :param speed_of_sound: speed of sound in m/s
+    :param dt: time step in s
+    :param number_time_steps: number of time steps including t = 0
+    :return: sparse matrix of shape (n_elements * number_time_steps, n_voxels)
+    """
+    kernel_width = VOXEL_KERNEL_WIDTH * spacing_mm
+    amplitude = spacing_mm ** 3 / ((2 * np.pi) ** 1.5 * kernel_width)
+    step_mm = speed_of_sound * 1000 * dt
+    number_of_samples = np.shape(element_samples_mm)[1]
+    support = int(np.ceil(8 * kernel_width / step_mm)) + 2
+    voxel_indices = np.arange(len(voxel_positions_mm))
+    rows, columns, values = [], [], []
+    for element_index, samples in enumerate(element_samples_mm):
+        for sample in samples:
+            distance = np.maximum(np.linalg.norm(voxel_positions_mm - sample, axis=1), kernel_width)
+            first_step = np.floor((distance - 4 * kernel_width) / step_mm - 0.5).astype(int)
+            time_steps = first_step[:, np.newaxis] + np.arange(support)[np.newaxis, :]
+            retarded_distance = distance[:, np.newaxis] - time_steps * step_mm
+            # integral of u g(u) over the sampling interval
+            pressure = amplitude / (2 * distance[:, np.newaxis] * step_mm) * (
+                np.exp(-(retarded_distance - step_mm / 2) ** 2 / (2 * kernel_width ** 2)) -
+                np.exp(-(retarded_distance + step_mm / 2) ** 2 / (2 * kernel_width ** 2)))
+            valid = (time_steps >= 0) & (time_steps < number_time_steps)
+            rows.append(element_index * number_time_steps + time_steps[valid])
+            columns.append(np.broadcast_to(voxel_indices[:, np.newaxis], valid.shape)[valid])
+            values.append(pressure[valid] / number_of_samples)
+    return coo_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                      shape=(len(element_samples_mm) * number_time_steps, len(voxel_positions_mm))).tocsr()
+
+
+def compute_gaussian_impulse_response_matrix(number_time_steps: int, sampling_frequency_hz: float,
+                                             center_frequency_hz: float, bandwidth_percent: float,
+                                             relative_threshold: float = 1e-6) -> csr_matrix:
+    """
+    computes the sparse circulant matrix that applies the Gaussian frequency response of
+    `apply_gaussian_frequency_response` to a time series. Entries of the impulse response below the relative
+    threshold are dropped.
+
+    :param number_time_steps: number of time steps
+    :param sampling_frequency_hz: sampling frequency in Hz
+    :param center_frequency_hz: center frequency of the detector in Hz
+    :param bandwidth_percent: full width at half maximum in percent of the center frequency
+    :param relative_threshold: threshold relative to the maximum of the impulse response
+    :return: sparse matrix of shape (number_time_steps, number_time_steps)
+    """
+    impulse_response = np.real(np.fft.ifft(compute_gaussian_frequency_response(
+        number_time_steps, sampling_frequency_hz, center_frequency_hz, bandwidth_percent)))
+    lags = np.flatnonzero(np.abs(impulse_response) > relative_threshold * np.max(np.abs(impulse_response)))
+    rows = (np.arange(number_time_steps)[:, np.newaxis] + lags[np.newaxis, :]) % number_time_steps
+    columns = np.broadcast_to(np.arange(number_time_steps)[:, np.newaxis], rows.shape)
+    values = np.broadcast_to(impulse_response[lags][np.newaxis, :], rows.shape)
+    return coo_matrix((values.ravel(), (rows.ravel(), columns.ravel())),
+                      shape=(number_time_steps, number_time_steps)).tocsr()
@@ -0,0 +1,97 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+from typing import Dict
+from simpa.utils import Tags, Settings
+from simpa.core.simulation_modules.optical_module.mcx_adapter import MCXAdapter
+from simpa.core.device_digital_twins.illumination_geometries import IlluminationGeometryBase
+from simpa.core.simulation_modules.optical_module.optical_utils import (rasterize_mcx_source,
+                                                                       compute_layered_diffusion_fluence)
+
+
+class AnalyticDiffusionAdapter(MCXAdapter):
+    """
+    This class implements a fast analytic fluence model for laterally homogeneous, layered media. The fluence is
+    computed with the diffusion approximation: the multilayer Green's function of the depth profile of the optical
+    properties is convolved with the lateral profile of the illumination in the Fourier domain.
+
+    The analytic model is used if the volume only consists of a background and horizontal layers or if
+    `Tags.OPTICAL_MODEL_FORCE_ANALYTIC_FLUENCE` is set. In the latter case, all other structures (e.g. sparse vessels)
+    are only considered through the laterally averaged optical properties of each depth.
+    Otherwise, the simulation falls back to MCX and the settings of `simpa.MCXAdapter` apply.
+
+    The illumination is expected to enter the volume from the top (along +z) and the fluence is normalized to a unit
+    injected energy just like the MCX output.
+
+    .. note::
+        The diffusion approximation is inaccurate within a few transport mean free paths of the source and in
+        strongly absorbing media. Deformed layers are approximated by their laterally averaged depth profile.
+    """
+
+    ANALYTIC_STRUCTURE_TYPES = [Tags.BACKGROUND, Tags.HORIZONTAL_LAYER_STRUCTURE]
+
+    def __init__(self, global_settings: Settings):
+        """
+        :param global_settings: global settings used during simulations
+        """
+        super(AnalyticDiffusionAdapter, self).__init__(global_settings=global_settings)
+
+    def use_analytic_model(self) -> bool:
+        """
+        decides whether the analytic model is used based on `Tags.OPTICAL_MODEL_FORCE_ANALYTIC_FLUENCE` and the
+        structures defined in the volume creation settings.
+
+        :return: True if the fluence should be computed with the analytic model
+        """
+        if (Tags.OPTICAL_MODEL_FORCE_ANALYTIC_FLUENCE in self.component_settings and
+                self.component_settings[Tags.OPTICAL_MODEL_FORCE_ANALYTIC_FLUENCE]):
+            return True
+        if (Tags.VOLUME_CREATION_MODEL_SETTINGS not in self.global_settings or
+                Tags.STRUCTURES not in self.global_settings.get_volume_creation_settings()):
+            return False
+        structures = self.global_settings.get_volume_creation_settings()[Tags.STRUCTURES]
+        return all(Tags.STRUCTURE_TYPE in structure and
+                   structure[Tags.STRUCTURE_TYPE] in self.ANALYTIC_STRUCTURE_TYPES
+                   for structure in structures.values())
+
+    def forward_model(self,
+                      absorption_cm: np.ndarray,
+                      scattering_cm: np.ndarray,
+                      anisotropy: np.ndarray,
+                      illumination_geometry: IlluminationGeometryBase) -> Dict:
+        """
+        computes the fluence with the analytic layered diffusion model or falls back to MCX,
+        see `self.use_analytic_model`.
+
+        :param absorption_cm: array containing the absorption of the tissue in `cm` units
+        :param scattering_cm: array containing the scattering of the tissue in `cm` units
+        :param anisotropy: array containing the anisotropy of the volume defined by `absorption_cm` and `scattering_cm`
+        :param illumination_geometry: and instance of `IlluminationGeometryBase` defining the illumination geometry
+        :return: `Dict` containing the fluence
+        """
+        if not self.use_analytic_model():
+            self.logger.warning("The volume is not composed of horizontal layers only. Falling back to MCX.")
+            return super(AnalyticDiffusionAdapter, self).forward_model(absorption_cm=absorption_cm,
+                                                                       scattering_cm=scattering_cm,
+                                                                       anisotropy=anisotropy,
+                                                                       illumination_geometry=illumination_geometry)
+
+        spacing = self.global_settings[Tags.SPACING_MM]
+        source = illumination_geometry.get_mcx_illuminator_definition(self.global_settings)
+        if not np.allclose(np.atleast_2d(source["Dir"])[:, :3], [0, 0, 1], atol=0.05):
+            self.logger.warning("The analytic fluence model assumes illumination along +z, but the illumination "
+                                f"direction is {source['Dir']}.")
+        source_depth_index = int(np.clip(np.floor(np.min(np.asarray(source["Pos"])[..., 2])), 0,
+                                         absorption_cm.shape[2] - 1))
+
+        lateral_profile = rasterize_mcx_source(source, absorption_cm.shape[:2]) / spacing ** 2
+        absorption_mm = np.mean(absorption_cm, axis=(0, 1)) / 10
+        reduced_scattering_mm = np.mean(scattering_cm * (1 - anisotropy), axis=(0, 1)) / 10
+        fluence = compute_layered_diffusion_fluence(absorption_per_mm=absorption_mm,
+                                                    reduced_scattering_per_mm=reduced_scattering_mm,
+                                                    lateral_profile_per_mm2=lateral_profile,
+                                                    spacing_mm=spacing,
+                                                    source_depth_index=source_depth_index)
+        return {Tags.DATA_FIELD_FLUENCE: fluence}
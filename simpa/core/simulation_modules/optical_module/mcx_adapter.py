@@ -10,7 +10,14 @@ from simpa.core.device_digital_twins.illumination_geometries import Illumination
 import json
 import jdata
 import os
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
+from simpa.core.simulation_modules.optical_module.optical_utils import (compute_transport_mean_free_path_mm,
+                                                                       get_optical_domain_slices,
+                                                                       pad_to_full_domain,
+                                                                       reweight_time_resolved_fluence)
+
+# speed of light in vacuum in mm/s, mcx is run with a refractive index of 1
+SPEED_OF_LIGHT_MM_PER_S = 2.99792458e11
 
 
 class MCXAdapter(OpticalAdapterBase):
@@ -36,7 +43,10 @@ class MCXAdapter(OpticalAdapterBase):
         self.mcx_json_config_file = None
         self.mcx_volumetric_data_file = None
         self.frames = None
+        self.time_step = None
         self.mcx_output_suffixes = {'mcx_volumetric_data_file': '.jnii'}
+        self.record_time_resolved_fluence = False
+        self.perturbation_references = dict()
 
     def forward_model(self,
                       absorption_cm: np.ndarray,
@@ -61,6 +71,25 @@ class MCXAdapter(OpticalAdapterBase):
         else:
             _assumed_anisotropy = 0.9
 
+        self.record_time_resolved_fluence = (Tags.OPTICAL_MODEL_PERTURBATION_MONTE_CARLO in self.component_settings and
+                                             self.component_settings[Tags.OPTICAL_MODEL_PERTURBATION_MONTE_CARLO])
+        if self.record_time_resolved_fluence:
+            perturbation_key = self.get_perturbation_reference_key(np.shape(absorption_cm), illumination_geometry)
+            fluence = self.perturb_reference_fluence(perturbation_key, absorption_cm, scattering_cm, anisotropy)
+            if fluence is not None:
+                return {Tags.DATA_FIELD_FLUENCE: fluence}
+
+        full_shape = np.shape(absorption_cm)
+        absorption_cm_full, scattering_cm_full, anisotropy_full = absorption_cm, scattering_cm, anisotropy
+        crop_slices = self.get_optical_domain_slices(absorption_cm=absorption_cm,
+                                                     scattering_cm=scattering_cm,
+                                                     anisotropy=anisotropy,
+                                                     illumination_geometry=illumination_geometry)
+        if crop_slices is not None:
+            absorption_cm = absorption_cm[crop_slices]
+            scattering_cm = scattering_cm[crop_slices]
+            anisotropy = anisotropy[crop_slices]
+
         self.generate_mcx_bin_input(absorption_cm=absorption_cm,
                                     scattering_cm=scattering_cm,
                                     anisotropy=anisotropy,
@@ -68,6 +97,9 @@ class MCXAdapter(OpticalAdapterBase):
 
         settings_dict = self.get_mcx_settings(illumination_geometry=illumination_geometry,
                                               assumed_anisotropy=_assumed_anisotropy)
+        if crop_slices is not None:
+            settings_dict["Optode"]["Source"] = self.shift_source_positions(
+                settings_dict["Optode"]["Source"], [-crop_slice.start for crop_slice in crop_slices])
 
         print(settings_dict)
         self.generate_mcx_json_input(settings_dict=settings_dict)
@@ -78,11 +110,157 @@ class MCXAdapter(OpticalAdapterBase):
 
         # Read output
         results = self.read_mcx_output()
+        fluence = results[Tags.DATA_FIELD_FLUENCE]
+        if crop_slices is not None:
+            fluence = pad_to_full_domain(fluence, crop_slices, full_shape + np.shape(fluence)[3:])
+        if np.ndim(fluence) > 3:
+            # time-resolved fluence with the time gates along the fourth axis
+            if self.record_time_resolved_fluence:
+                self.perturbation_references[perturbation_key] = {
+                    "time_resolved_fluence": fluence,
+                    "gate_path_lengths_mm": (np.arange(np.shape(fluence)[3] + 1) * self.time_step *
+                                             SPEED_OF_LIGHT_MM_PER_S),
+                    "absorption_mm": absorption_cm_full / 10,
+                    "reduced_scattering_mm": scattering_cm_full * (1 - anisotropy_full) / 10
+                }
+            fluence = np.sum(fluence, axis=3)
+        results[Tags.DATA_FIELD_FLUENCE] = fluence
 
         # clean temporary files
         self.remove_mcx_output()
         return results
 
+    def get_optical_domain_slices(self,
+                                  absorption_cm: np.ndarray,
+                                  scattering_cm: np.ndarray,
+                                  anisotropy: np.ndarray,
+                                  illumination_geometry: IlluminationGeometryBase) -> Optional[Tuple]:
+        """
+        computes the slices that crop the optical domain laterally to the region illuminated by
+        `illumination_geometry` plus a safety margin of `Tags.OPTICAL_MODEL_CROP_MARGIN_TRANSPORT_MEAN_FREE_PATHS`
+        transport mean free paths, if `Tags.OPTICAL_MODEL_CROP_TO_ILLUMINATION` is set in the component settings.
+
+        :param absorption_cm: array containing the absorption of the tissue in `cm` units
+        :param scattering_cm: array containing the scattering of the tissue in `cm` units
+        :param anisotropy: array containing the anisotropy of the volume defined by `absorption_cm` and `scattering_cm`
+        :param illumination_geometry: and instance of `IlluminationGeometryBase` defining the illumination geometry
+        :return: Tuple of slices for the x, y and z axis or None if the domain should not be cropped
+        """
+        if not (Tags.OPTICAL_MODEL_CROP_TO_ILLUMINATION in self.component_settings and
+                self.component_settings[Tags.OPTICAL_MODEL_CROP_TO_ILLUMINATION]):
+            return None
+        illuminated_region_mm = illumination_geometry.get_illuminated_region_mm()
+        if illuminated_region_mm is None:
+            self.logger.warning(f"The illuminated region of {type(illumination_geometry).__name__} is unknown. "
+                                f"The optical domain is not cropped.")
+            return None
+
+        if Tags.OPTICAL_MODEL_CROP_MARGIN_TRANSPORT_MEAN_FREE_PATHS in self.component_settings:
+            margin = self.component_settings[Tags.OPTICAL_MODEL_CROP_MARGIN_TRANSPORT_MEAN_FREE_PATHS]
+        else:
+            margin = 10
+        margin_mm = margin * compute_transport_mean_free_path_mm(absorption_cm, scattering_cm, anisotropy)
+        if not np.isfinite(margin_mm):
+            return None
+        crop_slices = get_optical_domain_slices(illuminated_region_mm=illuminated_region_mm,
+                                                spacing_mm=self.global_settings[Tags.SPACING_MM],
+                                                shape=np.shape(absorption_cm),
+                                                margin_mm=margin_mm)
+        self.logger.debug(f"Cropping the optical domain to {crop_slices}")
+        return crop_slices
+
+    def get_perturbation_reference_key(self, shape: Tuple, illumination_geometry: IlluminationGeometryBase) -> str:
+        """
+        generates the key under which the perturbation Monte Carlo reference of an illumination is stored. The key
+        comprises the volume shape, the spacing and the mcx source definition.
+
+        :param shape: shape of the volume
+        :param illumination_geometry: and instance of `IlluminationGeometryBase` defining the illumination geometry
+        :return: key of the reference
+        """
+        source = illumination_geometry.get_mcx_illuminator_definition(self.global_settings)
+        return json.dumps([list(shape), self.global_settings[Tags.SPACING_MM], source], sort_keys=True,
+                          default=lambda value: np.asarray(value).tolist())
+
+    def perturb_reference_fluence(self,
+                                  perturbation_key: str,
+                                  absorption_cm: np.ndarray,
+                                  scattering_cm: np.ndarray,
+                                  anisotropy: np.ndarray) -> Optional[np.ndarray]:
+        """
+        derives the fluence from the time-resolved reference fluence by perturbation Monte Carlo, i.e. by reweighting
+        the recorded photon path lengths with the change in absorption. The time-resolved fluence records the total
+        path lengths of the photons but not the partial path lengths in the individual voxels, so the reweighting is
+        exact only for a spatially uniform change in absorption, which is taken as the mean change weighted with the
+        reference fluence. If the change deviates from this mean so much that the attenuation along the mean photon
+        path length differs by more than Tags.OPTICAL_MODEL_PERTURBATION_ABSORPTION_TOLERANCE, e.g. because blood
+        changes its absorption much more than the background, mcx is run instead.
+
+        :param perturbation_key: key of the reference, see `self.get_perturbation_reference_key`
+        :param absorption_cm: array containing the absorption of the tissue in `cm` units
+        :param scattering_cm: array containing the scattering of the tissue in `cm` units
+        :param anisotropy: array containing the anisotropy of the volume defined by `absorption_cm` and `scattering_cm`
+        :return: fluence or None if there is no reference or the scattering or the change in absorption differ too
+            much from the reference
+        """
+        if perturbation_key not in self.perturbation_references:
+            return None
+        reference = self.perturbation_references[perturbation_key]
+
+        if Tags.OPTICAL_MODEL_PERTURBATION_SCATTERING_TOLERANCE in self.component_settings:
+            tolerance = self.component_settings[Tags.OPTICAL_MODEL_PERTURBATION_SCATTERING_TOLERANCE]
+        else:
+            tolerance = 0.05
+        reduced_scattering_mm = scattering_cm * (1 - anisotropy) / 10
+        reference_scattering_mm = reference["reduced_scattering_mm"]
+        relative_change = (np.abs(reduced_scattering_mm - reference_scattering_mm) /
+                           np.maximum(reference_scattering_mm, 1e-10))
+        if np.max(relative_change) > tolerance:
+            self.logger.info(f"The reduced scattering changed by up to {np.max(relative_change):.3f} with respect to "
+                             f"the perturbation Monte Carlo reference. Running mcx.")
+            return None
+
+        reference_fluence = np.sum(reference["time_resolved_fluence"], axis=3)
+        total_reference_fluence = max(np.sum(reference_fluence), 1e-30)
+        delta_absorption = absorption_cm / 10 - reference["absorption_mm"]
+        delta_absorption_mm = np.sum(delta_absorption * reference_fluence) / total_reference_fluence
+
+        if Tags.OPTICAL_MODEL_PERTURBATION_ABSORPTION_TOLERANCE in self.component_settings:
+            absorption_tolerance = self.component_settings[Tags.OPTICAL_MODEL_PERTURBATION_ABSORPTION_TOLERANCE]
+        else:
+            absorption_tolerance = 0.05
+        gate_path_lengths_mm = reference["gate_path_lengths_mm"]
+        gate_centres_mm = (gate_path_lengths_mm[:-1] + gate_path_lengths_mm[1:]) / 2
+        mean_path_length_mm = np.sum(np.sum(reference["time_resolved_fluence"], axis=(0, 1, 2)) *
+                                     gate_centres_mm) / total_reference_fluence
+        absorption_spread_mm = np.max(np.abs(delta_absorption - delta_absorption_mm)[reference_fluence > 0],
+                                      initial=0)
+        if absorption_spread_mm * mean_path_length_mm > absorption_tolerance:
+            self.logger.info(f"The absorption change deviates by up to {absorption_spread_mm:.5f}/mm from its mean "
+                             f"over a mean photon path length of {mean_path_length_mm:.1f} mm, so perturbation Monte "
+                             f"Carlo is not accurate. Running mcx.")
+            return None
+
+        self.logger.info(f"Deriving the fluence by perturbation Monte Carlo with a mean absorption change of "
+                         f"{delta_absorption_mm:.5f}/mm")
+        return reweight_time_resolved_fluence(time_resolved_fluence=reference["time_resolved_fluence"],
+                                              gate_path_lengths_mm=reference["gate_path_lengths_mm"],
+                                              delta_absorption_per_mm=delta_absorption_mm)
+
+    @staticmethod
+    def shift_source_positions(source: Dict, offset_voxels: List) -> Dict:
+        """
+        shifts the positions of an mcx source definition by an offset in voxels, e.g. after cropping the volume.
+
+        :param source: mcx source definition with a single position or one position per row
+        :param offset_voxels: offset along the x, y and z axis in voxels
+        :return: shifted source definition
+        """
+        source = dict(source)
+        position = np.asarray(source["Pos"], dtype=float)
+        source["Pos"] = (position + np.asarray(offset_voxels, dtype=float)).tolist()
+        return source
+
     def generate_mcx_json_input(self, settings_dict: Dict) -> None:
         """
         generates JSON serializable file with settings needed by MCX to run simulations.
@@ -118,11 +296,20 @@ class MCXAdapter(OpticalAdapterBase):
         if Tags.TIME_STEP and Tags.TOTAL_TIME in self.component_settings:
             dt = self.component_settings[Tags.TIME_STEP]
             time = self.component_settings[Tags.TOTAL_TIME]
+        elif self.record_time_resolved_fluence:
+            time = 5e-09
+            if Tags.OPTICAL_MODEL_PERTURBATION_TIME_GATES in self.component_settings:
+                dt = time / self.component_settings[Tags.OPTICAL_MODEL_PERTURBATION_TIME_GATES]
+            else:
+                dt = time / 100
         else:
             time = 5e-09
             dt = 5e-09
-        self.frames = int(time / dt)
+        self.frames = int(round(time / dt))
+        self.time_step = dt
 
+        # a source definition with one row per source (e.g. from a `CombinedIlluminationGeometry`) is launched by
+        # mcx as multiple sources within the same simulation, the fluence is normalised by the energy of all sources
         source = illumination_geometry.get_mcx_illuminator_definition(self.global_settings)
         settings_dict = {
             "Session": {
@@ -242,8 +429,11 @@ class MCXAdapter(OpticalAdapterBase):
         fluence = content['NIFTIData']
         print(f"fluence.shape {fluence.shape}")
         if fluence.ndim > 3:
-            # remove the 1 or 2 (for mcx >= v2024.1) additional dimensions of size 1 if present to obtain a 3d array
-            fluence = fluence.reshape(fluence.shape[0], fluence.shape[1], -1)
+            # remove the 1 or 2 (for mcx >= v2024.1) additional dimensions of size 1 if present to obtain a 3d array,
+            # the time gates of time-resolved simulations are kept as fourth axis
+            fluence = fluence.reshape(fluence.shape[0], fluence.shape[1], fluence.shape[2], -1)
+            if fluence.shape[3] == 1:
+                fluence = fluence[:, :, :, 0]
         print(f"fluence.shape {fluence.shape}")
         results = dict()
         results[Tags.DATA_FIELD_FLUENCE] = fluence
@@ -242,6 +242,7 @@ class MCXReflectanceAdapter(MCXAdapter):
         reflectance_position = []
         photon_position = []
         photon_direction = []
+        _device = self.combine_illumination_geometries(_device)
         if isinstance(_device, list):
             # per convention this list has at least two elements
             results = self.forward_model(absorption_cm=absorption,
@@ -7,8 +7,11 @@ from typing import Dict, Union
 import numpy as np
 
 from simpa.core.simulation_modules import SimulationModuleBase
-from simpa.core.device_digital_twins import (IlluminationGeometryBase,
+from simpa.core.device_digital_twins import (CombinedIlluminationGeometry,
+                                             IlluminationGeometryBase,
                                              PhotoacousticDevice)
+from simpa.core.simulation_modules.optical_module.optical_utils import (downsample_optical_properties,
+                                                                       upsample_volume)
 from simpa.io_handling.io_hdf5 import load_data_field, save_hdf5
 from simpa.utils import Settings, Tags
 from simpa.utils.dict_path_manager import generate_dict_path
@@ -81,11 +84,21 @@ class OpticalAdapterBase(SimulationModuleBase):
         else:
             raise TypeError(f"The optical forward modelling does not support devices of type {type(device)}")
 
-        results = self.run_forward_model(_device=_device,
-                                         device=device,
-                                         absorption=absorption,
-                                         scattering=scattering,
-                                         anisotropy=anisotropy)
+        if (Tags.OPTICAL_MODEL_DOWNSAMPLING_FACTOR in self.component_settings and
+                self.component_settings[Tags.OPTICAL_MODEL_DOWNSAMPLING_FACTOR] > 1):
+            results = self.run_downsampled_forward_model(_device=_device,
+                                                         device=device,
+                                                         absorption=absorption,
+                                                         scattering=scattering,
+                                                         anisotropy=anisotropy,
+                                                         factor=self.component_settings[
+                                                             Tags.OPTICAL_MODEL_DOWNSAMPLING_FACTOR])
+        else:
+            results = self.run_forward_model(_device=_device,
+                                             device=device,
+                                             absorption=absorption,
+                                             scattering=scattering,
+                                             anisotropy=anisotropy)
         fluence = results[Tags.DATA_FIELD_FLUENCE]
         if not (Tags.IGNORE_QA_ASSERTIONS in self.global_settings and Tags.IGNORE_QA_ASSERTIONS):
             assert_array_well_defined(fluence, assume_non_negativity=True, array_name="fluence")
@@ -115,6 +128,65 @@ class OpticalAdapterBase(SimulationModuleBase):
         save_hdf5(optical_output, self.global_settings[Tags.SIMPA_OUTPUT_FILE_PATH], optical_output_path)
         self.logger.info("Simulating the optical forward process...[Done]")
 
+    def run_downsampled_forward_model(self,
+                                      _device,
+                                      device: Union[IlluminationGeometryBase, PhotoacousticDevice],
+                                      absorption: np.ndarray,
+                                      scattering: np.ndarray,
+                                      anisotropy: np.ndarray,
+                                      factor: int) -> Dict:
+        """
+        runs `self.run_forward_model` on an optical grid that is coarser by `factor` along every axis and linearly
+        interpolates the resulting fluence back onto the full simulation grid. During the coarse run,
+        `Tags.SPACING_MM` of the global settings is set to the coarse spacing such that the optical forward model and
+        the illumination geometries use the coarse grid.
+        Only the fluence is interpolated back, other optical outputs are returned on the coarse grid.
+
+        :param _device: device illumination geometry
+        :param device: class defining illumination
+        :param absorption: Absorption volume
+        :param scattering: Scattering volume
+        :param anisotropy: Dimensionless scattering anisotropy
+        :param factor: integer downsampling factor
+        :return: Dictionary containing the fluence on the full simulation grid
+        """
+        factor = int(factor)
+        coarse_absorption, coarse_scattering, coarse_anisotropy = downsample_optical_properties(
+            absorption_cm=absorption, scattering_cm=scattering, anisotropy=anisotropy, factor=factor)
+        self.logger.debug(f"Running the optical forward model on a downsampled grid of shape "
+                          f"{np.shape(coarse_absorption)} instead of {np.shape(absorption)}")
+
+        spacing = self.global_settings[Tags.SPACING_MM]
+        self.global_settings[Tags.SPACING_MM] = spacing * factor
+        try:
+            results = self.run_forward_model(_device=_device,
+                                             device=device,
+                                             absorption=coarse_absorption,
+                                             scattering=coarse_scattering,
+                                             anisotropy=coarse_anisotropy)
+        finally:
+            self.global_settings[Tags.SPACING_MM] = spacing
+
+        results[Tags.DATA_FIELD_FLUENCE] = upsample_volume(results[Tags.DATA_FIELD_FLUENCE], factor,
+                                                           np.shape(absorption))
+        return results
+
+    def combine_illumination_geometries(self, _device):
+        """
+        fuses a list of illumination geometries into a single `CombinedIlluminationGeometry` if
+        `Tags.OPTICAL_MODEL_COMBINE_ILLUMINATION_GEOMETRIES` is set in the component settings. Otherwise, the
+        given device is returned unchanged.
+
+        :param _device: device illumination geometry or list of illumination geometries
+        :return: device illumination geometry or list of illumination geometries
+        """
+        if (isinstance(_device, list) and
+                Tags.OPTICAL_MODEL_COMBINE_ILLUMINATION_GEOMETRIES in self.component_settings and
+                self.component_settings[Tags.OPTICAL_MODEL_COMBINE_ILLUMINATION_GEOMETRIES]):
+            self.logger.debug(f"Combining {len(_device)} illumination geometries into a single optical run")
+            return CombinedIlluminationGeometry(_device)
+        return _device
+
     def run_forward_model(self,
                           _device,
                           device: Union[IlluminationGeometryBase, PhotoacousticDevice],
@@ -131,6 +203,7 @@ class OpticalAdapterBase(SimulationModuleBase):
         :param anisotropy: Dimensionless scattering anisotropy
         :return:
         """
+        _device = self.combine_illumination_geometries(_device)
         if isinstance(_device, list):
             # per convention this list has at least two elements
             results = self.forward_model(absorption_cm=absorption,
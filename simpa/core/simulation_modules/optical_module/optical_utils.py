@@ -0,0 +1,348 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+from scipy.fft import next_fast_len
+from scipy.ndimage import map_coordinates
+
+from simpa.utils import Tags
+
+
+def _pad_to_multiple(volume: np.ndarray, factor: int) -> np.ndarray:
+    """
+    pads a volume with its edge values such that every dimension is a multiple of `factor`.
+
+    :param volume: volume to pad
+    :param factor: integer downsampling factor
+    :return: padded volume
+    """
+    padding = [(0, (-dim) % factor) for dim in volume.shape]
+    if not any(after for _, after in padding):
+        return volume
+    return np.pad(volume, padding, mode="edge")
+
+
+def _block_mean(volume: np.ndarray, factor: int) -> np.ndarray:
+    """
+    averages non-overlapping blocks of `factor` voxels along every axis.
+
+    :param volume: volume whose dimensions are multiples of `factor`
+    :param factor: integer downsampling factor
+    :return: block averaged volume
+    """
+    shape = []
+    for dim in volume.shape:
+        shape += [dim // factor, factor]
+    return volume.reshape(shape).mean(axis=tuple(range(1, 2 * volume.ndim, 2)))
+
+
+def downsample_optical_properties(absorption_cm: np.ndarray,
+                                  scattering_cm: np.ndarray,
+                                  anisotropy: np.ndarray,
+                                  factor: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    downsamples the optical property volumes by an integer factor along every axis. Every coarse voxel contains the
+    volume-fraction weighted average of the fine voxels it covers. The anisotropy is averaged weighted by the
+    scattering coefficient, such that the reduced scattering coefficient mus' = mus * (1 - g) is preserved.
+    Volumes whose dimensions are not a multiple of `factor` are padded with their edge values.
+
+    :param absorption_cm: Absorption in units of per centimeter
+    :param scattering_cm: Scattering in units of per centimeter
+    :param anisotropy: Dimensionless scattering anisotropy
+    :param factor: integer downsampling factor
+    :return: Tuple of downsampled absorption, scattering and anisotropy
+    """
+    absorption_cm = _pad_to_multiple(absorption_cm, factor)
+    scattering_cm = _pad_to_multiple(scattering_cm, factor)
+    anisotropy = _pad_to_multiple(anisotropy, factor)
+
+    coarse_absorption = _block_mean(absorption_cm, factor)
+    coarse_scattering = _block_mean(scattering_cm, factor)
+    weighted_anisotropy = _block_mean(scattering_cm * anisotropy, factor)
+    coarse_anisotropy = np.where(coarse_scattering > 0,
+                                 weighted_anisotropy / np.where(coarse_scattering > 0, coarse_scattering, 1),
+                                 _block_mean(anisotropy, factor))
+    return coarse_absorption, coarse_scattering, coarse_anisotropy
+
+
+def upsample_volume(volume: np.ndarray, factor: int, target_shape: Tuple) -> np.ndarray:
+    """
+    linearly interpolates a volume that was computed on a grid downsampled with
+    `downsample_optical_properties` back onto the original grid. Non-negative volumes stay non-negative.
+
+    :param volume: coarse volume
+    :param factor: integer downsampling factor that was used to create the coarse grid
+    :param target_shape: shape of the original volume
+    :return: volume interpolated on the original grid
+    """
+    # the centre of fine voxel i lies at coarse voxel coordinate (i + 0.5) / factor - 0.5. Towards the borders of the
+    # volume, the values are linearly extrapolated using an odd reflection of the coarse volume.
+    padded_volume = np.pad(volume, 1, mode="reflect", reflect_type="odd")
+    coordinates = np.meshgrid(*[(np.arange(dim) + 0.5) / factor + 0.5 for dim in target_shape], indexing="ij")
+    upsampled_volume = map_coordinates(padded_volume, coordinates, order=1, mode="nearest")
+    if np.all(volume >= 0):
+        upsampled_volume = np.maximum(upsampled_volume, 0)
+    return upsampled_volume.astype(volume.dtype)
+
+
+def compute_transport_mean_free_path_mm(absorption_cm: np.ndarray,
+                                        scattering_cm: np.ndarray,
+                                        anisotropy: np.ndarray) -> float:
+    """
+    computes the transport mean free path 1 / (mua + mus * (1 - g)) of the volume-averaged optical properties.
+
+    :param absorption_cm: Absorption in units of per centimeter
+    :param scattering_cm: Scattering in units of per centimeter
+    :param anisotropy: Dimensionless scattering anisotropy
+    :return: transport mean free path in mm
+    """
+    transport_coefficient_cm = np.mean(absorption_cm + scattering_cm * (1 - anisotropy))
+    if transport_coefficient_cm <= 0:
+        return np.inf
+    return 10 / transport_coefficient_cm
+
+
+def get_optical_domain_slices(illuminated_region_mm: np.ndarray,
+                              spacing_mm: float,
+                              shape: Tuple,
+                              margin_mm: float) -> Tuple[slice, slice, slice]:
+    """
+    computes the slices that crop a volume laterally (along x and y) to the illuminated region plus a safety
+    margin. The full depth (z) is kept.
+
+    :param illuminated_region_mm: illuminated region in mm as [xs, xe, ys, ye, zs, ze]
+    :param spacing_mm: voxel spacing in mm
+    :param shape: shape of the volume that should be cropped
+    :param margin_mm: margin in mm that is added on both sides of the illuminated region
+    :return: Tuple of slices for the x, y and z axis
+    """
+    slices = []
+    for axis in range(2):
+        start = int(np.floor((illuminated_region_mm[2 * axis] - margin_mm) / spacing_mm))
+        end = int(np.ceil((illuminated_region_mm[2 * axis + 1] + margin_mm) / spacing_mm))
+        start = min(max(start, 0), shape[axis] - 1)
+        end = max(min(end, shape[axis]), start + 1)
+        slices.append(slice(start, end))
+    slices.append(slice(0, shape[2]))
+    return tuple(slices)
+
+
+def pad_to_full_domain(volume: np.ndarray, slices: Tuple, shape: Tuple) -> np.ndarray:
+    """
+    places a volume that was computed on a cropped domain into a zero-filled volume of the full domain.
+
+    :param volume: volume on the cropped domain
+    :param slices: slices that were used to crop the domain
+    :param shape: shape of the full domain
+    :return: volume on the full domain
+    """
+    full_volume = np.zeros(shape, dtype=volume.dtype)
+    full_volume[slices] = volume
+    return full_volume
+
+
+def _mcx_sources(source: Dict) -> List[Dict]:
+    """
+    splits an mcx source definition into a list of definitions with exactly one source position each.
+
+    :param source: mcx source definition with a single position or one position per row
+    :return: list of mcx source definitions
+    """
+    if np.ndim(source["Pos"]) == 1:
+        return [source]
+    sources = []
+    for idx in range(len(source["Pos"])):
+        single_source = dict()
+        for key, value in source.items():
+            single_source[key] = value[idx] if key != "Type" and np.ndim(value) > 1 else value
+        sources.append(single_source)
+    return sources
+
+
+def rasterize_mcx_source(source: Dict, shape: Tuple) -> np.ndarray:
+    """
+    rasterizes the lateral intensity profile of an mcx source definition onto the (x, y) plane of the voxel grid.
+    Several sources are averaged with equal weights. The profile is normalized to a sum of one.
+    Voxel `i` is assumed to span the mcx grid coordinates [i, i + 1).
+
+    :param source: mcx source definition with one or several sources as created by
+        `IlluminationGeometryBase.get_mcx_illuminator_definition`
+    :param shape: shape of the (x, y) plane in voxels
+    :raises ValueError: if a source type is not supported
+    :return: normalized lateral intensity profile
+    """
+    x, y = np.meshgrid(np.arange(shape[0]) + 0.5, np.arange(shape[1]) + 0.5, indexing="ij")
+    profile = np.zeros(shape)
+    sources = _mcx_sources(source)
+    for _source in sources:
+        source_type = _source["Type"]
+        position = np.asarray(_source["Pos"], dtype=float)
+        param1 = np.asarray(_source["Param1"] if "Param1" in _source else [0, 0, 0, 0], dtype=float)
+        param2 = np.asarray(_source["Param2"] if "Param2" in _source else [0, 0, 0, 0], dtype=float)
+        single_profile = np.zeros(shape)
+        distance_squared = (x - position[0]) ** 2 + (y - position[1]) ** 2
+
+        if source_type == Tags.ILLUMINATION_TYPE_PENCILARRAY and param1[3] > 0 and param2[3] > 0:
+            for i in range(int(param1[3])):
+                for j in range(int(param2[3])):
+                    pencil_position = position[:2] + i / param1[3] * param1[:2] + j / param2[3] * param2[:2]
+                    _add_point(single_profile, pencil_position)
+        elif source_type in [Tags.ILLUMINATION_TYPE_PENCIL, Tags.ILLUMINATION_TYPE_PENCILARRAY]:
+            _add_point(single_profile, position[:2])
+        elif source_type == Tags.ILLUMINATION_TYPE_DISK:
+            single_profile[(distance_squared <= param1[0] ** 2) & (distance_squared >= param1[1] ** 2)] = 1
+        elif source_type == Tags.ILLUMINATION_TYPE_GAUSSIAN:
+            if param1[0] > 0:
+                # mcx defines the gaussian waist at the 1/e^2 intensity threshold
+                single_profile = np.exp(-2 * distance_squared / param1[0] ** 2)
+        elif source_type == Tags.ILLUMINATION_TYPE_SLIT:
+            number_of_samples = max(int(np.ceil(np.linalg.norm(param1[:2]) * 4)), 1)
+            for t in (np.arange(number_of_samples) + 0.5) / number_of_samples:
+                _add_point(single_profile, position[:2] + t * param1[:2])
+        elif source_type == Tags.ILLUMINATION_TYPE_PLANAR:
+            # solve position + a * param1 + b * param2 = (x, y) for a and b
+            matrix = np.asarray([[param1[0], param2[0]], [param1[1], param2[1]]])
+            if abs(np.linalg.det(matrix)) > 0:
+                inverse = np.linalg.inv(matrix)
+                a = inverse[0, 0] * (x - position[0]) + inverse[0, 1] * (y - position[1])
+                b = inverse[1, 0] * (x - position[0]) + inverse[1, 1] * (y - position[1])
+                single_profile[(a >= 0) & (a < 1) & (b >= 0) & (b < 1)] = 1
+        elif source_type == Tags.ILLUMINATION_TYPE_RING:
+            mask = (distance_squared <= param1[0] ** 2) & (distance_squared >= param1[1] ** 2)
+            if param1[2] != 0 or param1[3] != 0:
+                angle = np.mod(np.arctan2(y - position[1], x - position[0]), 2 * np.pi)
+                mask &= (angle >= param1[2]) & (angle <= param1[3])
+            single_profile[mask] = 1
+        else:
+            raise ValueError(f"The illumination type {source_type} is not supported by the analytic fluence model.")
+
+        if np.sum(single_profile) > 0:
+            profile += single_profile / np.sum(single_profile)
+    if np.sum(profile) == 0:
+        raise ValueError("The illumination does not hit the simulated volume.")
+    return profile / np.sum(profile)
+
+
+def _add_point(profile: np.ndarray, position: np.ndarray) -> None:
+    """
+    adds a point source at the given mcx grid position to a lateral profile if it lies within the grid.
+
+    :param profile: lateral profile
+    :param position: mcx grid position in voxels
+    """
+    index = np.floor(position).astype(int)
+    if 0 <= index[0] < profile.shape[0] and 0 <= index[1] < profile.shape[1]:
+        profile[index[0], index[1]] += 1
+
+
+def compute_layered_diffusion_fluence(absorption_per_mm: np.ndarray,
+                                      reduced_scattering_per_mm: np.ndarray,
+                                      lateral_profile_per_mm2: np.ndarray,
+                                      spacing_mm: float,
+                                      source_depth_index: int = 0,
+                                      refractive_index: float = 1.0) -> np.ndarray:
+    """
+    computes the fluence of a collimated beam entering a laterally homogeneous, layered medium from the top
+    (along +z) using the diffusion approximation with extrapolated boundary conditions at the top and bottom of the
+    volume.
+    The collimated beam is attenuated according to the reduced extinction coefficient and acts as the source of the
+    diffuse fluence. The diffusion equation is solved in the lateral Fourier domain, where it reduces to an
+    independent tridiagonal system along z for every lateral spatial frequency, i.e. the multilayer Green's function is
+    convolved with the lateral illumination profile. The fluence is normalized to a unit injected energy.
+
+    :param absorption_per_mm: absorption coefficient per depth voxel in 1/mm, shape (nz,)
+    :param reduced_scattering_per_mm: reduced scattering coefficient per depth voxel in 1/mm, shape (nz,)
+    :param lateral_profile_per_mm2: lateral illumination profile in 1/mm^2, shape (nx, ny), integrating to one
+    :param spacing_mm: voxel spacing in mm
+    :param source_depth_index: index of the depth voxel in which the beam enters the medium
+    :param refractive_index: refractive index of the medium relative to the surroundings
+    :return: fluence in 1/mm^2 with shape (nx, ny, nz)
+    """
+    nx, ny = np.shape(lateral_profile_per_mm2)
+    nz = len(absorption_per_mm)
+    absorption_per_mm = np.asarray(absorption_per_mm, dtype=np.float64)
+    reduced_scattering_per_mm = np.asarray(reduced_scattering_per_mm, dtype=np.float64)
+    extinction_per_mm = absorption_per_mm + reduced_scattering_per_mm
+    diffusion_mm = 1 / (3 * np.maximum(extinction_per_mm, 1e-10))
+
+    # cell-averaged attenuation of the collimated beam
+    optical_depth = extinction_per_mm * spacing_mm
+    optical_depth[:source_depth_index] = 0
+    optical_depth_top = np.concatenate([[0], np.cumsum(optical_depth)[:-1]])
+    cell_average = np.where(optical_depth > 1e-12, -np.expm1(-optical_depth) / np.maximum(optical_depth, 1e-12), 1)
+    collimated_depth_profile = np.exp(-optical_depth_top) * cell_average
+    collimated_depth_profile[:source_depth_index] = 0
+    diffuse_source = reduced_scattering_per_mm * collimated_depth_profile
+
+    # extrapolated boundary condition phi = 2 * A * D * d(phi)/dn expressed as a conductance through the half cell
+    internal_reflection = (-1.44 * refractive_index ** -2 + 0.71 * refractive_index ** -1 + 0.668 +
+                           0.0636 * refractive_index)
+    a_coefficient = (1 + internal_reflection) / (1 - internal_reflection)
+
+    def boundary_conductance(diffusion):
+        half_cell_conductance = 2 * diffusion / spacing_mm
+        return half_cell_conductance / (2 * a_coefficient) / (half_cell_conductance + 1 / (2 * a_coefficient))
+
+    face_diffusion = 2 * diffusion_mm[1:] * diffusion_mm[:-1] / (diffusion_mm[1:] + diffusion_mm[:-1])
+    lower = np.concatenate([[0], -face_diffusion / spacing_mm ** 2])
+    upper = np.concatenate([-face_diffusion / spacing_mm ** 2, [0]])
+    diagonal = absorption_per_mm - lower - upper
+    diagonal[0] += boundary_conductance(diffusion_mm[0]) / spacing_mm
+    diagonal[-1] += boundary_conductance(diffusion_mm[-1]) / spacing_mm
+
+    # zero-pad laterally to suppress the periodic images of the lateral fourier transform
+    padded_nx = next_fast_len(2 * nx)
+    padded_ny = next_fast_len(2 * ny)
+    kx = 2 * np.pi * np.fft.fftfreq(padded_nx, d=spacing_mm)
+    ky = 2 * np.pi * np.fft.rfftfreq(padded_ny, d=spacing_mm)
+    k_squared = kx[:, np.newaxis] ** 2 + ky[np.newaxis, :] ** 2
+    unique_k_squared, inverse_indices = np.unique(k_squared, return_inverse=True)
+
+    # vectorised Thomas algorithm over all unique lateral spatial frequencies
+    greens_function = np.zeros((len(unique_k_squared), nz))
+    modified_upper = np.zeros((len(unique_k_squared), nz))
+    modified_rhs = np.zeros((len(unique_k_squared), nz))
+    for z in range(nz):
+        current_diagonal = diagonal[z] + diffusion_mm[z] * unique_k_squared
+        if z > 0:
+            current_diagonal = current_diagonal - lower[z] * modified_upper[:, z - 1]
+            modified_rhs[:, z] = (diffuse_source[z] - lower[z] * modified_rhs[:, z - 1]) / current_diagonal
+        else:
+            modified_rhs[:, z] = diffuse_source[z] / current_diagonal
+        modified_upper[:, z] = upper[z] / current_diagonal
+    greens_function[:, -1] = modified_rhs[:, -1]
+    for z in range(nz - 2, -1, -1):
+        greens_function[:, z] = modified_rhs[:, z] - modified_upper[:, z] * greens_function[:, z + 1]
+    greens_function = greens_function[inverse_indices.reshape(k_squared.shape)]
+
+    profile_spectrum = np.fft.rfft2(lateral_profile_per_mm2, s=(padded_nx, padded_ny))
+    diffuse_fluence = np.fft.irfft2(profile_spectrum[:, :, np.newaxis] * greens_function,
+                                    s=(padded_nx, padded_ny), axes=(0, 1))[:nx, :ny, :]
+    collimated_fluence = lateral_profile_per_mm2[:, :, np.newaxis] * collimated_depth_profile[np.newaxis, np.newaxis, :]
+    return np.maximum(diffuse_fluence, 0) + collimated_fluence
+
+
+def reweight_time_resolved_fluence(time_resolved_fluence: np.ndarray,
+                                   gate_path_lengths_mm: np.ndarray,
+                                   delta_absorption_per_mm: float) -> np.ndarray:
+    """
+    derives the fluence for a changed absorption coefficient from a time-resolved fluence following the microscopic
+    Beer-Lambert law: every photon that travelled the path length L is reweighted with exp(-delta_mua * L).
+    The photons are assumed to be distributed uniformly in path length within each time gate.
+
+    :param time_resolved_fluence: fluence integrated over each time gate with the time gates along the last axis
+    :param gate_path_lengths_mm: path lengths at the boundaries of the time gates in mm, shape (n_gates + 1,)
+    :param delta_absorption_per_mm: change of the absorption coefficient in 1/mm
+    :return: fluence for the changed absorption summed over all time gates
+    """
+    gate_path_lengths_mm = np.asarray(gate_path_lengths_mm, dtype=np.float64)
+    exponents = -delta_absorption_per_mm * gate_path_lengths_mm
+    gate_widths = -delta_absorption_per_mm * np.diff(gate_path_lengths_mm)
+    # mean of exp(-delta_mua * L) over a uniform distribution of L within each gate
+    weights = np.where(np.abs(gate_widths) > 1e-12,
+                       np.exp(exponents[:-1]) * np.expm1(gate_widths) / np.where(gate_widths != 0, gate_widths, 1),
+                       np.exp(exponents[:-1]))
+    return np.tensordot(time_resolved_fluence, weights.astype(time_resolved_fluence.dtype), axes=([-1], [0]))
@@ -6,20 +6,26 @@ from simpa.utils import Tags
 from simpa.core.simulation_modules.reconstruction_module import ReconstructionAdapterBase
 import numpy as np
 import torch
-from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import compute_delay_and_sum_values, \
-    compute_image_dimensions, preparing_reconstruction_and_obtaining_reconstruction_settings
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import compute_image_dimensions, \
+    get_accumulation_dtype, get_travel_time_tables, iterate_delay_and_sum_value_blocks, \
+    preparing_reconstruction_and_obtaining_reconstruction_settings, rescale_reduced_precision_image
 from simpa.core.device_digital_twins import DetectionGeometryBase
 from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings
 
 
 class DelayAndSumAdapter(ReconstructionAdapterBase):
 
+    accepts_tensors = True
+    supports_batched_frames = True
+
     def reconstruction_algorithm(self, time_series_sensor_data, detection_geometry: DetectionGeometryBase):
         """
         Applies the Delay and Sum beamforming algorithm [1] to the time series sensor data (2D numpy array where the
         first dimension corresponds to the sensor elements and the second to the recorded time steps) with the given
         beamforming settings (dictionary).
         A reconstructed image (2D numpy array) is returned.
+        A batch of frames (3D numpy array with the frames along the first dimension) is reconstructed at once and a
+        reconstructed image is returned for every frame.
         This implementation uses PyTorch Tensors to perform computations and is able to run on GPUs.
 
         [1] T. Kirchner et al. 2018, "Signed Real-Time Delay Multiply and Sum Beamforming for Multispectral
@@ -33,25 +39,30 @@ class DelayAndSumAdapter(ReconstructionAdapterBase):
 
         xdim, zdim, ydim, xdim_start, xdim_end, ydim_start, ydim_end, zdim_start, zdim_end = compute_image_dimensions(
             detection_geometry.field_of_view_extent_mm, spacing_in_mm, self.logger)
+        travel_time_tables = get_travel_time_tables(
+            self.component_settings, self.global_settings, detection_geometry, xdim, ydim, zdim, xdim_start,
+            ydim_start, zdim_start, spacing_in_mm, torch_device, self.logger)
 
         if zdim == 1:
             sensor_positions[:, 1] = 0  # Assume imaging plane
 
-        # construct output image
-        output = torch.zeros((xdim, ydim, zdim), dtype=torch.float32, device=torch_device)
-
-        values, _ = compute_delay_and_sum_values(time_series_sensor_data, sensor_positions, xdim,
-                                                 ydim, zdim, xdim_start, xdim_end, ydim_start, ydim_end, zdim_start, zdim_end, spacing_in_mm, speed_of_sound_in_m_per_s,
-                                                 time_spacing_in_ms, self.logger, torch_device,
-                                                 self.component_settings)
+        # construct output image, with the frames along the first dimension for a batch of frames
+        output = self.get_output_buffer(time_series_sensor_data.shape[:-2] + (xdim, ydim, zdim), torch_device)
 
-        _sum = torch.sum(values, dim=3)
-        counter = torch.count_nonzero(values, dim=3)
-        torch.divide(_sum, counter, out=output)
+        # the values are normalised by the number of non-zero values, which are counted in single precision also
+        # for reduced precisions
+        for image_block, values, _, counter in iterate_delay_and_sum_value_blocks(
+                time_series_sensor_data, sensor_positions, xdim, ydim, zdim, xdim_start, xdim_end, ydim_start,
+                ydim_end, zdim_start, zdim_end, spacing_in_mm, speed_of_sound_in_m_per_s, time_spacing_in_ms,
+                self.logger, torch_device, self.component_settings, travel_time_tables, count_nonzero_values=True,
+                plan_cache=self.beamforming_plan_cache):
+            _sum = torch.sum(values, dim=-1, dtype=get_accumulation_dtype(values))
+            output[(...,) + image_block] = torch.divide(_sum, counter)
 
-        reconstructed = output.cpu().numpy()
+        output = rescale_reduced_precision_image(output, time_series_sensor_data, self.component_settings)
+        reconstructed = self.output_buffer_to_numpy(output)
 
-        return reconstructed.squeeze()
+        return self.squeeze_image_dimensions(reconstructed, xdim, ydim, zdim)
 
 
 def reconstruct_delay_and_sum_pytorch(time_series_sensor_data: np.ndarray,
@@ -78,3 +89,35 @@ def reconstruct_delay_and_sum_pytorch(time_series_sensor_data: np.ndarray,
                                               recon_mode, apodization)
     adapter = DelayAndSumAdapter(settings)
     return adapter.reconstruction_algorithm(time_series_sensor_data, detection_geometry)
+
+
+def reconstruct_delay_and_sum_frames_pytorch(time_series_sensor_data: np.ndarray,
+                                             detection_geometry: DetectionGeometryBase,
+                                             speed_of_sound_in_m_per_s: int = 1540,
+                                             time_spacing_in_s: float = 2.5e-8,
+                                             sensor_spacing_in_mm: float = 0.1,
+                                             recon_mode: str = Tags.RECONSTRUCTION_MODE_PRESSURE,
+                                             apodization: str = Tags.RECONSTRUCTION_APODIZATION_BOX,
+                                             memory_budget_in_mb: float = None) -> np.ndarray:
+    """
+    Convenience function for reconstructing a batch of frames, e.g. all wavelengths of a stored dataset, using the
+    Delay and Sum algorithm implemented in PyTorch. The delays are computed once for all frames.
+
+    :param time_series_sensor_data: (3D numpy array) sensor data of shape (frames, sensor elements, time steps)
+    :param detection_geometry: The DetectionGeometryBase that should be used to reconstruct the given time series data
+    :param speed_of_sound_in_m_per_s: (int) speed of sound in medium in meters per second (default: 1540 m/s)
+    :param time_spacing_in_s: (float) time between sampling points in seconds (default: 2.5e-8 s which is equal to 40 MHz)
+    :param sensor_spacing_in_mm: (float) space between sensor elements in millimeters (default: 0.1 mm)
+    :param recon_mode: SIMPA Tag defining the reconstruction mode - pressure default OR differential
+    :param apodization: SIMPA Tag defining the apodization function (default box)
+    :param memory_budget_in_mb: (float) memory available for the intermediate tensors of the reconstruction in MB
+        (default: None, all pixels of all frames are reconstructed at once)
+    :return: (numpy array) reconstructed images with the frames along the first dimension
+    """
+    # create settings
+    settings = create_reconstruction_settings(speed_of_sound_in_m_per_s, time_spacing_in_s, sensor_spacing_in_mm,
+                                              recon_mode, apodization)
+    if memory_budget_in_mb is not None:
+        settings.get_reconstruction_settings()[Tags.RECONSTRUCTION_MEMORY_BUDGET_MB] = memory_budget_in_mb
+    adapter = DelayAndSumAdapter(settings)
+    return adapter.reconstruct_frames(time_series_sensor_data, detection_geometry)
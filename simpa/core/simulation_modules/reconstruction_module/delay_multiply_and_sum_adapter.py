@@ -7,19 +7,26 @@ from simpa.core.simulation_modules.reconstruction_module import ReconstructionAd
 from simpa.core.device_digital_twins import DetectionGeometryBase
 import numpy as np
 import torch
-from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import compute_delay_and_sum_values, \
-    preparing_reconstruction_and_obtaining_reconstruction_settings, compute_image_dimensions
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import \
+    compute_delay_multiply_and_sum, get_travel_time_tables, iterate_delay_and_sum_value_blocks, \
+    preparing_reconstruction_and_obtaining_reconstruction_settings, compute_image_dimensions, \
+    rescale_reduced_precision_image
 from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings
 
 
 class DelayMultiplyAndSumAdapter(ReconstructionAdapterBase):
 
+    accepts_tensors = True
+    supports_batched_frames = True
+
     def reconstruction_algorithm(self, time_series_sensor_data, detection_geometry: DetectionGeometryBase):
         """
         Applies the Delay Multiply and Sum beamforming algorithm [1] to the time series sensor data (2D numpy array where the
         first dimension corresponds to the sensor elements and the second to the recorded time steps) with the given
         beamforming settings (dictionary).
         A reconstructed image (2D numpy array) is returned.
+        A batch of frames (3D numpy array with the frames along the first dimension) is reconstructed at once and a
+        reconstructed image is returned for every frame.
         This implementation uses PyTorch Tensors to perform computations and is able to run on GPUs.
 
         [1] T. Kirchner et al. 2018, "Signed Real-Time Delay Multiply and Sum Beamforming for Multispectral
@@ -33,32 +40,27 @@ class DelayMultiplyAndSumAdapter(ReconstructionAdapterBase):
 
         xdim, zdim, ydim, xdim_start, xdim_end, ydim_start, ydim_end, zdim_start, zdim_end = compute_image_dimensions(
             detection_geometry.field_of_view_extent_mm, spacing_in_mm, self.logger)
+        travel_time_tables = get_travel_time_tables(
+            self.component_settings, self.global_settings, detection_geometry, xdim, ydim, zdim, xdim_start,
+            ydim_start, zdim_start, spacing_in_mm, torch_device, self.logger)
 
         if zdim == 1:
             sensor_positions[:, 1] = 0  # Assume imaging plane
 
-        # construct output image
-        output = torch.zeros((xdim, ydim, zdim), dtype=torch.float32, device=torch_device)
-
-        values, n_sensor_elements = compute_delay_and_sum_values(time_series_sensor_data, sensor_positions, xdim,
-                                                                 ydim, zdim, xdim_start, xdim_end, ydim_start, ydim_end,
-                                                                 zdim_start, zdim_end, spacing_in_mm, speed_of_sound_in_m_per_s,
-                                                                 time_spacing_in_ms, self.logger, torch_device,
-                                                                 self.component_settings)
+        # construct output image, with the frames along the first dimension for a batch of frames
+        output = self.get_output_buffer(time_series_sensor_data.shape[:-2] + (xdim, ydim, zdim), torch_device)
 
-        for x in range(xdim):
-            yy, zz, nn, mm = torch.meshgrid(torch.arange(ydim, device=torch_device),
-                                            torch.arange(zdim, device=torch_device),
-                                            torch.arange(n_sensor_elements, device=torch_device),
-                                            torch.arange(n_sensor_elements, device=torch_device))
-            M = values[x, yy, zz, nn] * values[x, yy, zz, mm]
-            M = torch.sign(M) * torch.sqrt(torch.abs(M))
-            # only take upper triangle without diagonal and sum up along n and m axis (last two)
-            output[x] = torch.triu(M, diagonal=1).sum(dim=(-1, -2))
+        for image_block, values, _ in iterate_delay_and_sum_value_blocks(
+                time_series_sensor_data, sensor_positions, xdim, ydim, zdim, xdim_start, xdim_end, ydim_start,
+                ydim_end, zdim_start, zdim_end, spacing_in_mm, speed_of_sound_in_m_per_s, time_spacing_in_ms,
+                self.logger, torch_device, self.component_settings, travel_time_tables,
+                plan_cache=self.beamforming_plan_cache):
+            output[(...,) + image_block] = compute_delay_multiply_and_sum(values)
 
-        reconstructed = output.cpu().numpy()
+        output = rescale_reduced_precision_image(output, time_series_sensor_data, self.component_settings)
+        reconstructed = self.output_buffer_to_numpy(output)
 
-        return reconstructed.squeeze()
+        return self.squeeze_image_dimensions(reconstructed, xdim, ydim, zdim)
 
 
 def reconstruct_delay_multiply_and_sum_pytorch(time_series_sensor_data: np.ndarray,
@@ -0,0 +1,203 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+import torch
+import torch.fft
+import torch.nn.functional
+from simpa.utils import Tags
+from simpa.core.simulation_modules.reconstruction_module import ReconstructionAdapterBase
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import compute_image_dimensions, \
+    preparing_reconstruction_and_obtaining_reconstruction_settings
+from simpa.core.device_digital_twins import DetectionGeometryBase, LinearArrayDetectionGeometry, \
+    PlanarArrayDetectionGeometry
+from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings
+
+
+class FourierDomainReconstructionAdapter(ReconstructionAdapterBase):
+    """
+    Reconstructs the initial pressure with the Fourier domain (k-space) reconstruction for planar detection surfaces
+    [1, 2]: The time series data of a linear or planar array is transformed with an FFT into the frequency and
+    lateral wavenumber domain, interpolated onto the wavenumber grid of the image with the dispersion relation
+    omega = c |k| and transformed back with an inverse FFT. This costs O(N log N) for N samples of the sensor data
+    instead of O(pixels x sensor elements) of Delay and Sum.
+    The time series data is mirrored about t = 0 and zero-padded laterally to the double number of detector elements
+    to avoid wrap-around artifacts. The reconstruction on the grid of the detector elements and the time samples is
+    linearly interpolated onto the pixels of the field of view.
+    Bandpass filtering, B-mode and the reconstruction mode are applied as for the other reconstruction adapters.
+
+    [1] K. P. Koestli et al. 2001, "Temporal backward projection of optoacoustic pressure transients using Fourier
+    transform methods", https://doi.org/10.1088/0031-9155/46/7/305
+    [2] B. E. Treeby and B. T. Cox 2010, "k-Wave: MATLAB toolbox for the simulation and reconstruction of
+    photoacoustic wave fields", https://doi.org/10.1117/1.3360308
+    """
+
+    accepts_tensors = True
+    supports_batched_frames = True
+
+    def reconstruction_algorithm(self, time_series_sensor_data, detection_geometry: DetectionGeometryBase):
+        """
+        Applies the Fourier domain reconstruction to the time series sensor data (2D numpy array where the first
+        dimension corresponds to the sensor elements and the second to the recorded time steps) of a linear or
+        planar array.
+        A reconstructed image (2D numpy array for a linear array and 3D numpy array for a planar array) is returned.
+        A batch of frames (with the frames along the first dimension) is reconstructed at once and a reconstructed
+        image is returned for every frame.
+        """
+
+        if isinstance(detection_geometry, LinearArrayDetectionGeometry):
+            number_detector_elements_x = detection_geometry.number_detector_elements
+            number_detector_elements_y = 1
+        elif isinstance(detection_geometry, PlanarArrayDetectionGeometry):
+            number_detector_elements_x = detection_geometry.number_detector_elements_x
+            number_detector_elements_y = detection_geometry.number_detector_elements_y
+        else:
+            msg = f"The Fourier domain reconstruction is only available for linear and planar arrays, " \
+                  f"not for {type(detection_geometry)}."
+            self.logger.critical(msg)
+            raise TypeError(msg)
+
+        time_series_sensor_data, sensor_positions, speed_of_sound_in_m_per_s, spacing_in_mm, time_spacing_in_ms, torch_device = preparing_reconstruction_and_obtaining_reconstruction_settings(
+            time_series_sensor_data, self.component_settings, self.global_settings, detection_geometry, self.logger)
+
+        xdim, zdim, ydim, xdim_start, xdim_end, ydim_start, ydim_end, zdim_start, zdim_end = compute_image_dimensions(
+            detection_geometry.field_of_view_extent_mm, spacing_in_mm, self.logger)
+
+        if number_detector_elements_y == 1 and zdim > 1:
+            msg = "The Fourier domain reconstruction of a linear array is limited to the imaging plane."
+            self.logger.critical(msg)
+            raise AttributeError(msg)
+
+        # arrange the time series data on the grid of the detector elements: (frames, x, y, time steps)
+        batch_shape = time_series_sensor_data.shape[:-2]
+        n_time_steps = time_series_sensor_data.shape[-1]
+        time_series_sensor_data = time_series_sensor_data.float().reshape(
+            -1, number_detector_elements_y, number_detector_elements_x, n_time_steps).transpose(1, 2)
+
+        # zero-padding to the double number of detector elements in each lateral dimension
+        padding_x = number_detector_elements_x // 2 if number_detector_elements_x > 1 else 0
+        padding_y = number_detector_elements_y // 2 if number_detector_elements_y > 1 else 0
+        time_series_sensor_data = torch.nn.functional.pad(time_series_sensor_data,
+                                                          (0, 0, padding_y, padding_y, padding_x, padding_x))
+
+        reconstruction = compute_fourier_domain_reconstruction(time_series_sensor_data, detection_geometry.pitch_mm,
+                                                               speed_of_sound_in_m_per_s, time_spacing_in_ms)
+
+        # positions of the reconstructed samples in mm
+        sensor_positions = sensor_positions.cpu().numpy()
+        grid_start_mm = [np.min(sensor_positions[:, 0]) - padding_x * detection_geometry.pitch_mm,
+                         np.min(sensor_positions[:, 1]) - padding_y * detection_geometry.pitch_mm,
+                         0]
+        grid_spacing_mm = [detection_geometry.pitch_mm, detection_geometry.pitch_mm,
+                           speed_of_sound_in_m_per_s * time_spacing_in_ms]
+
+        # positions of the pixels of the field of view in mm, as for Delay and Sum
+        x_offset = 0.5 if xdim % 2 == 0 else 0
+        pixel_positions_mm = [(xdim_start + np.arange(xdim) + x_offset) * spacing_in_mm,
+                              np.zeros(1) if zdim == 1 else (zdim_start + np.arange(zdim)) * spacing_in_mm,
+                              (ydim_start + np.arange(ydim)) * spacing_in_mm]
+
+        # normalised coordinates of the pixels for the linear interpolation with grid_sample
+        normalised_positions = []
+        for positions, start, grid_spacing, size in zip(pixel_positions_mm, grid_start_mm, grid_spacing_mm,
+                                                         reconstruction.shape[1:]):
+            if size == 1:
+                normalised_positions.append(np.zeros_like(positions))
+            else:
+                normalised_positions.append(2 * (positions - start) / (grid_spacing * (size - 1)) - 1)
+        xx, zz, yy = np.meshgrid(*normalised_positions, indexing="ij")
+        grid = torch.from_numpy(np.stack([yy, zz, xx], axis=-1)).float().to(torch_device)
+        grid = grid.expand(reconstruction.shape[0], *grid.shape)
+
+        output = torch.nn.functional.grid_sample(reconstruction.unsqueeze(1), grid, mode="bilinear",
+                                                 padding_mode="zeros", align_corners=True)
+        # (frames, x, z, y) -> (frames, x, y, z)
+        output = output[:, 0].permute(0, 1, 3, 2).reshape(batch_shape + (xdim, ydim, zdim))
+
+        reconstructed = output.cpu().numpy()
+
+        return self.squeeze_image_dimensions(reconstructed, xdim, ydim, zdim)
+
+
+def compute_fourier_domain_reconstruction(time_series_sensor_data: torch.Tensor, pitch_mm: float,
+                                          speed_of_sound_in_m_per_s: float,
+                                          time_spacing_in_ms: float) -> torch.Tensor:
+    """
+    Reconstructs the initial pressure from time series data that is sampled on a regular grid of a planar detection
+    surface at depth 0 with the Fourier domain reconstruction.
+
+    :param time_series_sensor_data: (torch tensor) time series data of shape (frames, x, y, time steps)
+    :param pitch_mm: (float) distance between the detector elements in mm
+    :param speed_of_sound_in_m_per_s: (float) speed of sound in m/s
+    :param time_spacing_in_ms: (float) temporal spacing of the time series data in ms
+    :return: (torch tensor) initial pressure of shape (frames, x, y, depth) on the grid of the detector elements with
+        a depth spacing of speed of sound times time spacing
+    """
+    # with distances in mm and times in ms, the speed of sound in m/s is in mm/ms
+    speed_of_sound = speed_of_sound_in_m_per_s
+    torch_device = time_series_sensor_data.device
+    n_x, n_y, n_time_steps = time_series_sensor_data.shape[-3:]
+
+    # mirror the time series data about t = 0, so that the cosine transform along time is computed with an FFT
+    time_series_sensor_data = torch.cat([torch.flip(time_series_sensor_data, dims=[-1]),
+                                         time_series_sensor_data[..., 1:]], dim=-1)
+    n_mirrored = time_series_sensor_data.shape[-1]
+    spectrum = torch.fft.fftshift(torch.fft.fftn(torch.fft.ifftshift(time_series_sensor_data, dim=-1),
+                                                 dim=(-3, -2, -1)), dim=-1)
+
+    omega = 2 * np.pi * torch.fft.fftshift(torch.fft.fftfreq(n_mirrored, d=time_spacing_in_ms, device=torch_device))
+    k_x = 2 * np.pi * torch.fft.fftfreq(n_x, d=pitch_mm, device=torch_device)
+    k_y = 2 * np.pi * torch.fft.fftfreq(n_y, d=pitch_mm, device=torch_device)
+    # the depth sampling of speed of sound times time spacing gives the same grid for the depth wavenumber
+    k_z = omega / speed_of_sound
+    k = torch.sqrt(k_x[:, None, None] ** 2 + k_y[None, :, None] ** 2 + k_z[None, None, :] ** 2)
+
+    # linear interpolation of the spectrum at the frequencies given by the dispersion relation omega = c |k|
+    delta_omega = float(omega[1] - omega[0])
+    fractional_indices = (speed_of_sound * k - omega[0]) / delta_omega
+    lower_indices = torch.floor(fractional_indices).long()
+    invalid = lower_indices >= n_mirrored - 1
+    lower_indices = torch.clip(lower_indices, max=n_mirrored - 2)
+    upper_weights = (fractional_indices - lower_indices).to(spectrum.dtype)
+    lower_indices = lower_indices.expand(spectrum.shape)
+    interpolated_spectrum = (torch.gather(spectrum, -1, lower_indices) * (1 - upper_weights) +
+                             torch.gather(spectrum, -1, lower_indices + 1) * upper_weights)
+    interpolated_spectrum = interpolated_spectrum.masked_fill(invalid, 0)
+
+    # Jacobian of the change of variables from omega to k_z, with its limit c / 2 at k = 0
+    scaling = torch.where(k > 0, speed_of_sound * torch.abs(k_z[None, None, :]) / (2 * k.clip(min=1e-12)),
+                          torch.full_like(k, speed_of_sound / 2))
+    interpolated_spectrum = interpolated_spectrum * scaling.to(spectrum.dtype)
+
+    reconstruction = torch.real(torch.fft.fftshift(torch.fft.ifftn(torch.fft.ifftshift(interpolated_spectrum, dim=-1),
+                                                                   dim=(-3, -2, -1)), dim=-1))
+    # remove the part that corresponds to the mirrored negative times, the reconstruction assumes the initial
+    # pressure to be symmetric about the detection surface
+    reconstruction = reconstruction[..., (n_mirrored - 1) // 2:]
+    return 4 * reconstruction / speed_of_sound
+
+
+def reconstruct_fourier_domain_pytorch(time_series_sensor_data: np.ndarray,
+                                       detection_geometry: DetectionGeometryBase,
+                                       speed_of_sound_in_m_per_s: int = 1540,
+                                       time_spacing_in_s: float = 2.5e-8,
+                                       sensor_spacing_in_mm: float = 0.1,
+                                       recon_mode: str = Tags.RECONSTRUCTION_MODE_PRESSURE) -> np.ndarray:
+    """
+    Convenience function for reconstructing time series data of a linear or planar array using the Fourier domain
+    reconstruction implemented in PyTorch
+
+    :param time_series_sensor_data: (2D numpy array) sensor data of shape (sensor elements, time steps)
+    :param detection_geometry: The linear or planar array that should be used to reconstruct the given time series data
+    :param speed_of_sound_in_m_per_s: (int) speed of sound in medium in meters per second (default: 1540 m/s)
+    :param time_spacing_in_s: (float) time between sampling points in seconds (default: 2.5e-8 s which is equal to 40 MHz)
+    :param sensor_spacing_in_mm: (float) space between pixels of the reconstructed image in millimeters (default: 0.1 mm)
+    :param recon_mode: SIMPA Tag defining the reconstruction mode - pressure default OR differential
+    :return: (numpy array) reconstructed image
+    """
+    # create settings
+    settings = create_reconstruction_settings(speed_of_sound_in_m_per_s, time_spacing_in_s, sensor_spacing_in_mm,
+                                              recon_mode)
+    adapter = FourierDomainReconstructionAdapter(settings)
+    return adapter.reconstruction_algorithm(time_series_sensor_data, detection_geometry)
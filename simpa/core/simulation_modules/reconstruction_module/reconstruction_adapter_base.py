@@ -11,8 +11,11 @@ from simpa.core.simulation_modules import SimulationModuleBase
 from simpa.utils.dict_path_manager import generate_dict_path
 from simpa.io_handling.io_hdf5 import save_hdf5
 import numpy as np
+import torch
 from simpa.utils import Settings
+from simpa.utils.processing_device import get_processing_device
 from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import bandpass_filter_with_settings, apply_b_mode
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import BEAMFORMING_PLAN_CACHE
 from simpa.utils.quality_assurance.data_sanity_testing import assert_array_well_defined
 
 
@@ -23,8 +26,19 @@ class ReconstructionAdapterBase(SimulationModuleBase):
     respective settings dictionary.
     """
 
+    # True if reconstruction_algorithm accepts the time series data as a torch tensor on the processing device
+    accepts_tensors = False
+    # True if reconstruction_algorithm reconstructs a batch of frames with the frames along the first dimension at once
+    supports_batched_frames = False
+
     def __init__(self, global_settings: Settings):
         super(ReconstructionAdapterBase, self).__init__(global_settings=global_settings)
+        # cache of the beamforming plans of the delay and sum based adapters
+        self.beamforming_plan_cache = BEAMFORMING_PLAN_CACHE
+        # if True, the reconstructed images are written into buffers that are reused for every reconstruction
+        self.reuse_output_buffer = False
+        self.output_buffer = None
+        self.host_output_buffer = None
 
     def load_component_settings(self) -> Settings:
         """Implements abstract method to serve reconstruction settings as component settings
@@ -45,36 +59,107 @@ class ReconstructionAdapterBase(SimulationModuleBase):
         """
         pass
 
-    def run(self, device):
-        self.logger.info("Performing reconstruction...")
+    def get_output_buffer(self, shape: tuple, torch_device: torch.device) -> torch.Tensor:
+        """
+        returns a float32 tensor of zeros for the reconstructed image. If self.reuse_output_buffer is True, the tensor
+        is allocated once and reused as long as the shape and the device stay the same.
 
-        time_series_sensor_data = load_data_field(self.global_settings[Tags.SIMPA_OUTPUT_FILE_PATH],
-                                                  Tags.DATA_FIELD_TIME_SERIES_DATA, self.global_settings[Tags.WAVELENGTH])
+        :param shape: shape of the reconstructed image
+        :param torch_device: device of the reconstruction
+        :return: tensor of zeros
+        """
+        if not self.reuse_output_buffer:
+            return torch.zeros(shape, dtype=torch.float32, device=torch_device)
+        if self.output_buffer is None or self.output_buffer.shape != shape or \
+                self.output_buffer.device != torch.device(torch_device):
+            self.output_buffer = torch.zeros(shape, dtype=torch.float32, device=torch_device)
+        return self.output_buffer.zero_()
+
+    def output_buffer_to_numpy(self, output: torch.Tensor) -> np.ndarray:
+        """
+        returns the reconstructed image as a numpy array. If self.reuse_output_buffer is True, an image on the GPU is
+        copied into a host buffer that is reused as well, so that the returned array is overwritten by the next
+        reconstruction.
 
-        _device = None
-        if isinstance(device, DetectionGeometryBase):
-            _device = device
-        elif isinstance(device, PhotoacousticDevice):
-            _device = device.get_detection_geometry()
-        else:
-            raise TypeError(f"Type {type(device)} is not supported for performing image reconstruction.")
+        :param output: reconstructed image of `get_output_buffer`
+        :return: reconstructed image
+        """
+        if not self.reuse_output_buffer or output.device.type == "cpu":
+            return output.cpu().numpy()
+        if self.host_output_buffer is None or self.host_output_buffer.shape != output.shape:
+            self.host_output_buffer = torch.empty(output.shape, dtype=output.dtype, pin_memory=True)
+        return self.host_output_buffer.copy_(output).numpy()
+
+    @staticmethod
+    def squeeze_image_dimensions(reconstructed: np.ndarray, xdim: int, ydim: int, zdim: int) -> np.ndarray:
+        """
+        Removes the image dimensions of size one from a reconstructed image of shape (..., xdim, ydim, zdim), but keeps
+        the frame dimension of a batch, even if it only contains a single frame.
+
+        :param reconstructed: the reconstructed image or batch of images
+        :param xdim: number of pixels along x
+        :param ydim: number of pixels along y
+        :param zdim: number of pixels along z
+        :return: the reconstructed image without the image dimensions of size one
+        """
+        return reconstructed.reshape(reconstructed.shape[:-3] + tuple(dim for dim in (xdim, ydim, zdim) if dim > 1))
+
+    def reconstruct_frames(self, time_series_sensor_data: np.ndarray,
+                           detection_geometry: DetectionGeometryBase) -> np.ndarray:
+        """
+        Reconstructs a batch of frames, e.g. the time series sensor data of several wavelengths or a recorded
+        sequence. Adapters that set supports_batched_frames reconstruct all frames at once and share the delays and
+        weights between them, all others reconstruct the frames one after another.
+
+        :param time_series_sensor_data: the time series sensor data of shape (frames, sensor elements, time steps)
+        :param detection_geometry:
+        :return: the reconstructed photoacoustic images with the frames along the first dimension
+        """
+        if self.supports_batched_frames:
+            return self.reconstruction_algorithm(time_series_sensor_data, detection_geometry)
+        return np.stack([self.reconstruction_algorithm(frame, detection_geometry)
+                         for frame in time_series_sensor_data])
 
-        if Tags.RECONSTRUCTION_PERFORM_BANDPASS_FILTERING in self.component_settings and \
-                self.component_settings[Tags.RECONSTRUCTION_PERFORM_BANDPASS_FILTERING]:
+    def reconstruct_with_settings(self, time_series_sensor_data,
+                                  detection_geometry: DetectionGeometryBase) -> np.ndarray:
+        """
+        Reconstructs the time series sensor data with the reconstruction algorithm and applies the bandpass filtering
+        and envelope detection that are specified in the component settings before and after it.
+        The time series data is moved to the processing device once before the filtering and envelope detection, which
+        then use the torch FFTs of `bandpass_filtering_pytorch` and `hilbert_envelope_pytorch`. It stays there for
+        adapters that accept tensors and is moved back to a numpy array for all others.
+
+        :param time_series_sensor_data: the time series sensor data
+        :param detection_geometry:
+        :return: a reconstructed photoacoustic image
+        """
+        bandpass_filtering = Tags.RECONSTRUCTION_PERFORM_BANDPASS_FILTERING in self.component_settings and \
+            self.component_settings[Tags.RECONSTRUCTION_PERFORM_BANDPASS_FILTERING]
+        b_mode_before_reconstruction = Tags.RECONSTRUCTION_BMODE_BEFORE_RECONSTRUCTION in self.component_settings \
+            and self.component_settings[Tags.RECONSTRUCTION_BMODE_BEFORE_RECONSTRUCTION] \
+            and Tags.RECONSTRUCTION_BMODE_METHOD in self.component_settings
+
+        if bandpass_filtering or b_mode_before_reconstruction:
+            if isinstance(time_series_sensor_data, np.ndarray):
+                time_series_sensor_data = torch.from_numpy(np.ascontiguousarray(time_series_sensor_data))
+            time_series_sensor_data = time_series_sensor_data.to(get_processing_device(self.global_settings))
+
+        if bandpass_filtering:
 
             time_series_sensor_data = bandpass_filter_with_settings(time_series_sensor_data,
                                                                     self.global_settings,
                                                                     self.component_settings,
-                                                                    _device)
+                                                                    detection_geometry)
 
         # check for B-mode methods and perform envelope detection on time series data if specified
-        if Tags.RECONSTRUCTION_BMODE_BEFORE_RECONSTRUCTION in self.component_settings \
-                and self.component_settings[Tags.RECONSTRUCTION_BMODE_BEFORE_RECONSTRUCTION] \
-                and Tags.RECONSTRUCTION_BMODE_METHOD in self.component_settings:
+        if b_mode_before_reconstruction:
             time_series_sensor_data = apply_b_mode(
                 time_series_sensor_data, method=self.component_settings[Tags.RECONSTRUCTION_BMODE_METHOD])
 
-        reconstruction = self.reconstruction_algorithm(time_series_sensor_data, _device)
+        if isinstance(time_series_sensor_data, torch.Tensor) and not self.accepts_tensors:
+            time_series_sensor_data = time_series_sensor_data.cpu().numpy()
+
+        reconstruction = self.reconstruction_algorithm(time_series_sensor_data, detection_geometry)
 
         # check for B-mode methods and perform envelope detection on time series data if specified
         if Tags.RECONSTRUCTION_BMODE_AFTER_RECONSTRUCTION in self.component_settings \
@@ -83,6 +168,24 @@ class ReconstructionAdapterBase(SimulationModuleBase):
             reconstruction = apply_b_mode(
                 reconstruction, method=self.component_settings[Tags.RECONSTRUCTION_BMODE_METHOD])
 
+        return reconstruction
+
+    def run(self, device):
+        self.logger.info("Performing reconstruction...")
+
+        time_series_sensor_data = load_data_field(self.global_settings[Tags.SIMPA_OUTPUT_FILE_PATH],
+                                                  Tags.DATA_FIELD_TIME_SERIES_DATA, self.global_settings[Tags.WAVELENGTH])
+
+        _device = None
+        if isinstance(device, DetectionGeometryBase):
+            _device = device
+        elif isinstance(device, PhotoacousticDevice):
+            _device = device.get_detection_geometry()
+        else:
+            raise TypeError(f"Type {type(device)} is not supported for performing image reconstruction.")
+
+        reconstruction = self.reconstruct_with_settings(time_series_sensor_data, _device)
+
         if not (Tags.IGNORE_QA_ASSERTIONS in self.global_settings and Tags.IGNORE_QA_ASSERTIONS):
             assert_array_well_defined(reconstruction, array_name="reconstruction")
 
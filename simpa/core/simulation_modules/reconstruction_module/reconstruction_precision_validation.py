@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import time
+from typing import Dict, Tuple, Type
+
+import numpy as np
+
+from simpa.core.device_digital_twins import (CurvedArrayDetectionGeometry, DetectionGeometryBase,
+                                             LinearArrayDetectionGeometry)
+from simpa.core.simulation_modules.reconstruction_module import ReconstructionAdapterBase, \
+    create_reconstruction_settings
+from simpa.core.simulation_modules.reconstruction_module.delay_and_sum_adapter import DelayAndSumAdapter
+from simpa.log.file_logger import Logger
+from simpa.utils import Tags
+
+
+def simulate_sphere_time_series(detection_geometry: DetectionGeometryBase, sphere_positions_mm: np.ndarray,
+                                sphere_radius_mm: float, speed_of_sound_in_m_per_s: float, time_spacing_in_s: float,
+                                n_time_steps: int) -> np.ndarray:
+    """
+    Computes the analytic time series data of uniformly heated spheres with an initial pressure of 1 in a homogeneous
+    medium, which is N-shaped at every sensor element.
+
+    :param detection_geometry: detection geometry with the sensor element positions
+    :param sphere_positions_mm: (numpy array) centres of the spheres of shape (spheres, 3) in the coordinates of
+        `get_detector_element_positions_base_mm`
+    :param sphere_radius_mm: (float) radius of the spheres in mm
+    :param speed_of_sound_in_m_per_s: (float) speed of sound in m/s
+    :param time_spacing_in_s: (float) time between the samples in s
+    :param n_time_steps: (int) number of samples
+    :return: (numpy array) time series data of shape (sensor elements, time steps)
+    """
+    sensor_positions = detection_geometry.get_detector_element_positions_base_mm()
+    travelled_distances = speed_of_sound_in_m_per_s * 1000 * time_spacing_in_s * np.arange(n_time_steps)
+    time_series_data = np.zeros((len(sensor_positions), n_time_steps))
+    for sphere_position in np.reshape(sphere_positions_mm, (-1, 3)):
+        distances = np.linalg.norm(sensor_positions - sphere_position, axis=1)[:, np.newaxis]
+        pressure = (distances - travelled_distances) / (2 * distances)
+        pressure[np.abs(distances - travelled_distances) > sphere_radius_mm] = 0
+        time_series_data += pressure
+    return time_series_data
+
+
+def get_precision_test_phantoms(speed_of_sound_in_m_per_s: float = 1540, time_spacing_in_s: float = 5e-8,
+                                n_time_steps: int = 800,
+                                small_amplitude: float = 1e-7) -> Dict[str, Tuple[DetectionGeometryBase, np.ndarray]]:
+    """
+    Returns the standard phantoms for validating the reconstruction precision: spheres with a radius of 0.5 mm at
+    several depths in front of a linear array and around the centre of a curved array. Every phantom is also returned
+    with its time series data scaled by the small amplitude, like pressures in Pa, which lie below the range of
+    float16.
+
+    :param small_amplitude: (float) scale of the time series data of the small amplitude phantoms
+    :return: dictionary of the phantom names and tuples of the detection geometry and the time series data
+    """
+    linear_array = LinearArrayDetectionGeometry(pitch_mm=0.3, number_detector_elements=64,
+                                                field_of_view_extent_mm=np.array([-8, 8, 0, 0, 0, 16]))
+    curved_array = CurvedArrayDetectionGeometry(pitch_mm=0.5, radius_mm=40, number_detector_elements=128,
+                                                field_of_view_extent_mm=np.array([-8, 8, 0, 0, -8, 8]))
+    phantoms = {
+        "linear_array_spheres": (linear_array, np.array([[-4, 0, 4], [0, 0, 8], [4, 0, 12]])),
+        "curved_array_spheres": (curved_array, np.array([[-4, 0, -4], [0, 0, 0], [4, 0, 4]]))
+    }
+    test_phantoms = dict()
+    for name, (detection_geometry, sphere_positions_mm) in phantoms.items():
+        time_series_data = simulate_sphere_time_series(detection_geometry, sphere_positions_mm, 0.5,
+                                                       speed_of_sound_in_m_per_s, time_spacing_in_s, n_time_steps)
+        test_phantoms[name] = (detection_geometry, time_series_data)
+        test_phantoms[f"{name}_small_amplitude"] = (detection_geometry, time_series_data * small_amplitude)
+    return test_phantoms
+
+
+def validate_reconstruction_precision(adapter_class: Type[ReconstructionAdapterBase] = DelayAndSumAdapter,
+                                      precisions: tuple = (Tags.RECONSTRUCTION_PRECISION_FLOAT16,
+                                                           Tags.RECONSTRUCTION_PRECISION_BFLOAT16),
+                                      phantoms: Dict[str, Tuple[DetectionGeometryBase, np.ndarray]] = None,
+                                      speed_of_sound_in_m_per_s: float = 1540, time_spacing_in_s: float = 5e-8,
+                                      spacing_in_mm: float = 0.2, tolerance: float = None,
+                                      ) -> Dict[str, Dict[str, float]]:
+    """
+    Reconstructs the phantoms with the reduced precisions and reports the maximum deviation from the reconstruction
+    with Tags.RECONSTRUCTION_PRECISION_FLOAT32, relative to the maximum absolute value of the reference. The
+    deviations and the reconstruction speed in pixels per second are logged.
+
+    :param adapter_class: delay and sum based reconstruction adapter to validate
+    :param precisions: Tags.RECONSTRUCTION_PRECISION values to compare with the float32 reference
+    :param phantoms: dictionary of phantom names and tuples of the detection geometry and the time series data
+        (default: `get_precision_test_phantoms`)
+    :param speed_of_sound_in_m_per_s: (float) speed of sound of the phantoms in m/s
+    :param time_spacing_in_s: (float) time between the samples of the phantoms in s
+    :param spacing_in_mm: (float) spacing of the reconstructed images in mm
+    :param tolerance: (float) if given, an AssertionError is raised if a relative deviation exceeds it
+    :return: dictionary of the phantom names and dictionaries of the precisions and their relative deviations
+    :raises AssertionError: if a relative deviation exceeds the tolerance
+    """
+    logger = Logger()
+    if phantoms is None:
+        phantoms = get_precision_test_phantoms(speed_of_sound_in_m_per_s, time_spacing_in_s)
+
+    def reconstruct(precision, detection_geometry, time_series_data):
+        settings = create_reconstruction_settings(speed_of_sound_in_m_per_s, time_spacing_in_s, spacing_in_mm)
+        settings.get_reconstruction_settings()[Tags.RECONSTRUCTION_PRECISION] = precision
+        start = time.time()
+        image = adapter_class(settings).reconstruction_algorithm(time_series_data.astype(np.float32),
+                                                                 detection_geometry)
+        logger.info(f"{adapter_class.__name__} with {precision}: "
+                    f"{image.size / max(time.time() - start, 1e-9):.3g} pixels per second")
+        return image
+
+    deviations = dict()
+    for name, (detection_geometry, time_series_data) in phantoms.items():
+        reference = reconstruct(Tags.RECONSTRUCTION_PRECISION_FLOAT32, detection_geometry, time_series_data)
+        scale = max(np.nanmax(np.abs(reference)), np.finfo(np.float32).tiny)
+        deviations[name] = dict()
+        for precision in precisions:
+            image = reconstruct(precision, detection_geometry, time_series_data)
+            # pixels without contributing sensor elements are nan in both images, other nan pixels are deviations
+            difference = np.abs(image - reference)
+            difference[np.isnan(image) & np.isnan(reference)] = 0
+            difference[np.isnan(difference)] = np.inf
+            deviations[name][precision] = float(np.max(difference) / scale)
+            logger.info(f"Maximum relative deviation of {adapter_class.__name__} with {precision} from "
+                        f"{Tags.RECONSTRUCTION_PRECISION_FLOAT32} on {name}: {deviations[name][precision]:.3g}")
+            if tolerance is not None and deviations[name][precision] > tolerance:
+                raise AssertionError(f"The maximum relative deviation {deviations[name][precision]:.3g} of "
+                                     f"{adapter_class.__name__} with {precision} on {name} exceeds the tolerance "
+                                     f"{tolerance}.")
+    return deviations
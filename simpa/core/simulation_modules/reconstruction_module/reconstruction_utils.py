@@ -2,22 +2,48 @@
 # SPDX-FileCopyrightText: 2021 Janek Groehl
 # SPDX-License-Identifier: MIT
 
-from typing import Tuple
+import hashlib
+import itertools
+import json
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Iterator, List, Tuple, Union
 from simpa.log.file_logger import Logger
 from simpa.core.device_digital_twins import DetectionGeometryBase
 from simpa.utils.processing_device import get_processing_device
 from simpa.utils.settings import Settings
 from simpa.io_handling.io_hdf5 import load_data_field
 from simpa.utils import Tags
+from simpa.core.simulation_modules.reconstruction_module.travel_time_tables import compute_travel_time_tables
 from simpa.utils import round_x5_away_from_zero
 import torch
 import torch.fft
 from torch import Tensor
 import numpy as np
-from scipy.signal import hilbert, butter, lfilter
+import scipy.sparse
+from scipy.signal import butter, freqz, lfilter
 from scipy.signal.windows import tukey
 from scipy.ndimage import zoom
 
+# peak size in bytes of the tensors of `compute_delay_and_sum_values` per pixel and sensor element if the plan is
+# computed: the plan (int32 indices, float64 weights and a bool mask, 25 B) and the float64 delays and their
+# temporaries while it is computed, which are freed before the float64 values are gathered. The measured peak is 57 B.
+DELAY_AND_SUM_BYTES_PER_VALUE = 64
+# the same with a reduced Tags.RECONSTRUCTION_PRECISION, which computes the plan in float32; measured peak 37 B
+REDUCED_PRECISION_BYTES_PER_VALUE = 40
+# additional peak size of the solid angle weights of the universal back-projection and the differences and distances
+# they are computed from; measured 44 B in float64 and 36 B with a reduced precision
+SOLID_ANGLE_WEIGHTS_BYTES_PER_VALUE = 48
+# fraction of the available host or GPU memory that is used as memory budget of the delay and sum based
+# reconstructions if Tags.RECONSTRUCTION_MEMORY_BUDGET_MB is not given
+DEFAULT_MEMORY_BUDGET_FRACTION = 0.5
+
+REDUCED_PRECISION_DTYPES = {
+    Tags.RECONSTRUCTION_PRECISION_FLOAT16: torch.float16,
+    Tags.RECONSTRUCTION_PRECISION_BFLOAT16: torch.bfloat16
+}
+
 
 def get_apodization_factor(apodization_method: str = Tags.RECONSTRUCTION_APODIZATION_BOX,
                            dimensions: tuple = None, n_sensor_elements=None,
@@ -57,8 +83,9 @@ def bandpass_filter_with_settings(data: np.ndarray, global_settings: Settings, c
     """
     Applies corresponding bandpass filter which can be set in 
     `component_settings[Tags.BANDPASS_FILTER_METHOD]`, using Tukey window-based filter as default.
+    Torch tensors are filtered with `bandpass_filtering_pytorch` on their device.
 
-    :param data: (numpy array) data to be filtered
+    :param data: (numpy array or torch tensor) data to be filtered
     :param global_settings: (Settings) settings for the whole simulation
     :param component_settings: (Settings) settings for the reconstruction module
     :param device:
@@ -105,12 +132,81 @@ def butter_bandpass_filtering(data: np.array,  time_spacing_in_ms: float = None,
     else:
         high = (cutoff_highpass_in_Hz / nyquist)
 
-    b, a = butter(N=order, Wn=[high, low], btype='band')
+    b, a = get_butter_bandpass_coefficients(order, high, low)
     y = lfilter(b, a, data)
 
     return y
 
 
+@lru_cache(maxsize=32)
+def get_butter_bandpass_coefficients(order: int, low: float, high: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Designs the butterworth bandpass filter of `order` between the critical frequencies `low` and `high` (relative to
+    the Nyquist frequency). The coefficients are cached, so that a filter is only designed once.
+
+    :return: numerator and denominator coefficients of the filter
+    """
+    return butter(N=order, Wn=[low, high], btype='band')
+
+
+@lru_cache(maxsize=32)
+def get_bandpass_frequency_response(n_fft: int, time_spacing_in_ms: float,
+                                    cutoff_lowpass_in_Hz: float, cutoff_highpass_in_Hz: float, filter_method: str,
+                                    order: int, tukey_alpha: float) -> np.ndarray:
+    """
+    Computes the frequency response of a bandpass filter at the frequencies of an rfft of length `n_fft`. This is the
+    filter plan of `bandpass_filtering_pytorch`, which is cached for every combination of sampling rate, cutoff
+    values, filter parameters and length.
+
+    :return: (numpy array) read-only frequency response with n_fft // 2 + 1 entries
+    """
+    if filter_method == Tags.BUTTERWORTH_BANDPASS_FILTER:
+        nyquist = 0.5 / time_spacing_in_ms * 1000
+        low = 0.000001 if cutoff_lowpass_in_Hz is None else cutoff_lowpass_in_Hz / nyquist
+        high = 0.999999999 if cutoff_highpass_in_Hz is None else cutoff_highpass_in_Hz / nyquist
+        b, a = get_butter_bandpass_coefficients(order, high, low)
+        _, response = freqz(b, a, worN=np.fft.rfftfreq(n_fft, time_spacing_in_ms / 1000),
+                            fs=1000 / time_spacing_in_ms)
+    else:
+        if cutoff_highpass_in_Hz > cutoff_lowpass_in_Hz:
+            raise ValueError("The highpass cutoff value must be lower than the lowpass cutoff value.")
+        response = tukey_window_function(n_fft, time_spacing_in_ms, cutoff_lowpass_in_Hz, cutoff_highpass_in_Hz,
+                                         tukey_alpha)
+    response.setflags(write=False)
+    return response
+
+
+def bandpass_filtering_pytorch(data: torch.Tensor, time_spacing_in_ms: float = None,
+                               cutoff_lowpass_in_Hz: int = int(8e6), cutoff_highpass_in_Hz: int = int(0.1e6),
+                               filter_method: str = Tags.TUKEY_BANDPASS_FILTER, order: int = 1,
+                               tukey_alpha: float = 0.5) -> torch.Tensor:
+    """
+    Applies the tukey or butterworth bandpass filter along the last dimension of `data` with torch FFTs on the device
+    of the data, batched over all other dimensions, e.g. sensor elements and frames.
+    The tukey filter equals `tukey_bandpass_filtering` without resampling, as torch FFTs are fast for any length.
+    The butterworth filter multiplies the data, zero-padded to the double length, with the frequency response of the
+    filter of `butter_bandpass_filtering`. This equals its causal filtering up to the part of the impulse response
+    that is longer than the data.
+
+    :param data: (torch tensor) data to be filtered
+    :param time_spacing_in_ms: (float) time spacing in milliseconds, e.g. 2.5e-5
+    :param cutoff_lowpass_in_Hz: (int) Signal above this value will be ignored (in Hz)
+    :param cutoff_highpass_in_Hz: (int) Signal below this value will be ignored (in Hz)
+    :param filter_method: (str) Tags.TUKEY_BANDPASS_FILTER (default) or Tags.BUTTERWORTH_BANDPASS_FILTER
+    :param order: (int) order of the butterworth filter
+    :param tukey_alpha: (float) transition value of the tukey window between 0 (rectangular) and 1 (Hann window)
+    :return: (torch tensor) filtered data
+    """
+    n_time_steps = data.shape[-1]
+    n_fft = 2 * n_time_steps if filter_method == Tags.BUTTERWORTH_BANDPASS_FILTER else n_time_steps
+    response = get_bandpass_frequency_response(n_fft, time_spacing_in_ms, cutoff_lowpass_in_Hz, cutoff_highpass_in_Hz,
+                                               filter_method, order, tukey_alpha)
+    spectrum = torch.fft.rfft(data, n=n_fft)
+    response = torch.from_numpy(np.array(response)).to(device=data.device, dtype=spectrum.dtype)
+    filtered_data = torch.fft.irfft(spectrum * response, n=n_fft)
+    return filtered_data[..., :n_time_steps].to(data.dtype)
+
+
 def butter_bandpass_filtering_with_settings(data: np.ndarray, global_settings: Settings, component_settings: Settings,
                                             device: DetectionGeometryBase) -> np.ndarray:
     """
@@ -142,6 +238,9 @@ def butter_bandpass_filtering_with_settings(data: np.ndarray, global_settings: S
     if data is None or time_spacing_in_ms is None:
         raise AttributeError("data and time spacing must be specified")
 
+    if isinstance(data, torch.Tensor):
+        return bandpass_filtering_pytorch(data, time_spacing_in_ms, cutoff_lowpass_in_Hz, cutoff_highpass_in_Hz,
+                                          Tags.BUTTERWORTH_BANDPASS_FILTER, order=filter_order)
     return butter_bandpass_filtering(data, time_spacing_in_ms, cutoff_lowpass_in_Hz, cutoff_highpass_in_Hz, filter_order)
 
 
@@ -194,8 +293,8 @@ def tukey_bandpass_filtering(data: np.ndarray, time_spacing_in_ms: float = None,
         time_spacing_in_ms *= resampling_factor
 
     # create tukey window
-    window = tukey_window_function(target_size, time_spacing_in_ms, cutoff_lowpass_in_Hz,
-                                   cutoff_highpass_in_Hz, tukey_alpha)
+    window = get_bandpass_frequency_response(target_size, time_spacing_in_ms, cutoff_lowpass_in_Hz,
+                                             cutoff_highpass_in_Hz, Tags.TUKEY_BANDPASS_FILTER, 1, tukey_alpha)
 
     # transform data into Fourier space, multiply filter and transform back
     data_in_fourier_space = np.fft.rfft(data)
@@ -281,19 +380,24 @@ def tukey_bandpass_filtering_with_settings(data: np.ndarray, global_settings: Se
     if data is None or time_spacing_in_ms is None:
         raise AttributeError("data and time spacing must be specified")
 
+    if isinstance(data, torch.Tensor):
+        return bandpass_filtering_pytorch(data, time_spacing_in_ms, cutoff_lowpass_in_Hz, cutoff_highpass_in_Hz,
+                                          Tags.TUKEY_BANDPASS_FILTER, tukey_alpha=tukey_alpha)
     return tukey_bandpass_filtering(data, time_spacing_in_ms, cutoff_lowpass_in_Hz, cutoff_highpass_in_Hz, tukey_alpha, resampling_for_fft)
 
 
-def apply_b_mode(data: np.ndarray = None, method: str = None) -> np.ndarray:
+def apply_b_mode(data: np.ndarray = None, method: str = None, axis: int = 1) -> np.ndarray:
     """
     Applies B-Mode specified method to data. Method is either
     envelope detection using hilbert transform (Tags.RECONSTRUCTION_BMODE_METHOD_HILBERT_TRANSFORM),
     absolute value (Tags.RECONSTRUCTION_BMODE_METHOD_ABS) or
     none if nothing is specified is performed.
+    Torch tensors stay on their device, numpy arrays are returned as numpy arrays.
 
-    :param data: (numpy array) data used for applying B-Mode method
+    :param data: (numpy array or torch tensor) data used for applying B-Mode method
     :param method: (str) Tags.RECONSTRUCTION_BMODE_METHOD_HILBERT_TRANSFORM or Tags.RECONSTRUCTION_BMODE_METHOD_ABS
-    :return: (numpy array) data with B-Mode method applied, all
+    :param axis: (int) axis along which the hilbert transform is computed (default: 1, the time or depth axis)
+    :return: (numpy array or torch tensor) data with B-Mode method applied, all
     """
     # input checks
     if data is None:
@@ -304,29 +408,57 @@ def apply_b_mode(data: np.ndarray = None, method: str = None) -> np.ndarray:
 
     if method == Tags.RECONSTRUCTION_BMODE_METHOD_HILBERT_TRANSFORM:
         # perform envelope detection using hilbert transform in depth direction
-        hilbert_transformed = hilbert(data, axis=1)
-        output = np.abs(hilbert_transformed)
+        if isinstance(data, torch.Tensor):
+            output = hilbert_envelope_pytorch(data, dim=axis)
+        else:
+            output = hilbert_envelope_pytorch(torch.from_numpy(np.asarray(data)), dim=axis).numpy()
     elif method == Tags.RECONSTRUCTION_BMODE_METHOD_ABS:
         # perform envelope detection using absolute value
-        output = np.abs(data)
+        output = abs(data)
     else:
         print("You have not specified a B-mode method")
         output = data
 
-    # sanity check that no elements are below zero
-    if output[output < 0].sum() != 0:
-        print("There are still negative values in the data.")
+        # sanity check that no elements are below zero, which only the unprocessed data can have
+        if (output < 0).any():
+            print("There are still negative values in the data.")
 
     return output
 
 
+def hilbert_envelope_pytorch(data: torch.Tensor, dim: int = -1) -> torch.Tensor:
+    """
+    Computes the envelope, i.e. the absolute value of the analytic signal, of real `data` along `dim` with torch FFTs
+    on the device of the data, batched over all other dimensions. This is the same computation as
+    `scipy.signal.hilbert`.
+
+    :param data: (torch tensor) real data
+    :param dim: (int) dimension along which the envelope is computed
+    :return: (torch tensor) envelope of the data
+    """
+    n = data.shape[dim]
+    # the analytic signal keeps the DC (and Nyquist) component and doubles the positive frequencies
+    h = torch.zeros(n, dtype=data.dtype, device=data.device)
+    h[0] = 1
+    if n % 2 == 0:
+        h[n // 2] = 1
+        h[1:n // 2] = 2
+    else:
+        h[1:(n + 1) // 2] = 2
+    shape = [1] * data.ndim
+    shape[dim] = n
+    analytic_signal = torch.fft.ifft(torch.fft.fft(data, dim=dim) * h.reshape(shape), dim=dim)
+    return torch.abs(analytic_signal)
+
+
 def reconstruction_mode_transformation(time_series_sensor_data: torch.tensor = None,
                                        mode: str = Tags.RECONSTRUCTION_MODE_PRESSURE) -> torch.tensor:
     """
     Transformes `time_series_sensor_data` for other modes, for example `Tags.RECONSTRUCTION_MODE_DIFFERENTIAL`.
     Default mode is `Tags.RECONSTRUCTION_MODE_PRESSURE`.
 
-    :param time_series_sensor_data: (torch tensor) Time series data to be transformed
+    :param time_series_sensor_data: (torch tensor) Time series data to be transformed with the time steps along the
+        last dimension
     :param mode: (str) reconstruction mode: Tags.RECONSTRUCTION_MODE_PRESSURE (default)
                 or Tags.RECONSTRUCTION_MODE_DIFFERENTIAL
     :return: (torch tensor) potentially transformed tensor
@@ -334,10 +466,10 @@ def reconstruction_mode_transformation(time_series_sensor_data: torch.tensor = N
 
     # depending on mode use pressure data or its derivative
     if mode == Tags.RECONSTRUCTION_MODE_DIFFERENTIAL:
-        zeros = torch.zeros([time_series_sensor_data.shape[0], 1], names=None).to(time_series_sensor_data.device)
-        time_vector = torch.arange(1, time_series_sensor_data.shape[1]+1).to(time_series_sensor_data.device)
-        time_derivative_pressure = time_series_sensor_data[:, 1:] - time_series_sensor_data[:, 0:-1]
-        time_derivative_pressure = torch.cat([time_derivative_pressure, zeros], dim=1)
+        zeros = torch.zeros_like(time_series_sensor_data[..., :1])
+        time_vector = torch.arange(1, time_series_sensor_data.shape[-1]+1).to(time_series_sensor_data.device)
+        time_derivative_pressure = time_series_sensor_data[..., 1:] - time_series_sensor_data[..., 0:-1]
+        time_derivative_pressure = torch.cat([time_derivative_pressure, zeros], dim=-1)
         time_derivative_pressure = torch.mul(time_derivative_pressure, time_vector)
         output = time_derivative_pressure  # use time derivative pressure
     elif mode == Tags.RECONSTRUCTION_MODE_PRESSURE:
@@ -348,38 +480,29 @@ def reconstruction_mode_transformation(time_series_sensor_data: torch.tensor = N
     return output
 
 
-def preparing_reconstruction_and_obtaining_reconstruction_settings(
-        time_series_sensor_data: np.ndarray, component_settings: Settings, global_settings: Settings,
-        detection_geometry: DetectionGeometryBase, logger: Logger) -> Tuple[torch.tensor, torch.tensor,
-                                                                            float, float, float,
-                                                                            torch.device]:
+def get_reconstruction_parameters(component_settings: Settings, global_settings: Settings,
+                                  detection_geometry: DetectionGeometryBase,
+                                  logger: Logger) -> Tuple[float, float, float]:
     """
-    Performs all preparation steps that need to be done before reconstructing an image:
-    - performs envelope detection of time series data if specified
-    - obtains speed of sound value from settings
-    - obtains time spacing value from settings or PA device
-    - obtain spacing from settings
-    - checks PA device prerequisites
-    - obtains sensor positions from PA device
-    - moves data arrays on correct torch device
-    - computed differential mode if specified
-    - perform bandpass filtering if specified
+    Obtains the speed of sound, the spacing of the reconstructed image and the time spacing of the time series data
+    from the settings or the PA device.
 
     Returns:
 
-    time_series_sensor_data: (torch tensor) potentially preprocessed time series data
-    sensor_positions: (torch tensor) sensor element positions of PA device
     speed_of_sound_in_m_per_s: (float) speed of sound in m/s
     spacing_in_mm: (float) spacing of voxels in reconstructed image in mm
     time_spacing_in_ms: (float) temporal spacing of the time series data in ms
-    torch_device: (torch device) either cpu or cuda GPU device used for the tensors
     """
 
     ### INPUT CHECKING AND VALIDATION ###
     # check settings dictionary for elements and read them in
 
-    # speed of sound: use given speed of sound, otherwise use average from simulation if specified
-    if Tags.DATA_FIELD_SPEED_OF_SOUND in component_settings and component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND]:
+    # speed of sound: use given speed of sound or the average of a given map, otherwise use average from simulation
+    # if specified
+    if Tags.DATA_FIELD_SPEED_OF_SOUND in component_settings and \
+            isinstance(component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND], np.ndarray):
+        speed_of_sound_in_m_per_s = np.mean(component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND])
+    elif Tags.DATA_FIELD_SPEED_OF_SOUND in component_settings and component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND]:
         speed_of_sound_in_m_per_s = component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND]
     elif Tags.WAVELENGTH in global_settings and global_settings[Tags.WAVELENGTH]:
         sound_speed_m = load_data_field(global_settings[Tags.SIMPA_OUTPUT_FILE_PATH], Tags.DATA_FIELD_SPEED_OF_SOUND)
@@ -409,6 +532,42 @@ def preparing_reconstruction_and_obtaining_reconstruction_settings(
         raise AttributeError("Please specify a value for SPACING_MM in either the component_settings or"
                              "the global_settings.")
 
+    return speed_of_sound_in_m_per_s, spacing_in_mm, time_spacing_in_ms
+
+
+def preparing_reconstruction_and_obtaining_reconstruction_settings(
+        time_series_sensor_data: np.ndarray, component_settings: Settings, global_settings: Settings,
+        detection_geometry: DetectionGeometryBase, logger: Logger) -> Tuple[torch.tensor, torch.tensor,
+                                                                            float, float, float,
+                                                                            torch.device]:
+    """
+    Performs all preparation steps that need to be done before reconstructing an image:
+    - performs envelope detection of time series data if specified
+    - obtains speed of sound value from settings
+    - obtains time spacing value from settings or PA device
+    - obtain spacing from settings
+    - checks PA device prerequisites
+    - obtains sensor positions from PA device
+    - moves data arrays on correct torch device
+    - computed differential mode if specified
+    - perform bandpass filtering if specified
+
+    The time series data is either a single frame of shape (sensor elements, time steps) or a batch of frames of
+    shape (frames, sensor elements, time steps), e.g. the time series data of several wavelengths.
+
+    Returns:
+
+    time_series_sensor_data: (torch tensor) potentially preprocessed time series data
+    sensor_positions: (torch tensor) sensor element positions of PA device
+    speed_of_sound_in_m_per_s: (float) speed of sound in m/s
+    spacing_in_mm: (float) spacing of voxels in reconstructed image in mm
+    time_spacing_in_ms: (float) temporal spacing of the time series data in ms
+    torch_device: (torch device) either cpu or cuda GPU device used for the tensors
+    """
+
+    speed_of_sound_in_m_per_s, spacing_in_mm, time_spacing_in_ms = get_reconstruction_parameters(
+        component_settings, global_settings, detection_geometry, logger)
+
     # get device specific sensor positions
     sensor_positions = detection_geometry.get_detector_element_positions_base_mm()
 
@@ -430,10 +589,10 @@ def preparing_reconstruction_and_obtaining_reconstruction_settings(
     time_series_sensor_data = time_series_sensor_data.to(torch_device)
 
     # array must be of correct dimension
-    assert time_series_sensor_data.ndim == 2, 'Time series data must have exactly 2 dimensions' \
-                                              ', one for the sensor elements and one for time. ' \
-                                              'Stack images and sensor positions for 3D reconstruction' \
-                                              'Apply beamforming per wavelength if you have a 3D array. '
+    assert time_series_sensor_data.ndim in [2, 3], 'Time series data must have 2 dimensions, one for the sensor ' \
+                                                   'elements and one for time, or 3 dimensions with the frames ' \
+                                                   'along the first dimension. ' \
+                                                   'Stack images and sensor positions for 3D reconstruction. '
 
     # check reconstruction mode - pressure by default
     if Tags.RECONSTRUCTION_MODE in component_settings:
@@ -442,6 +601,7 @@ def preparing_reconstruction_and_obtaining_reconstruction_settings(
         mode = Tags.RECONSTRUCTION_MODE_PRESSURE
     time_series_sensor_data = reconstruction_mode_transformation(time_series_sensor_data, mode=mode)
 
+
     return (time_series_sensor_data, sensor_positions, speed_of_sound_in_m_per_s, spacing_in_mm,
             time_spacing_in_ms, torch_device)
 
@@ -513,24 +673,115 @@ def compute_delay_and_sum_values(time_series_sensor_data: Tensor, sensor_positio
                                  ydim: int, zdim: int, xdim_start: int, xdim_end: int, ydim_start: int, ydim_end: int,
                                  zdim_start: int, zdim_end: int, spacing_in_mm: float, speed_of_sound_in_m_per_s: float,
                                  time_spacing_in_ms: float, logger: Logger, torch_device: torch.device,
-                                 component_settings: Settings) -> Tuple[torch.tensor, int]:
+                                 component_settings: Settings,
+                                 image_block: Tuple[slice, slice, slice] = None,
+                                 travel_time_tables: dict = None,
+                                 count_nonzero_values: bool = False,
+                                 sensor_orientations: torch.tensor = None,
+                                 plan_cache: "BeamformingPlanCache" = None) -> Tuple[torch.tensor, int]:
     """
     Perform the core computation of Delay and Sum, without summing up the delay dependend values.
+    If an image block (a tuple of slices along x, y and z, see `get_image_blocks`) is given, the values are only
+    computed for the pixels in this block of the image.
+    If travel-time tables (see `get_travel_time_tables`) are given, the delays are taken from them instead of the
+    straight lines between the pixels and the sensor elements.
+    The time series data may hold a batch of frames of shape (frames, sensor elements, time steps). The delays are
+    then computed once and the values of all frames are gathered at once.
+    If count_nonzero_values is True, the number of non-zero values of every pixel is returned as well. It is counted
+    on the single precision samples also for reduced precisions, in which values close to zero may round to zero.
+    For a reduced precision, the samples of every frame are divided by their maximum absolute value before they are
+    cast, so that neither large nor small pressures exceed the range of the reduced precision. The values are then
+    relative to this scale and the reconstructed image has to be rescaled with `rescale_reduced_precision_image`.
+    If the sensor orientations are given, the values are weighted with the solid angle weights of the universal
+    back-projection (see `compute_solid_angle_weights`), which are stored with the beamforming plan.
+    The beamforming plan is taken from the given plan cache or from BEAMFORMING_PLAN_CACHE (see
+    `get_beamforming_plan`).
 
     Returns
-    - values (torch tensor) of the time series data corrected for delay and sensor positioning, ready to be summed up
-    - and n_sensor_elements (int) which might be used for later computations
+    - values (torch tensor) of the time series data corrected for delay and sensor positioning, ready to be summed up,
+      of shape (x, y, z, sensor elements) or (frames, x, y, z, sensor elements)
+    - n_sensor_elements (int) which might be used for later computations
+    - and, if count_nonzero_values is True, the number of non-zero values (torch tensor) of shape (x, y, z) or
+      (frames, x, y, z)
     """
 
-    if time_series_sensor_data.shape[0] < sensor_positions.shape[0]:
+    if time_series_sensor_data.shape[-2] < sensor_positions.shape[0]:
         logger.warning("Warning: The time series data has less sensor element entries than the given sensor positions. "
                        "This might be due to a low simulated resolution, please increase it.")
 
-    n_sensor_elements = time_series_sensor_data.shape[0]
+    n_sensor_elements = time_series_sensor_data.shape[-2]
+    reduced_precision_dtype = get_reduced_precision_dtype(component_settings)
+    if reduced_precision_dtype is not None:
+        # single precision delays are accurate to far below a time step
+        sensor_positions = sensor_positions.float()
 
     logger.debug(f'Number of pixels in X dimension: {xdim}, Y dimension: {ydim}, Z dimension: {zdim} '
                  f',number of sensor elements: {n_sensor_elements}')
 
+    plan = get_beamforming_plan(component_settings, sensor_positions, n_sensor_elements,
+                                time_series_sensor_data.shape[-1], xdim, ydim, zdim, xdim_start, ydim_start,
+                                zdim_start, spacing_in_mm, speed_of_sound_in_m_per_s, time_spacing_in_ms,
+                                torch_device, image_block, travel_time_tables, sensor_orientations, plan_cache)
+
+    # interpolation between the samples enclosing the delays, which are gathered with the int32 indices of the plan
+    batch_shape = time_series_sensor_data.shape[:-2]
+    if reduced_precision_dtype is not None:
+        time_series_sensor_data = time_series_sensor_data / get_reduced_precision_scale(time_series_sensor_data)
+    time_series_sensor_data = time_series_sensor_data.reshape(*batch_shape, -1)
+    lower_weights, upper_weights = plan["lower_weights"], plan["upper_weights"]
+    values_shape = batch_shape + plan["lower_indices"].shape
+    nonzero_values = None
+    if count_nonzero_values and reduced_precision_dtype is not None:
+        # a single precision value is non-zero if one of its interpolated samples and the weight of that sample are
+        nonzero_samples = (time_series_sensor_data != 0).to(torch.uint8)
+        nonzero_values = torch.index_select(nonzero_samples, -1, plan["lower_indices"].reshape(-1)).reshape(
+            values_shape).bool() & (lower_weights != 0)
+        nonzero_values |= torch.index_select(nonzero_samples, -1, plan["upper_indices"].reshape(-1)).reshape(
+            values_shape).bool() & (upper_weights != 0)
+        nonzero_values &= ~plan["invalid"]
+    if reduced_precision_dtype is not None:
+        time_series_sensor_data = time_series_sensor_data.to(reduced_precision_dtype)
+        lower_weights = lower_weights.to(reduced_precision_dtype)
+        upper_weights = upper_weights.to(reduced_precision_dtype)
+    lower_values = torch.index_select(time_series_sensor_data, -1,
+                                      plan["lower_indices"].reshape(-1)).reshape(values_shape)
+    upper_values = torch.index_select(time_series_sensor_data, -1,
+                                      plan["upper_indices"].reshape(-1)).reshape(values_shape)
+    values = lower_values * lower_weights + upper_values * upper_weights
+
+    # perform apodization if specified
+    if Tags.RECONSTRUCTION_APODIZATION_METHOD in component_settings:
+        apodization = get_apodization_factor(apodization_method=component_settings[Tags.RECONSTRUCTION_APODIZATION_METHOD],
+                                             dimensions=tuple(values.shape[-4:-1]), n_sensor_elements=n_sensor_elements,
+                                             device=torch_device)
+        values = values * apodization.to(values.dtype)
+        if nonzero_values is not None:
+            nonzero_values &= apodization != 0
+
+    if "solid_angle_weights" in plan:
+        values = values * plan["solid_angle_weights"].to(values.dtype)
+
+    # set values of invalid indices to 0 so that they don't influence the result
+    values.masked_fill_(plan["invalid"], 0)
+
+    if count_nonzero_values:
+        if nonzero_values is None:
+            return values, n_sensor_elements, torch.count_nonzero(values, dim=-1)
+        return values, n_sensor_elements, torch.count_nonzero(nonzero_values, dim=-1)
+    return values, n_sensor_elements
+
+
+def compute_pixel_positions(xdim: int, ydim: int, zdim: int, xdim_start: int, ydim_start: int, zdim_start: int,
+                            torch_device: torch.device,
+                            image_block: Tuple[slice, slice, slice] = None) -> Tuple[torch.tensor, torch.tensor,
+                                                                                     torch.tensor]:
+    """
+    Computes the positions of the pixels of the reconstructed image along x, y and z in units of the spacing.
+    The y dimension of the image is the depth, which corresponds to the third coordinate of the sensor positions,
+    and the z dimension corresponds to the second coordinate of the sensor positions.
+
+    :return: tuple of the pixel positions along x, y and z, restricted to the image block if one is given
+    """
     x_offset = 0.5 if xdim % 2 == 0 else 0  # to ensure pixels are symmetrically arranged around the 0 like the
     # sensor positions, add an offset of 0.5 pixels if the dimension is even
 
@@ -540,38 +791,535 @@ def compute_delay_and_sum_values(time_series_sensor_data: Tensor, sensor_positio
         z = torch.arange(zdim, device=torch_device, dtype=torch.float32)
     else:
         z = zdim_start + torch.arange(zdim, device=torch_device, dtype=torch.float32)
+    if image_block is not None:
+        x, y, z = x[image_block[0]], y[image_block[1]], z[image_block[2]]
+    return x, y, z
+
+
+def compute_beamforming_plan(sensor_positions: torch.tensor, n_sensor_elements: int, n_time_steps: int, xdim: int,
+                             ydim: int, zdim: int, xdim_start: int, ydim_start: int, zdim_start: int,
+                             spacing_in_mm: float, speed_of_sound_in_m_per_s: float, time_spacing_in_ms: float,
+                             torch_device: torch.device, image_block: Tuple[slice, slice, slice] = None,
+                             travel_times_in_ms: torch.tensor = None,
+                             sensor_orientations: torch.tensor = None) -> dict:
+    """
+    Computes the geometric part of Delay and Sum, which only depends on the sensor positions, the image grid, the
+    speed of sound and the time spacing: for every pixel and sensor element, the indices of the two samples of the
+    flattened time series data that enclose the delay, their linear interpolation weights and whether the delay lies
+    outside of the recorded time series.
+    If the travel times of shape (x, y, z, n_sensor_elements) of the pixels are given, the delays are computed from
+    them instead of from the straight-line distances and the speed of sound.
+    If the sensor orientations are given, the plan also holds the solid angle weights of the universal
+    back-projection (see `compute_solid_angle_weights`).
+
+    :return: dictionary with the tensors "lower_indices" and "upper_indices" (int32), "lower_weights" and
+        "upper_weights" (of the dtype of the sensor positions) and "invalid" (bool), each of shape
+        (x, y, z, n_sensor_elements), and "solid_angle_weights" of the same shape if the sensor orientations are given
+    """
+    x, y, z = compute_pixel_positions(xdim, ydim, zdim, xdim_start, ydim_start, zdim_start, torch_device, image_block)
     j = torch.arange(n_sensor_elements, device=torch_device, dtype=torch.float32)
 
     xx, yy, zz, jj = torch.meshgrid(x, y, z, j)
-    jj = jj.long()
-
-    delays = torch.sqrt((yy * spacing_in_mm - sensor_positions[:, 2][jj]) ** 2 +
-                        (xx * spacing_in_mm - sensor_positions[:, 0][jj]) ** 2 +
-                        (zz * spacing_in_mm - sensor_positions[:, 1][jj]) ** 2) \
-        / (speed_of_sound_in_m_per_s * time_spacing_in_ms)
+    # int32 indices halve the memory of int64 indices, the flattened time series data is far smaller than 2^31 samples
+    jj = jj.int()
+
+    if travel_times_in_ms is None:
+        delays = torch.sqrt((yy * spacing_in_mm - sensor_positions[:, 2][jj]) ** 2 +
+                            (xx * spacing_in_mm - sensor_positions[:, 0][jj]) ** 2 +
+                            (zz * spacing_in_mm - sensor_positions[:, 1][jj]) ** 2) \
+            / (speed_of_sound_in_m_per_s * time_spacing_in_ms)
+    else:
+        delays = travel_times_in_ms.to(sensor_positions.dtype) / time_spacing_in_ms
 
     # perform index validation
-    invalid_indices = torch.where(torch.logical_or(delays < 0, delays >= float(time_series_sensor_data.shape[1])))
-    torch.clip_(delays, min=0, max=time_series_sensor_data.shape[1] - 1)
+    invalid = torch.logical_or(delays < 0, delays >= float(n_time_steps))
+    torch.clip_(delays, min=0, max=n_time_steps - 1)
 
     # interpolation of delays
-    lower_delays = (torch.floor(delays)).long()
+    lower_delays = (torch.floor(delays)).int()
     upper_delays = lower_delays + 1
-    torch.clip_(upper_delays, min=0, max=time_series_sensor_data.shape[1] - 1)
-    lower_values = time_series_sensor_data[jj, lower_delays]
-    upper_values = time_series_sensor_data[jj, upper_delays]
-    values = lower_values * (upper_delays - delays) + upper_values * (delays - lower_delays)
+    torch.clip_(upper_delays, min=0, max=n_time_steps - 1)
+
+    plan = {
+        "lower_indices": (jj * n_time_steps + lower_delays).int(),
+        "upper_indices": (jj * n_time_steps + upper_delays).int(),
+        "lower_weights": upper_delays - delays,
+        "upper_weights": delays - lower_delays,
+        "invalid": invalid
+    }
+    if sensor_orientations is not None:
+        plan["solid_angle_weights"] = compute_solid_angle_weights(
+            sensor_positions[:n_sensor_elements], sensor_orientations[:n_sensor_elements], xdim, ydim, zdim,
+            xdim_start, ydim_start, zdim_start, spacing_in_mm, torch_device, image_block)
+    return plan
+
+
+def compute_solid_angle_weights(sensor_positions: torch.tensor, sensor_orientations: torch.tensor, xdim: int,
+                                ydim: int, zdim: int, xdim_start: float, ydim_start: float, zdim_start: float,
+                                spacing_in_mm: float, torch_device: torch.device,
+                                image_block: tuple = None) -> torch.tensor:
+    """
+    Computes the weights of the sensor elements for the universal back-projection, which are the solid angles
+    cos(theta) / d^2 (or the in-plane angles cos(theta) / d for an image plane) of the elements at the pixels,
+    normalised by their sum over all elements.
 
-    # perform apodization if specified
-    if Tags.RECONSTRUCTION_APODIZATION_METHOD in component_settings:
-        apodization = get_apodization_factor(apodization_method=component_settings[Tags.RECONSTRUCTION_APODIZATION_METHOD],
-                                             dimensions=(xdim, ydim, zdim), n_sensor_elements=n_sensor_elements,
-                                             device=torch_device)
-        values = values * apodization
+    :param sensor_positions: (torch tensor) sensor element positions in mm
+    :param sensor_orientations: (torch tensor) unit normal vectors of the sensor elements
+    :return: (torch tensor) weights of shape (x, y, z, sensor elements) for the pixels of the image block
+    """
+    x, y, z = compute_pixel_positions(xdim, ydim, zdim, xdim_start, ydim_start, zdim_start, torch_device, image_block)
+    xx, yy, zz = torch.meshgrid(x * spacing_in_mm, y * spacing_in_mm, z * spacing_in_mm, indexing="ij")
 
-    # set values of invalid indices to 0 so that they don't influence the result
-    values[invalid_indices] = 0
+    # the image dimensions x, y and z correspond to the sensor coordinates 0, 2 and 1
+    difference_x = xx[..., None].to(sensor_positions.dtype) - sensor_positions[:, 0]
+    difference_y = zz[..., None].to(sensor_positions.dtype) - sensor_positions[:, 1]
+    difference_z = yy[..., None].to(sensor_positions.dtype) - sensor_positions[:, 2]
+    distances = torch.sqrt(difference_x ** 2 + difference_y ** 2 + difference_z ** 2).clip(min=1e-6)
+    cosines = torch.abs(difference_x * sensor_orientations[:, 0] + difference_y * sensor_orientations[:, 1] +
+                        difference_z * sensor_orientations[:, 2]) / distances
 
-    del delays  # free memory of delays
+    weights = cosines / distances if zdim == 1 else cosines / distances ** 2
+    return weights / torch.sum(weights, dim=-1, keepdim=True).clip(min=1e-12)
 
-    return values, n_sensor_elements
+
+class BeamformingPlanCache:
+    """
+    Least recently used cache of the beamforming plans computed by `compute_beamforming_plan`. The plans are held in
+    memory up to Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB and, if Tags.RECONSTRUCTION_PLAN_CACHE_PATH is given in the
+    component settings, stored in this directory to be reused in later sessions.
+    """
+
+    def __init__(self):
+        self.plans = OrderedDict()
+        self.size_in_bytes = 0
+        # number of plans that did not fit into the cache or were evicted
+        self.dropped_plans = 0
+
+    def get_plan(self, component_settings: Settings, sensor_positions: torch.tensor, *plan_arguments,
+                 travel_time_key: str = None) -> dict:
+        """
+        returns the beamforming plan for the given arguments of `compute_beamforming_plan` from memory, from the cache
+        directory or by computing it.
+
+        :param component_settings: reconstruction settings with the cache size and path
+        :param travel_time_key: key of the travel-time tables if travel times are given in the plan arguments
+        :return: beamforming plan
+        """
+        (n_sensor_elements, n_time_steps, xdim, ydim, zdim, xdim_start, ydim_start, zdim_start, spacing_in_mm,
+         speed_of_sound_in_m_per_s, time_spacing_in_ms, torch_device, image_block) = plan_arguments[:13]
+        sensor_orientations = plan_arguments[14] if len(plan_arguments) > 14 else None
+        if sensor_orientations is not None:
+            sensor_orientations = np.round(sensor_orientations[:n_sensor_elements].cpu().numpy().astype(float),
+                                           9).tolist()
+        key = hashlib.sha256(json.dumps({
+            "sensor_positions": np.round(sensor_positions[:n_sensor_elements].cpu().numpy().astype(float),
+                                         9).tolist(),
+            "n_time_steps": int(n_time_steps),
+            "dimensions": [int(xdim), int(ydim), int(zdim)],
+            "start": [float(xdim_start), float(ydim_start), float(zdim_start)],
+            "spacing_in_mm": float(spacing_in_mm),
+            "speed_of_sound_in_m_per_s": float(speed_of_sound_in_m_per_s),
+            "time_spacing_in_ms": float(time_spacing_in_ms),
+            "image_block": str(image_block),
+            "device": str(torch_device),
+            "dtype": str(sensor_positions.dtype),
+            "travel_times": travel_time_key,
+            "sensor_orientations": sensor_orientations
+        }, sort_keys=True).encode("utf-8")).hexdigest()
+
+        if key in self.plans:
+            self.plans.move_to_end(key)
+            return self.plans[key]
+
+        file_path = None
+        if Tags.RECONSTRUCTION_PLAN_CACHE_PATH in component_settings:
+            os.makedirs(component_settings[Tags.RECONSTRUCTION_PLAN_CACHE_PATH], exist_ok=True)
+            file_path = os.path.join(component_settings[Tags.RECONSTRUCTION_PLAN_CACHE_PATH],
+                                     f"beamforming_plan_{key}.pt")
+        if file_path is not None and os.path.exists(file_path):
+            plan = torch.load(file_path, map_location=torch_device)
+        else:
+            plan = compute_beamforming_plan(sensor_positions, *plan_arguments)
+            if file_path is not None:
+                torch.save({name: tensor.cpu() for name, tensor in plan.items()}, file_path)
+
+        if Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB in component_settings:
+            maximum_size_in_bytes = component_settings[Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB] * 1024 ** 2
+        else:
+            maximum_size_in_bytes = 0
+        plan_size_in_bytes = sum(tensor.element_size() * tensor.nelement() for tensor in plan.values())
+        if plan_size_in_bytes <= maximum_size_in_bytes:
+            self.plans[key] = plan
+            self.size_in_bytes += plan_size_in_bytes
+            while self.size_in_bytes > maximum_size_in_bytes:
+                _, evicted_plan = self.plans.popitem(last=False)
+                self.size_in_bytes -= sum(tensor.element_size() * tensor.nelement()
+                                          for tensor in evicted_plan.values())
+                self.dropped_plans += 1
+        else:
+            self.dropped_plans += 1
+        return plan
+
+    def clear(self):
+        """
+        removes all plans from memory.
+        """
+        self.plans.clear()
+        self.size_in_bytes = 0
+        self.dropped_plans = 0
+
+
+BEAMFORMING_PLAN_CACHE = BeamformingPlanCache()
+
+
+def get_beamforming_plan(component_settings: Settings, sensor_positions: torch.tensor, n_sensor_elements: int,
+                         n_time_steps: int, xdim: int, ydim: int, zdim: int, xdim_start: int, ydim_start: int,
+                         zdim_start: int, spacing_in_mm: float, speed_of_sound_in_m_per_s: float,
+                         time_spacing_in_ms: float, torch_device: torch.device,
+                         image_block: Tuple[slice, slice, slice] = None, travel_time_tables: dict = None,
+                         sensor_orientations: torch.tensor = None, plan_cache: BeamformingPlanCache = None) -> dict:
+    """
+    returns the beamforming plan of the image block from the beamforming plan cache if it is configured in the
+    component settings and computes it otherwise. The delays are taken from the travel-time tables if they are given.
+    If the sensor orientations are given, the plan holds the solid angle weights of the universal back-projection.
+    The plan cache defaults to the BEAMFORMING_PLAN_CACHE that is shared by all adapters.
+
+    :return: beamforming plan (see `compute_beamforming_plan`)
+    """
+    travel_times_in_ms, travel_time_key = None, None
+    if travel_time_tables is not None:
+        travel_times_in_ms = travel_time_tables["travel_times"]
+        if image_block is not None:
+            travel_times_in_ms = travel_times_in_ms[image_block]
+        travel_times_in_ms = travel_times_in_ms[..., :n_sensor_elements]
+        travel_time_key = travel_time_tables["key"]
+
+    plan_arguments = (sensor_positions, n_sensor_elements, n_time_steps, xdim, ydim, zdim, xdim_start, ydim_start,
+                      zdim_start, spacing_in_mm, speed_of_sound_in_m_per_s, time_spacing_in_ms, torch_device,
+                      image_block, travel_times_in_ms, sensor_orientations)
+    if Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB in component_settings or \
+            Tags.RECONSTRUCTION_PLAN_CACHE_PATH in component_settings:
+        if plan_cache is None:
+            plan_cache = BEAMFORMING_PLAN_CACHE
+        return plan_cache.get_plan(component_settings, *plan_arguments, travel_time_key=travel_time_key)
+    return compute_beamforming_plan(*plan_arguments)
+
+
+def get_travel_time_tables(component_settings: Settings, global_settings: Settings,
+                           detection_geometry: DetectionGeometryBase, xdim: int, ydim: int, zdim: int,
+                           xdim_start: int, ydim_start: int, zdim_start: int, spacing_in_mm: float,
+                           torch_device: torch.device, logger: Logger) -> dict:
+    """
+    Returns the travel-time tables from the sensor elements to the pixels of the image (see
+    `compute_travel_time_tables`) if Tags.RECONSTRUCTION_TRAVEL_TIME_TABLES is set in the component settings and None
+    otherwise. The speed of sound map is Tags.DATA_FIELD_SPEED_OF_SOUND of the component settings if it is a numpy
+    array and of the SIMPA output file otherwise. It is given in the coordinates of the simulation volume with
+    Tags.SPACING_MM of the global settings, in which the device is placed at its device position. For a 2D image, a
+    2D map of the imaging plane or the plane of a 3D map that contains the sensor elements is used.
+    The tables are stored in Tags.RECONSTRUCTION_PLAN_CACHE_PATH if it is given.
+
+    :return: travel-time tables or None
+    :raises AttributeError: if no speed of sound map is available or a 2D map is given for a 3D image
+    """
+    if not (Tags.RECONSTRUCTION_TRAVEL_TIME_TABLES in component_settings and
+            component_settings[Tags.RECONSTRUCTION_TRAVEL_TIME_TABLES]):
+        return None
+
+    if Tags.DATA_FIELD_SPEED_OF_SOUND in component_settings and \
+            isinstance(component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND], np.ndarray):
+        speed_of_sound_map = component_settings[Tags.DATA_FIELD_SPEED_OF_SOUND]
+    elif Tags.SIMPA_OUTPUT_FILE_PATH in global_settings:
+        speed_of_sound_map = load_data_field(global_settings[Tags.SIMPA_OUTPUT_FILE_PATH],
+                                             Tags.DATA_FIELD_SPEED_OF_SOUND)
+    else:
+        raise AttributeError("Please specify a speed of sound map as DATA_FIELD_SPEED_OF_SOUND or a "
+                             "SIMPA_OUTPUT_FILE_PATH to compute the travel-time tables")
+    if Tags.SPACING_MM in global_settings:
+        map_spacing_in_mm = global_settings[Tags.SPACING_MM]
+    else:
+        map_spacing_in_mm = spacing_in_mm
+
+    # the image dimensions x, y and z correspond to the coordinates 0, 2 and 1 of the volume
+    x, y, z = compute_pixel_positions(xdim, ydim, zdim, xdim_start, ydim_start, zdim_start, torch.device("cpu"))
+    xx, yy, zz = np.meshgrid(x.numpy() * spacing_in_mm, y.numpy() * spacing_in_mm, z.numpy() * spacing_in_mm,
+                             indexing="ij")
+    pixel_positions_mm = np.stack([xx, zz, yy], axis=-1) + detection_geometry.device_position_mm
+    sensor_positions_mm = detection_geometry.get_detector_element_positions_accounting_for_device_position_mm()
+
+    if zdim == 1:
+        if np.ndim(speed_of_sound_map) == 3:
+            plane = int(np.clip(np.floor(np.mean(sensor_positions_mm[:, 1]) / map_spacing_in_mm), 0,
+                                np.shape(speed_of_sound_map)[1] - 1))
+            speed_of_sound_map = speed_of_sound_map[:, plane, :]
+        sensor_positions_mm = sensor_positions_mm[:, [0, 2]]
+        pixel_positions_mm = pixel_positions_mm[..., [0, 2]]
+    elif np.ndim(speed_of_sound_map) != 3:
+        raise AttributeError("A 3D speed of sound map is needed for the travel-time tables of a 3D image")
+
+    if Tags.RECONSTRUCTION_PLAN_CACHE_PATH in component_settings:
+        cache_path = component_settings[Tags.RECONSTRUCTION_PLAN_CACHE_PATH]
+    else:
+        cache_path = None
+    return compute_travel_time_tables(speed_of_sound_map, map_spacing_in_mm, sensor_positions_mm,
+                                      pixel_positions_mm, torch_device, cache_path, logger)
+
+
+def get_reduced_precision_dtype(component_settings: Settings) -> torch.dtype:
+    """
+    returns the torch dtype of the reduced Tags.RECONSTRUCTION_PRECISION in the component settings or None if the
+    reconstruction is performed in full precision.
+    """
+    if Tags.RECONSTRUCTION_PRECISION not in component_settings or \
+            component_settings[Tags.RECONSTRUCTION_PRECISION] not in REDUCED_PRECISION_DTYPES:
+        return None
+    return REDUCED_PRECISION_DTYPES[component_settings[Tags.RECONSTRUCTION_PRECISION]]
+
+
+def get_reduced_precision_scale(time_series_sensor_data: Tensor) -> Tensor:
+    """
+    returns the maximum absolute value of every frame of the time series data, by which the samples are divided before
+    they are cast to a reduced precision.
+
+    :param time_series_sensor_data: (torch tensor) time series data of shape (..., sensor elements, time steps)
+    :return: (torch tensor) scale of shape (..., 1, 1), which is 1 for frames without non-zero samples
+    """
+    scale = torch.amax(torch.abs(time_series_sensor_data), dim=(-2, -1), keepdim=True)
+    return torch.where(scale > 0, scale, torch.ones_like(scale))
+
+
+def rescale_reduced_precision_image(image: Tensor, time_series_sensor_data: Tensor,
+                                    component_settings: Settings) -> Tensor:
+    """
+    rescales an image that was reconstructed from the normalised delay and sum values of a reduced precision (see
+    `compute_delay_and_sum_values`) to the scale of the time series data. This is exact for reconstructions that are
+    positively homogeneous of degree one in the time series data, like Delay and Sum, (signed) Delay Multiply and Sum
+    and the universal back-projection. Images of full precision reconstructions are returned unchanged.
+
+    :param image: (torch tensor) reconstructed image of shape (..., x, y, z)
+    :param time_series_sensor_data: (torch tensor) time series data of shape (..., sensor elements, time steps)
+    :param component_settings: reconstruction settings
+    :return: (torch tensor) the image, which is rescaled in place
+    """
+    if get_reduced_precision_dtype(component_settings) is None:
+        return image
+    return image.mul_(get_reduced_precision_scale(time_series_sensor_data).to(image.dtype)[..., np.newaxis])
+
+
+def get_accumulation_dtype(values: torch.tensor) -> torch.dtype:
+    """
+    returns the dtype in which sums over the values are accumulated, which is at least single precision.
+    """
+    return torch.promote_types(values.dtype, torch.float32)
+
+
+def compute_delay_multiply_and_sum(values: torch.tensor) -> torch.tensor:
+    """
+    Sums the signed square roots of the products of all pairs of different sensor elements, which is the core of
+    Delay Multiply and Sum. As sign(a b) sqrt(|a b|) = s(a) s(b) with s(a) = sign(a) sqrt(|a|), the sum over all pairs
+    equals ((sum s)^2 - sum s^2) / 2 and is computed in O(n_sensor_elements) per pixel.
+
+    :param values: (torch tensor) delay and sum values with the sensor elements along the last dimension
+    :return: (torch tensor) delay multiply and sum values of the pixels
+    """
+    signed_roots = torch.sign(values) * torch.sqrt(torch.abs(values))
+    accumulation_dtype = get_accumulation_dtype(values)
+    return (torch.sum(signed_roots, dim=-1, dtype=accumulation_dtype) ** 2 -
+            torch.sum(torch.abs(values), dim=-1, dtype=accumulation_dtype)) / 2
+
+
+def get_available_memory_in_mb(torch_device: torch.device) -> Union[float, None]:
+    """
+    returns the memory that is available for new tensors on the device: the free GPU memory plus the memory that torch
+    has reserved but not allocated on a cuda device, and the available host memory otherwise.
+
+    :param torch_device: processing device
+    :return: available memory in MB or None if it cannot be determined
+    """
+    torch_device = torch.device(torch_device)
+    if torch_device.type == "cuda":
+        free_memory, _ = torch.cuda.mem_get_info(torch_device)
+        free_memory += torch.cuda.memory_reserved(torch_device) - torch.cuda.memory_allocated(torch_device)
+        return free_memory / 1024 ** 2
+    if os.path.exists("/proc/meminfo"):
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    if hasattr(os, "sysconf") and "SC_AVPHYS_PAGES" in os.sysconf_names:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    return None
+
+
+def get_memory_budget_in_mb(component_settings: Settings, torch_device: torch.device) -> Union[float, None]:
+    """
+    returns Tags.RECONSTRUCTION_MEMORY_BUDGET_MB of the component settings or, if it is not given,
+    DEFAULT_MEMORY_BUDGET_FRACTION of the available memory of the processing device (see
+    `get_available_memory_in_mb`).
+
+    :param component_settings: reconstruction settings
+    :param torch_device: processing device
+    :return: memory budget in MB or None if no budget is given and the available memory cannot be determined
+    """
+    if Tags.RECONSTRUCTION_MEMORY_BUDGET_MB in component_settings:
+        return component_settings[Tags.RECONSTRUCTION_MEMORY_BUDGET_MB]
+    available_memory_in_mb = get_available_memory_in_mb(torch_device)
+    if available_memory_in_mb is None:
+        return None
+    return DEFAULT_MEMORY_BUDGET_FRACTION * available_memory_in_mb
+
+
+def get_image_blocks(xdim: int, ydim: int, zdim: int, n_sensor_elements: int,
+                     memory_budget_in_mb: float = None,
+                     bytes_per_value: int = DELAY_AND_SUM_BYTES_PER_VALUE) -> List[Tuple[slice, slice, slice]]:
+    """
+    Splits the image into blocks whose delay and sum values fit into the given memory budget. The blocks are
+    contiguous along z first, then y and then x. Without a memory budget, the entire image is a single block.
+
+    :param xdim: number of pixels along x
+    :param ydim: number of pixels along y
+    :param zdim: number of pixels along z
+    :param n_sensor_elements: number of sensor elements
+    :param memory_budget_in_mb: memory available for the intermediate tensors of one block in MB
+    :param bytes_per_value: size of the intermediate tensors per pixel and sensor element in bytes
+    :return: list of tuples of slices along x, y and z
+    """
+    shape = (xdim, ydim, zdim)
+    if memory_budget_in_mb is None:
+        return [(slice(0, xdim), slice(0, ydim), slice(0, zdim))]
+
+    remaining = int(memory_budget_in_mb * 1024 ** 2 // (n_sensor_elements * bytes_per_value))
+    block_shape = []
+    for size in reversed(shape):
+        block_size = min(size, max(1, remaining))
+        block_shape.insert(0, block_size)
+        remaining //= block_size
+
+    starts = [range(0, size, block_size) for size, block_size in zip(shape, block_shape)]
+    return [tuple(slice(start, min(start + block_size, size))
+                  for start, block_size, size in zip(block_start, block_shape, shape))
+            for block_start in itertools.product(*starts)]
+
+
+def iterate_delay_and_sum_value_blocks(time_series_sensor_data: Tensor, sensor_positions: torch.tensor,
+                                       xdim: int, ydim: int, zdim: int, xdim_start: int, xdim_end: int,
+                                       ydim_start: int, ydim_end: int, zdim_start: int, zdim_end: int,
+                                       spacing_in_mm: float, speed_of_sound_in_m_per_s: float,
+                                       time_spacing_in_ms: float, logger: Logger, torch_device: torch.device,
+                                       component_settings: Settings, travel_time_tables: dict = None,
+                                       count_nonzero_values: bool = False,
+                                       sensor_orientations: torch.tensor = None,
+                                       plan_cache: BeamformingPlanCache = None
+                                       ) -> Iterator[Tuple[Tuple, torch.tensor, int]]:
+    """
+    Computes the delay and sum values block by block, so that the intermediate tensors of the computation fit into
+    the memory budget of `get_memory_budget_in_mb`. Every block should be
+    reduced before the next one is requested. For a batch of frames, the budget is shared by all frames. Each pixel
+    is computed exactly as by `compute_delay_and_sum_values` for the entire image, with the delays of the travel-time
+    tables of the entire image if they are given.
+
+    Yields
+    - the image block (tuple of slices along x, y and z)
+    - values (torch tensor) of the time series data corrected for delay and sensor positioning in this block
+    - n_sensor_elements (int)
+    - and, if count_nonzero_values is True, the number of non-zero values of every pixel in this block (see
+      `compute_delay_and_sum_values`)
+    """
+    memory_budget_in_mb = get_memory_budget_in_mb(component_settings, torch_device)
+    if get_reduced_precision_dtype(component_settings) is not None:
+        bytes_per_value = REDUCED_PRECISION_BYTES_PER_VALUE
+    else:
+        bytes_per_value = DELAY_AND_SUM_BYTES_PER_VALUE
+    if sensor_orientations is not None:
+        bytes_per_value += SOLID_ANGLE_WEIGHTS_BYTES_PER_VALUE
+    n_values_per_pixel = int(np.prod(time_series_sensor_data.shape[:-1]))
+    image_blocks = get_image_blocks(xdim, ydim, zdim, n_values_per_pixel, memory_budget_in_mb, bytes_per_value)
+    logger.debug(f"Computing delay and sum values in {len(image_blocks)} block(s)")
+
+    for image_block in image_blocks:
+        yield (image_block, ) + compute_delay_and_sum_values(
+            time_series_sensor_data, sensor_positions, xdim, ydim, zdim, xdim_start, xdim_end, ydim_start, ydim_end,
+            zdim_start, zdim_end, spacing_in_mm, speed_of_sound_in_m_per_s, time_spacing_in_ms, logger,
+            torch_device, component_settings, image_block, travel_time_tables, count_nonzero_values,
+            sensor_orientations, plan_cache)
+
+
+def compute_delay_and_sum_matrix(detection_geometry: DetectionGeometryBase, n_time_steps: int,
+                                 global_settings: Settings, component_settings: Settings, logger: Logger,
+                                 torch_sparse: bool = False) -> Union[scipy.sparse.csr_matrix, torch.Tensor]:
+    """
+    Assembles Delay and Sum as a sparse matrix that maps the flattened time series data of shape
+    (sensor elements, time steps) to the flattened image of shape (x, y, z). The matrix includes the linear
+    interpolation between the samples, the apodization, the masking of delays outside of the recorded time series, the
+    normalisation by the number of contributing sensor elements and the differential reconstruction mode. It is
+    assembled block by block within Tags.RECONSTRUCTION_MEMORY_BUDGET_MB and uses the beamforming plan cache if it is
+    configured in the component settings.
+    Multiplying the matrix with the time series data gives the image of the `DelayAndSumAdapter`, except for pixels
+    where the delayed samples themselves are exactly zero, which the adapter excludes from the normalisation.
+    The transpose is the adjoint for iterative reconstructions and the matrix can be stored with
+    `scipy.sparse.save_npz` to reconstruct many frames with the same settings.
+
+    :param detection_geometry: detection geometry of the time series data
+    :param n_time_steps: number of time steps of the time series data
+    :param global_settings: settings for the whole simulation
+    :param component_settings: settings for the reconstruction module
+    :param logger: logger for debugging purposes
+    :param torch_sparse: return a sparse CSR torch tensor on the processing device instead of a SciPy CSR matrix
+    :return: sparse matrix of shape (x * y * z, sensor elements * time steps)
+    """
+    speed_of_sound_in_m_per_s, spacing_in_mm, time_spacing_in_ms = get_reconstruction_parameters(
+        component_settings, global_settings, detection_geometry, logger)
+    xdim, zdim, ydim, xdim_start, xdim_end, ydim_start, ydim_end, zdim_start, zdim_end = compute_image_dimensions(
+        detection_geometry.field_of_view_extent_mm, spacing_in_mm, logger)
+    torch_device = get_processing_device(global_settings)
+
+    sensor_positions = torch.from_numpy(detection_geometry.get_detector_element_positions_base_mm()).to(torch_device)
+    if zdim == 1:
+        sensor_positions[:, 1] = 0  # Assume imaging plane
+    n_sensor_elements = sensor_positions.shape[0]
+    travel_time_tables = get_travel_time_tables(component_settings, global_settings, detection_geometry, xdim, ydim,
+                                                zdim, xdim_start, ydim_start, zdim_start, spacing_in_mm, torch_device,
+                                                logger)
+
+    if Tags.RECONSTRUCTION_APODIZATION_METHOD in component_settings:
+        apodization = get_apodization_factor(apodization_method=component_settings[Tags.RECONSTRUCTION_APODIZATION_METHOD],
+                                             dimensions=(), n_sensor_elements=n_sensor_elements, device=torch_device)
+    else:
+        apodization = torch.ones(n_sensor_elements, device=torch_device)
+
+    image_blocks = get_image_blocks(xdim, ydim, zdim, n_sensor_elements,
+                                    get_memory_budget_in_mb(component_settings, torch_device))
+    logger.debug(f"Assembling the delay and sum matrix in {len(image_blocks)} block(s)")
+
+    pixel_indices = torch.arange(xdim * ydim * zdim, device=torch_device).reshape(xdim, ydim, zdim)
+    rows, columns, entries = [], [], []
+    for image_block in image_blocks:
+        plan = get_beamforming_plan(component_settings, sensor_positions, n_sensor_elements, n_time_steps, xdim, ydim,
+                                    zdim, xdim_start, ydim_start, zdim_start, spacing_in_mm, speed_of_sound_in_m_per_s,
+                                    time_spacing_in_ms, torch_device, image_block, travel_time_tables)
+
+        # the image is normalised by the number of sensor elements that contribute to a pixel
+        valid = torch.logical_and(torch.logical_not(plan["invalid"]), apodization != 0)
+        normalisation = apodization / torch.clip(torch.sum(valid, dim=-1, keepdim=True), min=1)
+        pixels = pixel_indices[image_block].unsqueeze(-1).expand_as(valid)
+        for indices, weights in [(plan["lower_indices"], plan["lower_weights"]),
+                                 (plan["upper_indices"], plan["upper_weights"])]:
+            rows.append(pixels[valid].cpu().numpy())
+            columns.append(indices[valid].cpu().numpy())
+            entries.append((weights * normalisation)[valid].cpu().numpy())
+
+    # entries of the same sample and pixel are summed up
+    matrix = scipy.sparse.csr_matrix((np.concatenate(entries), (np.concatenate(rows), np.concatenate(columns))),
+                                     shape=(xdim * ydim * zdim, n_sensor_elements * n_time_steps))
+
+    if Tags.RECONSTRUCTION_MODE in component_settings and \
+            component_settings[Tags.RECONSTRUCTION_MODE] == Tags.RECONSTRUCTION_MODE_DIFFERENTIAL:
+        # the same operator as `reconstruction_mode_transformation` for every sensor element
+        time_vector = np.arange(1, n_time_steps + 1, dtype=float)
+        time_vector[-1] = 0
+        differential = scipy.sparse.diags([-time_vector, time_vector[:-1]], [0, 1])
+        matrix = (matrix @ scipy.sparse.kron(scipy.sparse.identity(n_sensor_elements), differential)).tocsr()
+
+    if torch_sparse:
+        return torch.sparse_csr_tensor(torch.from_numpy(matrix.indptr).long(), torch.from_numpy(matrix.indices).long(),
+                                       torch.from_numpy(matrix.data), size=matrix.shape, device=torch_device)
+    return matrix
@@ -0,0 +1,151 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Type, Union
+
+import numpy as np
+
+from simpa.core.device_digital_twins import DetectionGeometryBase, PhotoacousticDevice
+from simpa.core.simulation_modules.reconstruction_module import ReconstructionAdapterBase
+from simpa.core.simulation_modules.reconstruction_module.delay_and_sum_adapter import DelayAndSumAdapter
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import BeamformingPlanCache
+from simpa.io_handling.io_hdf5 import load_data_field
+from simpa.log.file_logger import Logger
+from simpa.utils import Settings, Tags
+
+# size of the beamforming plan cache if none is given in the reconstruction settings
+STREAMING_PLAN_CACHE_SIZE_MB = 1024
+
+
+class StreamingReconstructor:
+    """
+    Persistent reconstructor for a stream of frames with the same detection geometry, e.g. for a live preview.
+    The reconstruction adapter is instantiated once and keeps the beamforming plan in a plan cache of its own, which
+    is neither cleared nor evicted by other reconstructions, so that every frame only gathers and sums the delayed
+    samples. A speed of sound map of the simulation is loaded once instead of for every frame. If the frame shape is
+    given, a first frame of zeros is reconstructed on construction to compute the plan and allocate the output
+    buffer before the first frame arrives. A warning is logged if the plan does not fit into
+    Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB and has to be recomputed for every frame.
+    The images are written into the same output buffer for every frame and are only valid until the next frame is
+    reconstructed; copy them to keep them.
+    Frames are reconstructed one by one with `process` or as a stream with `stream`, which loads the next frame in
+    the background while the current frame is reconstructed. The latency of every frame is recorded.
+
+    Usage::
+
+        reconstructor = StreamingReconstructor(settings, device, frame_shape=(128, 2048))
+        for image in reconstructor.stream(frames):
+            show(image)
+        print(reconstructor.get_latency_report())
+    """
+
+    def __init__(self, global_settings: Settings, device: Union[DetectionGeometryBase, PhotoacousticDevice],
+                 adapter_class: Type[ReconstructionAdapterBase] = DelayAndSumAdapter, frame_shape: tuple = None):
+        """
+        :param global_settings: SIMPA settings with the reconstruction settings, which are copied
+        :param device: detection geometry or photoacoustic device that records the frames
+        :param adapter_class: reconstruction adapter that reconstructs the frames
+        :param frame_shape: shape (sensor elements, time steps) of the frames to prepare the reconstruction for
+        """
+        self.logger = Logger()
+        if isinstance(device, DetectionGeometryBase):
+            self.detection_geometry = device
+        elif isinstance(device, PhotoacousticDevice):
+            self.detection_geometry = device.get_detection_geometry()
+        else:
+            raise TypeError(f"Type {type(device)} is not supported for performing image reconstruction.")
+
+        settings = Settings(global_settings, verbose=False)
+        reconstruction_settings = Settings(global_settings.get_reconstruction_settings(), verbose=False)
+        if Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB not in reconstruction_settings:
+            reconstruction_settings[Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB] = STREAMING_PLAN_CACHE_SIZE_MB
+        self.speed_of_sound = None
+        loads_speed_of_sound = ((Tags.WAVELENGTH in settings and settings[Tags.WAVELENGTH]) or
+                                (Tags.RECONSTRUCTION_TRAVEL_TIME_TABLES in reconstruction_settings and
+                                 reconstruction_settings[Tags.RECONSTRUCTION_TRAVEL_TIME_TABLES]))
+        if Tags.DATA_FIELD_SPEED_OF_SOUND not in reconstruction_settings and Tags.SIMPA_OUTPUT_FILE_PATH in settings \
+                and loads_speed_of_sound:
+            # the adapters would otherwise load the speed of sound from the file for every frame
+            self.speed_of_sound = load_data_field(settings[Tags.SIMPA_OUTPUT_FILE_PATH], Tags.DATA_FIELD_SPEED_OF_SOUND)
+            reconstruction_settings[Tags.DATA_FIELD_SPEED_OF_SOUND] = self.speed_of_sound
+        settings[Tags.RECONSTRUCTION_MODEL_SETTINGS] = reconstruction_settings
+        self.adapter = adapter_class(settings)
+        self.adapter.beamforming_plan_cache = BeamformingPlanCache()
+        self.adapter.reuse_output_buffer = True
+        self.latencies_in_ms = []
+        self.plan_cache_checked = False
+
+        if frame_shape is not None:
+            start = time.perf_counter()
+            self.adapter.reconstruction_algorithm(np.zeros(frame_shape, dtype=np.float32), self.detection_geometry)
+            self.logger.debug(f"Prepared the reconstruction of frames of shape {frame_shape} in "
+                              f"{(time.perf_counter() - start) * 1000:.1f} ms")
+            self.check_plan_cache()
+
+    def check_plan_cache(self):
+        """
+        Logs a warning if the beamforming plan did not fit into the plan cache of the reconstructor.
+        """
+        self.plan_cache_checked = True
+        if self.adapter.beamforming_plan_cache.dropped_plans > 0:
+            self.logger.warning("The beamforming plan does not fit into the plan cache and is recomputed for every "
+                                "frame. Please increase Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB.")
+
+    def process(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Reconstructs a single frame, including the bandpass filtering and envelope detection of the reconstruction
+        settings, and records its latency.
+
+        :param frame: time series sensor data of shape (sensor elements, time steps)
+        :return: the reconstructed image, which is only valid until the next frame is reconstructed
+        """
+        start = time.perf_counter()
+        reconstruction = self.adapter.reconstruct_with_settings(frame, self.detection_geometry)
+        self.latencies_in_ms.append((time.perf_counter() - start) * 1000)
+        if not self.plan_cache_checked:
+            self.check_plan_cache()
+        self.logger.debug(f"Reconstructed frame {len(self.latencies_in_ms)} in {self.latencies_in_ms[-1]:.1f} ms")
+        return reconstruction
+
+    def stream(self, frames: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        """
+        Reconstructs the frames of an iterable, e.g. a generator that reads them from a file or an acquisition
+        system. The next frame is requested in a background thread while the current frame is reconstructed.
+
+        :param frames: iterable of time series sensor data of shape (sensor elements, time steps)
+        :return: iterator over the reconstructed images
+        """
+        frames = iter(frames)
+        end_of_stream = object()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_frame = executor.submit(next, frames, end_of_stream)
+            while True:
+                frame = next_frame.result()
+                if frame is end_of_stream:
+                    return
+                next_frame = executor.submit(next, frames, end_of_stream)
+                yield self.process(frame)
+
+    def get_latency_report(self) -> dict:
+        """
+        Summarises the latencies of the reconstructed frames.
+
+        :return: dictionary with the number of frames and the mean, median, 95th percentile and maximum latency in ms
+        """
+        if len(self.latencies_in_ms) == 0:
+            return {"frames": 0}
+        latencies = np.asarray(self.latencies_in_ms)
+        report = {
+            "frames": len(latencies),
+            "mean_latency_ms": float(np.mean(latencies)),
+            "median_latency_ms": float(np.median(latencies)),
+            "p95_latency_ms": float(np.percentile(latencies, 95)),
+            "max_latency_ms": float(np.max(latencies))
+        }
+        self.logger.info(f"Reconstructed {report['frames']} frames with a mean latency of "
+                         f"{report['mean_latency_ms']:.1f} ms and a maximum latency of "
+                         f"{report['max_latency_ms']:.1f} ms")
+        return report
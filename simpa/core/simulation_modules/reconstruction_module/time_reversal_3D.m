@@ -113,6 +113,6 @@ else
 end
 
 %% Write data to mat array
-save(strcat(acoustic_path, 'tr.mat'), 'reconstructed_data')
+save(strcat(acoustic_path, 'tr.mat'), 'reconstructed_data', '-v7.3')
 
 end
\ No newline at end of file
@@ -4,12 +4,11 @@
 
 from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import compute_image_dimensions
 from simpa.utils import Tags, round_x5_away_from_zero
-from simpa.utils.matlab import generate_matlab_cmd
+from simpa.utils.matlab import generate_matlab_cmd, load_mat_v73, save_mat_v73
 from simpa.utils.settings import Settings
 from simpa.core.simulation_modules.reconstruction_module import ReconstructionAdapterBase
 from simpa.core.device_digital_twins import LinearArrayDetectionGeometry
 import numpy as np
-import scipy.io as sio
 import subprocess
 import os
 
@@ -160,7 +159,10 @@ class TimeReversalAdapter(ReconstructionAdapterBase):
             k_wave_settings["dt"] = time_per_sample_s
             k_wave_settings["Nt"] = num_samples
         input_data["settings"] = k_wave_settings
-        sio.savemat(acoustic_path, input_data, long_field_names=True)
+        save_mat_v73(acoustic_path, input_data, single_precision_fields=[Tags.DATA_FIELD_TIME_SERIES_DATA,
+                                                                        Tags.DATA_FIELD_SPEED_OF_SOUND,
+                                                                        Tags.DATA_FIELD_DENSITY,
+                                                                        Tags.DATA_FIELD_ALPHA_COEFF])
 
         if Tags.ACOUSTIC_SIMULATION_3D in self.component_settings and \
                 self.component_settings[Tags.ACOUSTIC_SIMULATION_3D]:
@@ -178,7 +180,7 @@ class TimeReversalAdapter(ReconstructionAdapterBase):
         self.logger.info(cmd)
         subprocess.run(cmd)
 
-        reconstructed_data = sio.loadmat(acoustic_path + "tr.mat")[Tags.DATA_FIELD_RECONSTRUCTED_DATA]
+        reconstructed_data = load_mat_v73(acoustic_path + "tr.mat", Tags.DATA_FIELD_RECONSTRUCTED_DATA)
 
         reconstructed_data = reconstructed_data.T
 
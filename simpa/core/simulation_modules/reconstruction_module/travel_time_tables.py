@@ -0,0 +1,223 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from scipy.ndimage import map_coordinates
+
+from simpa.log.file_logger import Logger
+
+# number of travel-time tables that are kept in memory
+TRAVEL_TIME_TABLE_CACHE_SIZE = 2
+TRAVEL_TIME_TABLE_CACHE = OrderedDict()
+# approximate computation time of the fast iterative method per voxel and sensor element on a single CPU core
+FAST_ITERATIVE_SECONDS_PER_VOXEL = 1e-5
+# memory of the travel times, factors and gradients of the sensor elements that are computed at once
+FAST_ITERATIVE_MEMORY_BUDGET_MB = 2048
+
+
+def compute_travel_times_fast_iterative(speed_of_sound_map: np.ndarray, spacing_in_mm: float,
+                                        source_positions_mm: np.ndarray,
+                                        torch_device: torch.device = torch.device("cpu"),
+                                        initialisation_radius_in_voxels: float = 2.0,
+                                        tolerance: float = 1e-7) -> torch.Tensor:
+    """
+    Solves the eikonal equation |grad T| = 1 / c for the first arrival times T of point sources with the fast
+    iterative method [1]. The travel time is factored into T = T0 * tau, where T0 is the straight-line travel time
+    with the speed of sound at the source, and tau is computed with first order upwind differences [2]. The travel
+    times are thus exact in homogeneous media and the singularity at the source does not degrade their accuracy.
+    The voxels within the initialisation radius around the source are initialised with T0.
+    Instead of accepting the voxels one by one in the order of their arrival times like the fast marching method,
+    all voxels of the active band are updated at once with tensor operations until their relative change is below
+    the tolerance, and the neighbours of changed voxels form the next band. All sources are computed at once, so that
+    the computation runs on all cores of the CPU or on the GPU.
+
+    [1] W.-K. Jeong and R. T. Whitaker 2008, "A fast iterative method for eikonal equations",
+    https://doi.org/10.1137/060670298
+    [2] S. Luo and J. Qian 2012, "Fast sweeping methods for factored anisotropic eikonal equations: multiplicative
+    and additive factors", https://doi.org/10.1007/s10915-011-9550-y
+
+    :param speed_of_sound_map: (numpy array) speed of sound in m/s on a 2D or 3D grid, with the voxel centres at
+        (index + 0.5) * spacing
+    :param spacing_in_mm: (float) spacing of the grid in mm
+    :param source_positions_mm: (numpy array) positions of the sources of shape (sources, dimensions) in mm
+    :param torch_device: device on which the travel times are computed
+    :param initialisation_radius_in_voxels: (float) radius around the sources in which the straight-line travel
+        times are used
+    :param tolerance: (float) relative change of the travel times below which a voxel is converged
+    :return: (torch tensor) travel times in ms of shape (sources, ...) on the grid of the speed of sound map
+    :raises ValueError: if no voxel lies within the initialisation radius around a source
+    """
+    shape = np.shape(speed_of_sound_map)
+    ndim = len(shape)
+    # the grid is padded by a voxel on every side, at which the travel times are infinite, so that the neighbours
+    # of all voxels can be gathered without checking the bounds
+    padded_shape = tuple(dimension + 2 for dimension in shape)
+    strides = [int(np.prod(padded_shape[axis + 1:])) for axis in range(ndim)]
+    inner = tuple(slice(1, -1) for _ in shape)
+    speed = torch.ones(padded_shape, dtype=torch.float64, device=torch_device)
+    speed[inner] = torch.as_tensor(np.asarray(speed_of_sound_map), dtype=torch.float64, device=torch_device)
+    slowness = (1 / speed).reshape(-1, 1)
+    is_inner = torch.zeros(padded_shape, dtype=torch.bool, device=torch_device)
+    is_inner[inner] = True
+    is_inner = is_inner.reshape(-1)
+
+    # the travel times, factors and gradients are of shape (voxels, sources)
+    source_positions_mm = torch.as_tensor(np.asarray(source_positions_mm, dtype=np.float64), device=torch_device)
+    coordinates = torch.stack(torch.meshgrid(*[torch.arange(dimension, device=torch_device)
+                                               for dimension in padded_shape], indexing="ij"), dim=-1).reshape(-1, ndim)
+    difference = (coordinates.to(torch.float64)[:, None] - 0.5) * spacing_in_mm - source_positions_mm
+    distance = torch.linalg.norm(difference, dim=-1)
+    source_voxels = torch.floor(source_positions_mm / spacing_in_mm).long()
+    source_voxels = torch.minimum(source_voxels.clip(min=0), torch.tensor(shape, device=torch_device) - 1) + 1
+    # with the speed of sound in m/s = mm/ms, the travel times are in ms
+    source_speed = speed[tuple(source_voxels.T)]
+    t0 = distance / source_speed
+    gradient_t0 = [difference[..., axis] / (distance.clip(min=1e-12) * source_speed) for axis in range(ndim)]
+    del difference
+
+    initialised = (distance <= initialisation_radius_in_voxels * spacing_in_mm) & is_inner[:, None]
+    if not torch.all(torch.any(initialised, dim=0)):
+        raise ValueError(f"A source of {source_positions_mm.cpu().numpy()} mm lies outside of the speed of sound map.")
+    tau = torch.where(initialised, 1.0, torch.inf).to(torch.float64)
+    offsets = torch.tensor([sign * stride for stride in strides for sign in (-1, 1)], device=torch_device)
+    updatable = is_inner & ~torch.all(initialised, dim=1)
+
+    def neighbours(indices):
+        is_neighbour = torch.zeros_like(is_inner)
+        is_neighbour[(indices[:, None] + offsets).reshape(-1)] = True
+        return torch.nonzero(is_neighbour & updatable).reshape(-1)
+
+    band = neighbours(torch.nonzero(torch.any(initialised, dim=1)).reshape(-1))
+    while band.numel() > 0:
+        t0_band = t0[band]
+        # for every axis, the neighbour with the earlier arrival determines the upwind difference of
+        # dT / dx = tau * dT0 / dx + T0 * dtau / dx = alpha * tau - beta
+        upwind = []
+        for axis in range(ndim):
+            tau_lower, tau_upper = tau[band - strides[axis]], tau[band + strides[axis]]
+            arrival_lower = t0[band - strides[axis]] * tau_lower
+            arrival_upper = t0[band + strides[axis]] * tau_upper
+            use_lower = arrival_lower <= arrival_upper
+            direction = torch.where(use_lower, t0_band, -t0_band) / spacing_in_mm
+            gradient = gradient_t0[axis][band]
+            alpha = gradient + direction
+            beta = direction * torch.where(use_lower, tau_lower, tau_upper)
+            # the derivative of tau along an axis without upwind neighbour is zero
+            upwind.append([torch.minimum(arrival_lower, arrival_upper), alpha * alpha, alpha * beta, beta * beta,
+                           gradient * gradient])
+        # sort the axes by the arrival times of their upwind neighbours with a sorting network
+        for first, second in [(0, 1), (1, 2), (0, 1)][:{1: 0, 2: 1, 3: 3}[ndim]]:
+            swap = upwind[first][0] > upwind[second][0]
+            upwind[first], upwind[second] = ([torch.where(swap, b, a) for a, b in zip(upwind[first], upwind[second])],
+                                             [torch.where(swap, a, b) for a, b in zip(upwind[first], upwind[second])])
+        # sum over the axes of (alpha * tau - beta) ** 2 = 1 / c ** 2 with the upwind differences of the earliest
+        # neighbours, the solution with the most neighbours that is not earlier than them is causal
+        slowness_band = slowness[band]
+        a = sum(terms[4] for terms in upwind)
+        b = torch.zeros_like(t0_band)
+        c = -slowness_band ** 2
+        solution = torch.full_like(t0_band, torch.inf)
+        for terms in upwind:
+            a = a + terms[1] - terms[4]
+            b = b + terms[2]
+            c = c + terms[3]
+            discriminant = b * b - a * c
+            candidate = (b + torch.sqrt(discriminant.clip(min=0))) / a
+            solution = torch.where((discriminant >= 0) & (t0_band * candidate >= terms[0]), candidate, solution)
+        # the factored update has no solution if the medium is much faster than at the source, in which case the
+        # unfactored one-sided update from the earliest neighbour is used
+        solution = torch.where(torch.isinf(solution), (upwind[0][0] + spacing_in_mm * slowness_band) / t0_band,
+                               solution)
+
+        previous = tau[band]
+        solution = torch.where(initialised[band], previous, solution)
+        changed = torch.where(torch.isinf(previous), torch.isfinite(solution),
+                              torch.abs(solution - previous) > tolerance * previous)
+        tau[band] = solution
+        band = neighbours(band[torch.any(changed, dim=1)])
+
+    travel_times = (t0 * tau).reshape(padded_shape + (-1, ))[inner]
+    return torch.movedim(travel_times, -1, 0)
+
+
+def compute_travel_time_tables(speed_of_sound_map: np.ndarray, spacing_in_mm: float, sensor_positions_mm: np.ndarray,
+                               pixel_positions_mm: np.ndarray, torch_device: torch.device = torch.device("cpu"),
+                               cache_path: str = None, logger: Logger = None) -> dict:
+    """
+    Computes the travel times from every sensor element to every pixel in a heterogeneous medium. The eikonal
+    equation is solved with `compute_travel_times_fast_iterative` on the part of the speed of sound map that contains
+    the elements and the pixels, for as many elements at once as fit into FAST_ITERATIVE_MEMORY_BUDGET_MB, and the
+    travel times are linearly interpolated at the pixels.
+    The tables are kept in memory for the last TRAVEL_TIME_TABLE_CACHE_SIZE inputs and, if a cache path is given,
+    stored as float32 numpy files in this directory to be reused in later sessions.
+
+    :param speed_of_sound_map: (numpy array) speed of sound in m/s on a 2D or 3D grid, with the voxel centres at
+        (index + 0.5) * spacing
+    :param spacing_in_mm: (float) spacing of the speed of sound map in mm
+    :param sensor_positions_mm: (numpy array) positions of the sensor elements of shape (elements, dimensions) in mm
+    :param pixel_positions_mm: (numpy array) positions of the pixels of shape (..., dimensions) in mm
+    :param torch_device: device on which the travel times are computed and of the returned travel times
+    :param cache_path: directory in which the tables are stored
+    :param logger: logger for the progress of the computation
+    :return: dictionary with the travel times "travel_times" in ms (float32 torch tensor of shape (..., elements))
+        and the "key" that identifies the inputs
+    """
+    if logger is None:
+        logger = Logger()
+    speed_of_sound_map = np.ascontiguousarray(speed_of_sound_map, dtype=np.float32)
+    sensor_positions_mm = np.ascontiguousarray(sensor_positions_mm, dtype=np.float64)
+    pixel_positions_mm = np.ascontiguousarray(pixel_positions_mm, dtype=np.float64)
+    hash_function = hashlib.sha256()
+    for array in [speed_of_sound_map, np.asarray(speed_of_sound_map.shape), np.asarray([spacing_in_mm], dtype=float),
+                  sensor_positions_mm, pixel_positions_mm, np.asarray(pixel_positions_mm.shape)]:
+        hash_function.update(array.tobytes())
+    key = hash_function.hexdigest()
+
+    if (key, str(torch_device)) in TRAVEL_TIME_TABLE_CACHE:
+        TRAVEL_TIME_TABLE_CACHE.move_to_end((key, str(torch_device)))
+        return TRAVEL_TIME_TABLE_CACHE[(key, str(torch_device))]
+
+    file_path = None
+    if cache_path is not None:
+        os.makedirs(cache_path, exist_ok=True)
+        file_path = os.path.join(cache_path, f"travel_times_{key}.npy")
+    if file_path is not None and os.path.exists(file_path):
+        travel_times = np.load(file_path)
+    else:
+        # restrict the marching to the voxels around the sensor elements and the pixels
+        positions = np.concatenate([sensor_positions_mm, pixel_positions_mm.reshape(-1, sensor_positions_mm.shape[1])])
+        lower = np.clip(np.floor(np.min(positions, axis=0) / spacing_in_mm).astype(int) - 2, 0, None)
+        upper = np.minimum(np.ceil(np.max(positions, axis=0) / spacing_in_mm).astype(int) + 3,
+                           speed_of_sound_map.shape)
+        cropped_map = speed_of_sound_map[tuple(slice(start, end) for start, end in zip(lower, upper))]
+        offset_mm = lower * spacing_in_mm
+
+        expected_seconds = FAST_ITERATIVE_SECONDS_PER_VOXEL * len(sensor_positions_mm) * cropped_map.size
+        logger.info(f"Computing the travel times of {len(sensor_positions_mm)} sensor elements on a grid of "
+                    f"{cropped_map.shape} voxels, which is expected to take up to {expected_seconds:.0f} s on a "
+                    f"single CPU core")
+        # the travel times, factors and gradients of every padded voxel and element are held in double precision
+        bytes_per_element = 8 * (cropped_map.ndim + 2) * np.prod(np.add(cropped_map.shape, 2))
+        elements_per_batch = max(1, int(FAST_ITERATIVE_MEMORY_BUDGET_MB * 1024 ** 2 // bytes_per_element))
+        coordinates = np.moveaxis(pixel_positions_mm - offset_mm, -1, 0) / spacing_in_mm - 0.5
+        travel_times = np.zeros(pixel_positions_mm.shape[:-1] + (len(sensor_positions_mm), ), dtype=np.float32)
+        for first_element in range(0, len(sensor_positions_mm), elements_per_batch):
+            batch = slice(first_element, first_element + elements_per_batch)
+            travel_time_maps = compute_travel_times_fast_iterative(
+                cropped_map, spacing_in_mm, sensor_positions_mm[batch] - offset_mm, torch_device).cpu().numpy()
+            for element, travel_time_map in enumerate(travel_time_maps, first_element):
+                travel_times[..., element] = map_coordinates(travel_time_map, coordinates, order=1, mode="nearest")
+        if file_path is not None:
+            np.save(file_path, travel_times)
+
+    tables = {"travel_times": torch.from_numpy(travel_times).to(torch_device), "key": key}
+    TRAVEL_TIME_TABLE_CACHE[(key, str(torch_device))] = tables
+    while len(TRAVEL_TIME_TABLE_CACHE) > TRAVEL_TIME_TABLE_CACHE_SIZE:
+        TRAVEL_TIME_TABLE_CACHE.popitem(last=False)
+    return tables
@@ -0,0 +1,120 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+from simpa.utils import Tags
+from simpa.core.simulation_modules.reconstruction_module import ReconstructionAdapterBase
+import numpy as np
+import torch
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import compute_image_dimensions, \
+    get_accumulation_dtype, get_travel_time_tables, iterate_delay_and_sum_value_blocks, \
+    preparing_reconstruction_and_obtaining_reconstruction_settings, rescale_reduced_precision_image
+from simpa.core.device_digital_twins import DetectionGeometryBase
+from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings
+
+
+class UniversalBackProjectionAdapter(ReconstructionAdapterBase):
+    """
+    Reconstructs the initial pressure with the universal back-projection [1] that is exact for closed detection
+    surfaces like ring arrays and a good approximation for curved arrays:
+    The back-projection term b(t) = 2 p(t) - 2 t dp/dt of every sensor element is back-projected and weighted with the
+    solid angle that the element subtends at the pixel, normalised by the solid angle of the whole array.
+    The back-projection uses the delay and sum values of `reconstruction_utils` and thus the memory budget of the
+    reconstruction settings. The solid angle weights are stored with the beamforming plan of every image block, so
+    that they are computed once per device, grid and block if the beamforming plan cache is configured.
+    For an image plane, the in-plane angle of the elements is used instead of the solid angle.
+    As b(t) already contains the derivative of the pressure, Tags.RECONSTRUCTION_MODE_DIFFERENTIAL is not supported.
+
+    [1] M. Xu and L. V. Wang 2005, "Universal back-projection algorithm for photoacoustic computed tomography",
+    https://doi.org/10.1103/PhysRevE.71.016706
+    """
+
+    accepts_tensors = True
+    supports_batched_frames = True
+
+    def __init__(self, global_settings):
+        super(UniversalBackProjectionAdapter, self).__init__(global_settings)
+        # 2 t of the back-projection term for the last number of time steps, device and dtype
+        self.back_projection_ramp = None
+
+    def reconstruction_algorithm(self, time_series_sensor_data, detection_geometry: DetectionGeometryBase):
+        """
+        Applies the universal back-projection to the time series sensor data (2D numpy array where the first
+        dimension corresponds to the sensor elements and the second to the recorded time steps).
+        A reconstructed image (2D numpy array) is returned.
+        A batch of frames (3D numpy array with the frames along the first dimension) is reconstructed at once and a
+        reconstructed image is returned for every frame.
+        """
+
+        if Tags.RECONSTRUCTION_MODE in self.component_settings and \
+                self.component_settings[Tags.RECONSTRUCTION_MODE] == Tags.RECONSTRUCTION_MODE_DIFFERENTIAL:
+            raise ValueError("The universal back-projection already differentiates the pressure, "
+                             "Tags.RECONSTRUCTION_MODE_DIFFERENTIAL is not supported.")
+
+        time_series_sensor_data, sensor_positions, speed_of_sound_in_m_per_s, spacing_in_mm, time_spacing_in_ms, torch_device = preparing_reconstruction_and_obtaining_reconstruction_settings(
+            time_series_sensor_data, self.component_settings, self.global_settings, detection_geometry, self.logger)
+
+        xdim, zdim, ydim, xdim_start, xdim_end, ydim_start, ydim_end, zdim_start, zdim_end = compute_image_dimensions(
+            detection_geometry.field_of_view_extent_mm, spacing_in_mm, self.logger)
+        travel_time_tables = get_travel_time_tables(
+            self.component_settings, self.global_settings, detection_geometry, xdim, ydim, zdim, xdim_start,
+            ydim_start, zdim_start, spacing_in_mm, torch_device, self.logger)
+
+        if zdim == 1:
+            sensor_positions[:, 1] = 0  # Assume imaging plane
+        sensor_orientations = torch.from_numpy(detection_geometry.get_detector_element_orientations()).to(
+            sensor_positions.dtype).to(torch_device)
+
+        # back-projection term b(t) = 2 p(t) - 2 t dp/dt, with the time in units of the time spacing
+        ramp = self.back_projection_ramp
+        if ramp is None or ramp.shape[-1] != time_series_sensor_data.shape[-1] or ramp.device != \
+                time_series_sensor_data.device or ramp.dtype != time_series_sensor_data.dtype:
+            ramp = 2 * torch.arange(time_series_sensor_data.shape[-1], device=time_series_sensor_data.device,
+                                    dtype=time_series_sensor_data.dtype)
+            self.back_projection_ramp = ramp
+        time_series_sensor_data = 2 * time_series_sensor_data - ramp * torch.gradient(time_series_sensor_data,
+                                                                                      dim=-1)[0]
+
+        # construct output image, with the frames along the first dimension for a batch of frames
+        output = self.get_output_buffer(time_series_sensor_data.shape[:-2] + (xdim, ydim, zdim), torch_device)
+
+        for image_block, values, _ in iterate_delay_and_sum_value_blocks(
+                time_series_sensor_data, sensor_positions, xdim, ydim, zdim, xdim_start, xdim_end, ydim_start,
+                ydim_end, zdim_start, zdim_end, spacing_in_mm, speed_of_sound_in_m_per_s, time_spacing_in_ms,
+                self.logger, torch_device, self.component_settings, travel_time_tables,
+                sensor_orientations=sensor_orientations, plan_cache=self.beamforming_plan_cache):
+            # the values are already weighted with the solid angle weights of the beamforming plan
+            output[(...,) + image_block] = torch.sum(values, dim=-1, dtype=get_accumulation_dtype(values))
+
+        output = rescale_reduced_precision_image(output, time_series_sensor_data, self.component_settings)
+        reconstructed = self.output_buffer_to_numpy(output)
+
+        return self.squeeze_image_dimensions(reconstructed, xdim, ydim, zdim)
+
+
+def reconstruct_universal_back_projection_pytorch(time_series_sensor_data: np.ndarray,
+                                                  detection_geometry: DetectionGeometryBase,
+                                                  speed_of_sound_in_m_per_s: int = 1540,
+                                                  time_spacing_in_s: float = 2.5e-8,
+                                                  sensor_spacing_in_mm: float = 0.1,
+                                                  recon_mode: str = Tags.RECONSTRUCTION_MODE_PRESSURE,
+                                                  apodization: str = Tags.RECONSTRUCTION_APODIZATION_BOX
+                                                  ) -> np.ndarray:
+    """
+    Convenience function for reconstructing time series data using the universal back-projection implemented in
+    PyTorch
+
+    :param time_series_sensor_data: (2D numpy array) sensor data of shape (sensor elements, time steps)
+    :param detection_geometry: The DetectionGeometryBase that should be used to reconstruct the given time series data
+    :param speed_of_sound_in_m_per_s: (int) speed of sound in medium in meters per second (default: 1540 m/s)
+    :param time_spacing_in_s: (float) time between sampling points in seconds (default: 2.5e-8 s which is equal to 40 MHz)
+    :param sensor_spacing_in_mm: (float) space between pixels of the reconstructed image in millimeters (default: 0.1 mm)
+    :param recon_mode: SIMPA Tag defining the reconstruction mode - only pressure, as b(t) already differentiates
+    :param apodization: SIMPA Tag defining the apodization function (default box)
+    :return: (numpy array) reconstructed image
+    """
+    # create settings
+    settings = create_reconstruction_settings(speed_of_sound_in_m_per_s, time_spacing_in_s, sensor_spacing_in_mm,
+                                              recon_mode, apodization)
+    adapter = UniversalBackProjectionAdapter(settings)
+    return adapter.reconstruction_algorithm(time_series_sensor_data, detection_geometry)
@@ -170,8 +170,20 @@ def load_hdf5(file_path, file_dictionary_path="/"):
         return data_grabber(h5file, file_dictionary_path)
 
 
-def load_data_field(file_path, data_field, wavelength=None):
+def load_data_field(file_path, data_field, wavelength=None, data_slice=None):
+    """
+    Loads a data field from an hdf5 file in the SIMPA convention.
+
+    :param file_path: Path of the file to load the data field from.
+    :param data_field: Data field to load.
+    :param wavelength: Wavelength of the data field, if it is wavelength-dependent.
+    :param data_slice: If given, only this part of the array is read from the file.
+    :returns: the data field
+    """
     path = generate_dict_path(data_field, wavelength=wavelength)
+    if data_slice is not None:
+        with h5py.File(file_path, "r") as h5file:
+            return h5file[path][data_slice]
     data = load_hdf5(file_path, path)
     return data
 
@@ -4,8 +4,12 @@
 
 import inspect
 import os
+import time
 from typing import List
 
+import h5py
+import numpy as np
+
 
 def generate_matlab_cmd(matlab_binary_path: str, simulation_script_path: str, data_path: str, additional_flags: List[str] = []) -> List[str]:
     """Generates the MATLAB execution command from the given paths
@@ -37,3 +41,81 @@ def generate_matlab_cmd(matlab_binary_path: str, simulation_script_path: str, da
     cmd.append("-r")
     cmd.append(f"addpath('{base_script_path}');{simulation_script_path}('{data_path}');exit;")
     return cmd
+
+
+def save_mat_v73(file_path: str, data: dict, single_precision_fields: List[str] = []) -> None:
+    """Saves a dictionary as MAT-file version 7.3, i.e. as an HDF5 file that MATLAB can load with `load`.
+    Nested dictionaries are stored as structs, strings as char arrays and booleans as logical values. The arrays
+    are stored in the column-major layout of MATLAB, such that their shape in MATLAB equals their shape in numpy.
+
+    :param file_path: path of the .mat file
+    :type file_path: str
+    :param data: dictionary with the variables
+    :type data: dict
+    :param single_precision_fields: names of the variables whose floating point arrays are stored in single
+        precision, e.g. large volumes
+    :type single_precision_fields: List[str]
+    """
+    with h5py.File(file_path, "w", userblock_size=512) as mat_file:
+        for name, value in data.items():
+            _write_matlab_variable(mat_file, str(name), value, name in single_precision_fields)
+
+    header = f"MATLAB 7.3 MAT-file, Platform: GLNXA64, Created on: {time.strftime('%a %b %d %H:%M:%S %Y')} " \
+             f"HDF5 schema 1.00 ."
+    with open(file_path, "r+b") as mat_file:
+        mat_file.write(header.encode("ascii").ljust(116, b" ") + b" " * 8 + b"\x00\x02IM")
+
+
+def _write_matlab_variable(group: h5py.Group, name: str, value, single_precision: bool = False) -> None:
+    """Writes a variable with the attributes MATLAB expects in MAT-files version 7.3.
+
+    :param group: HDF5 group the variable is written to
+    :param name: name of the variable
+    :param value: value of the variable
+    :param single_precision: whether floating point arrays are stored in single precision
+    """
+    if isinstance(value, dict):
+        struct = group.create_group(name)
+        struct.attrs["MATLAB_class"] = np.bytes_("struct")
+        for field_name, field_value in value.items():
+            _write_matlab_variable(struct, str(field_name), field_value)
+        return
+
+    if value is None:
+        dataset = group.create_dataset(name, data=np.zeros(2, dtype=np.uint64))
+        dataset.attrs["MATLAB_class"] = np.bytes_("double")
+        dataset.attrs["MATLAB_empty"] = np.uint8(1)
+        return
+
+    if isinstance(value, str):
+        array = np.array([[ord(character) for character in value]], dtype=np.uint16).reshape(1, -1)
+        matlab_class, int_decode = "char", 2
+    else:
+        array = np.asarray(value)
+        if array.dtype == bool:
+            array, matlab_class, int_decode = array.astype(np.uint8, order="F", copy=False), "logical", 1
+        elif np.issubdtype(array.dtype, np.floating) and single_precision:
+            array, matlab_class, int_decode = array.astype(np.float32, order="F", copy=False), "single", None
+        else:
+            array, matlab_class, int_decode = array.astype(np.float64, order="F", copy=False), "double", None
+        array = array.reshape((1,) * (2 - array.ndim) + array.shape)
+
+    # arrays converted in Fortran order are C-contiguous once transposed and are not copied a second time
+    dataset = group.create_dataset(name, data=np.ascontiguousarray(array.transpose()))
+    dataset.attrs["MATLAB_class"] = np.bytes_(matlab_class)
+    if int_decode is not None:
+        dataset.attrs["MATLAB_int_decode"] = np.int32(int_decode)
+
+
+def load_mat_v73(file_path: str, variable_name: str) -> np.ndarray:
+    """Loads a single numeric variable from a MAT-file version 7.3 without reading the remaining variables.
+
+    :param file_path: path of the .mat file
+    :type file_path: str
+    :param variable_name: name of the variable
+    :type variable_name: str
+    :return: the variable with its shape in MATLAB
+    :rtype: np.ndarray
+    """
+    with h5py.File(file_path, "r") as mat_file:
+        return mat_file[variable_name][()].transpose()
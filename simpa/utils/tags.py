@@ -86,6 +86,14 @@ class Tags:
     Usage: SIMPA package
     """
 
+    ACOUSTIC_MODEL_BATCH_WAVELENGTHS = ("acoustic_model_batch_wavelengths", bool)
+    """
+    If True, the acoustic forward model is run once for all wavelengths after the preceding pipeline elements have
+    been run for every wavelength. Adapters that support it propagate the initial pressure distributions of all
+    wavelengths in one batched run.\n
+    Usage: module acoustic_forward_module
+    """
+
     MEDIUM_TEMPERATURE_CELCIUS = ("medium_temperature", Number)
     """
     Temperature of the simulated volume.\n
@@ -410,6 +418,88 @@ class Tags:
     Usage: module optical_modelling, adapter mcx_adapter
     """
 
+    OPTICAL_MODEL_COMBINE_ILLUMINATION_GEOMETRIES = ("optical_model_combine_illumination_geometries",
+                                                     (bool, np.bool_))
+    """
+    If True, devices with several illumination geometries are simulated in a single optical forward model run that
+    launches photons from all sources at once instead of running and averaging one simulation per illuminator.
+    All illumination geometries of the device need to have the same mcx source type. Default is False.\n
+    Usage: module optical_modelling, adapter mcx_adapter
+    """
+
+    OPTICAL_MODEL_DOWNSAMPLING_FACTOR = ("optical_model_downsampling_factor", (int, np.integer))
+    """
+    Integer factor by which the optical grid is coarsened along every axis compared to Tags.SPACING_MM.
+    The optical properties are averaged onto the coarse grid, the optical forward model is run on the coarse grid and
+    the resulting fluence is linearly interpolated back onto the full grid. The initial pressure is computed at full
+    resolution. Default is 1 (no downsampling).\n
+    Usage: module optical_modelling
+    """
+
+    OPTICAL_MODEL_CROP_TO_ILLUMINATION = ("optical_model_crop_to_illumination", (bool, np.bool_))
+    """
+    If True, the optical domain is laterally cropped to the region illuminated by the illumination geometry plus a
+    safety margin before it is passed to the optical forward model. The fluence is zero-padded back into the full
+    volume afterwards. Default is False.\n
+    Usage: module optical_modelling, adapter mcx_adapter
+    """
+
+    OPTICAL_MODEL_CROP_MARGIN_TRANSPORT_MEAN_FREE_PATHS = ("optical_model_crop_margin_transport_mean_free_paths",
+                                                           Number)
+    """
+    Safety margin around the illuminated region in units of the transport mean free path 1 / (mua + mus') of the
+    volume when Tags.OPTICAL_MODEL_CROP_TO_ILLUMINATION is set. Default is 10.\n
+    Usage: module optical_modelling, adapter mcx_adapter
+    """
+
+    OPTICAL_MODEL_FORCE_ANALYTIC_FLUENCE = ("optical_model_force_analytic_fluence", (bool, np.bool_))
+    """
+    If True, the analytic diffusion adapter computes the fluence with the layered diffusion model even if the volume
+    contains structures other than the background and horizontal layers. Such structures are then only considered
+    through the laterally averaged optical properties of each depth.\n
+    Usage: module optical_modelling, adapter analytic_diffusion_adapter
+    """
+
+    OPTICAL_MODEL_PERTURBATION_MONTE_CARLO = ("optical_model_perturbation_monte_carlo", (bool, np.bool_))
+    """
+    If True, mcx records the time-resolved fluence, i.e. the distribution of photon path lengths in every voxel, for a
+    reference wavelength. The fluence at subsequent wavelengths is derived by reweighting the recorded path lengths with
+    the change in absorption instead of running mcx again, as long as the reduced scattering coefficient stays within
+    Tags.OPTICAL_MODEL_PERTURBATION_SCATTERING_TOLERANCE of the reference and the change in absorption is uniform
+    within Tags.OPTICAL_MODEL_PERTURBATION_ABSORPTION_TOLERANCE.
+    The partial path lengths of the photons in the individual voxels are not recorded, so the mode is limited to
+    near-uniform changes in absorption, e.g. closely spaced wavelengths in tissue without strong absorbers. In
+    phantoms with blood vessels, the absorption of blood changes much more between wavelengths than that of the
+    background, so that mcx is run again for most wavelengths and the mode only adds the memory of the time-resolved
+    reference.\n
+    Usage: module optical_modelling, adapter mcx_adapter
+    """
+
+    OPTICAL_MODEL_PERTURBATION_SCATTERING_TOLERANCE = ("optical_model_perturbation_scattering_tolerance", Number)
+    """
+    Maximum relative change of the reduced scattering coefficient with respect to the reference wavelength for which
+    the fluence is derived by perturbation Monte Carlo. If the change is larger, mcx is run again and the run becomes
+    the new reference. Default is 0.05.\n
+    Usage: module optical_modelling, adapter mcx_adapter
+    """
+
+    OPTICAL_MODEL_PERTURBATION_ABSORPTION_TOLERANCE = ("optical_model_perturbation_absorption_tolerance", Number)
+    """
+    Only the total path lengths of the photons are recorded for perturbation Monte Carlo, so the fluence is
+    reweighted with the mean change in absorption. This tolerance is the maximum deviation of the change in
+    absorption of a voxel from the mean change, times the mean photon path length, for which the fluence is derived
+    by perturbation Monte Carlo. If the change is more heterogeneous, e.g. because the absorption of blood changes
+    much more than that of the background, mcx is run again and the run becomes the new reference. Default is 0.05.\n
+    Usage: module optical_modelling, adapter mcx_adapter
+    """
+
+    OPTICAL_MODEL_PERTURBATION_TIME_GATES = ("optical_model_perturbation_time_gates", (int, np.integer))
+    """
+    Number of time gates used to record the photon path lengths for perturbation Monte Carlo if Tags.TIME_STEP is not
+    given. The memory required for the reference is this number times the size of the volume. Default is 100.\n
+    Usage: module optical_modelling, adapter mcx_adapter
+    """
+
     ILLUMINATION_TYPE = ("optical_model_illumination_type", str)
     """
     Type of the illumination geometry used in mcx.\n
@@ -618,6 +708,41 @@ class Tags:
     Usage: module optical_simulation_module
     """
 
+    ACOUSTIC_SYSTEM_MATRIX_CACHE_PATH = ("acoustic_system_matrix_cache_path", str)
+    """
+    Directory in which the AcousticSystemMatrixAdapter stores its system matrices to reuse them across simulations
+    with the same device and grid.\n
+    Usage: adapter AcousticSystemMatrixAdapter
+    """
+
+    ACOUSTIC_MODEL_VOXELS_PER_CHUNK = ("acoustic_model_voxels_per_chunk", int)
+    """
+    Number of voxels whose signals the AnalyticPointSourceAdapter computes at once. Larger chunks are faster but
+    need more memory. Default is 2048.\n
+    Usage: adapter AnalyticPointSourceAdapter
+    """
+
+    K_WAVE_BACKEND = ("k_wave_backend", str)
+    """
+    Execution backend of the k-Wave adapter. Either Tags.K_WAVE_BACKEND_MATLAB (default) or
+    Tags.K_WAVE_BACKEND_BINARY. For the binary backend, Tags.ACOUSTIC_MODEL_BINARY_PATH has to point to the k-Wave
+    C++ executable, e.g. kspaceFirstOrder-OMP.\n
+    Usage: adapter KwaveAcousticForwardModel
+    """
+
+    K_WAVE_BACKEND_MATLAB = "matlab"
+    """
+    Runs k-Wave simulations with the MATLAB toolbox.\n
+    Usage: adapter KwaveAcousticForwardModel, naming convention
+    """
+
+    K_WAVE_BACKEND_BINARY = "binary"
+    """
+    Runs k-Wave simulations with the multi-threaded C++ code (e.g. kspaceFirstOrder-OMP) using its HDF5 input and
+    output file format.\n
+    Usage: adapter KwaveAcousticForwardModel, naming convention
+    """
+
     ACOUSTIC_MODEL_OUTPUT_NAME = "acoustic_forward_model_output"
     """
     Name of the acoustic forward model output field in the SIMPA output file.\n
@@ -648,6 +773,13 @@ class Tags:
     Usage: naming convention
     """
 
+    TIME_SERIES_DECIMATION_BLOCK_SIZE = ("time_series_decimation_block_size", int)
+    """
+    Number of detector elements whose time series data the TimeSeriesDecimation component reads and filters at once.
+    Default is 64.\n
+    Usage: module core.processing_components
+    """
+
     RECONSTRUCTION_MODEL_SETTINGS = ("reconstruction_model_settings", dict)
     """"
     Reconstruction Model Settings
@@ -767,6 +899,74 @@ class Tags:
     Usage: adapter PyTorchDASAdapter, naming convention
     """
 
+    RECONSTRUCTION_MEMORY_BUDGET_MB = ("reconstruction_memory_budget_mb", Number)
+    """
+    Memory in MB that the intermediate tensors of the delay and sum based reconstructions may use. The image is
+    reconstructed in blocks that fit into this budget. By default, half of the available host or GPU memory is used.\n
+    Usage: adapter DelayAndSumAdapter, adapter DelayMultiplyAndSumAdapter, adapter SignedDelayMultiplyAndSumAdapter
+    """
+
+    RECONSTRUCTION_PLAN_CACHE_SIZE_MB = ("reconstruction_plan_cache_size_mb", Number)
+    """
+    Memory in MB for the beamforming plans (delay indices and interpolation weights) of the delay and sum based
+    reconstructions. If set, the plans are kept in memory and the least recently used plans are evicted once the cache
+    is full, so that repeated reconstructions with the same geometry skip the delay computation.\n
+    Usage: adapter DelayAndSumAdapter, adapter DelayMultiplyAndSumAdapter, adapter SignedDelayMultiplyAndSumAdapter
+    """
+
+    RECONSTRUCTION_PLAN_CACHE_PATH = ("reconstruction_plan_cache_path", str)
+    """
+    Directory in which the beamforming plans and the travel-time tables of the delay and sum based reconstructions
+    are stored to reuse them across sessions.\n
+    Usage: adapter DelayAndSumAdapter, adapter DelayMultiplyAndSumAdapter, adapter SignedDelayMultiplyAndSumAdapter
+    """
+
+    RECONSTRUCTION_PRECISION = ("reconstruction_precision", str)
+    """
+    Floating point precision of the delayed samples and interpolation weights of the delay and sum based
+    reconstructions. Reduced precisions halve the memory of these tensors, so that larger blocks fit into
+    Tags.RECONSTRUCTION_MEMORY_BUDGET_MB. The delays themselves are computed in single precision and the sums are
+    accumulated in single precision. With a reduced precision, the samples of every frame are normalised by their
+    maximum absolute value before they are cast, and the image is rescaled afterwards, so that small pressures do not
+    underflow and large pressures do not overflow. By default, Tags.RECONSTRUCTION_PRECISION_FLOAT32 is used. The
+    deviation from the full precision can be checked with `validate_reconstruction_precision`.\n
+    Usage: adapter DelayAndSumAdapter, adapter DelayMultiplyAndSumAdapter, adapter SignedDelayMultiplyAndSumAdapter,
+    adapter UniversalBackProjectionAdapter
+    """
+
+    RECONSTRUCTION_PRECISION_FLOAT32 = "Float32Precision"
+    """
+    Corresponds to the full precision of the delay and sum based reconstructions.\n
+    Usage: adapter DelayAndSumAdapter, naming convention
+    """
+
+    RECONSTRUCTION_PRECISION_FLOAT16 = "Float16Precision"
+    """
+    Corresponds to half precision (float16) samples and interpolation weights.\n
+    Usage: adapter DelayAndSumAdapter, naming convention
+    """
+
+    RECONSTRUCTION_PRECISION_BFLOAT16 = "BFloat16Precision"
+    """
+    Corresponds to bfloat16 samples and interpolation weights, which have the range of float32 but a lower
+    resolution than float16.\n
+    Usage: adapter DelayAndSumAdapter, naming convention
+    """
+
+    RECONSTRUCTION_TRAVEL_TIME_TABLES = ("reconstruction_travel_time_tables", (bool, np.bool_))
+    """
+    If True, the delay and sum based reconstructions use the travel times through the heterogeneous speed of sound
+    map instead of the straight-line travel times with a single speed of sound. The map is taken from
+    Tags.DATA_FIELD_SPEED_OF_SOUND in the reconstruction settings if it is given as a numpy array and from the
+    simulation output otherwise. The travel times of every sensor element are computed once with the fast iterative
+    method on the device of the reconstruction and stored in Tags.RECONSTRUCTION_PLAN_CACHE_PATH if it is given. On
+    a single CPU core, the fast iterative method takes up to 10 microseconds per voxel and sensor element, e.g. about
+    half a minute for 128 elements on a 150 x 150 grid, so that the tables should be cached for repeated
+    reconstructions of larger grids.\n
+    Usage: adapter DelayAndSumAdapter, adapter DelayMultiplyAndSumAdapter, adapter SignedDelayMultiplyAndSumAdapter,
+    adapter UniversalBackProjectionAdapter
+    """
+
     RECONSTRUCTION_PERFORM_BANDPASS_FILTERING = ("reconstruction_perform_bandpass_filtering",
                                                  (bool, np.bool_))
     """
@@ -0,0 +1,101 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import json
+import tempfile
+import unittest
+import jdata
+import numpy as np
+from simpa import MCXAdapter, Settings, Tags
+from simpa.core.device_digital_twins import (CombinedIlluminationGeometry, DiskIlluminationGeometry,
+                                             PencilBeamIlluminationGeometry, MSOTInVisionIlluminationGeometry)
+
+
+class LinearTransportMCXAdapter(MCXAdapter):
+    """
+    MCXAdapter that replaces the mcx binary by a linear toy model of its source handling: the photons of a run are
+    split equally between the rows of the source definition, every photon deposits its weight along the column below
+    its source with an exponential decay, and the fluence is normalised by the total number of launched photons.
+    The configuration is read from and the fluence is written to the files that the real mcx binary would use.
+    """
+
+    def __init__(self, global_settings):
+        super(LinearTransportMCXAdapter, self).__init__(global_settings)
+        self.number_of_runs = 0
+
+    def run_mcx(self, cmd):
+        self.number_of_runs += 1
+        with open(self.mcx_json_config_file, "r") as json_file:
+            mcx_settings = json.load(json_file)
+        photons = int(mcx_settings["Session"]["Photons"])
+        positions = np.reshape(mcx_settings["Optode"]["Source"]["Pos"], (-1, 3))
+        depth_profile = np.exp(-0.5 * np.arange(self.nz))
+        fluence = np.zeros((self.nx, self.ny, self.nz))
+        for index, position in enumerate(positions):
+            photons_of_source = photons // len(positions) + (index < photons % len(positions))
+            x, y = np.clip(np.floor(position[:2]).astype(int), 0, [self.nx - 1, self.ny - 1])
+            fluence[x, y, :] += photons_of_source * depth_profile
+        jdata.save({"NIFTIData": fluence / photons}, self.mcx_volumetric_data_file)
+
+
+class TestCombinedIlluminationGeometry(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.settings = Settings({Tags.SPACING_MM: 1.0,
+                                  Tags.SIMULATION_PATH: self.temporary_directory.name,
+                                  Tags.VOLUME_NAME: "combined_illumination_test"})
+        self.geometries = [PencilBeamIlluminationGeometry(device_position_mm=np.array([x, 2, 0]))
+                           for x in range(5)]
+        self.volume = np.ones((5, 5, 5))
+
+    def tearDown(self) -> None:
+        self.temporary_directory.cleanup()
+
+    def test_mcx_definition_stacks_all_sources(self):
+        combined = CombinedIlluminationGeometry(self.geometries)
+        definition = combined.get_mcx_illuminator_definition(self.settings)
+        self.assertEqual(definition["Type"], Tags.ILLUMINATION_TYPE_PENCILARRAY)
+        for key in ["Pos", "Dir", "Param1", "Param2"]:
+            self.assertEqual(len(definition[key]), len(self.geometries))
+        for index, geometry in enumerate(self.geometries):
+            source = geometry.get_mcx_illuminator_definition(self.settings)
+            for key in ["Pos", "Dir", "Param1", "Param2"]:
+                np.testing.assert_allclose(definition[key][index], source[key])
+
+    def test_nested_multi_source_geometries_are_supported(self):
+        combined = CombinedIlluminationGeometry([MSOTInVisionIlluminationGeometry(),
+                                                 MSOTInVisionIlluminationGeometry()])
+        definition = combined.get_mcx_illuminator_definition(self.settings)
+        self.assertEqual(len(definition["Pos"]), 20)
+        self.assertEqual(len(definition["Param2"]), 20)
+
+    def test_mixed_source_types_are_rejected(self):
+        combined = CombinedIlluminationGeometry([self.geometries[0], DiskIlluminationGeometry(beam_radius_mm=1)])
+        with self.assertRaises(ValueError):
+            combined.get_mcx_illuminator_definition(self.settings)
+
+    def test_combined_run_is_equivalent_to_average_of_separate_runs(self):
+        self.settings.set_optical_settings({Tags.OPTICAL_MODEL_NUMBER_PHOTONS: 1000,
+                                            Tags.OPTICAL_MODEL_BINARY_PATH: "."})
+        adapter = LinearTransportMCXAdapter(self.settings)
+        separate = adapter.run_forward_model(self.geometries, None, self.volume, self.volume, self.volume)
+        self.assertEqual(adapter.number_of_runs, len(self.geometries))
+
+        self.settings.get_optical_settings()[Tags.OPTICAL_MODEL_COMBINE_ILLUMINATION_GEOMETRIES] = True
+        adapter = LinearTransportMCXAdapter(self.settings)
+        combined = adapter.run_forward_model(self.geometries, None, self.volume, self.volume, self.volume)
+        self.assertEqual(adapter.number_of_runs, 1)
+        np.testing.assert_allclose(combined[Tags.DATA_FIELD_FLUENCE], separate[Tags.DATA_FIELD_FLUENCE])
+        self.assertAlmostEqual(np.sum(combined[Tags.DATA_FIELD_FLUENCE]), np.sum(np.exp(-0.5 * np.arange(5))))
+
+    def test_single_geometry_is_not_wrapped(self):
+        self.settings.set_optical_settings({Tags.OPTICAL_MODEL_COMBINE_ILLUMINATION_GEOMETRIES: True})
+        adapter = LinearTransportMCXAdapter(self.settings)
+        self.assertIs(adapter.combine_illumination_geometries(self.geometries[0]), self.geometries[0])
+
+    def test_serialization_round_trip(self):
+        combined = CombinedIlluminationGeometry(self.geometries)
+        serialized = combined.serialize()
+        deserialized = CombinedIlluminationGeometry.deserialize(serialized["CombinedIlluminationGeometry"])
+        self.assertEqual(len(deserialized.illumination_geometries), len(self.geometries))
@@ -0,0 +1,80 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from simpa import KSpacePseudospectralAdapter, Settings, Tags, load_data_field
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry
+from simpa.core.simulation_modules.acoustic_module import acoustic_adapter_base
+from simpa.io_handling.io_hdf5 import save_data_field
+
+ACOUSTIC_PROPERTIES = [Tags.DATA_FIELD_SPEED_OF_SOUND, Tags.DATA_FIELD_DENSITY, Tags.DATA_FIELD_ALPHA_COEFF]
+
+
+class TestAcousticSliceLoading(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temporary_directory.name, "slice_loading_test.hdf5")
+        self.volumes = {data_field: np.random.random((8, 10, 12)) for data_field in ACOUSTIC_PROPERTIES}
+        for data_field, volume in self.volumes.items():
+            save_data_field(volume, self.file_path, data_field)
+        self.settings = Settings({Tags.SPACING_MM: 0.5,
+                                  Tags.SIMPA_OUTPUT_FILE_PATH: self.file_path,
+                                  Tags.WAVELENGTHS: [700, 800],
+                                  Tags.WAVELENGTH: 700})
+        self.settings.set_acoustic_settings({})
+        self.device = LinearArrayDetectionGeometry(pitch_mm=0.5, number_detector_elements=6,
+                                                   detector_element_width_mm=0.25,
+                                                   device_position_mm=np.array([2.0, 2.0, 0]))
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_slice_is_read_from_file(self):
+        for data_slice in [np.s_[:, 3, :], np.s_[5, :, :], np.s_[:]]:
+            np.testing.assert_array_equal(load_data_field(self.file_path, Tags.DATA_FIELD_DENSITY,
+                                                          data_slice=data_slice),
+                                          self.volumes[Tags.DATA_FIELD_DENSITY][data_slice])
+
+    def test_acoustic_properties_are_loaded_once_per_simulation(self):
+        adapter = KSpacePseudospectralAdapter(self.settings)
+        image_slice = adapter.get_image_slice(self.device)
+        self.assertEqual(image_slice, np.s_[:, 3, :])
+        speeds_of_sound = []
+
+        def forward_model(detection_geometry):
+            acoustic_properties = adapter.load_acoustic_properties(adapter.get_image_slice(detection_geometry))
+            speeds_of_sound.append(acoustic_properties[Tags.DATA_FIELD_SPEED_OF_SOUND])
+            for data_field in ACOUSTIC_PROPERTIES[1:]:
+                np.testing.assert_array_equal(acoustic_properties[data_field], self.volumes[data_field][image_slice])
+            return np.zeros((6, 10))
+
+        with patch.object(acoustic_adapter_base, "load_data_field", wraps=load_data_field) as load, \
+                patch.object(adapter, "forward_model", side_effect=forward_model), \
+                patch.object(adapter, "forward_model_multiple_wavelengths",
+                             side_effect=lambda detection_geometry, wavelengths:
+                             [forward_model(detection_geometry)] * len(wavelengths)), \
+                patch.object(adapter, "get_detection_geometry", return_value=self.device), \
+                patch.object(adapter, "save_time_series_data"):
+            for wavelength in self.settings[Tags.WAVELENGTHS]:
+                self.settings[Tags.WAVELENGTH] = wavelength
+                adapter.run(None)
+            self.assertEqual(load.call_count, 3)
+
+            # every batched simulation reads the properties again, although the wavelength is left at the last one
+            for simulation in range(2):
+                speed_of_sound = np.random.random((8, 10, 12))
+                save_data_field(speed_of_sound, self.file_path, Tags.DATA_FIELD_SPEED_OF_SOUND)
+                adapter.run_multiple_wavelengths(None, self.settings[Tags.WAVELENGTHS])
+                self.assertEqual(load.call_count, 6 + 3 * simulation)
+                np.testing.assert_array_equal(speeds_of_sound[-1], speed_of_sound[image_slice])
+
+            # a new simulation starts with the first wavelength and reads the properties again
+            self.settings[Tags.WAVELENGTH] = 700
+            adapter.run(None)
+            self.assertEqual(load.call_count, 12)
@@ -0,0 +1,113 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from simpa import AcousticSystemMatrixAdapter, Settings, Tags
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry
+from simpa.core.simulation_modules.acoustic_module import system_matrix_adapter
+from simpa.core.simulation_modules.acoustic_module.k_space_pseudospectral_adapter import \
+    apply_gaussian_frequency_response
+from simpa.core.simulation_modules.acoustic_module.system_matrix_adapter import (
+    VOXEL_KERNEL_WIDTH, compute_acoustic_system_matrix, compute_gaussian_impulse_response_matrix)
+
+
+class TestAcousticSystemMatrixAdapter(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.settings = Settings({Tags.SPACING_MM: 0.1,
+                                  Tags.WAVELENGTH: 800})
+        self.settings.set_acoustic_settings({Tags.ACOUSTIC_SYSTEM_MATRIX_CACHE_PATH: self.temporary_directory.name})
+        self.device = LinearArrayDetectionGeometry(pitch_mm=0.2, number_detector_elements=8,
+                                                   detector_element_width_mm=0.1,
+                                                   device_position_mm=np.array([1.0, 0.5, 0]))
+        self.initial_pressure = np.random.random((21, 10, 24))
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_spherical_wave_matches_analytic_solution(self):
+        spacing, speed_of_sound, sigma, distance = 0.05, 1500.0, 0.15, 1.5
+        grid = (np.arange(24) - 12 + 0.5) * spacing
+        x, y, z = np.meshgrid(grid, grid, grid, indexing="ij")
+        voxel_positions = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+        initial_pressure = np.exp(-np.sum(voxel_positions ** 2, axis=1) / (2 * sigma ** 2))
+        dt = 1e-8
+        system_matrix = compute_acoustic_system_matrix(voxel_positions, np.array([[[0, 0, distance]]]),
+                                                       spacing, speed_of_sound, dt, 150)
+        time_series_data = system_matrix @ initial_pressure
+
+        # exact solution of a spherically symmetric initial value problem, the source is blurred by the voxel kernel
+        travelled_distance = np.arange(150) * dt * speed_of_sound * 1000
+        blurred_sigma = np.sqrt(sigma ** 2 + (VOXEL_KERNEL_WIDTH * spacing) ** 2)
+        profile = lambda r: (sigma / blurred_sigma) ** 3 * np.exp(-r ** 2 / (2 * blurred_sigma ** 2))
+        expected = ((distance - travelled_distance) * profile(distance - travelled_distance) +
+                    (distance + travelled_distance) * profile(distance + travelled_distance)) / (2 * distance)
+        self.assertLess(np.max(np.abs(time_series_data - expected)), 0.01 * np.max(np.abs(expected)))
+
+    def test_impulse_response_matrix_matches_frequency_response(self):
+        time_series_data = np.random.random((3, 200))
+        impulse_response = compute_gaussian_impulse_response_matrix(200, 40e6, 4e6, 80)
+        self.assertLess(impulse_response.nnz, 200 * 200 / 2)
+        np.testing.assert_allclose((impulse_response @ time_series_data.T).T,
+                                   apply_gaussian_frequency_response(time_series_data, 40e6, 4e6, 80), atol=1e-5)
+
+    def test_forward_model_is_linear_in_initial_pressure(self):
+        adapter = AcousticSystemMatrixAdapter(self.settings)
+        image_slice = adapter.get_image_slice(self.device)
+        time_series_data, settings = adapter.system_matrix_acoustic_forward_model(self.device, 1500,
+                                                                                  self.initial_pressure, image_slice)
+        self.assertEqual(time_series_data.shape, (8, settings[Tags.K_WAVE_SPECIFIC_NT]))
+        doubled, _ = adapter.system_matrix_acoustic_forward_model(self.device, 1500, 2 * self.initial_pressure,
+                                                                  image_slice)
+        np.testing.assert_allclose(doubled, 2 * time_series_data)
+        # only the imaging plane contributes to the signals
+        outside_plane = self.initial_pressure.copy()
+        outside_plane[image_slice] = 0
+        silent, _ = adapter.system_matrix_acoustic_forward_model(self.device, 1500, outside_plane, image_slice)
+        self.assertTrue(np.all(silent == 0))
+
+    def test_system_matrix_is_cached_on_disk(self):
+        with patch.object(system_matrix_adapter, "compute_acoustic_system_matrix",
+                          wraps=compute_acoustic_system_matrix) as compute:
+            adapter = AcousticSystemMatrixAdapter(self.settings)
+            first, _ = adapter.system_matrix_acoustic_forward_model(self.device, 1500, self.initial_pressure)
+            adapter.system_matrix_acoustic_forward_model(self.device, 1500, self.initial_pressure)
+            self.assertEqual(compute.call_count, 1)
+            self.assertEqual(len(os.listdir(self.temporary_directory.name)), 1)
+
+            second, _ = AcousticSystemMatrixAdapter(self.settings).system_matrix_acoustic_forward_model(
+                self.device, 1500, self.initial_pressure)
+            self.assertEqual(compute.call_count, 1)
+            np.testing.assert_array_equal(first, second)
+
+            AcousticSystemMatrixAdapter(self.settings).system_matrix_acoustic_forward_model(
+                self.device, 1540, self.initial_pressure)
+            self.assertEqual(compute.call_count, 2)
+
+    def test_disk_cache_is_reused_by_another_process(self):
+        # the device and its logger are created anew in a separate python process
+        subprocess.run([sys.executable, "-c", f"""
+import numpy as np
+from simpa import AcousticSystemMatrixAdapter, Settings, Tags
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry
+settings = Settings({{Tags.SPACING_MM: 0.1, Tags.WAVELENGTH: 800}})
+settings.set_acoustic_settings({{Tags.ACOUSTIC_SYSTEM_MATRIX_CACHE_PATH: {self.temporary_directory.name!r}}})
+device = LinearArrayDetectionGeometry(pitch_mm=0.2, number_detector_elements=8, detector_element_width_mm=0.1,
+                                      device_position_mm=np.array([1.0, 0.5, 0]))
+AcousticSystemMatrixAdapter(settings).system_matrix_acoustic_forward_model(device, 1500, np.ones((21, 10, 24)))
+"""], check=True)
+        self.assertEqual(len(os.listdir(self.temporary_directory.name)), 1)
+
+        with patch.object(system_matrix_adapter, "compute_acoustic_system_matrix") as compute:
+            AcousticSystemMatrixAdapter(self.settings).system_matrix_acoustic_forward_model(
+                self.device, 1500, self.initial_pressure)
+            compute.assert_not_called()
+        self.assertEqual(len(os.listdir(self.temporary_directory.name)), 1)
@@ -0,0 +1,135 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import tempfile
+import unittest
+import numpy as np
+from simpa import AnalyticDiffusionAdapter, Settings, Tags, TISSUE_LIBRARY
+from simpa.core.device_digital_twins import (DiskIlluminationGeometry, PencilBeamIlluminationGeometry,
+                                             CombinedIlluminationGeometry)
+from simpa.core.simulation_modules.optical_module.optical_utils import (compute_layered_diffusion_fluence,
+                                                                       rasterize_mcx_source)
+
+
+class FallbackTestAdapter(AnalyticDiffusionAdapter):
+    """
+    AnalyticDiffusionAdapter that records the fallback to MCX instead of calling mcx.
+    """
+
+    def run_mcx(self, cmd):
+        self.mcx_was_called = True
+
+    def read_mcx_output(self, **kwargs):
+        return {Tags.DATA_FIELD_FLUENCE: np.ones((self.nx, self.ny, self.nz))}
+
+
+class TestAnalyticDiffusionAdapter(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.settings = Settings({Tags.SPACING_MM: 0.5,
+                                  Tags.SIMULATION_PATH: self.temporary_directory.name,
+                                  Tags.VOLUME_NAME: "analytic_diffusion_test"})
+        background = Settings()
+        background[Tags.MOLECULE_COMPOSITION] = TISSUE_LIBRARY.muscle()
+        background[Tags.STRUCTURE_TYPE] = Tags.BACKGROUND
+        layer = Settings()
+        layer[Tags.STRUCTURE_TYPE] = Tags.HORIZONTAL_LAYER_STRUCTURE
+        self.structures = {Tags.BACKGROUND: background, "layer": layer}
+        self.settings.set_volume_creation_settings({Tags.STRUCTURES: self.structures})
+        self.settings.set_optical_settings({Tags.OPTICAL_MODEL_NUMBER_PHOTONS: 1e5,
+                                            Tags.OPTICAL_MODEL_BINARY_PATH: "."})
+        self.shape = (40, 30, 20)
+        self.absorption = np.ones(self.shape) * 0.1
+        self.scattering = np.ones(self.shape) * 100
+        self.anisotropy = np.ones(self.shape) * 0.9
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_planar_illumination_matches_semi_infinite_solution(self):
+        spacing = 0.5
+        mua, musp = 0.01, 1.0
+        depth = (np.arange(60) + 0.5) * spacing
+        lateral_profile = np.zeros((120, 120))
+        lateral_profile[60, 60] = 1 / spacing ** 2
+        fluence = compute_layered_diffusion_fluence(np.ones(60) * mua, np.ones(60) * musp, lateral_profile, spacing)
+        # the laterally integrated fluence of a pencil beam equals the fluence of a planar illumination
+        integrated_fluence = np.sum(fluence, axis=(0, 1)) * spacing ** 2
+
+        diffusion = 1 / (3 * (mua + musp))
+        mu_t = mua + musp
+        mu_eff = np.sqrt(mua / diffusion)
+        a = 1.0
+        c = musp / (diffusion * (mu_eff ** 2 - mu_t ** 2))
+        b = -c * (1 + 2 * a * diffusion * mu_t) / (1 + 2 * a * diffusion * mu_eff)
+        expected = c * np.exp(-mu_t * depth) + b * np.exp(-mu_eff * depth) + np.exp(-mu_t * depth)
+        shallow = depth < 10
+        np.testing.assert_allclose(integrated_fluence[shallow], expected[shallow], rtol=0.035)
+
+    def test_rasterized_sources_are_normalized(self):
+        disk = DiskIlluminationGeometry(beam_radius_mm=2, device_position_mm=np.array([10, 7.5, 0]))
+        profile = rasterize_mcx_source(disk.get_mcx_illuminator_definition(self.settings), self.shape[:2])
+        self.assertAlmostEqual(np.sum(profile), 1)
+        self.assertEqual(np.count_nonzero(profile), np.count_nonzero(profile == np.max(profile)))
+        pencils = CombinedIlluminationGeometry([PencilBeamIlluminationGeometry(device_position_mm=np.array([x, 5, 0]))
+                                                for x in [5, 10]])
+        profile = rasterize_mcx_source(pencils.get_mcx_illuminator_definition(self.settings), self.shape[:2])
+        self.assertEqual(profile[10, 10], 0.5)
+        self.assertEqual(profile[20, 10], 0.5)
+
+    def test_unsupported_source_type_raises(self):
+        with self.assertRaises(ValueError):
+            rasterize_mcx_source({"Type": Tags.ILLUMINATION_TYPE_PATTERN, "Pos": [0, 0, 0]}, self.shape[:2])
+
+    def test_layered_composition_is_detected(self):
+        adapter = AnalyticDiffusionAdapter(self.settings)
+        self.assertTrue(adapter.use_analytic_model())
+        vessel = Settings()
+        vessel[Tags.STRUCTURE_TYPE] = Tags.CIRCULAR_TUBULAR_STRUCTURE
+        self.structures["vessel"] = vessel
+        self.settings.set_volume_creation_settings({Tags.STRUCTURES: self.structures})
+        self.assertFalse(AnalyticDiffusionAdapter(self.settings).use_analytic_model())
+        self.settings.get_optical_settings()[Tags.OPTICAL_MODEL_FORCE_ANALYTIC_FLUENCE] = True
+        self.assertTrue(AnalyticDiffusionAdapter(self.settings).use_analytic_model())
+
+    def test_analytic_forward_model(self):
+        adapter = FallbackTestAdapter(self.settings)
+        geometry = DiskIlluminationGeometry(beam_radius_mm=3, device_position_mm=np.array([10, 7.5, 0]))
+        fluence = adapter.forward_model(self.absorption, self.scattering, self.anisotropy,
+                                        geometry)[Tags.DATA_FIELD_FLUENCE]
+        self.assertFalse(hasattr(adapter, "mcx_was_called"))
+        self.assertEqual(fluence.shape, self.shape)
+        self.assertTrue(np.all(fluence >= 0))
+        depth_profile = fluence[20, 15, :]
+        self.assertTrue(np.all(np.diff(depth_profile[2:]) < 0))
+        self.assertGreater(fluence[20, 15, 5], fluence[2, 15, 5])
+
+    def test_structures_are_laterally_averaged(self):
+        adapter = FallbackTestAdapter(self.settings)
+        geometry = DiskIlluminationGeometry(beam_radius_mm=3, device_position_mm=np.array([10, 7.5, 0]))
+        # an inclusion that covers less than half of the lateral area would be ignored by the median
+        absorption = self.absorption.copy()
+        absorption[:10, :, 5:10] = 10
+        averaged_absorption = np.ones(self.shape) * np.mean(absorption, axis=(0, 1))
+        fluence = adapter.forward_model(absorption, self.scattering, self.anisotropy,
+                                        geometry)[Tags.DATA_FIELD_FLUENCE]
+        expected = adapter.forward_model(averaged_absorption, self.scattering, self.anisotropy,
+                                         geometry)[Tags.DATA_FIELD_FLUENCE]
+        np.testing.assert_allclose(fluence, expected)
+        self.assertFalse(np.allclose(fluence, adapter.forward_model(self.absorption, self.scattering,
+                                                                    self.anisotropy,
+                                                                    geometry)[Tags.DATA_FIELD_FLUENCE]))
+
+    def test_fallback_to_mcx(self):
+        vessel = Settings()
+        vessel[Tags.STRUCTURE_TYPE] = Tags.CIRCULAR_TUBULAR_STRUCTURE
+        self.structures["vessel"] = vessel
+        self.settings.set_volume_creation_settings({Tags.STRUCTURES: self.structures})
+        adapter = FallbackTestAdapter(self.settings)
+        geometry = PencilBeamIlluminationGeometry(device_position_mm=np.array([10, 7.5, 0]))
+        fluence = adapter.forward_model(self.absorption, self.scattering, self.anisotropy,
+                                        geometry)[Tags.DATA_FIELD_FLUENCE]
+        self.assertTrue(adapter.mcx_was_called)
+        self.assertTrue(np.all(fluence == 1))
@@ -0,0 +1,71 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import os
+import tempfile
+import unittest
+import numpy as np
+from simpa import AcousticSystemMatrixAdapter, AnalyticPointSourceAdapter, Settings, Tags
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry
+from simpa.core.simulation_modules.acoustic_module.k_space_pseudospectral_adapter import \
+    apply_gaussian_frequency_response
+from simpa.io_handling.io_hdf5 import save_data_field
+
+
+class TestAnalyticPointSourceAdapter(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.settings = Settings({Tags.SPACING_MM: 0.1,
+                                  Tags.GPU: False,
+                                  Tags.WAVELENGTH: 800,
+                                  Tags.WAVELENGTHS: [800],
+                                  Tags.DIM_VOLUME_X_MM: 2.1,
+                                  Tags.DIM_VOLUME_Y_MM: 1.0,
+                                  Tags.DIM_VOLUME_Z_MM: 2.4,
+                                  Tags.SIMPA_OUTPUT_FILE_PATH: os.path.join(self.temporary_directory.name,
+                                                                            "point_source_test.hdf5")})
+        self.settings.set_acoustic_settings({Tags.ACOUSTIC_MODEL_VOXELS_PER_CHUNK: 50})
+        self.device = LinearArrayDetectionGeometry(pitch_mm=0.2, number_detector_elements=8,
+                                                   detector_element_width_mm=0.1,
+                                                   device_position_mm=np.array([1.0, 0.5, 0]))
+        self.initial_pressure = np.random.random((21, 10, 24))
+        self.initial_pressure[self.initial_pressure < 0.5] = 0
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_matches_system_matrix(self):
+        adapter = AnalyticPointSourceAdapter(self.settings)
+        image_slice = adapter.get_image_slice(self.device)
+        time_series_data, settings = adapter.point_source_acoustic_forward_model(
+            self.device, 1500, self.initial_pressure[image_slice], image_slice)
+        expected, expected_settings = AcousticSystemMatrixAdapter(self.settings).system_matrix_acoustic_forward_model(
+            self.device, 1500, self.initial_pressure, image_slice)
+        self.assertEqual(time_series_data.shape, (8, expected_settings[Tags.K_WAVE_SPECIFIC_NT]))
+        np.testing.assert_allclose(time_series_data, expected, atol=1e-10 * np.max(np.abs(expected)))
+
+    def test_frequency_response_is_applied(self):
+        adapter = AnalyticPointSourceAdapter(self.settings)
+        image_slice = adapter.get_image_slice(self.device)
+        unfiltered, settings = adapter.point_source_acoustic_forward_model(
+            self.device, 1500, self.initial_pressure[image_slice], image_slice)
+        self.settings.get_acoustic_settings()[Tags.MODEL_SENSOR_FREQUENCY_RESPONSE] = True
+        filtered, _ = adapter.point_source_acoustic_forward_model(
+            self.device, 1500, self.initial_pressure[image_slice], image_slice)
+        np.testing.assert_allclose(filtered, apply_gaussian_frequency_response(
+            unfiltered, 1 / settings[Tags.K_WAVE_SPECIFIC_DT], self.device.center_frequency_Hz,
+            self.device.bandwidth_percent), atol=1e-12)
+
+    def test_forward_model_reads_imaging_plane(self):
+        save_data_field(self.initial_pressure, self.settings[Tags.SIMPA_OUTPUT_FILE_PATH],
+                        Tags.DATA_FIELD_INITIAL_PRESSURE, 800)
+        save_data_field(np.ones_like(self.initial_pressure) * 1500, self.settings[Tags.SIMPA_OUTPUT_FILE_PATH],
+                        Tags.DATA_FIELD_SPEED_OF_SOUND)
+        adapter = AnalyticPointSourceAdapter(self.settings)
+        time_series_data = adapter.forward_model(self.device)
+        image_slice = adapter.get_image_slice(self.device)
+        expected, _ = adapter.point_source_acoustic_forward_model(self.device, 1500,
+                                                                  self.initial_pressure[image_slice], image_slice)
+        np.testing.assert_array_equal(time_series_data, expected)
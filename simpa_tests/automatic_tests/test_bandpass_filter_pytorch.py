@@ -0,0 +1,80 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import unittest
+from unittest.mock import patch
+import numpy as np
+import torch
+from scipy.signal import hilbert
+from simpa import DelayAndSumAdapter
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry
+from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings, reconstruction_utils
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_test_adapter import ReconstructionTestAdapter
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import apply_b_mode, \
+    bandpass_filtering_pytorch, butter_bandpass_filtering, get_bandpass_frequency_response, \
+    hilbert_envelope_pytorch, tukey_bandpass_filtering
+from simpa.utils import Tags
+
+
+class TestBandpassFilterPytorch(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(4711)
+        # two frames of 8 sensor elements sampled at 40 MHz
+        self.time_spacing_in_ms = 2.5e-5
+        self.data = np.random.random((2, 8, 2000)) - 0.5
+
+    def test_tukey_filter_matches_numpy(self):
+        filtered = bandpass_filtering_pytorch(torch.from_numpy(self.data), self.time_spacing_in_ms, int(8e6),
+                                              int(1e6), Tags.TUKEY_BANDPASS_FILTER, tukey_alpha=0.5)
+        expected = tukey_bandpass_filtering(self.data, self.time_spacing_in_ms, int(8e6), int(1e6), 0.5)
+        np.testing.assert_allclose(filtered.numpy(), expected, atol=1e-12)
+
+    def test_butterworth_filter_matches_scipy(self):
+        filtered = bandpass_filtering_pytorch(torch.from_numpy(self.data), self.time_spacing_in_ms, int(8e6),
+                                              int(1e6), Tags.BUTTERWORTH_BANDPASS_FILTER, order=2)
+        expected = butter_bandpass_filtering(self.data, self.time_spacing_in_ms, int(8e6), int(1e6), 2)
+        np.testing.assert_allclose(filtered.numpy(), expected, atol=1e-6)
+
+    def test_filter_plan_is_cached(self):
+        get_bandpass_frequency_response.cache_clear()
+        data = torch.from_numpy(self.data).float()
+        for _ in range(3):
+            filtered = bandpass_filtering_pytorch(data, self.time_spacing_in_ms,
+                                                  filter_method=Tags.BUTTERWORTH_BANDPASS_FILTER)
+        self.assertEqual(get_bandpass_frequency_response.cache_info().misses, 1)
+        self.assertEqual(get_bandpass_frequency_response.cache_info().hits, 2)
+        self.assertEqual(filtered.dtype, torch.float32)
+
+    def test_hilbert_envelope_matches_scipy(self):
+        for n_time_steps in [2000, 1999]:
+            data = self.data[..., :n_time_steps]
+            envelope = hilbert_envelope_pytorch(torch.from_numpy(data), dim=-1)
+            np.testing.assert_allclose(envelope.numpy(), np.abs(hilbert(data, axis=-1)), atol=1e-12)
+        np.testing.assert_allclose(apply_b_mode(self.data[0], Tags.RECONSTRUCTION_BMODE_METHOD_HILBERT_TRANSFORM),
+                                   np.abs(hilbert(self.data[0], axis=1)), atol=1e-12)
+        self.assertIsInstance(apply_b_mode(torch.from_numpy(self.data[0]),
+                                           Tags.RECONSTRUCTION_BMODE_METHOD_HILBERT_TRANSFORM), torch.Tensor)
+
+    def test_reconstruction_filters_with_torch(self):
+        device = LinearArrayDetectionGeometry(pitch_mm=0.25, number_detector_elements=8,
+                                              field_of_view_extent_mm=np.array([-1, 1, 0, 0, 0, 2]))
+        settings = create_reconstruction_settings(speed_of_sound_in_m_per_s=1540, sensor_spacing_in_mm=0.2)
+        settings[Tags.GPU] = False
+        reconstruction_settings = settings.get_reconstruction_settings()
+        reconstruction_settings[Tags.RECONSTRUCTION_PERFORM_BANDPASS_FILTERING] = True
+        reconstruction_settings[Tags.BANDPASS_FILTER_METHOD] = Tags.BUTTERWORTH_BANDPASS_FILTER
+        reconstruction_settings[Tags.RECONSTRUCTION_BMODE_BEFORE_RECONSTRUCTION] = True
+        reconstruction_settings[Tags.RECONSTRUCTION_BMODE_METHOD] = Tags.RECONSTRUCTION_BMODE_METHOD_HILBERT_TRANSFORM
+        data = self.data[0].astype(np.float32)
+
+        for adapter, expected_type in [(DelayAndSumAdapter(settings), torch.Tensor),
+                                       (ReconstructionTestAdapter(settings), np.ndarray)]:
+            with patch.object(reconstruction_utils, "bandpass_filtering_pytorch",
+                              wraps=bandpass_filtering_pytorch) as filtering, \
+                    patch.object(adapter, "reconstruction_algorithm",
+                                 wraps=adapter.reconstruction_algorithm) as reconstruction_algorithm:
+                adapter.reconstruct_with_settings(data, device)
+            self.assertEqual(filtering.call_count, 1)
+            self.assertIsInstance(reconstruction_algorithm.call_args[0][0], expected_type)
@@ -0,0 +1,108 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import tempfile
+import unittest
+import numpy as np
+from simpa import KSpacePseudospectralAdapter, ModelBasedAdapter, Settings, Tags, load_data_field, simulate
+from simpa.core.device_digital_twins import (LinearArrayDetectionGeometry, PencilBeamIlluminationGeometry,
+                                             PhotoacousticDevice)
+from simpa.core.simulation_modules.acoustic_module import AcousticAdapterBase
+from simpa.core.simulation_modules.acoustic_module.k_space_pseudospectral_adapter import (
+    compute_detector_sensor_matrix, simulate_k_space_first_order)
+from simpa.core.simulation_modules.optical_module.optical_test_adapter import OpticalTestAdapter
+from simpa_tests.test_utils import create_test_structure_parameters
+
+
+class RecordingAcousticAdapter(AcousticAdapterBase):
+    """
+    Acoustic adapter that records the order in which it is called.
+    """
+
+    def __init__(self, global_settings, calls):
+        super(RecordingAcousticAdapter, self).__init__(global_settings)
+        self.calls = calls
+
+    def forward_model(self, detection_geometry) -> np.ndarray:
+        self.calls.append(("acoustic", self.global_settings[Tags.WAVELENGTH]))
+        return np.ones((2, 10)) * self.global_settings[Tags.WAVELENGTH]
+
+
+class RecordingOpticalAdapter(OpticalTestAdapter):
+    """
+    Optical test adapter that records the order in which it is called.
+    """
+
+    def __init__(self, global_settings, calls):
+        super(RecordingOpticalAdapter, self).__init__(global_settings)
+        self.calls = calls
+
+    def run(self, digital_device_twin):
+        self.calls.append(("optical", self.global_settings[Tags.WAVELENGTH]))
+        super(RecordingOpticalAdapter, self).run(digital_device_twin)
+
+
+class TestBatchedAcousticForwardModel(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.settings = Settings({Tags.RANDOM_SEED: 4711,
+                                  Tags.VOLUME_NAME: "batched_acoustic_test",
+                                  Tags.SIMULATION_PATH: self.temporary_directory.name,
+                                  Tags.SPACING_MM: 0.25,
+                                  Tags.DIM_VOLUME_Z_MM: 3,
+                                  Tags.DIM_VOLUME_X_MM: 4,
+                                  Tags.DIM_VOLUME_Y_MM: 4,
+                                  Tags.WAVELENGTHS: [700, 800]})
+        self.settings.set_volume_creation_settings({Tags.STRUCTURES: create_test_structure_parameters()})
+        self.settings.set_optical_settings({Tags.OPTICAL_MODEL_NUMBER_PHOTONS: 1e7})
+        self.settings.set_acoustic_settings({Tags.ACOUSTIC_MODEL_BATCH_WAVELENGTHS: True,
+                                             Tags.KWAVE_PROPERTY_ALPHA_POWER: 1.05,
+                                             Tags.KWAVE_PROPERTY_PMLSize: [10, 10]})
+        self.device = PhotoacousticDevice(device_position_mm=np.array([2, 2, 0]))
+        self.device.set_detection_geometry(LinearArrayDetectionGeometry(pitch_mm=0.5, number_detector_elements=6,
+                                                                        detector_element_width_mm=0.25))
+        self.device.add_illumination_geometry(PencilBeamIlluminationGeometry())
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_stacked_initial_pressures_match_individual_runs(self):
+        shape = (16, 12)
+        initial_pressures = np.random.random((3,) + shape)
+        sensor_matrix = compute_detector_sensor_matrix(np.array([[8.0, 10], [12, 10]]), np.array([[0, 1.0], [0, 1.0]]),
+                                                       1, (36, 32))
+        arguments = [np.ones(shape) * 1500, np.ones(shape) * 1000, np.ones(shape) * 0.5, 1.05, 1e-4, 2e-8, 50,
+                     sensor_matrix, [10, 10]]
+        batched = simulate_k_space_first_order(initial_pressures, *arguments)
+        self.assertEqual(batched.shape, (3, 2, 50))
+        for initial_pressure, sensor_data in zip(initial_pressures, batched):
+            np.testing.assert_allclose(sensor_data, simulate_k_space_first_order(initial_pressure, *arguments),
+                                       atol=1e-5 * np.max(np.abs(sensor_data)))
+
+    def test_batched_pipeline_matches_sequential_pipeline(self):
+        adapter = KSpacePseudospectralAdapter(self.settings)
+        simulate([ModelBasedAdapter(self.settings), OpticalTestAdapter(self.settings), adapter],
+                 self.settings, self.device)
+        file_path = self.settings[Tags.SIMPA_OUTPUT_FILE_PATH]
+        for wavelength in self.settings[Tags.WAVELENGTHS]:
+            self.settings[Tags.WAVELENGTH] = wavelength
+            batched = load_data_field(file_path, Tags.DATA_FIELD_TIME_SERIES_DATA, wavelength)
+            sequential = adapter.forward_model(self.device.get_detection_geometry())
+            np.testing.assert_allclose(batched, sequential, atol=1e-5 * np.max(np.abs(sequential)))
+
+    def test_pipeline_runs_batched_adapter_once_after_all_wavelengths(self):
+        calls = []
+        simulate([ModelBasedAdapter(self.settings), RecordingOpticalAdapter(self.settings, calls),
+                  RecordingAcousticAdapter(self.settings, calls)], self.settings, self.device)
+        self.assertEqual(calls, [("optical", 700), ("optical", 800), ("acoustic", 700), ("acoustic", 800)])
+        time_series_data = load_data_field(self.settings[Tags.SIMPA_OUTPUT_FILE_PATH],
+                                           Tags.DATA_FIELD_TIME_SERIES_DATA, 700)
+        self.assertTrue(np.all(time_series_data == 700))
+
+        calls.clear()
+        self.settings.get_acoustic_settings()[Tags.ACOUSTIC_MODEL_BATCH_WAVELENGTHS] = False
+        simulate([ModelBasedAdapter(self.settings), RecordingOpticalAdapter(self.settings, calls),
+                  RecordingAcousticAdapter(self.settings, calls)], self.settings, self.device)
+        self.assertEqual(calls, [("optical", 700), ("acoustic", 700), ("optical", 800), ("acoustic", 800)])
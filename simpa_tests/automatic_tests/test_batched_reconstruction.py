@@ -0,0 +1,64 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import unittest
+from unittest.mock import patch
+import numpy as np
+from simpa import (DelayAndSumAdapter, DelayMultiplyAndSumAdapter, SignedDelayMultiplyAndSumAdapter, Tags,
+                   reconstruct_delay_and_sum_frames_pytorch)
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry, PlanarArrayDetectionGeometry
+from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings
+from simpa.core.simulation_modules.reconstruction_module import reconstruction_utils
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_test_adapter import ReconstructionTestAdapter
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import compute_beamforming_plan
+
+
+class TestBatchedReconstruction(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(4711)
+        self.time_series_data = np.random.random((3, 16, 400)).astype(np.float32) - 0.5
+        self.linear_array = LinearArrayDetectionGeometry(pitch_mm=0.25, number_detector_elements=16,
+                                                         field_of_view_extent_mm=np.array([-2, 2, 0, 0, 0, 4]))
+        self.planar_array = PlanarArrayDetectionGeometry(pitch_mm=0.5, number_detector_elements_x=4,
+                                                         number_detector_elements_y=4,
+                                                         field_of_view_extent_mm=np.array([-1, 1, -1, 1, 0, 2]))
+
+    def create_adapter(self, adapter_class, recon_mode=Tags.RECONSTRUCTION_MODE_PRESSURE):
+        settings = create_reconstruction_settings(speed_of_sound_in_m_per_s=1540, sensor_spacing_in_mm=0.2,
+                                                  recon_mode=recon_mode,
+                                                  apodization=Tags.RECONSTRUCTION_APODIZATION_HANN)
+        settings[Tags.GPU] = False
+        return adapter_class(settings)
+
+    def test_batch_matches_frame_by_frame_reconstruction(self):
+        for adapter_class in [DelayAndSumAdapter, DelayMultiplyAndSumAdapter, SignedDelayMultiplyAndSumAdapter]:
+            for detection_geometry in [self.linear_array, self.planar_array]:
+                for recon_mode in [Tags.RECONSTRUCTION_MODE_PRESSURE, Tags.RECONSTRUCTION_MODE_DIFFERENTIAL]:
+                    adapter = self.create_adapter(adapter_class, recon_mode)
+                    batch = adapter.reconstruct_frames(self.time_series_data.copy(), detection_geometry)
+                    frames = [adapter.reconstruction_algorithm(frame.copy(), detection_geometry)
+                              for frame in self.time_series_data]
+                    self.assertEqual(batch.shape, (3,) + frames[0].shape)
+                    np.testing.assert_allclose(batch, np.stack(frames), rtol=1e-5, atol=1e-6)
+
+    def test_delays_are_computed_once_per_batch(self):
+        with patch.object(reconstruction_utils, "compute_beamforming_plan", wraps=compute_beamforming_plan) as compute:
+            images = reconstruct_delay_and_sum_frames_pytorch(self.time_series_data, self.linear_array,
+                                                              sensor_spacing_in_mm=0.2)
+            self.assertEqual(compute.call_count, 1)
+        self.assertEqual(images.shape, (3, 20, 20))
+
+    def test_single_frame_keeps_frame_dimension(self):
+        adapter = self.create_adapter(DelayAndSumAdapter)
+        batch = adapter.reconstruct_frames(self.time_series_data[:1].copy(), self.linear_array)
+        self.assertEqual(batch.shape, (1, 20, 20))
+
+    def test_adapters_without_batch_support_reconstruct_frame_by_frame(self):
+        adapter = self.create_adapter(ReconstructionTestAdapter)
+        self.assertFalse(adapter.supports_batched_frames)
+        with patch.object(adapter, "reconstruction_algorithm", wraps=adapter.reconstruction_algorithm) as reconstruct:
+            batch = adapter.reconstruct_frames(self.time_series_data, self.linear_array)
+        self.assertEqual(reconstruct.call_count, len(self.time_series_data))
+        np.testing.assert_allclose(batch, self.time_series_data / 10 + 5)
@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from simpa import DelayAndSumAdapter, Tags
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry
+from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings
+from simpa.core.simulation_modules.reconstruction_module import reconstruction_utils
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import (BEAMFORMING_PLAN_CACHE,
+                                                                                      compute_beamforming_plan)
+
+
+class TestBeamformingPlanCache(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(4711)
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.time_series_data = np.random.random((16, 400)).astype(np.float32) - 0.5
+        self.device = LinearArrayDetectionGeometry(pitch_mm=0.25, number_detector_elements=16,
+                                                   field_of_view_extent_mm=np.array([-2, 2, 0, 0, 0, 4]))
+        BEAMFORMING_PLAN_CACHE.clear()
+
+    def tearDown(self):
+        BEAMFORMING_PLAN_CACHE.clear()
+        self.temporary_directory.cleanup()
+
+    def reconstruct(self, speed_of_sound_in_m_per_s=1540, **cache_settings):
+        settings = create_reconstruction_settings(speed_of_sound_in_m_per_s=speed_of_sound_in_m_per_s,
+                                                  sensor_spacing_in_mm=0.2,
+                                                  apodization=Tags.RECONSTRUCTION_APODIZATION_HANN)
+        settings[Tags.GPU] = False
+        settings.get_reconstruction_settings().update(cache_settings)
+        return DelayAndSumAdapter(settings).reconstruction_algorithm(self.time_series_data.copy(), self.device)
+
+    def test_cached_plan_gives_identical_reconstruction(self):
+        uncached = self.reconstruct()
+        with patch.object(reconstruction_utils, "compute_beamforming_plan", wraps=compute_beamforming_plan) as compute:
+            first = self.reconstruct(**{Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB[0]: 100})
+            second = self.reconstruct(**{Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB[0]: 100})
+            self.assertEqual(compute.call_count, 1)
+            self.reconstruct(1500, **{Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB[0]: 100})
+            self.assertEqual(compute.call_count, 2)
+        np.testing.assert_array_equal(first, uncached)
+        np.testing.assert_array_equal(second, uncached)
+
+    def test_least_recently_used_plan_is_evicted(self):
+        self.reconstruct(1500, **{Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB[0]: 100})
+        plan_size_in_mb = BEAMFORMING_PLAN_CACHE.size_in_bytes / 1024 ** 2
+        # room for two and a half plans
+        cache_settings = {Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB[0]: 2.5 * plan_size_in_mb}
+        for speed_of_sound in [1540, 1500, 1580]:
+            self.reconstruct(speed_of_sound, **cache_settings)
+        self.assertEqual(len(BEAMFORMING_PLAN_CACHE.plans), 2)
+        with patch.object(reconstruction_utils, "compute_beamforming_plan", wraps=compute_beamforming_plan) as compute:
+            self.reconstruct(1500, **cache_settings)
+            self.assertEqual(compute.call_count, 0)
+            self.reconstruct(1540, **cache_settings)
+            self.assertEqual(compute.call_count, 1)
+
+    def test_plan_is_persisted_on_disk(self):
+        cache_settings = {Tags.RECONSTRUCTION_PLAN_CACHE_PATH[0]: self.temporary_directory.name}
+        first = self.reconstruct(**cache_settings)
+        self.assertEqual(len(os.listdir(self.temporary_directory.name)), 1)
+        self.assertEqual(len(BEAMFORMING_PLAN_CACHE.plans), 0)
+        with patch.object(reconstruction_utils, "compute_beamforming_plan", wraps=compute_beamforming_plan) as compute:
+            second = self.reconstruct(**cache_settings)
+            self.assertEqual(compute.call_count, 0)
+        np.testing.assert_array_equal(first, second)
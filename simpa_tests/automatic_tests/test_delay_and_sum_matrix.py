@@ -0,0 +1,56 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import unittest
+import numpy as np
+import torch
+from simpa import DelayAndSumAdapter, Tags
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry, PlanarArrayDetectionGeometry
+from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import compute_delay_and_sum_matrix
+
+
+class TestDelayAndSumMatrix(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(4711)
+        self.time_series_data = np.random.random((16, 400)) - 0.5
+        self.linear_array = LinearArrayDetectionGeometry(pitch_mm=0.25, number_detector_elements=16,
+                                                         field_of_view_extent_mm=np.array([-2, 2, 0, 0, 0, 4]))
+        self.planar_array = PlanarArrayDetectionGeometry(pitch_mm=0.5, number_detector_elements_x=4,
+                                                         number_detector_elements_y=4,
+                                                         field_of_view_extent_mm=np.array([-1, 1, -1, 1, 0, 2]))
+
+    def create_adapter(self, recon_mode=Tags.RECONSTRUCTION_MODE_PRESSURE):
+        settings = create_reconstruction_settings(speed_of_sound_in_m_per_s=1540, sensor_spacing_in_mm=0.2,
+                                                  recon_mode=recon_mode,
+                                                  apodization=Tags.RECONSTRUCTION_APODIZATION_HANN)
+        settings[Tags.GPU] = False
+        return DelayAndSumAdapter(settings)
+
+    def test_matrix_reproduces_delay_and_sum(self):
+        for detection_geometry in [self.linear_array, self.planar_array]:
+            for recon_mode in [Tags.RECONSTRUCTION_MODE_PRESSURE, Tags.RECONSTRUCTION_MODE_DIFFERENTIAL]:
+                adapter = self.create_adapter(recon_mode)
+                matrix = compute_delay_and_sum_matrix(detection_geometry, 400, adapter.global_settings,
+                                                      adapter.component_settings, adapter.logger)
+                reconstruction = adapter.reconstruction_algorithm(self.time_series_data.copy(), detection_geometry)
+                self.assertEqual(matrix.shape, (reconstruction.size, 16 * 400))
+                np.testing.assert_allclose((matrix @ self.time_series_data.reshape(-1)).reshape(reconstruction.shape),
+                                           reconstruction, rtol=1e-5, atol=1e-5 * np.max(np.abs(reconstruction)))
+
+    def test_blocks_and_torch_matrix_are_identical(self):
+        adapter = self.create_adapter()
+        matrix = compute_delay_and_sum_matrix(self.linear_array, 400, adapter.global_settings,
+                                              adapter.component_settings, adapter.logger)
+        adapter.component_settings[Tags.RECONSTRUCTION_MEMORY_BUDGET_MB] = 0.01
+        blockwise_matrix = compute_delay_and_sum_matrix(self.linear_array, 400, adapter.global_settings,
+                                                        adapter.component_settings, adapter.logger)
+        self.assertEqual((matrix != blockwise_matrix).nnz, 0)
+
+        torch_matrix = compute_delay_and_sum_matrix(self.linear_array, 400, adapter.global_settings,
+                                                    adapter.component_settings, adapter.logger, torch_sparse=True)
+        self.assertEqual(torch_matrix.layout, torch.sparse_csr)
+        np.testing.assert_allclose((torch_matrix @ torch.from_numpy(self.time_series_data.reshape(-1))).numpy(),
+                                   matrix @ self.time_series_data.reshape(-1))
@@ -0,0 +1,24 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import unittest
+import numpy as np
+import torch
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import compute_delay_multiply_and_sum
+
+
+class TestDelayMultiplyAndSum(unittest.TestCase):
+
+    def test_matches_pairwise_products(self):
+        torch.manual_seed(4711)
+        values = torch.randn((3, 4, 2, 16), dtype=torch.float64)
+        values[0, 0, 0, :5] = 0
+        n_sensor_elements = values.shape[-1]
+        # sum over the upper triangle of the signed square roots of all pairwise products
+        products = values[..., :, None] * values[..., None, :]
+        pairwise = torch.sign(products) * torch.sqrt(torch.abs(products))
+        mask = torch.triu(torch.ones((n_sensor_elements, n_sensor_elements), dtype=torch.bool), diagonal=1)
+        expected = pairwise[..., mask].sum(dim=-1)
+        np.testing.assert_allclose(compute_delay_multiply_and_sum(values).numpy(), expected.numpy(), rtol=1e-10,
+                                   atol=1e-12)
@@ -0,0 +1,63 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import unittest
+import numpy as np
+from simpa import FourierDomainReconstructionAdapter, Tags, reconstruct_fourier_domain_pytorch
+from simpa.core.device_digital_twins import CurvedArrayDetectionGeometry, LinearArrayDetectionGeometry, \
+    PlanarArrayDetectionGeometry
+from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_precision_validation import \
+    simulate_sphere_time_series
+
+
+class TestFourierDomainReconstruction(unittest.TestCase):
+
+    def setUp(self):
+        self.speed_of_sound = 1500
+        self.time_spacing = 2.5e-8
+        self.linear_array = LinearArrayDetectionGeometry(pitch_mm=0.2, number_detector_elements=64,
+                                                         field_of_view_extent_mm=np.array([-6.4, 6.4, 0, 0, 0, 12]))
+        self.planar_array = PlanarArrayDetectionGeometry(pitch_mm=0.25, number_detector_elements_x=24,
+                                                         number_detector_elements_y=16,
+                                                         field_of_view_extent_mm=np.array([-3, 3, -2, 2, 0, 5]))
+
+    def test_linear_array_reconstructs_source_position(self):
+        time_series_data = simulate_sphere_time_series(self.linear_array, np.array([1.5, 0, 6.0]), 0.3,
+                                                       self.speed_of_sound, self.time_spacing, 800)
+        image = reconstruct_fourier_domain_pytorch(time_series_data, self.linear_array, self.speed_of_sound,
+                                                   self.time_spacing, 0.1)
+        self.assertEqual(image.shape, (128, 120))
+        x, depth = np.unravel_index(np.argmax(image), image.shape)
+        # pixel centres are at (x - 63.5) * 0.1 mm and depth * 0.1 mm
+        self.assertAlmostEqual((x - 63.5) * 0.1, 1.5, delta=0.1)
+        self.assertAlmostEqual(depth * 0.1, 6.0, delta=0.3)
+
+    def test_planar_array_reconstructs_source_position(self):
+        time_series_data = simulate_sphere_time_series(self.planar_array, np.array([0.5, -0.5, 3.0]), 0.3,
+                                                       self.speed_of_sound, self.time_spacing, 800)
+        image = reconstruct_fourier_domain_pytorch(time_series_data, self.planar_array, self.speed_of_sound,
+                                                   self.time_spacing, 0.1)
+        self.assertEqual(image.shape, (60, 50, 40))
+        x, depth, y = np.unravel_index(np.argmax(image), image.shape)
+        self.assertAlmostEqual((x - 29.5) * 0.1, 0.5, delta=0.1)
+        self.assertAlmostEqual((y - 20) * 0.1, -0.5, delta=0.15)
+        self.assertAlmostEqual(depth * 0.1, 3.0, delta=0.3)
+
+    def test_batch_matches_single_frames(self):
+        settings = create_reconstruction_settings(self.speed_of_sound, self.time_spacing, 0.1,
+                                                  Tags.RECONSTRUCTION_MODE_DIFFERENTIAL)
+        settings[Tags.GPU] = False
+        adapter = FourierDomainReconstructionAdapter(settings)
+        frames = np.stack([simulate_sphere_time_series(self.linear_array, np.array([x, 0, 5.0]), 0.3,
+                                                       self.speed_of_sound, self.time_spacing, 800)
+                           for x in [-2, 0, 2]])
+        batch = adapter.reconstruct_frames(frames, self.linear_array)
+        for frame, image in zip(frames, batch):
+            np.testing.assert_allclose(image, adapter.reconstruction_algorithm(frame, self.linear_array),
+                                       atol=1e-6 * np.max(np.abs(batch)))
+
+    def test_unsupported_geometry_is_rejected(self):
+        with self.assertRaises(TypeError):
+            reconstruct_fourier_domain_pytorch(np.zeros((128, 100)), CurvedArrayDetectionGeometry())
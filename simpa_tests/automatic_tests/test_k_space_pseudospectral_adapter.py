@@ -0,0 +1,77 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import unittest
+import numpy as np
+from simpa import KSpacePseudospectralAdapter, Settings, Tags
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry
+from simpa.core.simulation_modules.acoustic_module.k_space_pseudospectral_adapter import (
+    apply_gaussian_frequency_response, compute_detector_sensor_matrix, simulate_k_space_first_order)
+
+
+class TestKSpacePseudospectralAdapter(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = Settings({Tags.SPACING_MM: 0.1,
+                                  Tags.WAVELENGTH: 800})
+        self.settings.set_acoustic_settings({Tags.KWAVE_PROPERTY_ALPHA_POWER: 1.05,
+                                             Tags.KWAVE_PROPERTY_INITIAL_PRESSURE_SMOOTHING: False})
+        self.device = LinearArrayDetectionGeometry(pitch_mm=0.2, number_detector_elements=8,
+                                                   detector_element_width_mm=0.1,
+                                                   device_position_mm=np.array([1.0, 0.5, 0]))
+        lateral, depth = np.meshgrid(np.arange(21) - 10, np.arange(24) - 12, indexing="ij")
+        self.initial_pressure = np.exp(-(lateral ** 2 + depth ** 2) / (2 * 1.5 ** 2))
+
+    def test_spherical_wave_matches_analytic_solution(self):
+        size, spacing, speed_of_sound, sigma = 40, 1e-4, 1500.0, 2.0
+        grid = np.arange(size) - size // 2
+        x, y, z = np.meshgrid(grid, grid, grid, indexing="ij")
+        initial_pressure = np.exp(-(x ** 2 + y ** 2 + z ** 2) / (2 * sigma ** 2))
+        pml_size = 10
+        distance = 10
+        sensor_matrix = compute_detector_sensor_matrix(
+            np.array([[size // 2, size // 2, size // 2 + distance]]) + pml_size, np.array([[0, 0, 1.0]]),
+            0.01, (size + 2 * pml_size,) * 3)
+        dt = 0.3 * spacing / speed_of_sound
+        sensor_data = simulate_k_space_first_order(initial_pressure, np.ones_like(initial_pressure) * speed_of_sound,
+                                                   np.ones_like(initial_pressure) * 1000,
+                                                   np.zeros_like(initial_pressure), 0, spacing, dt, 100,
+                                                   sensor_matrix, [pml_size] * 3, 2.0, False)
+
+        # exact solution of a spherically symmetric initial value problem
+        time = np.arange(100) * dt * speed_of_sound / spacing
+        profile = lambda r: np.exp(-r ** 2 / (2 * sigma ** 2))
+        expected = ((distance - time) * profile(distance - time) +
+                    (distance + time) * profile(distance + time)) / (2 * distance)
+        self.assertLess(np.max(np.abs(sensor_data[0] - expected)), 1e-3 * np.max(np.abs(expected)))
+
+    def test_2d_time_series_layout(self):
+        adapter = KSpacePseudospectralAdapter(self.settings)
+        time_series_data, settings = adapter.k_space_acoustic_forward_model(self.device, 1500, 1000, 0,
+                                                                            self.initial_pressure)
+        self.assertEqual(time_series_data.shape, (8, settings[Tags.K_WAVE_SPECIFIC_NT]))
+        self.assertAlmostEqual(settings[Tags.K_WAVE_SPECIFIC_DT], 0.3 * 1e-4 / 1500)
+        # the source is centered below the array
+        np.testing.assert_allclose(time_series_data, time_series_data[::-1], atol=1e-3 * np.max(time_series_data))
+        self.assertGreater(np.max(time_series_data[3]), np.max(time_series_data[0]))
+
+    def test_absorption_reduces_amplitude(self):
+        adapter = KSpacePseudospectralAdapter(self.settings)
+        lossless, _ = adapter.k_space_acoustic_forward_model(self.device, 1500, 1000, 0, self.initial_pressure)
+        absorbing, _ = adapter.k_space_acoustic_forward_model(self.device, 1500, 1000, 50, self.initial_pressure)
+        self.assertLess(np.max(np.abs(absorbing[3])), np.max(np.abs(lossless[3])))
+        self.assertTrue(np.all(np.isfinite(absorbing)))
+
+    def test_image_slice_of_linear_array(self):
+        adapter = KSpacePseudospectralAdapter(self.settings)
+        self.assertEqual(adapter.get_lateral_axis(self.device), 0)
+        self.assertEqual(adapter.get_image_slice(self.device), np.s_[:, 4, :])
+        self.settings.get_acoustic_settings()[Tags.ACOUSTIC_SIMULATION_3D] = True
+        adapter = KSpacePseudospectralAdapter(self.settings)
+        self.assertEqual(adapter.get_image_slice(self.device), np.s_[:])
+
+    def test_frequency_response_removes_offset(self):
+        signal = np.ones((2, 100))
+        filtered = apply_gaussian_frequency_response(signal, 40e6, 4e6, 50)
+        self.assertLess(np.max(np.abs(filtered)), 1e-4)
@@ -0,0 +1,101 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import os
+import stat
+import sys
+import tempfile
+import unittest
+import h5py
+import numpy as np
+from simpa import KWaveAdapter, Settings, Tags
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry
+from simpa.core.simulation_modules.acoustic_module.k_wave_binary_io import (get_sensor_mask_index,
+                                                                            write_k_wave_binary_input_file)
+from simpa.core.simulation_modules.acoustic_module.k_space_pseudospectral_adapter import \
+    compute_detector_sensor_matrix
+
+# stand-in for kspaceFirstOrder-OMP that records the initial pressure at the sensor points for all time steps
+STAND_IN_EXECUTABLE = """#!{python}
+import sys
+import h5py
+import numpy as np
+
+input_file_path = sys.argv[sys.argv.index("-i") + 1]
+output_file_path = sys.argv[sys.argv.index("-o") + 1]
+with h5py.File(input_file_path, "r") as file:
+    number_time_steps = int(file["Nt"][()].flat[0])
+    sensor_mask_index = file["sensor_mask_index"][()].reshape(-1).astype(int)
+    initial_pressure = file["p0_source_input"][()].reshape(-1)
+pressure = initial_pressure[sensor_mask_index - 1][np.newaxis, :] * (np.arange(number_time_steps) + 1)[:, np.newaxis]
+with h5py.File(output_file_path, "w") as file:
+    file.create_dataset("p", data=pressure[np.newaxis].astype(np.float32))
+"""
+
+
+class TestKWaveBinaryBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.binary_path = os.path.join(self.temporary_directory.name, "kspaceFirstOrder-OMP")
+        with open(self.binary_path, "w") as executable:
+            executable.write(STAND_IN_EXECUTABLE.format(python=sys.executable))
+        os.chmod(self.binary_path, os.stat(self.binary_path).st_mode | stat.S_IXUSR)
+
+        self.settings = Settings({Tags.SPACING_MM: 0.1,
+                                  Tags.WAVELENGTH: 800})
+        self.settings.set_acoustic_settings({Tags.K_WAVE_BACKEND: Tags.K_WAVE_BACKEND_BINARY,
+                                             Tags.ACOUSTIC_MODEL_BINARY_PATH: self.binary_path,
+                                             Tags.KWAVE_PROPERTY_ALPHA_POWER: 1.05,
+                                             Tags.KWAVE_PROPERTY_INITIAL_PRESSURE_SMOOTHING: False})
+        self.device = LinearArrayDetectionGeometry(pitch_mm=0.2, number_detector_elements=8,
+                                                   detector_element_width_mm=0.1,
+                                                   device_position_mm=np.array([1.0, 0.5, 0.5]))
+        self.initial_pressure = np.random.random((24, 21))
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_time_series_from_binary_output(self):
+        adapter = KWaveAdapter(self.settings)
+        optical_path = os.path.join(self.temporary_directory.name, "k_wave_binary_test")
+        time_series_data, settings = adapter.k_wave_acoustic_forward_model(self.device, 1500, 1000, 0,
+                                                                          self.initial_pressure, optical_path)
+        number_time_steps = settings[Tags.K_WAVE_SPECIFIC_NT]
+        self.assertEqual(time_series_data.shape, (8, number_time_steps))
+        self.assertAlmostEqual(settings[Tags.K_WAVE_SPECIFIC_DT], 0.3 * 1e-4 / 1500)
+        self.assertEqual(os.listdir(self.temporary_directory.name), ["kspaceFirstOrder-OMP"])
+
+        # the grid is padded with the gel layer and the PML before the sensor points are recorded
+        padded_pressure = np.pad(self.initial_pressure, [(23, 20), (20, 20)])
+        positions = self.device.get_detector_element_positions_accounting_for_device_position_mm()[:, [2, 0]] / 0.1
+        sensor_matrix = compute_detector_sensor_matrix(positions + np.array([23, 20]),
+                                                       self.device.get_detector_element_orientations()[:, [2, 0]],
+                                                       1, padded_pressure.shape)
+        np.testing.assert_allclose(time_series_data[:, 0], sensor_matrix @ padded_pressure.reshape(-1), rtol=1e-5)
+        np.testing.assert_allclose(time_series_data[:, -1], time_series_data[:, 0] * number_time_steps, rtol=1e-5)
+
+    def test_input_file_layout(self):
+        shape = (6, 5, 4)
+        initial_pressure = np.random.random(shape)
+        sensor_matrix = compute_detector_sensor_matrix(np.array([[2, 2, 2.5], [3, 1, 1]]),
+                                                       np.array([[0, 0, 1.0], [0, 0, 1.0]]), 2, shape)
+        sensor_mask_index, combination_matrix = get_sensor_mask_index(sensor_matrix, shape)
+        self.assertTrue(np.all(np.diff(sensor_mask_index) > 0))
+
+        file_path = os.path.join(self.temporary_directory.name, "input.h5")
+        write_k_wave_binary_input_file(file_path, initial_pressure, np.ones(shape) * 1500, np.ones(shape) * 1000,
+                                       np.zeros(shape), 1.05, 1e-4, 2e-8, 100, sensor_mask_index, [2, 2, 2], 2.0)
+        with h5py.File(file_path, "r") as file:
+            self.assertEqual(file.attrs["file_type"], b"input")
+            self.assertEqual(file["p0_source_input"].shape, shape[::-1])
+            self.assertEqual(file["Nx"].attrs["data_type"], b"long")
+            self.assertEqual(int(file["Nz"][()].flat[0]), 4)
+            self.assertEqual(int(file["absorbing_flag"][()].flat[0]), 0)
+            self.assertEqual(file["c0"].shape, (1, 1, 1))
+            self.assertNotIn("alpha_coeff", file)
+            # the sensor points read from the column-major data reproduce the sensor matrix
+            recorded = file["p0_source_input"][()].reshape(-1)[file["sensor_mask_index"][()].reshape(-1) - 1]
+        np.testing.assert_allclose(combination_matrix @ recorded, sensor_matrix @ initial_pressure.reshape(-1),
+                                   rtol=1e-6)
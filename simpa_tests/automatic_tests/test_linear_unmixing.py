@@ -9,6 +9,9 @@ from simpa_tests.test_utils.tissue_models import create_simple_tissue_model
 import simpa as sp
 import numpy as np
 import os
+from unittest.mock import patch
+from scipy.optimize import nnls
+from simpa.core.processing_components.multispectral import linear_unmixing
 
 
 class TestLinearUnmixing(unittest.TestCase):
@@ -116,6 +119,24 @@ class TestLinearUnmixing(unittest.TestCase):
         lu_results = sp.load_data_field(self.settings[Tags.SIMPA_OUTPUT_FILE_PATH], Tags.LINEAR_UNMIXING_RESULT)
         self.assert_correct_so2_vales(lu_results["sO2"])
 
+    def test_batched_non_negative_least_squares_matches_nnls(self):
+        """
+        This function tests that the batched non-negative least squares solvers give the solutions of
+        scipy.optimize.nnls for every pixel, also if the pixels are split into several chunks.
+        """
+        random_generator = np.random.default_rng(471)
+        for n_endmembers in [2, 3, 5, 8]:
+            n_wavelengths = max(len(self.WAVELENGTHS), 2 * n_endmembers)
+            matrix = random_generator.random((n_wavelengths, n_endmembers))
+            data = matrix @ random_generator.normal(size=(n_endmembers, 1000)) + \
+                0.1 * random_generator.normal(size=(n_wavelengths, 1000))
+            data[:, 0] = 0
+            expected = np.stack([nnls(matrix, data[:, pixel])[0] for pixel in range(1000)], axis=1)
+            with patch.object(linear_unmixing, "NON_NEGATIVE_UNMIXING_CHUNK_SIZE", 300):
+                solution = linear_unmixing.non_negative_least_squares(matrix, data)
+            self.assertTrue(np.all(solution >= 0))
+            np.testing.assert_allclose(solution, expected, atol=1e-8)
+
     @expectedFailure
     def test_invalid_wavelengths(self):
         """
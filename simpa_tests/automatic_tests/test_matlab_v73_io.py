@@ -0,0 +1,62 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import os
+import tempfile
+import unittest
+import h5py
+import numpy as np
+from simpa.utils import Settings, Tags
+from simpa.utils.matlab import load_mat_v73, save_mat_v73
+
+
+class TestMatlabV73IO(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temporary_directory.name, "data.mat")
+        self.initial_pressure = np.random.random((4, 5, 6))
+        self.settings = Settings({Tags.SPACING_MM: 0.1,
+                                  Tags.GPU: True,
+                                  Tags.MOVIENAME: "movie"})
+        save_mat_v73(self.file_path, {Tags.DATA_FIELD_INITIAL_PRESSURE: self.initial_pressure,
+                                      Tags.SENSOR_ELEMENT_POSITIONS: np.arange(6.0).reshape(2, 3),
+                                      "directivity_angle": np.array([0.1, 0.2]),
+                                      "settings": self.settings},
+                     single_precision_fields=[Tags.DATA_FIELD_INITIAL_PRESSURE])
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_header_identifies_mat_file_version_7_3(self):
+        with open(self.file_path, "rb") as mat_file:
+            header = mat_file.read(128)
+        self.assertTrue(header.startswith(b"MATLAB 7.3 MAT-file"))
+        self.assertEqual(header[124:128], b"\x00\x02IM")
+        self.assertTrue(h5py.is_hdf5(self.file_path))
+
+    def test_arrays_are_stored_in_matlab_layout(self):
+        with h5py.File(self.file_path, "r") as mat_file:
+            initial_pressure = mat_file[Tags.DATA_FIELD_INITIAL_PRESSURE]
+            self.assertEqual(initial_pressure.shape, (6, 5, 4))
+            self.assertEqual(initial_pressure.dtype, np.float32)
+            self.assertEqual(initial_pressure.attrs["MATLAB_class"], b"single")
+            self.assertEqual(mat_file["directivity_angle"].shape, (2, 1))
+            self.assertEqual(mat_file[Tags.SENSOR_ELEMENT_POSITIONS].dtype, np.float64)
+        np.testing.assert_allclose(load_mat_v73(self.file_path, Tags.DATA_FIELD_INITIAL_PRESSURE),
+                                   self.initial_pressure, rtol=1e-6)
+        np.testing.assert_array_equal(load_mat_v73(self.file_path, Tags.SENSOR_ELEMENT_POSITIONS),
+                                      np.arange(6.0).reshape(2, 3))
+
+    def test_settings_are_stored_as_struct(self):
+        with h5py.File(self.file_path, "r") as mat_file:
+            settings = mat_file["settings"]
+            self.assertEqual(settings.attrs["MATLAB_class"], b"struct")
+            self.assertEqual(settings[Tags.SPACING_MM[0]][()].item(), 0.1)
+            self.assertEqual(settings[Tags.SPACING_MM[0]].shape, (1, 1))
+            self.assertEqual(settings[Tags.GPU[0]].attrs["MATLAB_class"], b"logical")
+            self.assertEqual(settings[Tags.GPU[0]][()].item(), 1)
+            movie_name = settings[Tags.MOVIENAME[0]]
+            self.assertEqual(movie_name.attrs["MATLAB_class"], b"char")
+            self.assertEqual("".join(chr(character) for character in movie_name[()].ravel()), "movie")
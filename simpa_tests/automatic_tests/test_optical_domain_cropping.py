@@ -0,0 +1,90 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+from simpa import MCXAdapter, Settings, Tags
+from simpa.core.device_digital_twins import (DiskIlluminationGeometry, MSOTAcuityIlluminationGeometry,
+                                             CombinedIlluminationGeometry, PencilBeamIlluminationGeometry)
+from simpa.core.simulation_modules.optical_module.optical_utils import (compute_transport_mean_free_path_mm,
+                                                                       get_optical_domain_slices)
+
+
+class CroppingTestMCXAdapter(MCXAdapter):
+    """
+    MCXAdapter that does not call mcx but returns a fluence of ones on the domain it was given.
+    """
+
+    def run_mcx(self, cmd):
+        with open(self.mcx_json_config_file, "r") as json_file:
+            self.mcx_settings = json.load(json_file)
+
+    def read_mcx_output(self, **kwargs):
+        return {Tags.DATA_FIELD_FLUENCE: np.ones((self.nx, self.ny, self.nz))}
+
+
+class TestOpticalDomainCropping(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.settings = Settings({Tags.SPACING_MM: 0.5,
+                                  Tags.SIMULATION_PATH: self.temporary_directory.name,
+                                  Tags.VOLUME_NAME: "cropping_test"})
+        self.shape = (100, 80, 20)
+        self.absorption = np.ones(self.shape) * 0.1
+        # mua + mus' = 10 / cm -> transport mean free path of 1 mm
+        self.scattering = np.ones(self.shape) * 99
+        self.anisotropy = np.ones(self.shape) * 0.9
+        self.geometry = DiskIlluminationGeometry(beam_radius_mm=2, device_position_mm=np.array([25, 20, 0]))
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_transport_mean_free_path(self):
+        self.assertAlmostEqual(compute_transport_mean_free_path_mm(self.absorption, self.scattering,
+                                                                   self.anisotropy), 1.0)
+
+    def test_slices_are_clipped_to_volume(self):
+        slices = get_optical_domain_slices(np.array([-5, 5, 30, 50, 0, 0]), 0.5, self.shape, 1)
+        self.assertEqual(slices[0], slice(0, 12))
+        self.assertEqual(slices[1], slice(58, 80))
+        self.assertEqual(slices[2], slice(0, 20))
+
+    def test_illuminated_region_of_combined_geometry(self):
+        pencil_beam = PencilBeamIlluminationGeometry(device_position_mm=np.array([40, 2, 0]))
+        combined = CombinedIlluminationGeometry([self.geometry, pencil_beam])
+        np.testing.assert_allclose(combined.get_illuminated_region_mm(), [23, 40, 2, 22, -2, 2])
+        combined.illumination_geometries.append(MSOTAcuityIlluminationGeometry())
+        self.assertIsNone(combined.get_illuminated_region_mm())
+
+    def test_no_cropping_by_default(self):
+        self.settings.set_optical_settings({Tags.OPTICAL_MODEL_NUMBER_PHOTONS: 1e5,
+                                            Tags.OPTICAL_MODEL_BINARY_PATH: "."})
+        adapter = CroppingTestMCXAdapter(self.settings)
+        fluence = adapter.forward_model(self.absorption, self.scattering, self.anisotropy,
+                                        self.geometry)[Tags.DATA_FIELD_FLUENCE]
+        self.assertTrue(np.all(fluence == 1))
+
+    def test_cropped_forward_model(self):
+        self.settings.set_optical_settings({Tags.OPTICAL_MODEL_NUMBER_PHOTONS: 1e5,
+                                            Tags.OPTICAL_MODEL_BINARY_PATH: ".",
+                                            Tags.OPTICAL_MODEL_CROP_TO_ILLUMINATION: True,
+                                            Tags.OPTICAL_MODEL_CROP_MARGIN_TRANSPORT_MEAN_FREE_PATHS: 3})
+        adapter = CroppingTestMCXAdapter(self.settings)
+        fluence = adapter.forward_model(self.absorption, self.scattering, self.anisotropy,
+                                        self.geometry)[Tags.DATA_FIELD_FLUENCE]
+        self.assertEqual(fluence.shape, self.shape)
+        # disk from 23 to 27 mm and 18 to 22 mm plus 3 mm margin
+        self.assertEqual([adapter.nx, adapter.ny, adapter.nz], [20, 20, 20])
+        self.assertTrue(np.all(fluence[40:60, 30:50, :] == 1))
+        self.assertEqual(np.sum(fluence), 20 * 20 * 20)
+
+        # the source position is given relative to the cropped domain
+        full_position = np.asarray(self.geometry.get_mcx_illuminator_definition(self.settings)["Pos"])
+        np.testing.assert_allclose(adapter.mcx_settings["Optode"]["Source"]["Pos"],
+                                   full_position - np.array([40, 30, 0]))
+        self.assertFalse(any(os.path.isfile(f) for f in adapter.temporary_output_files))
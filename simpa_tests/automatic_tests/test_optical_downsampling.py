@@ -0,0 +1,65 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import unittest
+import numpy as np
+from simpa import Settings, Tags
+from simpa.core.device_digital_twins import PencilBeamIlluminationGeometry
+from simpa.core.simulation_modules.optical_module import OpticalAdapterBase
+from simpa.core.simulation_modules.optical_module.optical_utils import (downsample_optical_properties,
+                                                                       upsample_volume)
+
+
+class DepthDecayOpticalAdapter(OpticalAdapterBase):
+    """
+    Smooth toy model: the fluence decays exponentially with depth in mm, which requires the adapter to use the
+    spacing of the grid it is run on.
+    """
+
+    def forward_model(self, absorption_cm, scattering_cm, anisotropy, illumination_geometry):
+        spacing = self.global_settings[Tags.SPACING_MM]
+        depth_mm = (np.arange(absorption_cm.shape[2]) + 0.5) * spacing
+        fluence = np.ones_like(absorption_cm) * np.exp(-0.1 * depth_mm)[np.newaxis, np.newaxis, :]
+        return {Tags.DATA_FIELD_FLUENCE: fluence}
+
+
+class TestOpticalDownsampling(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(4711)
+        self.absorption = np.random.random((16, 12, 20)) + 0.1
+        self.scattering = np.random.random((16, 12, 20)) * 100 + 1
+        self.anisotropy = np.random.random((16, 12, 20)) * 0.5 + 0.5
+
+    def test_downsampling_preserves_mean_properties(self):
+        mua, mus, g = downsample_optical_properties(self.absorption, self.scattering, self.anisotropy, 2)
+        self.assertEqual(mua.shape, (8, 6, 10))
+        self.assertAlmostEqual(np.mean(mua), np.mean(self.absorption))
+        self.assertAlmostEqual(np.mean(mus), np.mean(self.scattering))
+        # the reduced scattering coefficient is preserved
+        self.assertAlmostEqual(np.mean(mus * (1 - g)), np.mean(self.scattering * (1 - self.anisotropy)))
+
+    def test_downsampling_of_non_divisible_shapes(self):
+        mua, mus, g = downsample_optical_properties(self.absorption[:15], self.scattering[:15],
+                                                    self.anisotropy[:15], 4)
+        self.assertEqual(mua.shape, (4, 3, 5))
+
+    def test_upsampling_of_linear_volume_is_exact(self):
+        coarse = np.ones((4, 3, 5)) * (np.arange(5) + 1.0)[np.newaxis, np.newaxis, :]
+        fine = upsample_volume(coarse, 2, (8, 6, 10))
+        expected = (np.arange(10) + 0.5) / 2 + 0.5
+        np.testing.assert_allclose(fine[0, 0, :], expected)
+
+    def test_downsampled_forward_model_is_close_to_full_resolution(self):
+        settings = Settings({Tags.SPACING_MM: 0.5})
+        settings.set_optical_settings({})
+        adapter = DepthDecayOpticalAdapter(settings)
+        geometry = PencilBeamIlluminationGeometry()
+        reference = adapter.run_forward_model(geometry, geometry, self.absorption, self.scattering,
+                                              self.anisotropy)[Tags.DATA_FIELD_FLUENCE]
+        downsampled = adapter.run_downsampled_forward_model(geometry, geometry, self.absorption, self.scattering,
+                                                            self.anisotropy, 2)[Tags.DATA_FIELD_FLUENCE]
+        self.assertEqual(settings[Tags.SPACING_MM], 0.5)
+        self.assertEqual(downsampled.shape, reference.shape)
+        self.assertLess(np.max(np.abs(downsampled - reference) / reference), 0.01)
@@ -0,0 +1,141 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import json
+import tempfile
+import unittest
+import numpy as np
+from simpa import MCXAdapter, Settings, Tags
+from simpa.core.device_digital_twins import PencilBeamIlluminationGeometry
+from simpa.core.simulation_modules.optical_module.optical_utils import reweight_time_resolved_fluence
+
+
+class TimeResolvedTestMCXAdapter(MCXAdapter):
+    """
+    MCXAdapter that does not call mcx but returns the time-resolved fluence of photons whose path lengths are
+    distributed uniformly up to the path length travelled within the simulated time.
+    """
+
+    def __init__(self, global_settings):
+        super(TimeResolvedTestMCXAdapter, self).__init__(global_settings)
+        self.number_of_runs = 0
+
+    def generate_mcx_bin_input(self, absorption_cm, scattering_cm, anisotropy, assumed_anisotropy):
+        super(TimeResolvedTestMCXAdapter, self).generate_mcx_bin_input(absorption_cm, scattering_cm, anisotropy,
+                                                                       assumed_anisotropy)
+        self.absorption_mm = np.mean(absorption_cm) / 10
+
+    def run_mcx(self, cmd):
+        self.number_of_runs += 1
+        with open(self.mcx_json_config_file, "r") as json_file:
+            self.mcx_settings = json.load(json_file)
+
+    def read_mcx_output(self, **kwargs):
+        forward = self.mcx_settings["Forward"]
+        number_of_gates = int(round((forward["T1"] - forward["T0"]) / forward["Dt"]))
+        path_lengths = np.arange(number_of_gates + 1) * forward["Dt"] * 2.99792458e11
+        gate_fluence = -np.diff(np.exp(-self.absorption_mm * path_lengths)) / self.absorption_mm
+        fluence = np.ones((self.nx, self.ny, self.nz, 1))
+        if number_of_gates > 1:
+            fluence = fluence * gate_fluence[np.newaxis, np.newaxis, np.newaxis, :]
+        else:
+            fluence = fluence * np.sum(gate_fluence)
+        return {Tags.DATA_FIELD_FLUENCE: fluence}
+
+
+def expected_fluence(absorption_mm):
+    return (1 - np.exp(-absorption_mm * 5e-9 * 2.99792458e11)) / absorption_mm
+
+
+class TestPerturbationMonteCarlo(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.settings = Settings({Tags.SPACING_MM: 0.5,
+                                  Tags.SIMULATION_PATH: self.temporary_directory.name,
+                                  Tags.VOLUME_NAME: "perturbation_test"})
+        self.settings.set_optical_settings({Tags.OPTICAL_MODEL_NUMBER_PHOTONS: 1e5,
+                                            Tags.OPTICAL_MODEL_BINARY_PATH: ".",
+                                            Tags.OPTICAL_MODEL_PERTURBATION_MONTE_CARLO: True,
+                                            Tags.OPTICAL_MODEL_PERTURBATION_TIME_GATES: 200})
+        self.shape = (8, 6, 4)
+        self.scattering = np.ones(self.shape) * 100
+        self.anisotropy = np.ones(self.shape) * 0.9
+        self.geometry = PencilBeamIlluminationGeometry(device_position_mm=np.array([2, 1.5, 0]))
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def run_wavelength(self, adapter, absorption_cm, scattering_cm):
+        return adapter.forward_model(np.ones(self.shape) * absorption_cm, scattering_cm, self.anisotropy,
+                                     self.geometry)[Tags.DATA_FIELD_FLUENCE]
+
+    def test_reweighting_without_absorption_change(self):
+        time_resolved_fluence = np.random.random((3, 4, 5, 10))
+        fluence = reweight_time_resolved_fluence(time_resolved_fluence, np.arange(11), 0)
+        np.testing.assert_allclose(fluence, np.sum(time_resolved_fluence, axis=3))
+
+    def test_fluence_is_derived_from_reference(self):
+        adapter = TimeResolvedTestMCXAdapter(self.settings)
+        reference = self.run_wavelength(adapter, 0.1, self.scattering)
+        self.assertEqual(reference.shape, self.shape)
+        np.testing.assert_allclose(reference, expected_fluence(0.01))
+        for absorption_cm in [0.05, 0.2, 0.5]:
+            fluence = self.run_wavelength(adapter, absorption_cm, self.scattering)
+            np.testing.assert_allclose(fluence, expected_fluence(absorption_cm / 10), rtol=5e-3)
+        self.assertEqual(adapter.number_of_runs, 1)
+
+    def test_scattering_change_beyond_tolerance_triggers_full_run(self):
+        adapter = TimeResolvedTestMCXAdapter(self.settings)
+        self.run_wavelength(adapter, 0.1, self.scattering)
+        self.run_wavelength(adapter, 0.2, self.scattering * 1.04)
+        self.assertEqual(adapter.number_of_runs, 1)
+        self.run_wavelength(adapter, 0.2, self.scattering * 1.1)
+        self.assertEqual(adapter.number_of_runs, 2)
+        # the new run is the reference for subsequent wavelengths
+        fluence = self.run_wavelength(adapter, 0.3, self.scattering * 1.1)
+        self.assertEqual(adapter.number_of_runs, 2)
+        np.testing.assert_allclose(fluence, expected_fluence(0.03), rtol=5e-3)
+
+    def test_vessel_phantom_reuses_reference_only_for_near_uniform_changes(self):
+        adapter = TimeResolvedTestMCXAdapter(self.settings)
+        vessel = np.zeros(self.shape, dtype=bool)
+        vessel[3:5, 2:4, 1:3] = True
+        blood_absorption_cm, background_absorption_cm = 2.0, 0.2
+        adapter.forward_model(np.where(vessel, blood_absorption_cm, background_absorption_cm), self.scattering,
+                              self.anisotropy, self.geometry)
+        self.assertEqual(adapter.number_of_runs, 1)
+
+        # a proportional change of 0.5 % in blood and background is still derived from the reference
+        adapter.forward_model(np.where(vessel, blood_absorption_cm, background_absorption_cm) * 1.005,
+                              self.scattering, self.anisotropy, self.geometry)
+        self.assertEqual(adapter.number_of_runs, 1)
+        # so is a much larger change that is uniform across the phantom
+        adapter.forward_model(np.where(vessel, blood_absorption_cm, background_absorption_cm) + 0.5,
+                              self.scattering, self.anisotropy, self.geometry)
+        self.assertEqual(adapter.number_of_runs, 1)
+
+        # a proportional change of 5 %, which is typical between neighbouring wavelengths of blood, is not
+        adapter.forward_model(np.where(vessel, blood_absorption_cm, background_absorption_cm) * 1.05,
+                              self.scattering, self.anisotropy, self.geometry)
+        self.assertEqual(adapter.number_of_runs, 2)
+        # neither is a change of the blood absorption alone
+        adapter.forward_model(np.where(vessel, 2 * blood_absorption_cm, background_absorption_cm) * 1.05,
+                              self.scattering, self.anisotropy, self.geometry)
+        self.assertEqual(adapter.number_of_runs, 3)
+
+    def test_references_are_kept_per_illumination(self):
+        adapter = TimeResolvedTestMCXAdapter(self.settings)
+        self.run_wavelength(adapter, 0.1, self.scattering)
+        self.geometry = PencilBeamIlluminationGeometry(device_position_mm=np.array([1, 1.5, 0]))
+        self.run_wavelength(adapter, 0.2, self.scattering)
+        self.assertEqual(adapter.number_of_runs, 2)
+        self.assertEqual(len(adapter.perturbation_references), 2)
+
+    def test_single_time_gate_without_perturbation(self):
+        self.settings.get_optical_settings()[Tags.OPTICAL_MODEL_PERTURBATION_MONTE_CARLO] = False
+        adapter = TimeResolvedTestMCXAdapter(self.settings)
+        self.assertEqual(self.run_wavelength(adapter, 0.1, self.scattering).shape, self.shape)
+        self.assertEqual(adapter.frames, 1)
+        self.assertEqual(len(adapter.perturbation_references), 0)
@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import unittest
+from unittest.mock import patch
+import numpy as np
+import torch
+from simpa import (DelayAndSumAdapter, DelayMultiplyAndSumAdapter, Settings, SignedDelayMultiplyAndSumAdapter,
+                   Tags, UniversalBackProjectionAdapter, validate_reconstruction_precision)
+from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings
+from simpa.core.simulation_modules.reconstruction_module import reconstruction_utils
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_precision_validation import \
+    get_precision_test_phantoms
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import compute_delay_and_sum_values, \
+    get_reduced_precision_dtype
+
+
+class TestReconstructionPrecision(unittest.TestCase):
+
+    def setUp(self):
+        self.phantoms = get_precision_test_phantoms()
+
+    def reconstruct(self, adapter_class, precision, time_series_data, memory_budget_in_mb=None):
+        detection_geometry, _ = self.phantoms["linear_array_spheres"]
+        settings = create_reconstruction_settings(1540, 5e-8, 0.2)
+        settings[Tags.GPU] = False
+        settings.get_reconstruction_settings()[Tags.RECONSTRUCTION_PRECISION] = precision
+        if memory_budget_in_mb is not None:
+            settings.get_reconstruction_settings()[Tags.RECONSTRUCTION_MEMORY_BUDGET_MB] = memory_budget_in_mb
+        return adapter_class(settings).reconstruction_algorithm(time_series_data, detection_geometry)
+
+    def test_reduced_precision_is_close_to_float32(self):
+        for adapter_class in [DelayAndSumAdapter, DelayMultiplyAndSumAdapter, SignedDelayMultiplyAndSumAdapter,
+                              UniversalBackProjectionAdapter]:
+            deviations = validate_reconstruction_precision(adapter_class, phantoms=self.phantoms, tolerance=0.01)
+            self.assertEqual(set(deviations), set(self.phantoms))
+        with self.assertRaises(AssertionError):
+            validate_reconstruction_precision(DelayMultiplyAndSumAdapter, phantoms=self.phantoms, tolerance=1e-9)
+
+    def test_reduced_precision_uses_larger_blocks(self):
+        time_series_data = self.phantoms["linear_array_spheres"][1].astype(np.float32)
+        block_counts = dict()
+        for precision in [Tags.RECONSTRUCTION_PRECISION_FLOAT32, Tags.RECONSTRUCTION_PRECISION_FLOAT16]:
+            with patch.object(reconstruction_utils, "compute_delay_and_sum_values",
+                              wraps=compute_delay_and_sum_values) as compute:
+                self.reconstruct(DelayAndSumAdapter, precision, time_series_data, memory_budget_in_mb=2)
+                block_counts[precision] = compute.call_count
+        self.assertLess(block_counts[Tags.RECONSTRUCTION_PRECISION_FLOAT16],
+                        block_counts[Tags.RECONSTRUCTION_PRECISION_FLOAT32])
+
+    def test_float16_covers_large_and_small_amplitudes(self):
+        settings = Settings({Tags.RECONSTRUCTION_PRECISION: Tags.RECONSTRUCTION_PRECISION_FLOAT16})
+        self.assertEqual(get_reduced_precision_dtype(settings), torch.float16)
+        self.assertIsNone(get_reduced_precision_dtype(Settings()))
+
+        # pressures beyond the range of float16 in both directions, including a frame of zeros
+        time_series_data = self.phantoms["linear_array_spheres"][1].astype(np.float32)
+        time_series_data = np.stack([time_series_data * 1e6, time_series_data * 1e-9, time_series_data * 0])
+        for adapter_class in [DelayAndSumAdapter, DelayMultiplyAndSumAdapter]:
+            images = self.reconstruct(adapter_class, Tags.RECONSTRUCTION_PRECISION_FLOAT16, time_series_data)
+            references = self.reconstruct(adapter_class, Tags.RECONSTRUCTION_PRECISION_FLOAT32, time_series_data)
+            for image, reference in zip(images, references):
+                valid = ~np.isnan(reference)
+                self.assertTrue(np.all(np.isfinite(image[valid])))
+                np.testing.assert_allclose(image[valid], reference[valid],
+                                           atol=0.01 * np.max(np.abs(reference[valid]), initial=0))
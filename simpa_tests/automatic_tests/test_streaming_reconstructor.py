@@ -0,0 +1,108 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import threading
+import unittest
+from unittest.mock import patch
+import numpy as np
+from simpa import DelayAndSumAdapter, StreamingReconstructor, Tags, UniversalBackProjectionAdapter
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry
+from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings
+from simpa.core.simulation_modules.reconstruction_module import reconstruction_utils, streaming_reconstructor
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import (BEAMFORMING_PLAN_CACHE,
+                                                                                      compute_beamforming_plan)
+
+
+class TestStreamingReconstructor(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(4711)
+        self.frames = np.random.random((4, 16, 400)).astype(np.float32) - 0.5
+        self.device = LinearArrayDetectionGeometry(pitch_mm=0.25, number_detector_elements=16,
+                                                   field_of_view_extent_mm=np.array([-2, 2, 0, 0, 0, 4]))
+        self.settings = create_reconstruction_settings(speed_of_sound_in_m_per_s=1540, sensor_spacing_in_mm=0.2,
+                                                       apodization=Tags.RECONSTRUCTION_APODIZATION_HANN)
+        self.settings[Tags.GPU] = False
+        BEAMFORMING_PLAN_CACHE.clear()
+
+    def tearDown(self):
+        BEAMFORMING_PLAN_CACHE.clear()
+
+    def test_frames_are_reconstructed_with_a_prepared_plan(self):
+        with patch.object(reconstruction_utils, "compute_beamforming_plan", wraps=compute_beamforming_plan) as compute:
+            reconstructor = StreamingReconstructor(self.settings, self.device, frame_shape=self.frames.shape[1:])
+            self.assertEqual(compute.call_count, 1)
+            images = [reconstructor.process(frame).copy() for frame in self.frames]
+            self.assertEqual(compute.call_count, 1)
+        self.assertNotIn(Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB, self.settings.get_reconstruction_settings())
+
+        adapter = DelayAndSumAdapter(self.settings)
+        for frame, image in zip(self.frames, images):
+            np.testing.assert_array_equal(image, adapter.reconstruction_algorithm(frame, self.device))
+
+        report = reconstructor.get_latency_report()
+        self.assertEqual(report["frames"], len(self.frames))
+        self.assertLessEqual(report["median_latency_ms"], report["max_latency_ms"])
+
+    def test_next_frame_is_loaded_during_reconstruction(self):
+        reconstructor = StreamingReconstructor(self.settings, self.device, UniversalBackProjectionAdapter)
+        second_frame_requested = threading.Event()
+        overlapped = []
+
+        def load_frames():
+            for index, frame in enumerate(self.frames):
+                if index == 1:
+                    second_frame_requested.set()
+                yield frame
+
+        reconstruct_with_settings = reconstructor.adapter.reconstruct_with_settings
+
+        def reconstruct_and_check_loading(*args):
+            if not overlapped:
+                overlapped.append(second_frame_requested.wait(timeout=10))
+            return reconstruct_with_settings(*args)
+
+        with patch.object(reconstructor.adapter, "reconstruct_with_settings",
+                          side_effect=reconstruct_and_check_loading):
+            images = [image.copy() for image in reconstructor.stream(load_frames())]
+        self.assertEqual(overlapped, [True])
+        self.assertEqual(len(images), len(self.frames))
+        np.testing.assert_array_equal(images[-1], reconstructor.process(self.frames[-1]))
+        self.assertEqual(reconstructor.get_latency_report()["frames"], len(self.frames) + 1)
+
+    def test_plan_and_output_buffer_are_kept_on_the_reconstructor(self):
+        reconstructor = StreamingReconstructor(self.settings, self.device, frame_shape=self.frames.shape[1:])
+        first_image = reconstructor.process(self.frames[0])
+        BEAMFORMING_PLAN_CACHE.clear()
+        DelayAndSumAdapter(self.settings).reconstruction_algorithm(self.frames[0], self.device)
+        with patch.object(reconstruction_utils, "compute_beamforming_plan", wraps=compute_beamforming_plan) as compute:
+            second_image = reconstructor.process(self.frames[1])
+            self.assertEqual(compute.call_count, 0)
+        self.assertTrue(np.shares_memory(first_image, second_image))
+
+    def test_warning_if_plan_does_not_fit_into_the_cache(self):
+        self.settings.get_reconstruction_settings()[Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB] = 0.0001
+        with self.assertLogs("SIMPA Logger", level="WARNING") as logs:
+            StreamingReconstructor(self.settings, self.device, frame_shape=self.frames.shape[1:])
+        self.assertIn("RECONSTRUCTION_PLAN_CACHE_SIZE_MB", "".join(logs.output))
+
+    def test_speed_of_sound_is_loaded_once(self):
+        del self.settings.get_reconstruction_settings()[Tags.DATA_FIELD_SPEED_OF_SOUND]
+        self.settings[Tags.SIMPA_OUTPUT_FILE_PATH] = "simulation.hdf5"
+        self.settings[Tags.WAVELENGTH] = 800
+        speed_of_sound = np.full((20, 20), 1540.0)
+        with patch.object(reconstruction_utils, "load_data_field", return_value=speed_of_sound) as load_in_adapter, \
+                patch.object(streaming_reconstructor, "load_data_field", return_value=speed_of_sound) as load:
+            reconstructor = StreamingReconstructor(self.settings, self.device, frame_shape=self.frames.shape[1:])
+            images = [reconstructor.process(frame).copy() for frame in self.frames]
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(load_in_adapter.call_count, 0)
+        self.assertNotIn(Tags.DATA_FIELD_SPEED_OF_SOUND, self.settings.get_reconstruction_settings())
+        self.settings.get_reconstruction_settings()[Tags.DATA_FIELD_SPEED_OF_SOUND] = 1540
+        adapter = DelayAndSumAdapter(self.settings)
+        np.testing.assert_allclose(images[-1], adapter.reconstruction_algorithm(self.frames[-1], self.device))
+
+    def test_unsupported_device_raises_error(self):
+        with self.assertRaises(TypeError):
+            StreamingReconstructor(self.settings, "device")
@@ -0,0 +1,94 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import unittest
+from unittest.mock import patch
+import numpy as np
+import torch
+from torch.profiler import profile, ProfilerActivity
+from simpa import (DelayAndSumAdapter, DelayMultiplyAndSumAdapter, SignedDelayMultiplyAndSumAdapter, Tags)
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry, PlanarArrayDetectionGeometry
+from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings, reconstruction_utils
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import \
+    DELAY_AND_SUM_BYTES_PER_VALUE, REDUCED_PRECISION_BYTES_PER_VALUE, SOLID_ANGLE_WEIGHTS_BYTES_PER_VALUE, \
+    compute_delay_and_sum_values, get_image_blocks
+from simpa.log.file_logger import Logger
+from simpa.utils import Settings
+
+
+class TestTiledDelayAndSum(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(4711)
+        self.time_series_data = np.random.random((16, 400)).astype(np.float32) - 0.5
+        self.linear_array = LinearArrayDetectionGeometry(pitch_mm=0.25, number_detector_elements=16,
+                                                         field_of_view_extent_mm=np.array([-2, 2, 0, 0, 0, 4]))
+        self.planar_array = PlanarArrayDetectionGeometry(pitch_mm=0.5, number_detector_elements_x=4,
+                                                         number_detector_elements_y=4,
+                                                         field_of_view_extent_mm=np.array([-1, 1, -1, 1, 0, 2]))
+
+    def reconstruct(self, adapter_class, detection_geometry, memory_budget_in_mb=None):
+        settings = create_reconstruction_settings(speed_of_sound_in_m_per_s=1540, time_spacing_in_s=2.5e-8,
+                                                  sensor_spacing_in_mm=0.2,
+                                                  apodization=Tags.RECONSTRUCTION_APODIZATION_HANN)
+        settings[Tags.GPU] = False
+        if memory_budget_in_mb is not None:
+            settings.get_reconstruction_settings()[Tags.RECONSTRUCTION_MEMORY_BUDGET_MB] = memory_budget_in_mb
+        return adapter_class(settings).reconstruction_algorithm(self.time_series_data.copy(), detection_geometry)
+
+    def test_image_blocks_cover_image(self):
+        budget_for_70_pixels = 70 * 16 * DELAY_AND_SUM_BYTES_PER_VALUE / 1024 ** 2
+        blocks = get_image_blocks(5, 6, 7, 16, budget_for_70_pixels)
+        self.assertEqual(blocks[0], (slice(0, 1), slice(0, 6), slice(0, 7)))
+        self.assertEqual(len(blocks), 5)
+        covered = np.zeros((5, 6, 7), dtype=int)
+        for block in get_image_blocks(5, 6, 7, 16, 4 * 16 * DELAY_AND_SUM_BYTES_PER_VALUE / 1024 ** 2):
+            covered[block] += 1
+        self.assertTrue(np.all(covered == 1))
+        self.assertEqual(get_image_blocks(5, 6, 7, 16), [(slice(0, 5), slice(0, 6), slice(0, 7))])
+
+    def test_tiled_reconstructions_are_identical(self):
+        for adapter_class in [DelayAndSumAdapter, DelayMultiplyAndSumAdapter, SignedDelayMultiplyAndSumAdapter]:
+            for detection_geometry in [self.linear_array, self.planar_array]:
+                untiled = self.reconstruct(adapter_class, detection_geometry)
+                tiled = self.reconstruct(adapter_class, detection_geometry, memory_budget_in_mb=0.01)
+                np.testing.assert_array_equal(tiled, untiled)
+
+    def test_default_memory_budget_is_derived_from_available_memory(self):
+        with patch.object(reconstruction_utils, "get_available_memory_in_mb", return_value=0.02), \
+                patch.object(reconstruction_utils, "get_image_blocks", wraps=get_image_blocks) as image_blocks:
+            tiled = self.reconstruct(DelayAndSumAdapter, self.linear_array)
+        self.assertEqual(image_blocks.call_args[0][4], 0.01)
+        self.assertGreater(len(get_image_blocks(*image_blocks.call_args[0])), 1)
+        with patch.object(reconstruction_utils, "get_available_memory_in_mb", return_value=None):
+            untiled = self.reconstruct(DelayAndSumAdapter, self.linear_array)
+        np.testing.assert_array_equal(tiled, untiled)
+        self.assertGreater(reconstruction_utils.get_available_memory_in_mb(torch.device("cpu")), 0)
+
+    def test_bytes_per_value_cover_peak_memory(self):
+        n_sensor_elements, xdim, ydim = 16, 32, 32
+        time_series_data = torch.from_numpy(self.time_series_data)
+        sensor_positions = torch.zeros((n_sensor_elements, 3), dtype=torch.float64)
+        sensor_positions[:, 0] = torch.linspace(-2, 2, n_sensor_elements)
+        sensor_orientations = torch.zeros((n_sensor_elements, 3), dtype=torch.float64)
+        sensor_orientations[:, 2] = 1
+        apodization = {Tags.RECONSTRUCTION_APODIZATION_METHOD: Tags.RECONSTRUCTION_APODIZATION_HANN}
+        reduced_precision = {Tags.RECONSTRUCTION_PRECISION: Tags.RECONSTRUCTION_PRECISION_FLOAT16}
+
+        for component_settings, orientations, bytes_per_value in [
+                (apodization, None, DELAY_AND_SUM_BYTES_PER_VALUE),
+                ({**apodization, **reduced_precision}, None, REDUCED_PRECISION_BYTES_PER_VALUE),
+                ({}, sensor_orientations, DELAY_AND_SUM_BYTES_PER_VALUE + SOLID_ANGLE_WEIGHTS_BYTES_PER_VALUE),
+                (reduced_precision, sensor_orientations,
+                 REDUCED_PRECISION_BYTES_PER_VALUE + SOLID_ANGLE_WEIGHTS_BYTES_PER_VALUE)]:
+            with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as profiler:
+                compute_delay_and_sum_values(time_series_data, sensor_positions, xdim, ydim, 1, -xdim // 2,
+                                             xdim // 2, 0, ydim, 0, 1, 0.1, 1540, 2.5e-5, Logger(),
+                                             torch.device("cpu"), Settings(component_settings),
+                                             count_nonzero_values=True, sensor_orientations=orientations)
+            memory_events = sorted((event for event in profiler.profiler.kineto_results.events()
+                                    if event.name() == "[memory]"), key=lambda event: event.start_ns())
+            peak_memory = np.max(np.cumsum([event.nbytes() for event in memory_events]))
+            self.assertLessEqual(peak_memory, n_sensor_elements * xdim * ydim * bytes_per_value)
+            self.assertGreater(peak_memory, n_sensor_elements * xdim * ydim * bytes_per_value * 0.75)
@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import os
+import tempfile
+import unittest
+import numpy as np
+from simpa import Settings, Tags, TimeSeriesDecimation, load_data_field
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry
+from simpa.io_handling.io_hdf5 import save_data_field
+
+
+class TestTimeSeriesDecimation(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temporary_directory.name, "decimation_test.hdf5")
+        self.dt = 5e-9
+        self.settings = Settings({Tags.SIMPA_OUTPUT_FILE_PATH: self.file_path,
+                                  Tags.WAVELENGTHS: [700, 800],
+                                  Tags.WAVELENGTH: 700,
+                                  Tags.K_WAVE_SPECIFIC_DT: self.dt,
+                                  Tags.K_WAVE_SPECIFIC_NT: 4000})
+        self.settings["TimeSeriesDecimation"] = Settings({Tags.TIME_SERIES_DECIMATION_BLOCK_SIZE: 3})
+        # linear array at z = 0 with a field of view of 20 mm depth, sampled at 40 MHz
+        self.device = LinearArrayDetectionGeometry(pitch_mm=0.5, number_detector_elements=8,
+                                                   field_of_view_extent_mm=np.array([-2, 2, 0, 0, 0, 20]),
+                                                   device_position_mm=np.array([5, 5, 0]))
+        save_data_field(np.ones((10, 10, 10)) * 1500, self.file_path, Tags.DATA_FIELD_SPEED_OF_SOUND)
+        self.time = np.arange(4000) * self.dt
+        self.frequencies = np.linspace(1e6, 4e6, 8)
+        for wavelength in self.settings[Tags.WAVELENGTHS]:
+            save_data_field(np.sin(2 * np.pi * self.frequencies[:, np.newaxis] * self.time[np.newaxis]) * wavelength,
+                            self.file_path, Tags.DATA_FIELD_TIME_SERIES_DATA, wavelength)
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_time_series_is_cropped_and_decimated(self):
+        decimation = TimeSeriesDecimation(self.settings)
+        for wavelength in self.settings[Tags.WAVELENGTHS]:
+            self.settings[Tags.WAVELENGTH] = wavelength
+            decimation.run(self.device)
+            time_series_data = load_data_field(self.file_path, Tags.DATA_FIELD_TIME_SERIES_DATA, wavelength)
+
+            self.assertAlmostEqual(self.settings[Tags.K_WAVE_SPECIFIC_DT], 2.5e-8)
+            # the far corner of the field of view is sqrt(20^2 + 3.75^2) mm away from the outermost element
+            expected_number_time_steps = int(np.ceil(np.sqrt(20 ** 2 + 3.75 ** 2) / 1000 / 1500 / 2.5e-8)) + 1
+            self.assertEqual(time_series_data.shape, (8, expected_number_time_steps))
+            self.assertEqual(self.settings[Tags.K_WAVE_SPECIFIC_NT], expected_number_time_steps)
+
+            time = np.arange(expected_number_time_steps) * 2.5e-8
+            expected = np.sin(2 * np.pi * self.frequencies[:, np.newaxis] * time[np.newaxis]) * wavelength
+            # the polyphase filter settles after a few samples at the start of the signal
+            np.testing.assert_allclose(time_series_data[:, 20:], expected[:, 20:], atol=1e-2 * wavelength)
+
+    def test_block_size_does_not_change_result(self):
+        TimeSeriesDecimation(self.settings).run(self.device)
+        blockwise = load_data_field(self.file_path, Tags.DATA_FIELD_TIME_SERIES_DATA, 700)
+
+        save_data_field(np.sin(2 * np.pi * self.frequencies[:, np.newaxis] * self.time[np.newaxis]) * 700,
+                        self.file_path, Tags.DATA_FIELD_TIME_SERIES_DATA, 700)
+        self.settings[Tags.K_WAVE_SPECIFIC_DT] = self.dt
+        self.settings["TimeSeriesDecimation"][Tags.TIME_SERIES_DECIMATION_BLOCK_SIZE] = 64
+        TimeSeriesDecimation(self.settings).run(self.device)
+        np.testing.assert_allclose(load_data_field(self.file_path, Tags.DATA_FIELD_TIME_SERIES_DATA, 700), blockwise)
@@ -0,0 +1,139 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from scipy.ndimage import map_coordinates
+from simpa import DelayAndSumAdapter, DelayMultiplyAndSumAdapter, Tags
+from simpa.core.device_digital_twins import LinearArrayDetectionGeometry
+from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings
+from simpa.core.simulation_modules.reconstruction_module import travel_time_tables
+from simpa.core.simulation_modules.reconstruction_module.travel_time_tables import TRAVEL_TIME_TABLE_CACHE, \
+    compute_travel_times_fast_iterative
+
+
+class TestTravelTimeTables(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        # the device is placed inside of the speed of sound map, which starts at the origin
+        self.device = LinearArrayDetectionGeometry(pitch_mm=0.3, number_detector_elements=32,
+                                                   device_position_mm=np.array([10, 0, 0]),
+                                                   field_of_view_extent_mm=np.array([-4, 4, 0, 0, 0, 10]))
+        self.spacing_in_mm = 0.25
+        self.time_spacing_in_s = 2.5e-8
+        TRAVEL_TIME_TABLE_CACHE.clear()
+
+    def tearDown(self):
+        TRAVEL_TIME_TABLE_CACHE.clear()
+        self.temporary_directory.cleanup()
+
+    def layered_speed_of_sound_map(self):
+        # 1500 m/s above and 1800 m/s below an interface at a depth of 4 mm
+        speed_of_sound_map = np.full((80, 48), 1500.0)
+        speed_of_sound_map[:, 16:] = 1800
+        return speed_of_sound_map
+
+    def sensor_positions(self):
+        return self.device.get_detector_element_positions_accounting_for_device_position_mm()[:, [0, 2]]
+
+    @staticmethod
+    def refracted_travel_times(source_position_mm, receiver_positions_mm, interface_depth_mm=4.0,
+                               upper_speed=1500.0, lower_speed=1800.0):
+        """
+        analytic travel times in ms from a source below a horizontal interface to receivers above it, given by the
+        crossing point of the interface at which the travel time is minimal (Fermat's principle, Snell's law)
+        """
+        crossing_points = np.linspace(0, 20, 20001)[np.newaxis]
+        lower_distances = np.sqrt((crossing_points - source_position_mm[0]) ** 2 +
+                                  (source_position_mm[1] - interface_depth_mm) ** 2)
+        upper_distances = np.sqrt((crossing_points - receiver_positions_mm[:, :1]) ** 2 +
+                                  (interface_depth_mm - receiver_positions_mm[:, 1:]) ** 2)
+        return np.min(lower_distances / lower_speed + upper_distances / upper_speed, axis=1)
+
+    def simulate_point_source(self, arrival_times):
+        time_steps = np.arange(600) * self.time_spacing_in_s * 1000
+        return np.exp(-((time_steps - np.asarray(arrival_times)[:, None]) / 1e-4) ** 2).astype(np.float32)
+
+    def reconstruct(self, time_series_data, speed_of_sound, adapter_class=DelayAndSumAdapter,
+                    **reconstruction_settings):
+        settings = create_reconstruction_settings(speed_of_sound_in_m_per_s=1500,
+                                                  time_spacing_in_s=self.time_spacing_in_s,
+                                                  sensor_spacing_in_mm=self.spacing_in_mm)
+        settings[Tags.GPU] = False
+        settings.get_reconstruction_settings()[Tags.DATA_FIELD_SPEED_OF_SOUND] = speed_of_sound
+        settings.get_reconstruction_settings().update(reconstruction_settings)
+        return adapter_class(settings).reconstruction_algorithm(time_series_data, self.device)
+
+    def test_fast_iterative_travel_times(self):
+        homogeneous = compute_travel_times_fast_iterative(np.full((40, 30), 1500.0), 0.5,
+                                                          np.array([[7.3, 2.1]])).numpy()[0]
+        coordinates = (np.indices((40, 30)) + 0.5) * 0.5
+        distances = np.sqrt((coordinates[0] - 7.3) ** 2 + (coordinates[1] - 2.1) ** 2)
+        np.testing.assert_allclose(homogeneous, distances / 1500, rtol=1e-6, atol=1e-9)
+
+        # across a horizontal interface, the vertical travel time is close to the sum of the times in both layers
+        layered = np.full((40, 60), 1500.0)
+        layered[:, 20:] = 3000
+        travel_times = compute_travel_times_fast_iterative(layered, 0.5, np.array([[10.25, 0.25]])).numpy()[0]
+        self.assertAlmostEqual(travel_times[20, 59], 9.5 / 1500 + 20 / 3000, delta=0.01 * travel_times[20, 59])
+
+    def test_fast_iterative_travel_times_follow_snells_law(self):
+        sensor_positions = self.sensor_positions()
+        source_position_mm = np.array([11, 8])
+        travel_time_maps = compute_travel_times_fast_iterative(self.layered_speed_of_sound_map(), self.spacing_in_mm,
+                                                               sensor_positions).numpy()
+        travel_times = [map_coordinates(travel_time_map, source_position_mm[:, np.newaxis] / self.spacing_in_mm - 0.5,
+                                        order=1)[0] for travel_time_map in travel_time_maps]
+        np.testing.assert_allclose(travel_times, self.refracted_travel_times(source_position_mm, sensor_positions),
+                                   rtol=1e-3)
+
+        # all sources are computed at once, as if every source was computed on its own
+        np.testing.assert_allclose(travel_time_maps[3], compute_travel_times_fast_iterative(
+            self.layered_speed_of_sound_map(), self.spacing_in_mm, sensor_positions[3:4]).numpy()[0], rtol=1e-12)
+
+    def test_homogeneous_map_reproduces_straight_line_delays(self):
+        time_series_data = self.simulate_point_source(
+            np.linalg.norm(self.sensor_positions() - np.array([11, 6]), axis=1) / 1500)
+        for adapter_class in [DelayAndSumAdapter, DelayMultiplyAndSumAdapter]:
+            reference = self.reconstruct(time_series_data, 1500, adapter_class)
+            image = self.reconstruct(time_series_data, np.full((80, 48), 1500.0), adapter_class,
+                                     **{Tags.RECONSTRUCTION_TRAVEL_TIME_TABLES[0]: True})
+            np.testing.assert_allclose(image, reference, atol=0.02 * np.nanmax(np.abs(reference)))
+
+    def test_travel_time_tables_focus_layered_medium(self):
+        speed_of_sound_map = self.layered_speed_of_sound_map()
+        source_position_mm = np.array([11, 8])
+        time_series_data = self.simulate_point_source(self.refracted_travel_times(source_position_mm,
+                                                                                 self.sensor_positions()))
+        straight_line = self.reconstruct(time_series_data, 1500, DelayMultiplyAndSumAdapter)
+        travel_times = self.reconstruct(time_series_data, speed_of_sound_map, DelayMultiplyAndSumAdapter,
+                                        **{Tags.RECONSTRUCTION_TRAVEL_TIME_TABLES[0]: True})
+
+        # image pixel (i, j) lies at x = 10 - 4 + (i + 0.5) * spacing and depth j * spacing
+        expected_pixel = np.array([(source_position_mm[0] - 6) / self.spacing_in_mm - 0.5,
+                                   source_position_mm[1] / self.spacing_in_mm])
+        travel_time_error = np.linalg.norm(np.unravel_index(np.argmax(travel_times), travel_times.shape) -
+                                           expected_pixel)
+        straight_line_error = np.linalg.norm(np.unravel_index(np.argmax(straight_line), straight_line.shape) -
+                                             expected_pixel)
+        self.assertLessEqual(travel_time_error, 1.5)
+        self.assertGreater(straight_line_error, 2 * travel_time_error)
+
+    def test_travel_time_tables_are_stored_on_disk(self):
+        time_series_data = np.random.random((32, 600)).astype(np.float32)
+        cache_settings = {Tags.RECONSTRUCTION_TRAVEL_TIME_TABLES[0]: True,
+                          Tags.RECONSTRUCTION_PLAN_CACHE_PATH[0]: self.temporary_directory.name}
+        first = self.reconstruct(time_series_data, self.layered_speed_of_sound_map(), **cache_settings)
+        self.assertEqual(len([file_name for file_name in os.listdir(self.temporary_directory.name)
+                              if file_name.startswith("travel_times_")]), 1)
+
+        TRAVEL_TIME_TABLE_CACHE.clear()
+        with patch.object(travel_time_tables, "compute_travel_times_fast_iterative") as compute:
+            second = self.reconstruct(time_series_data, self.layered_speed_of_sound_map(), **cache_settings)
+            compute.assert_not_called()
+        np.testing.assert_array_equal(first, second)
@@ -0,0 +1,72 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+import unittest
+from unittest.mock import patch
+import numpy as np
+from simpa import Tags, UniversalBackProjectionAdapter, reconstruct_universal_back_projection_pytorch
+from simpa.core.device_digital_twins import CurvedArrayDetectionGeometry
+from simpa.core.simulation_modules.reconstruction_module import create_reconstruction_settings
+from simpa.core.simulation_modules.reconstruction_module import reconstruction_utils
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_precision_validation import \
+    simulate_sphere_time_series
+from simpa.core.simulation_modules.reconstruction_module.reconstruction_utils import BEAMFORMING_PLAN_CACHE, \
+    compute_solid_angle_weights
+
+
+class TestUniversalBackProjection(unittest.TestCase):
+
+    def setUp(self):
+        self.speed_of_sound = 1500
+        self.time_spacing = 2.5e-8
+        # full ring array with a radius of 15 mm
+        self.ring_array = CurvedArrayDetectionGeometry(pitch_mm=2 * np.pi * 15 / 256, radius_mm=15,
+                                                       number_detector_elements=256,
+                                                       field_of_view_extent_mm=np.array([-5, 5, 0, 0, -5, 5]))
+        self.time_series_data = simulate_sphere_time_series(self.ring_array, np.array([1.0, 0, -2.0]), 0.5,
+                                                            self.speed_of_sound, self.time_spacing, 1600)
+
+    def test_ring_array_reconstructs_initial_pressure(self):
+        image = reconstruct_universal_back_projection_pytorch(self.time_series_data, self.ring_array,
+                                                              self.speed_of_sound, self.time_spacing, 0.1)
+        self.assertEqual(image.shape, (100, 100))
+        # pixel centres are at (x - 49.5) * 0.1 mm and (depth - 50) * 0.1 mm
+        np.testing.assert_allclose(image[57:62, 27:32], 1, atol=0.05)
+        self.assertLess(np.max(np.abs(image[:40])), 0.2)
+
+    def test_weights_are_stored_per_block_and_tiling_does_not_change_result(self):
+        settings = create_reconstruction_settings(self.speed_of_sound, self.time_spacing, 0.1)
+        settings[Tags.GPU] = False
+        image = UniversalBackProjectionAdapter(settings).reconstruction_algorithm(self.time_series_data,
+                                                                                  self.ring_array)
+
+        reconstruction_settings = settings.get_reconstruction_settings()
+        reconstruction_settings[Tags.RECONSTRUCTION_MEMORY_BUDGET_MB] = 0.5
+        reconstruction_settings[Tags.RECONSTRUCTION_PLAN_CACHE_SIZE_MB] = 100
+        BEAMFORMING_PLAN_CACHE.clear()
+        tiled_adapter = UniversalBackProjectionAdapter(settings)
+        try:
+            with patch.object(reconstruction_utils, "compute_solid_angle_weights",
+                              wraps=compute_solid_angle_weights) as compute:
+                tiled_image = tiled_adapter.reconstruction_algorithm(self.time_series_data, self.ring_array)
+                # every block computes only the weights of its own pixels
+                n_blocks = compute.call_count
+                self.assertGreater(n_blocks, 1)
+                for call in compute.call_args_list:
+                    self.assertIsNotNone(call.args[-1])
+                self.assertTrue(all("solid_angle_weights" in plan for plan in BEAMFORMING_PLAN_CACHE.plans.values()))
+
+                # the weights of all blocks are reused from the beamforming plan cache
+                second_image = tiled_adapter.reconstruction_algorithm(self.time_series_data, self.ring_array)
+                self.assertEqual(compute.call_count, n_blocks)
+        finally:
+            BEAMFORMING_PLAN_CACHE.clear()
+        np.testing.assert_allclose(tiled_image, image, rtol=1e-6, atol=1e-6)
+        np.testing.assert_array_equal(second_image, tiled_image)
+
+    def test_differential_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            reconstruct_universal_back_projection_pytorch(self.time_series_data, self.ring_array,
+                                                          self.speed_of_sound, self.time_spacing, 0.1,
+                                                          Tags.RECONSTRUCTION_MODE_DIFFERENTIAL)
@@ -0,0 +1,155 @@
+# SPDX-FileCopyrightText: 2021 Division of Intelligent Medical Systems, DKFZ
+# SPDX-FileCopyrightText: 2021 Janek Groehl
+# SPDX-License-Identifier: MIT
+
+"""
+This script benchmarks the multi-resolution optical simulation (Tags.OPTICAL_MODEL_DOWNSAMPLING_FACTOR).
+The fluence of a layered tissue with blood vessels is simulated with MCX once on the full grid and once on an
+optical grid that is coarser by a factor of 2 along every axis (8x fewer voxels).
+The run times and the relative error of the fluence and initial pressure with respect to the full resolution
+reference are reported.
+"""
+
+import os
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from simpa import MCXAdapter, ModelBasedAdapter
+from simpa.core.device_digital_twins import PhotoacousticDevice, DiskIlluminationGeometry
+from simpa.core.simulation import simulate
+from simpa.io_handling import load_data_field
+from simpa.utils import Tags, Settings, PathManager, TISSUE_LIBRARY
+from simpa_tests.manual_tests import ManualIntegrationTestClass
+# FIXME temporary workaround for newest Intel architectures
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+
+
+class TestDownsampledOpticalSimulation(ManualIntegrationTestClass):
+
+    def create_example_tissue(self):
+        background_dictionary = Settings()
+        background_dictionary[Tags.MOLECULE_COMPOSITION] = TISSUE_LIBRARY.muscle()
+        background_dictionary[Tags.STRUCTURE_TYPE] = Tags.BACKGROUND
+
+        epidermis_dictionary = Settings()
+        epidermis_dictionary[Tags.PRIORITY] = 8
+        epidermis_dictionary[Tags.STRUCTURE_START_MM] = [0, 0, 1]
+        epidermis_dictionary[Tags.STRUCTURE_END_MM] = [0, 0, 1.5]
+        epidermis_dictionary[Tags.MOLECULE_COMPOSITION] = TISSUE_LIBRARY.epidermis()
+        epidermis_dictionary[Tags.CONSIDER_PARTIAL_VOLUME] = True
+        epidermis_dictionary[Tags.ADHERE_TO_DEFORMATION] = True
+        epidermis_dictionary[Tags.STRUCTURE_TYPE] = Tags.HORIZONTAL_LAYER_STRUCTURE
+
+        vessel_dictionary = Settings()
+        vessel_dictionary[Tags.PRIORITY] = 3
+        vessel_dictionary[Tags.STRUCTURE_START_MM] = [self.dim / 2, 0, 8]
+        vessel_dictionary[Tags.STRUCTURE_END_MM] = [self.dim / 2, self.dim, 8]
+        vessel_dictionary[Tags.STRUCTURE_RADIUS_MM] = 2
+        vessel_dictionary[Tags.MOLECULE_COMPOSITION] = TISSUE_LIBRARY.blood()
+        vessel_dictionary[Tags.CONSIDER_PARTIAL_VOLUME] = True
+        vessel_dictionary[Tags.STRUCTURE_TYPE] = Tags.CIRCULAR_TUBULAR_STRUCTURE
+
+        tissue_dict = Settings()
+        tissue_dict[Tags.BACKGROUND] = background_dictionary
+        tissue_dict["epidermis"] = epidermis_dictionary
+        tissue_dict["vessel"] = vessel_dictionary
+        return tissue_dict
+
+    def setup(self):
+        """
+        This is not a completely autonomous simpa_tests case yet.
+        Please make sure that a valid path_config.env file is located in your home directory, or that you
+        point to the correct file in the PathManager().
+        """
+        self.path_manager = PathManager()
+        self.dim = 20
+        self.downsampling_factor = 2
+
+        self.settings = Settings({
+            Tags.WAVELENGTHS: [800],
+            Tags.WAVELENGTH: 800,
+            Tags.VOLUME_NAME: "DownsampledOpticalSimulation",
+            Tags.SIMULATION_PATH: self.path_manager.get_hdf5_file_save_path(),
+            Tags.SPACING_MM: 0.1,
+            Tags.DIM_VOLUME_X_MM: self.dim,
+            Tags.DIM_VOLUME_Y_MM: self.dim,
+            Tags.DIM_VOLUME_Z_MM: self.dim,
+            Tags.RANDOM_SEED: 4711
+        })
+        self.settings.set_volume_creation_settings({
+            Tags.STRUCTURES: self.create_example_tissue()
+        })
+        self.optical_settings = {
+            Tags.OPTICAL_MODEL_NUMBER_PHOTONS: 1e7,
+            Tags.OPTICAL_MODEL_BINARY_PATH: self.path_manager.get_mcx_binary_path(),
+            Tags.LASER_PULSE_ENERGY_IN_MILLIJOULE: 50,
+            Tags.MCX_ASSUMED_ANISOTROPY: 0.9
+        }
+
+        self.device = PhotoacousticDevice(device_position_mm=np.asarray([self.dim / 2, self.dim / 2, 0]))
+        self.device.add_illumination_geometry(DiskIlluminationGeometry(beam_radius_mm=5))
+
+    def run_optical_simulation(self, downsampling_factor):
+        optical_settings = dict(self.optical_settings)
+        optical_settings[Tags.OPTICAL_MODEL_DOWNSAMPLING_FACTOR] = downsampling_factor
+        self.settings.set_optical_settings(optical_settings)
+        simulate([ModelBasedAdapter(self.settings)], self.settings, self.device)
+        self.settings[Tags.CONTINUE_SIMULATION] = True
+        start_time = time.time()
+        simulate([MCXAdapter(self.settings)], self.settings, self.device)
+        run_time = time.time() - start_time
+        self.settings[Tags.CONTINUE_SIMULATION] = False
+        fluence = load_data_field(self.settings[Tags.SIMPA_OUTPUT_FILE_PATH], Tags.DATA_FIELD_FLUENCE,
+                                  self.settings[Tags.WAVELENGTH])
+        initial_pressure = load_data_field(self.settings[Tags.SIMPA_OUTPUT_FILE_PATH],
+                                           Tags.DATA_FIELD_INITIAL_PRESSURE, self.settings[Tags.WAVELENGTH])
+        return fluence, initial_pressure, run_time
+
+    def perform_test(self):
+        self.reference_fluence, self.reference_p0, self.reference_time = self.run_optical_simulation(1)
+        self.downsampled_fluence, self.downsampled_p0, self.downsampled_time = \
+            self.run_optical_simulation(self.downsampling_factor)
+
+        illuminated = self.reference_fluence > 1e-3 * np.max(self.reference_fluence)
+        self.fluence_error = (np.abs(self.downsampled_fluence - self.reference_fluence)[illuminated] /
+                              self.reference_fluence[illuminated])
+        self.p0_error = (np.linalg.norm(self.downsampled_p0 - self.reference_p0) /
+                         np.linalg.norm(self.reference_p0))
+
+        print(f"Full resolution run time: {self.reference_time:.2f}s")
+        print(f"Downsampled ({self.downsampling_factor ** 3}x fewer voxels) run time: {self.downsampled_time:.2f}s")
+        print(f"Speed-up: {self.reference_time / self.downsampled_time:.2f}")
+        print(f"Fluence relative error in illuminated region: mean {np.mean(self.fluence_error):.4f}, "
+              f"median {np.median(self.fluence_error):.4f}, 95th percentile {np.percentile(self.fluence_error, 95):.4f}")
+        print(f"Initial pressure relative L2 error: {self.p0_error:.4f}")
+
+    def tear_down(self):
+        os.remove(self.settings[Tags.SIMPA_OUTPUT_FILE_PATH])
+
+    def visualise_result(self, show_figure_on_screen=True, save_path=None):
+        y_slice = int(self.reference_fluence.shape[1] / 2)
+        fig, axes = plt.subplots(1, 3, figsize=(12, 4))
+        axes[0].set_title("Fluence (full resolution)")
+        axes[0].imshow(np.log10(self.reference_fluence[:, y_slice, :].T + 1e-10))
+        axes[1].set_title(f"Fluence (downsampled x{self.downsampling_factor})")
+        axes[1].imshow(np.log10(self.downsampled_fluence[:, y_slice, :].T + 1e-10))
+        axes[2].set_title("Relative difference")
+        relative_difference = ((self.downsampled_fluence - self.reference_fluence) /
+                               (self.reference_fluence + 1e-10))[:, y_slice, :].T
+        image = axes[2].imshow(relative_difference, vmin=-0.2, vmax=0.2, cmap="seismic")
+        plt.colorbar(image, ax=axes[2])
+        plt.tight_layout()
+        if show_figure_on_screen:
+            plt.show()
+        else:
+            if save_path is None:
+                save_path = ""
+            plt.savefig(save_path + "downsampled_optical_simulation.png")
+        plt.close()
+
+
+if __name__ == '__main__':
+    test = TestDownsampledOpticalSimulation()
+    test.run_test(show_figure_on_screen=False)